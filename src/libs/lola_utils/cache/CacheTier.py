@@ -0,0 +1,113 @@
+"""
+Contains the base class of the tiers of a TieredCache.
+"""
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+# Expiry time (epoch seconds, -1 for none) written before the payload of the byte tiers, so a value
+# copied to another tier keeps its remaining time to live.
+HEADER = struct.Struct("<d")
+
+
+class CacheTier:
+    """
+    This class is the base of the tiers of a TieredCache. A tier maps string keys to entries
+    (value, expiry time in epoch seconds or None) and counts its hits, misses, expired entries,
+    sets, evictions and errors. Expired entries are misses, and so are the keys a tier fails to
+    read, e.g. when its server is unreachable, which count as errors.
+
+    Usage:
+        class MyTier(CacheTier):
+            def mget(self, keys): ...
+            def mset(self, entries): ...
+    """
+
+    def __init__(self, name: str):
+        """
+        Initializes the statistics of the tier.
+        Args:
+            name (str): Name of the tier in the statistics.
+        """
+        self.name = name
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "sets": 0, "evictions": 0, "errors": 0}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def is_expired(expires_at: float, now: float = None) -> bool:
+        return expires_at is not None and expires_at <= (time.time() if now is None else now)
+
+    @staticmethod
+    def pack(payload: bytes, expires_at: float) -> bytes:
+        """
+        Prepends the expiry time to a payload.
+        Args:
+            payload (bytes): Serialized value.
+            expires_at (float): Expiry time in epoch seconds, None for none.
+        Returns:
+            bytes: Stored bytes.
+        """
+        return HEADER.pack(-1.0 if expires_at is None else expires_at) + payload
+
+    @staticmethod
+    def unpack(data: bytes) -> Tuple[bytes, float]:
+        """
+        Splits stored bytes into the payload and the expiry time.
+        Args:
+            data (bytes): Stored bytes.
+        Returns:
+            tuple: Payload and expiry time, None for none.
+        """
+        expires_at = HEADER.unpack_from(data)[0]
+        return data[HEADER.size:], None if expires_at < 0 else expires_at
+
+    def count(self, **increments) -> None:
+        with self._lock:
+            for key, value in increments.items():
+                self.counters[key] += value
+
+    def mget(self, keys: List[str]) -> Dict[str, Tuple[Any, float]]:
+        """
+        Gets the entries of the keys found and not expired.
+        Args:
+            keys ([str]): Keys.
+        Returns:
+            dict: Entry (value, expiry time) of every key found.
+        """
+        raise NotImplementedError
+
+    def mset(self, entries: Dict[str, Tuple[Any, float]]) -> None:
+        """
+        Sets entries.
+        Args:
+            entries (dict): Entry (value, expiry time) of every key.
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def delete(self, keys: List[str]) -> None:
+        raise NotImplementedError
+
+    def clear(self, prefix: str = "") -> None:
+        """
+        Removes the keys starting with prefix.
+        Args:
+            prefix (str): Prefix of the keys, e.g. the namespace of a cache.
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the statistics of the tier.
+        Returns:
+            dict: Hits, misses, expired, sets, evictions, errors and hit rate.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else None
+        return stats
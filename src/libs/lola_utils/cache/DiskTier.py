@@ -0,0 +1,183 @@
+"""
+Contains the local disk tier of a TieredCache.
+"""
+import hashlib
+import logging
+import os
+import struct
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from libs.lola_utils.cache.CacheTier import CacheTier
+
+KEY_LENGTH = struct.Struct("<I")
+
+
+class DiskTier(CacheTier):
+    """
+    This class keeps serialized values in files of a local folder, one file per key named by the
+    sha256 of the key, so processes of the node and later runs share them. Files hold the expiry
+    time, the key (checked on read) and the payload, and are written under a temporary name and
+    renamed in place. When the files exceed max_bytes the oldest written are removed. Files that
+    cannot be read or written, e.g. on a full disk or a truncated file, count as misses or skipped
+    sets and as errors.
+
+    Usage:
+        tier = DiskTier("/local_disk0/lola_cache", max_bytes=10 * 2 ** 30)
+        tier.mset({"key": (payload, time.time() + 3600)})
+        tier.mget(["key"])
+    """
+
+    def __init__(self, path: str, max_bytes: int = None, name: str = "disk"):
+        """
+        Initializes the tier, removing the expired files and the oldest ones beyond max_bytes.
+        Args:
+            path (str): Folder of the files.
+            max_bytes (int): Budget of the files. None for no budget.
+            name (str): Name of the tier in the statistics.
+        """
+        super().__init__(name)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(path, exist_ok=True)
+        self.bytes = 0
+        self.prune()
+
+    def file(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.path, digest[:2], f"{digest}.bin")
+
+    def __files(self) -> List[os.DirEntry]:
+        entries = []
+        for folder in os.scandir(self.path):
+            if folder.is_dir() and not folder.name.startswith("."):
+                entries.extend(e for e in os.scandir(folder.path) if e.name.endswith(".bin"))
+        return entries
+
+    def __read(self, path: str) -> Tuple[str, bytes, float]:
+        """
+        Reads a file.
+        Args:
+            path (str): Path of the file.
+        Returns:
+            tuple: Key, payload and expiry time, or None if the file does not exist or is unreadable.
+        """
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            self.logger.warning(f"Disk tier {self.name}: {path} not read: {exc}")
+            self.count(errors=1)
+            return None
+        try:
+            content, expires_at = self.unpack(data)
+            length = KEY_LENGTH.unpack_from(content)[0]
+            key = content[KEY_LENGTH.size:KEY_LENGTH.size + length].decode()
+        except (struct.error, UnicodeDecodeError) as exc:
+            self.logger.warning(f"Disk tier {self.name}: {path} is corrupt: {exc}")
+            self.count(errors=1)
+            return None
+        return key, content[KEY_LENGTH.size + length:], expires_at
+
+    def mget(self, keys: List[str]) -> Dict[str, Tuple[bytes, float]]:
+        now, found, hits, misses, expired = time.time(), {}, 0, 0, 0
+        for key in keys:
+            path = self.file(key)
+            entry = self.__read(path)
+            if entry is None or entry[0] != key:
+                misses += 1
+            elif self.is_expired(entry[2], now):
+                self.delete([key])
+                misses += 1
+                expired += 1
+            else:
+                found[key] = (entry[1], entry[2])
+                hits += 1
+        self.count(hits=hits, misses=misses, expired=expired)
+        return found
+
+    def mset(self, entries: Dict[str, Tuple[bytes, float]]) -> None:
+        written, sets, errors = 0, 0, 0
+        for key, (payload, expires_at) in entries.items():
+            path = self.file(key)
+            encoded = key.encode()
+            data = self.pack(KEY_LENGTH.pack(len(encoded)) + encoded + payload, expires_at)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as exc:
+                self.logger.warning(f"Disk tier {self.name}: {path} not written: {exc}")
+                self.__remove(tmp_path)
+                errors += 1
+                continue
+            written += len(data)
+            sets += 1
+        with self._lock:
+            self.bytes += written
+            self.counters["sets"] += sets
+            self.counters["errors"] += errors
+            over_budget = self.max_bytes is not None and self.bytes > self.max_bytes
+        if over_budget:
+            self.prune()
+
+    @staticmethod
+    def __remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, keys: List[str]) -> None:
+        for key in keys:
+            self.__remove(self.file(key))
+
+    def clear(self, prefix: str = "") -> None:
+        for entry in self.__files():
+            content = self.__read(entry.path)
+            if content is not None and content[0].startswith(prefix):
+                self.delete([content[0]])
+        self.prune()
+
+    def prune(self) -> None:
+        """
+        Removes the expired files, then the oldest written until the files take at most 90% of
+        max_bytes, and recounts their size.
+        Returns:
+            None
+        """
+        now, files = time.time(), []
+        for entry in self.__files():
+            try:
+                stat = entry.stat()
+                with open(entry.path, "rb") as f:
+                    _, expires_at = self.unpack(f.read(8))
+            except (FileNotFoundError, struct.error):
+                continue
+            if self.is_expired(expires_at, now):
+                self.__remove(entry.path)
+            else:
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        if self.max_bytes is not None and total > self.max_bytes:
+            for _, size, path in sorted(files):
+                if total <= 0.9 * self.max_bytes:
+                    break
+                self.__remove(path)
+                total -= size
+                evicted += 1
+        with self._lock:
+            self.bytes = total
+            self.counters["evictions"] += evicted
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(bytes=self.bytes, max_bytes=self.max_bytes)
+        return stats
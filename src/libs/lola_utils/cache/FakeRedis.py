@@ -0,0 +1,120 @@
+"""
+Contains an in-process stand-in for a redis-py client.
+"""
+import fnmatch
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+
+class FakePipeline:
+    """Buffers the commands of a FakeRedis pipeline until execute()."""
+
+    def __init__(self, client: "FakeRedis") -> None:
+        self.client = client
+        self.commands = []
+
+    def set(self, name: str, value: bytes, ex: float = None, px: int = None) -> "FakePipeline":
+        self.commands.append(("set", (name, value, ex, px)))
+        return self
+
+    def delete(self, *names: str) -> "FakePipeline":
+        self.commands.append(("delete", names))
+        return self
+
+    def execute(self) -> List[Any]:
+        with self.client.lock:
+            self.client.calls["pipeline"] += 1
+            results = [self.client.set(*args) if command == "set" else self.client.delete(*args)
+                       for command, args in self.commands]
+        self.commands = []
+        return results
+
+
+class FakeRedis:
+    """
+    This class serves the calls of redis-py used by RedisTier (get, set with ex or px, mget,
+    delete, scan_iter and pipeline) from a dict in process memory, with expiry, so the Redis tier
+    runs and can be tested without a server. Values are bytes, as redis-py returns them. calls
+    counts the round trips a server would get.
+
+    Usage:
+        client = FakeRedis()
+        client.set("key", b"value", px=1000)
+        client.mget(["key"])
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty store.
+        """
+        self.data = {}
+        self.expiry = {}
+        self.lock = threading.RLock()
+        self.calls = {"get": 0, "set": 0, "mget": 0, "delete": 0, "scan": 0, "pipeline": 0}
+
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    def __live(self, name: str) -> bool:
+        expires_at = self.expiry.get(name)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(name, None)
+            self.expiry.pop(name, None)
+        return name in self.data
+
+    def ping(self) -> bool:
+        return True
+
+    def get(self, name: str) -> bytes:
+        with self.lock:
+            self.calls["get"] += 1
+            return self.data[name] if self.__live(name) else None
+
+    def set(self, name: str, value: Any, ex: float = None, px: int = None) -> bool:
+        with self.lock:
+            self.calls["set"] += 1
+            self.data[name] = self.encode(value)
+            self.expiry.pop(name, None)
+            if ex is not None or px is not None:
+                self.expiry[name] = time.time() + (ex if ex is not None else px / 1000)
+            return True
+
+    def mget(self, keys: Any, *args: str) -> List[bytes]:
+        keys = [keys] + list(args) if isinstance(keys, str) else list(keys) + list(args)
+        with self.lock:
+            self.calls["mget"] += 1
+            return [self.data[k] if self.__live(k) else None for k in keys]
+
+    def delete(self, *names: str) -> int:
+        with self.lock:
+            self.calls["delete"] += 1
+            deleted = 0
+            for name in names:
+                if self.__live(name):
+                    deleted += 1
+                self.data.pop(name, None)
+                self.expiry.pop(name, None)
+            return deleted
+
+    def scan_iter(self, match: str = None, count: int = None) -> Iterator[bytes]:
+        with self.lock:
+            self.calls["scan"] += 1
+            names = [k for k in list(self.data) if self.__live(k) and (match is None or fnmatch.fnmatchcase(k, match))]
+        return iter(names)
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    def flushdb(self) -> bool:
+        with self.lock:
+            self.data.clear()
+            self.expiry.clear()
+            return True
+
+    def info(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"keys": len(self.data), "used_memory": sum(len(v) for v in self.data.values())}
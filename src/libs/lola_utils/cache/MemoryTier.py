@@ -0,0 +1,94 @@
+"""
+Contains the in-process tier of a TieredCache: a least recently used map with a byte budget.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from libs.lola_utils.cache.CacheTier import CacheTier
+
+
+class MemoryTier(CacheTier):
+    """
+    This class keeps values in process memory, least recently used first out when their size
+    exceeds max_bytes. Values are kept as objects, so a hit costs no deserialization; their size is
+    the size of their serialized payload. Values are shared by all the callers, treat them as read
+    only.
+
+    Usage:
+        tier = MemoryTier(max_bytes=256 * 2 ** 20)
+        tier.mset({"key": (value, None, 120)})
+        tier.mget(["key"])
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2 ** 20, name: str = "memory"):
+        """
+        Initializes an empty tier.
+        Args:
+            max_bytes (int): Budget of the sizes of the values kept.
+            name (str): Name of the tier in the statistics.
+        """
+        super().__init__(name)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+
+    def __remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def mget(self, keys: List[str]) -> Dict[str, Tuple[Any, float]]:
+        now, found = time.time(), {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    self.counters["misses"] += 1
+                elif self.is_expired(entry[1], now):
+                    self.__remove(key)
+                    self.counters["misses"] += 1
+                    self.counters["expired"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    found[key] = entry[:2]
+        return found
+
+    def mset(self, entries: Dict[str, Tuple[Any, float, int]]) -> None:
+        """
+        Sets entries, evicting the least recently used ones beyond the budget. A value larger
+        than the budget is not kept.
+        Args:
+            entries (dict): Entry (value, expiry time, size in bytes) of every key.
+        Returns:
+            None
+        """
+        with self._lock:
+            for key, (value, expires_at, size) in entries.items():
+                if key in self._entries:
+                    self.__remove(key)
+                if size > self.max_bytes:
+                    continue
+                self._entries[key] = (value, expires_at, size)
+                self.bytes += size
+                self.counters["sets"] += 1
+            while self.bytes > self.max_bytes:
+                self.__remove(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def delete(self, keys: List[str]) -> None:
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self.__remove(key)
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self.__remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats.update(keys=len(self._entries), bytes=self.bytes, max_bytes=self.max_bytes)
+        return stats
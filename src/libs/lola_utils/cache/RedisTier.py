@@ -0,0 +1,100 @@
+"""
+Contains the Redis tier of a TieredCache.
+"""
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+from libs.lola_utils.cache.CacheTier import CacheTier
+
+
+class RedisTier(CacheTier):
+    """
+    This class keeps serialized values in Redis, shared by the nodes of a cluster. Multi-gets are
+    one MGET and multi-sets one pipeline of SET with the remaining time to live, in chunks of
+    chunk_size keys. The client is redis-py (with hiredis installed it parses replies in C), or
+    any client with the same calls such as FakeRedis. A chunk that fails, e.g. on a timeout or a
+    lost connection, counts as misses or skipped sets and as an error, so a Redis outage slows the
+    cache down to its other tiers instead of failing the lookups.
+
+    Usage:
+        tier = RedisTier(url="redis://cache.internal:6379/0")
+        tier = RedisTier(client=FakeRedis())
+    """
+
+    def __init__(self, client: Any = None, url: str = None, chunk_size: int = 1000, name: str = "redis",
+                 **options):
+        """
+        Initializes the tier.
+        Args:
+            client (Any): Redis client. Created from url when None.
+            url (str): Url of the Redis server, e.g. redis://host:6379/0.
+            chunk_size (int): Keys per MGET or pipeline.
+            name (str): Name of the tier in the statistics.
+            options: Other arguments of redis.Redis.from_url, e.g. socket_timeout.
+        """
+        super().__init__(name)
+        if client is None:
+            if not url:
+                raise ValueError("Error: a Redis tier needs a client or a url")
+            import redis
+
+            client = redis.Redis.from_url(url, **options)
+        self.client = client
+        self.chunk_size = chunk_size
+        self.logger = logging.getLogger(__name__)
+
+    def mget(self, keys: List[str]) -> Dict[str, Tuple[bytes, float]]:
+        now, found, misses, expired = time.time(), {}, 0, 0
+        for start in range(0, len(keys), self.chunk_size):
+            chunk = keys[start:start + self.chunk_size]
+            try:
+                replies = self.client.mget(chunk)
+            except Exception as exc:
+                self.logger.warning(f"Redis tier {self.name}: MGET of {len(chunk)} keys failed: {exc}")
+                self.count(errors=1)
+                misses += len(chunk)
+                continue
+            for key, data in zip(chunk, replies):
+                if data is None:
+                    misses += 1
+                    continue
+                payload, expires_at = self.unpack(data)
+                # Redis expires keys itself; this only covers the last milliseconds and clock skew.
+                if self.is_expired(expires_at, now):
+                    misses += 1
+                    expired += 1
+                else:
+                    found[key] = (payload, expires_at)
+        self.count(hits=len(found), misses=misses, expired=expired)
+        return found
+
+    def mset(self, entries: Dict[str, Tuple[bytes, float]]) -> None:
+        now, items, sets = time.time(), list(entries.items()), 0
+        for start in range(0, len(items), self.chunk_size):
+            pipeline, queued = self.client.pipeline(transaction=False), 0
+            for key, (payload, expires_at) in items[start:start + self.chunk_size]:
+                if expires_at is None:
+                    pipeline.set(key, self.pack(payload, None))
+                elif expires_at > now:
+                    pipeline.set(key, self.pack(payload, expires_at), px=max(1, int((expires_at - now) * 1000)))
+                else:
+                    continue
+                queued += 1
+            try:
+                pipeline.execute()
+            except Exception as exc:
+                self.logger.warning(f"Redis tier {self.name}: SET of {queued} keys failed: {exc}")
+                self.count(errors=1)
+                continue
+            sets += queued
+        self.count(sets=sets)
+
+    def delete(self, keys: List[str]) -> None:
+        for start in range(0, len(keys), self.chunk_size):
+            if keys[start:start + self.chunk_size]:
+                self.client.delete(*keys[start:start + self.chunk_size])
+
+    def clear(self, prefix: str = "") -> None:
+        keys = list(self.client.scan_iter(match=f"{prefix}*", count=self.chunk_size))
+        self.delete(keys)
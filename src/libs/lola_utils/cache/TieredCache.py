@@ -0,0 +1,242 @@
+"""
+Contains a cache of features, lookups and reference data with an in-process, a local disk and a
+Redis tier.
+"""
+import logging
+import pickle
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+from libs.lola_utils.cache.CacheTier import CacheTier
+from libs.lola_utils.cache.DiskTier import DiskTier
+from libs.lola_utils.cache.FakeRedis import FakeRedis
+from libs.lola_utils.cache.MemoryTier import MemoryTier
+from libs.lola_utils.cache.RedisTier import RedisTier
+
+
+class TieredCache:
+    """
+    This class caches values under string keys in tiers, fastest first: usually a MemoryTier,
+    a DiskTier and a RedisTier. A lookup asks each tier only for the keys the previous ones
+    missed, in one batch per tier, and copies the values found to the faster tiers with their
+    remaining time to live. A set writes every tier. Values are pickled once for the byte tiers.
+    Keys are prefixed with the namespace, so caches of different data share tiers safely. A tier
+    that fails is counted in its errors and skipped: its keys are looked up in the next tiers and
+    its sets are dropped, so the cache degrades to its working tiers instead of failing.
+
+    Unpickling runs code chosen by whoever wrote the bytes, so the disk and Redis tiers must only
+    be writable by trusted processes, e.g. a Redis reachable only from the cluster and protected
+    by a password. Do not point a cache at a Redis shared with other applications.
+
+    Usage:
+        cache = TieredCache.from_settings({"memory": {"max_bytes": 2 ** 28}, "disk": {"path": "/local_disk0/cache"},
+                                           "redis": {"url": "redis://cache:6379/0"}, "ttl": 3600}, "sd_features")
+        features = cache.mget_or_compute(keys, lambda missing: read_features(missing))
+        cache.stats()["tiers"]["memory"]["hit_rate"]
+    """
+
+    def __init__(self, tiers: List[CacheTier], namespace: str = "lola", ttl: float = None,
+                 protocol: int = pickle.HIGHEST_PROTOCOL):
+        """
+        Initializes the cache.
+        Args:
+            tiers ([CacheTier]): Tiers, fastest first. Only the first can be a MemoryTier.
+            namespace (str): Prefix of the keys.
+            ttl (float): Default time to live in seconds. None for no expiry.
+            protocol (int): Pickle protocol of the byte tiers.
+        """
+        if any(isinstance(tier, MemoryTier) for tier in tiers[1:]):
+            raise ValueError("Error: only the first tier of a TieredCache can be in memory")
+        self.tiers = tiers
+        self.namespace = namespace
+        self.ttl = ttl
+        self.protocol = protocol
+        self.counters = {"lookups": 0, "hits": 0, "computed": 0}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], namespace: str = None) -> "TieredCache":
+        """
+        Builds a cache from a config, e.g. {"namespace": "ptc", "ttl": 86400, "memory": {"max_bytes":
+        268435456}, "disk": {"path": "/local_disk0/cache", "max_bytes": 10737418240},
+        "redis": {"url": "redis://host:6379/0"}}. Tiers missing from the config are not used, and
+        {"redis": {"fake": true}} uses an in-process FakeRedis.
+        Args:
+            settings (dict): Config of the cache.
+            namespace (str): Prefix of the keys, when the config has none.
+        Returns:
+            TieredCache: The cache.
+        """
+        tiers = []
+        if settings.get("memory") is not None:
+            tiers.append(MemoryTier(**settings["memory"]))
+        if settings.get("disk") is not None:
+            tiers.append(DiskTier(**settings["disk"]))
+        if settings.get("redis") is not None:
+            redis = dict(settings["redis"])
+            client = FakeRedis() if redis.pop("fake", False) else None
+            tiers.append(RedisTier(client=client, **redis))
+        if not tiers:
+            raise ValueError("Error: a TieredCache needs at least one of the memory, disk or redis tiers")
+        return cls(tiers, settings.get("namespace") or namespace or "lola", settings.get("ttl"))
+
+    def key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def mget(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Gets the values of the keys found in any tier.
+        Args:
+            keys (Iterable[str]): Keys, without the namespace.
+        Returns:
+            dict: Value of every key found.
+        """
+        keys = list(dict.fromkeys(keys))
+        missing = [self.key(k) for k in keys]
+        values = {}
+        for position, tier in enumerate(self.tiers):
+            if not missing:
+                break
+            try:
+                entries = tier.mget(missing)
+            except Exception as exc:
+                self.__error(tier, "lookup", exc)
+                continue
+            if not entries:
+                continue
+            if isinstance(tier, MemoryTier):
+                values.update({k: value for k, (value, _) in entries.items()})
+            else:
+                for k, (payload, expires_at) in list(entries.items()):
+                    try:
+                        values[k] = pickle.loads(payload)
+                    except Exception as exc:
+                        # A payload that does not unpickle, e.g. of another version of a class, is a miss.
+                        self.__error(tier, f"value of {k}", exc)
+                        del entries[k]
+                self.__fill(self.tiers[:position], entries, values)
+            missing = [k for k in missing if k not in entries]
+        prefix = len(self.namespace) + 1
+        found = {k[prefix:]: value for k, value in values.items()}
+        with self._lock:
+            self.counters["lookups"] += len(keys)
+            self.counters["hits"] += len(found)
+        return found
+
+    def __fill(self, tiers: List[CacheTier], entries: Dict[str, tuple], values: Dict[str, Any]) -> None:
+        """
+        Copies the entries found in a byte tier to the faster tiers.
+        Args:
+            tiers ([CacheTier]): Faster tiers.
+            entries (dict): Entry (payload, expiry time) of every key found.
+            values (dict): Unpickled value of every key found.
+        Returns:
+            None
+        """
+        for tier in tiers:
+            try:
+                if isinstance(tier, MemoryTier):
+                    tier.mset({k: (values[k], expires_at, len(payload))
+                               for k, (payload, expires_at) in entries.items()})
+                else:
+                    tier.mset(entries)
+            except Exception as exc:
+                self.__error(tier, "backfill", exc)
+
+    def __error(self, tier: CacheTier, operation: str, exc: Exception) -> None:
+        self.logger.warning(f"Cache {self.namespace}: {operation} in tier {tier.name} failed: {exc}")
+        tier.count(errors=1)
+
+    def mset(self, mapping: Dict[str, Any], ttl: float = None) -> None:
+        """
+        Sets values in every tier.
+        Args:
+            mapping (dict): Value of every key, without the namespace.
+            ttl (float): Time to live in seconds. Defaults to the ttl of the cache.
+        Returns:
+            None
+        """
+        if not mapping:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        payloads = {self.key(k): pickle.dumps(v, protocol=self.protocol) for k, v in mapping.items()}
+        for tier in self.tiers:
+            try:
+                if isinstance(tier, MemoryTier):
+                    tier.mset({self.key(k): (v, expires_at, len(payloads[self.key(k)])) for k, v in mapping.items()})
+                else:
+                    tier.mset({k: (payload, expires_at) for k, payload in payloads.items()})
+            except Exception as exc:
+                self.__error(tier, "set", exc)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.mget([key]).get(key, default)
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        self.mset({key: value}, ttl)
+
+    def mget_or_compute(self, keys: Iterable[str], compute: Callable[[List[str]], Dict[str, Any]],
+                        ttl: float = None) -> Dict[str, Any]:
+        """
+        Gets the values of the keys, computing the missing ones in one call and caching them.
+        Args:
+            keys (Iterable[str]): Keys, without the namespace.
+            compute (Callable): Function from the missing keys to their values. Keys it leaves
+                                out stay missing.
+            ttl (float): Time to live of the computed values. Defaults to the ttl of the cache.
+        Returns:
+            dict: Value of every key found or computed.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = self.mget(keys)
+        missing = [k for k in keys if k not in found]
+        if missing:
+            computed = compute(missing)
+            self.mset(computed, ttl)
+            with self._lock:
+                self.counters["computed"] += len(computed)
+            found.update(computed)
+        return found
+
+    def delete(self, keys: Iterable[str]) -> None:
+        """
+        Removes keys from every tier. A tier failing is counted and skipped.
+        Args:
+            keys (Iterable[str]): Keys, without the namespace.
+        Returns:
+            None
+        """
+        keys = [self.key(k) for k in keys]
+        for tier in self.tiers:
+            try:
+                tier.delete(keys)
+            except Exception as exc:
+                self.__error(tier, "delete", exc)
+
+    def clear(self) -> None:
+        """
+        Removes the keys of the namespace from every tier. A tier failing is counted and skipped.
+        Returns:
+            None
+        """
+        for tier in self.tiers:
+            try:
+                tier.clear(f"{self.namespace}:")
+            except Exception as exc:
+                self.__error(tier, "clear", exc)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Gets the statistics of the cache and of every tier.
+        Returns:
+            dict: Lookups, hits, computed values and hit rate of the cache, and the statistics of
+                  every tier by name.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else None
+        stats["tiers"] = {tier.name: tier.stats() for tier in self.tiers}
+        return stats
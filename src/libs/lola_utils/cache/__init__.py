@@ -0,0 +1,6 @@
+from libs.lola_utils.cache.CacheTier import CacheTier
+from libs.lola_utils.cache.DiskTier import DiskTier
+from libs.lola_utils.cache.FakeRedis import FakeRedis
+from libs.lola_utils.cache.MemoryTier import MemoryTier
+from libs.lola_utils.cache.RedisTier import RedisTier
+from libs.lola_utils.cache.TieredCache import TieredCache
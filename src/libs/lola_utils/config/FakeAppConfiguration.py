@@ -0,0 +1,107 @@
+"""
+Contains an in-process stand-in for an Azure App Configuration client.
+"""
+import fnmatch
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List
+
+
+class FakeSetting:
+    """A configuration setting with the attributes of azure.appconfiguration.ConfigurationSetting."""
+
+    def __init__(self, key: str, value: str, label: str = None, content_type: str = None, etag: str = None):
+        self.key = key
+        self.value = value
+        self.label = label
+        self.content_type = content_type
+        self.etag = etag or uuid.uuid4().hex
+
+
+class FakeAppConfiguration:
+    """
+    This class serves the calls of azure.appconfiguration.AzureAppConfigurationClient used by
+    RemoteConfigSource (list_configuration_settings with key and label filters, and
+    get_configuration_setting with an etag and match condition) from a dict in process memory, so
+    remote configs run and can be tested without a store. latency delays every call and
+    fail_with raises on every call, to test slow and unreachable stores. calls counts the round
+    trips a store would get, one per page of listed settings.
+
+    Usage:
+        client = FakeAppConfiguration({"smart_discounts:optimization:budget": "0.1"}, latency=0.5)
+        client.set("smart_discounts:optimization:budget", "0.2", label="co")
+        source = RemoteConfigSource(client, key_filter="smart_discounts:*")
+    """
+
+    def __init__(self, settings: Dict[str, str] = None, label: str = None, latency: float = 0.0,
+                 page_size: int = 100):
+        """
+        Initializes the store.
+        Args:
+            settings (dict): Value of every key, set with label.
+            label (str): Label of settings.
+            latency (float): Seconds every call waits.
+            page_size (int): Settings per page of a list.
+        """
+        self.settings = {}
+        self.latency = latency
+        self.page_size = page_size
+        self.fail_with = None
+        self.lock = threading.Lock()
+        self.calls = {"list": 0, "pages": 0, "get": 0, "not_modified": 0}
+        for key, value in (settings or {}).items():
+            self.set(key, value, label)
+
+    def set(self, key: str, value: str, label: str = None, content_type: str = None) -> FakeSetting:
+        with self.lock:
+            setting = FakeSetting(key, value, label, content_type)
+            self.settings[(key, label)] = setting
+            return setting
+
+    def delete(self, key: str, label: str = None) -> None:
+        with self.lock:
+            self.settings.pop((key, label), None)
+
+    def __call(self, name: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[name] += 1
+        if self.fail_with is not None:
+            raise self.fail_with
+
+    @staticmethod
+    def __labels(label_filter: str) -> List[str]:
+        if label_filter is None:
+            return None
+        return [None if label == "\0" else label for label in label_filter.split(",")]
+
+    def list_configuration_settings(self, key_filter: str = None, label_filter: str = None,
+                                    **kwargs) -> Iterator[FakeSetting]:
+        self.__call("list")
+        labels = self.__labels(label_filter)
+        with self.lock:
+            settings = [s for s in self.settings.values()
+                        if (key_filter is None or fnmatch.fnmatchcase(s.key, key_filter))
+                        and (labels is None or s.label in labels)]
+        for start in range(0, len(settings), self.page_size):
+            if start:
+                self.__call("pages")
+            yield from settings[start:start + self.page_size]
+
+    def get_configuration_setting(self, key: str, label: str = None, etag: str = "*",
+                                  match_condition: Any = None, **kwargs) -> FakeSetting:
+        self.__call("get")
+        with self.lock:
+            setting = self.settings.get((key, label))
+        if setting is None:
+            raise KeyError(f"Error: setting {key} with label {label} not found")
+        if getattr(match_condition, "name", match_condition) == "IfModified" and setting.etag == etag:
+            with self.lock:
+                self.calls["not_modified"] += 1
+            return None
+        return setting
+
+    def close(self) -> None:
+        pass
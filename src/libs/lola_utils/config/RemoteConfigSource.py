@@ -0,0 +1,315 @@
+"""
+Contains a source of configs kept in Azure App Configuration, fetched in bulk and cached on local
+disk.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+
+class RemoteConfigSource:
+    """
+    This class reads the settings of an Azure App Configuration store matching a key filter and a
+    list of labels with one list call (one round trip per page of 100 settings), never one call
+    per key, and turns them into a config dict: keys are split on the separator into nested keys
+    and values are parsed as json when they can be. When a key has several labels, the label last
+    in labels wins, e.g. labels [None, "co"] reads the defaults and overrides them for Colombia.
+
+    The settings and their etags are cached in a json file of cache_dir. A run starts from the
+    cached copy when it is younger than max_age seconds and revalidates it in the background;
+    otherwise it waits up to timeout seconds for the store and falls back to the cached copy if
+    the store is slow or unreachable, while the fetch goes on and refreshes the file. With a
+    sentinel_key, a revalidation first asks for the sentinel only if its etag changed, and lists
+    the settings only then.
+
+    Usage:
+        source = RemoteConfigSource.from_settings({"key_filter": "smart_discounts:*", "labels": [null, "co"],
+                                                   "sentinel_key": "smart_discounts:sentinel"}, ".lola/remote_config")
+        ConfigManager().upsert_config(source.load())
+        source.start(interval=300, on_change=lambda config: ConfigManager().upsert_config(config))
+    """
+
+    def __init__(self, client: Any, key_filter: str = "*", labels: List[str] = None, cache_dir: str = None,
+                 max_age: float = 300.0, timeout: float = 5.0, sentinel_key: str = None, separator: str = ":",
+                 strip_prefix: bool = True, store_id: str = None):
+        """
+        Initializes the source.
+        Args:
+            client (Any): AzureAppConfigurationClient, or a client with the same calls such as
+                          FakeAppConfiguration.
+            key_filter (str): Keys to read, e.g. "smart_discounts:*".
+            labels ([str]): Labels to read, lowest precedence first. None is the empty label.
+            cache_dir (str): Folder of the cached copy. None for no cache.
+            max_age (float): Age in seconds under which the cached copy is used without waiting.
+            timeout (float): Seconds to wait for the store when the cached copy is older.
+            sentinel_key (str): Key changed whenever the settings change, checked by etag first.
+            separator (str): Separator of the nested keys.
+            strip_prefix (bool): Remove the fixed prefix of key_filter from the keys.
+            store_id (str): Id of the store in the name of the cached copy, e.g. its endpoint.
+        """
+        self.client = client
+        self.key_filter = key_filter
+        self.labels = labels if labels is not None else [None]
+        self.max_age = max_age
+        self.timeout = timeout
+        self.sentinel_key = sentinel_key
+        self.separator = separator
+        self.prefix = key_filter.split("*")[0] if strip_prefix else ""
+        self.cache_path = None
+        if cache_dir:
+            name = json.dumps([store_id, key_filter, self.labels, sentinel_key])
+            digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+            self.cache_path = os.path.join(cache_dir, f"{digest}.json")
+        self.state = None
+        self.stats = {"lists": 0, "sentinel_checks": 0, "not_modified": 0, "changes": 0, "errors": 0,
+                      "cache_loads": 0}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._fetching = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any], cache_dir: str = None) -> "RemoteConfigSource":
+        """
+        Builds a source from a config, e.g. {"key_filter": "smart_discounts:*", "labels": [null, "co"],
+        "connection_string_env": "APP_CONFIGURATION_CONNECTION_STRING", "timeout": 5}. The
+        connection string is read from the environment variable, never from the config, and
+        {"fake": {"key": "value"}} uses a FakeAppConfiguration with those settings.
+        Args:
+            settings (dict): Config of the source.
+            cache_dir (str): Folder of the cached copy, when the config has no cache_dir.
+        Returns:
+            RemoteConfigSource: The source.
+        """
+        settings = dict(settings)
+        fake = settings.pop("fake", None)
+        variable = settings.pop("connection_string_env", "APP_CONFIGURATION_CONNECTION_STRING")
+        settings.setdefault("cache_dir", cache_dir)
+        if fake is not None:
+            from libs.lola_utils.config.FakeAppConfiguration import FakeAppConfiguration
+
+            return cls(FakeAppConfiguration(fake), store_id="fake", **settings)
+        connection_string = os.getenv(variable)
+        if not connection_string:
+            raise ValueError(f"Error: the environment variable {variable} with the connection string of the "
+                             f"App Configuration store is not set")
+        from azure.appconfiguration import AzureAppConfigurationClient
+
+        endpoint = dict(p.split("=", 1) for p in connection_string.split(";") if "=" in p).get("Endpoint")
+        settings.setdefault("store_id", endpoint)
+        return cls(AzureAppConfigurationClient.from_connection_string(connection_string), **settings)
+
+    def __read_cache(self) -> Dict[str, Any]:
+        if self.cache_path is None or not os.path.isfile(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as exc:
+            self.logger.warning(f"Remote config cache {self.cache_path} unreadable: {exc}")
+            return None
+
+    def __write_cache(self, state: Dict[str, Any]) -> None:
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp_path = f"{self.cache_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.cache_path)
+
+    @staticmethod
+    def __if_modified() -> Any:
+        try:
+            from azure.core import MatchConditions
+
+            return MatchConditions.IfModified
+        except ImportError:
+            return "IfModified"
+
+    def __sentinel_modified(self) -> bool:
+        """
+        Asks the store for the sentinel only if its etag changed since the cached copy.
+        Returns:
+            bool: Whether the sentinel changed.
+        """
+        self.stats["sentinel_checks"] += 1
+        etag = self.state["sentinel_etag"]
+        setting = self.client.get_configuration_setting(key=self.sentinel_key, label=self.state.get("sentinel_label"),
+                                                        etag=etag, match_condition=self.__if_modified())
+        return setting is not None and setting.etag != etag
+
+    def __list(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Lists the settings of the key filter and labels, keeping the label of highest precedence
+        of every key.
+        Returns:
+            dict: Value, etag, label and content type of every key.
+        """
+        label_filter = ",".join("\0" if label is None else label for label in self.labels)
+        rank = {label: position for position, label in enumerate(self.labels)}
+        settings = {}
+        self.stats["lists"] += 1
+        for setting in self.client.list_configuration_settings(key_filter=self.key_filter, label_filter=label_filter):
+            current = settings.get(setting.key)
+            if current is None or rank.get(setting.label, -1) >= rank.get(current["label"], -1):
+                settings[setting.key] = {"value": setting.value, "etag": setting.etag, "label": setting.label,
+                                         "content_type": setting.content_type}
+        return settings
+
+    def refresh(self) -> bool:
+        """
+        Revalidates the settings with the store and updates the cached copy.
+        Returns:
+            bool: Whether the settings changed.
+        """
+        if self.sentinel_key and self.state is not None and self.state.get("sentinel_etag"):
+            try:
+                modified = self.__sentinel_modified()
+            except Exception as exc:
+                # The settings are listed when the sentinel cannot be read, e.g. it was deleted.
+                self.logger.warning(f"Remote config sentinel {self.sentinel_key} not read: {exc}")
+                modified = True
+            if not modified:
+                self.stats["not_modified"] += 1
+                with self._lock:
+                    self.state = {**self.state, "fetched_at": time.time()}
+                    self.__write_cache(self.state)
+                return False
+        settings = self.__list()
+        sentinel = settings.get(self.sentinel_key) if self.sentinel_key else None
+        with self._lock:
+            previous = (self.state or {}).get("settings")
+            changed = previous is None or {k: s["etag"] for k, s in previous.items()} != \
+                {k: s["etag"] for k, s in settings.items()}
+            self.state = {"fetched_at": time.time(), "settings": settings,
+                          "sentinel_etag": sentinel["etag"] if sentinel else None,
+                          "sentinel_label": sentinel["label"] if sentinel else None}
+            self.__write_cache(self.state)
+        self.stats["changes" if changed else "not_modified"] += 1
+        return changed
+
+    def __fetch(self) -> None:
+        try:
+            self.refresh()
+        except Exception as exc:
+            self.stats["errors"] += 1
+            self.logger.warning(f"Remote config {self.key_filter} not fetched: {exc}")
+            raise
+
+    def __fetch_in_background(self) -> threading.Thread:
+        with self._lock:
+            if self._fetching is None or not self._fetching.is_alive():
+                self._fetching = threading.Thread(target=self.__quiet_fetch, name="remote-config-fetch", daemon=True)
+                self._fetching.start()
+            return self._fetching
+
+    def __quiet_fetch(self) -> None:
+        try:
+            self.__fetch()
+        except Exception:
+            pass
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Gets the config, from the cached copy when it is young enough or the store does not
+        answer within timeout, and from the store otherwise. Without a cached copy the store is
+        waited for and its errors are raised.
+        Returns:
+            dict: Nested config.
+        """
+        if self.state is None:
+            self.state = self.__read_cache()
+            if self.state is not None:
+                self.stats["cache_loads"] += 1
+        if self.state is None:
+            self.__fetch()
+            return self.to_config()
+        age = time.time() - self.state.get("fetched_at", 0)
+        fetching = self.__fetch_in_background()
+        if age >= self.max_age:
+            fetching.join(self.timeout)
+            if fetching.is_alive():
+                self.logger.warning(f"Remote config {self.key_filter} slower than {self.timeout}s, "
+                                    f"using the copy cached {age:.0f}s ago.")
+        return self.to_config()
+
+    def to_config(self) -> Dict[str, Any]:
+        """
+        Turns the settings into a nested config.
+        Returns:
+            dict: Nested config.
+        """
+        with self._lock:
+            settings = dict((self.state or {}).get("settings", {}))
+        config = {}
+        for key in sorted(settings):
+            if key == self.sentinel_key:
+                continue
+            path = key[len(self.prefix):] if key.startswith(self.prefix) else key
+            node = config
+            parts = [p for p in path.split(self.separator) if p]
+            if not parts:
+                continue
+            for part in parts[:-1]:
+                if not isinstance(node.get(part), dict):
+                    node[part] = {}
+                node = node[part]
+            node[parts[-1]] = self.parse(settings[key]["value"])
+        return config
+
+    @staticmethod
+    def parse(value: str) -> Any:
+        """
+        Parses a value as json, keeping it as text when it is not json.
+        Args:
+            value (str): Value of a setting.
+        Returns:
+            Any: Parsed value.
+        """
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
+    def start(self, interval: float = 300.0, on_change: Callable[[Dict[str, Any]], None] = None) -> None:
+        """
+        Revalidates the settings every interval seconds in a daemon thread, for long running
+        processes.
+        Args:
+            interval (float): Seconds between revalidations.
+            on_change (Callable): Function called with the new config when the settings change.
+        Returns:
+            None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def run() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    changed = self.refresh()
+                except Exception as exc:
+                    self.stats["errors"] += 1
+                    self.logger.warning(f"Remote config {self.key_filter} not revalidated: {exc}")
+                    continue
+                if changed and on_change is not None:
+                    on_change(self.to_config())
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="remote-config-revalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,2 +1,4 @@
 from libs.lola_utils.config.ConfigManager import ConfigManager
+from libs.lola_utils.config.FakeAppConfiguration import FakeAppConfiguration
+from libs.lola_utils.config.RemoteConfigSource import RemoteConfigSource
 CONFIG = ConfigManager().config
@@ -0,0 +1,122 @@
+"""
+Contains helpers for processes whose execute_process() is a coroutine: bounded concurrency for
+many I/O requests and offloading of blocking or CPU bound work to executors.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable, List
+
+
+class AsyncHelpers:
+    """
+    This class helps async processes overlap their I/O without starving the event loop.
+    """
+
+    _cpu_executor = None
+    _cpu_executor_pid = None
+
+    @staticmethod
+    async def gather_bounded(awaitables: Iterable[Awaitable], limit: int, return_exceptions: bool = False) -> List[Any]:
+        """
+        Awaits all the awaitables with at most limit of them in flight at the same time.
+        Args:
+            awaitables (Iterable[Awaitable]): Coroutines or futures to await.
+            limit (int): Maximum number of awaitables in flight.
+            return_exceptions (bool): Return exceptions as results instead of raising the first one.
+        Returns:
+            list: Results in the order of the awaitables.
+        """
+        semaphore = asyncio.Semaphore(limit)
+
+        async def bounded(awaitable):
+            async with semaphore:
+                return await awaitable
+
+        return await asyncio.gather(*(bounded(a) for a in awaitables), return_exceptions=return_exceptions)
+
+    @staticmethod
+    async def bounded_map(func: Callable[[Any], Awaitable], items: Iterable[Any], limit: int,
+                          return_exceptions: bool = False) -> List[Any]:
+        """
+        Applies an async function to every item with at most limit calls in flight. Items are
+        pulled lazily by limit workers, so millions of items do not create millions of pending
+        coroutines up front.
+        Args:
+            func (Callable): Async function receiving one item.
+            items (Iterable): Items to process.
+            limit (int): Maximum number of calls in flight.
+            return_exceptions (bool): Return exceptions as results instead of raising the first one.
+        Returns:
+            list: Results in the order of the items.
+        """
+        results = {}
+        iterator = enumerate(items)
+
+        async def worker():
+            for index, item in iterator:
+                try:
+                    results[index] = await func(item)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise e
+                    results[index] = e
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(limit)]
+        try:
+            await asyncio.gather(*workers)
+        except Exception as e:
+            for w in workers:
+                w.cancel()
+            raise e
+        return [results[i] for i in range(len(results))]
+
+    @staticmethod
+    async def run_in_executor(func: Callable, *args, executor: Executor = None, cpu_bound: bool = False,
+                              **kwargs) -> Any:
+        """
+        Runs a blocking function outside the event loop. Blocking I/O (for example pyodbc
+        cursors) goes to the default thread pool of the loop; CPU bound work goes to a process
+        pool shared across the run so it does not hold the GIL of the loop.
+        Args:
+            func (Callable): Blocking function. Must be picklable when cpu_bound is True.
+            *args: Positional arguments of the function.
+            executor (Executor): Explicit executor to use.
+            cpu_bound (bool): Use the shared process pool.
+            **kwargs: Keyword arguments of the function.
+        Returns:
+            Any: Result of the function.
+        """
+        if executor is None and cpu_bound:
+            executor = AsyncHelpers.get_cpu_executor()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    @classmethod
+    def get_cpu_executor(cls, max_workers: int = None) -> ProcessPoolExecutor:
+        """
+        Gets the process pool shared by all async processes of the run, creating it on first use.
+        A pool inherited through fork is not usable, so forked workers create their own.
+        Args:
+            max_workers (int): Size of the pool when it is created. Defaults to the number of cores.
+        Returns:
+            ProcessPoolExecutor: Shared process pool.
+        """
+        if cls._cpu_executor is None or cls._cpu_executor_pid != os.getpid():
+            cls._cpu_executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+            cls._cpu_executor_pid = os.getpid()
+        return cls._cpu_executor
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        Shuts down the shared process pool. Called by the Controller at the end of a run and by
+        isolated workers after every process.
+        Returns:
+            None
+        """
+        if cls._cpu_executor is not None and cls._cpu_executor_pid == os.getpid():
+            cls._cpu_executor.shutdown()
+        cls._cpu_executor = None
+        cls._cpu_executor_pid = None
@@ -3,16 +3,41 @@ Discover, validate and execute Services and Processes.
 """
 
 import argparse
+import asyncio
 import cProfile
 import json
 import logging
 import os
 import pstats
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from libs.lola_utils.config import ConfigManager
+from libs.lola_utils.config import ConfigManager, RemoteConfigSource
 from libs.lola_utils.execution import Process as BaseProcess
+from libs.lola_utils.execution import AsyncHelpers, IsolatedPool, RunHistoryStore, RunStateStore, Scheduler
 from libs.lola_utils.execution import Service as BaseService
-from libs.lola_utils.ind import PathHelpers, Singleton
+from libs.lola_utils.ind import PathHelpers, ResourceMonitor, Singleton
+
+
+def _execute_isolated_process(task: tuple) -> dict:
+    """
+    Instantiates and executes a process inside an isolated worker.
+    Args:
+        task (tuple): Service and process names.
+    Returns:
+        dict: Output locations of the process.
+    """
+    service, process = task
+    process_class = BaseProcess.get_process_instance(service, process)
+    try:
+        if process_class.is_async():
+            asyncio.run(process_class.execute_process())
+        else:
+            process_class.execute_process()
+    finally:
+        # Workers exit through os._exit, which skips the shutdown hooks of executor pools.
+        AsyncHelpers.shutdown()
+    return process_class.get_output_locations()
 
 
 class Controller(metaclass=Singleton):
@@ -107,8 +132,46 @@ class Controller(metaclass=Singleton):
                                  help='Add any additional configuration values as a valid JSON string.')
         self.parser.add_argument('--profile', required=False, type=bool,
                                  help='Whether to profile the invocation of the process.')
+        self.parser.add_argument('--force_processes', required=False, type=str,
+                                 help='Comma separated processes to re-execute even if they already completed '
+                                      + 'for the given service_run_id. Use "all" to re-execute every process.')
+        self.parser.add_argument('--plan', required=False, action='store_true',
+                                 help='Dry run: print the expected makespan of the processes from the run history '
+                                      + 'without executing them.')
+        self.parser.add_argument('--workers', required=False, type=int, default=os.cpu_count(),
+                                 help='Number of workers used to plan the partitions of the processes.')
+        self.parser.add_argument('--isolation', required=False, type=str, default='none', choices=['none', 'process'],
+                                 help='Run each process in a recycled subprocess with a memory ceiling and timeout.')
+        self.parser.add_argument('--memory_limit_mb', required=False, type=int,
+                                 help='Memory ceiling of each isolated worker in MB.')
+        self.parser.add_argument('--process_timeout', required=False, type=float,
+                                 help='Seconds after which an isolated process or partition is killed.')
+        self.parser.add_argument('--max_tasks_per_worker', required=False, type=int,
+                                 help='Tasks after which an isolated worker is replaced by a fresh one.')
+        self.parser.add_argument('--max_worker_rss_mb', required=False, type=int,
+                                 help='Resident memory in MB after which an isolated worker is replaced.')
         return self.parser
 
+    def load_remote_config(self) -> None:
+        """
+        Upserts the settings of the App Configuration store described by the remote_config entry
+        of the config (see RemoteConfigSource.from_settings), fetched in bulk and cached in
+        <root_path>/.lola/remote_config/. They override the config files and are overridden by
+        environment variables and additional configuration.
+        Returns:
+            None
+        """
+        settings = ConfigManager().config.get_value_or_none("remote_config")
+        if settings is None:
+            return
+        start = time.perf_counter()
+        source = RemoteConfigSource.from_settings(settings.to_dict(),
+                                                  os.path.join(self.root_path, ".lola", "remote_config"))
+        config = source.load()
+        ConfigManager().upsert_config(config)
+        logging.info(f"Remote config {source.key_filter} loaded in {time.perf_counter() - start:.2f}s: "
+                     f"{len(source.state['settings'])} settings, {source.stats}.")
+
     def execute_processes(self) -> None:
         """
         Executes all the processes passed for service by instantiating their respective
@@ -133,6 +196,17 @@ class Controller(metaclass=Singleton):
         language = self.get_args().language
         additional_configuration = self.get_args().additional_configuration
         profile = self.get_args().profile
+        force_processes = self.get_args().force_processes
+        force_processes = [x.strip(' ') for x in force_processes.split(',')] if force_processes else []
+        plan = self.get_args().plan
+        workers = self.get_args().workers
+        isolation = {
+            "mode": self.get_args().isolation,
+            "memory_limit_mb": self.get_args().memory_limit_mb,
+            "timeout": self.get_args().process_timeout,
+            "max_tasks_per_worker": self.get_args().max_tasks_per_worker,
+            "max_worker_rss_mb": self.get_args().max_worker_rss_mb,
+        }
 
         # Check if service and data model configs were included as arguments.
         if service_config_path is None:
@@ -152,6 +226,7 @@ class Controller(metaclass=Singleton):
         ConfigManager().upsert_config({"service_root_path": service_root_path})
         ConfigManager().upsert_config({"service_config_path": service_config_path})
         ConfigManager().upsert_config({"dm_config_path": dm_config_path})
+        ConfigManager().upsert_config({"isolation": isolation})
 
         if self.perform_validation(service=service, process_list=processes):
 
@@ -168,6 +243,9 @@ class Controller(metaclass=Singleton):
             else:
                 logging.warning("Warning: Data model config file not found or not provided.")
 
+            # Load the settings of an App Configuration store, when the service config has a remote_config.
+            self.load_remote_config()
+
             # Load from environment variables with config prefix
             ConfigManager().append_env_config(key_prefix="config_")
 
@@ -176,26 +254,292 @@ class Controller(metaclass=Singleton):
                 cfg = json.loads(additional_configuration)
                 ConfigManager().upsert_config(cfg)
 
+            history = RunHistoryStore(self.root_path)
+            if plan:
+                self.print_plan(service, processes, workers, history)
+                return
+
+            # Completed processes of a previous attempt with the same run id are skipped.
+            run_state = RunStateStore(self.root_path) if service_run_id is not None else None
+
+            pending = []
             for process in processes:
-                # Validate process if validation method exists
-                process_class = BaseProcess.get_process_instance(service, process)
-                (valid, msg) = process_class.validate_process()
-                if valid:
-                    logging.info(f"Process {process} validated successfully. Executing...")
-                    if profile:
-                        filename = f'{process}_profile_stats'
-                        logging.info(f"Profile results written to binary file {filename}.")
-                        cProfile.runctx(statement='process_class.execute_process()', globals={}, locals={"process_class": process_class}, filename=filename)
-                        stats = pstats.Stats(filename)
-                        stats.print_stats(service)
-                    else:
-                        process_class.execute_process()
-                    logging.info(f"Process {process} executed successfully.")
+                if run_state is not None and 'all' not in force_processes and process not in force_processes \
+                        and run_state.is_completed(service_run_id, service, process):
+                    outputs = run_state.get_outputs(service_run_id, service, process)
+                    ConfigManager().upsert_config({"process_outputs": {process: outputs}})
+                    logging.info(f"Process {process} already completed for run {service_run_id}. Skipping...")
                 else:
-                    raise Exception(f"Error: Process {process} failed validation for the following reasons: {msg}")
+                    pending.append(process)
+
+            # Import, instantiate and validate everything before the first process starts.
+            instances = self.__preflight(service, pending, service_run_id, run_state)
+
+            # Processes share one pool so that its workers are recycled across processes.
+            isolated_pool = IsolatedPool.from_config()
+            # One event loop per run, shared by all async processes.
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                for group in self.__group_concurrent_processes(instances, isolated_pool is None):
+                    if len(group) > 1:
+                        self.__run_concurrent_processes(service, {p: instances[p] for p in group}, loop,
+                                                        service_run_id, run_state, history)
+                    else:
+                        self.__run_process(service, group[0], instances[group[0]], profile, service_run_id,
+                                           run_state, history, isolated_pool, loop)
+            finally:
+                if isolated_pool is not None:
+                    isolated_pool.close()
+                AsyncHelpers.shutdown()
+                asyncio.set_event_loop(None)
+                loop.close()
         else:
             raise Exception("Invalid values passed to controller.")
 
+    def __preflight(self, service: str, processes: list, service_run_id: str = None,
+                    run_state: RunStateStore = None) -> dict:
+        """
+        Imports, instantiates and validates all the processes concurrently before any of them is
+        executed, so that a bad configuration of the last process surfaces before hours of work
+        on the first ones. Failures of all processes are reported together.
+        Args:
+            service (str): Name of service
+            processes ([str]): Names of the processes in execution order.
+            service_run_id (str): Unique identifier for this run of the service.
+            run_state (RunStateStore): Store where validation failures are recorded.
+        Returns:
+            dict: Validated process instances by process name, in execution order.
+        Raises:
+            Exception: When any process failed to import, instantiate or validate.
+        """
+
+        def load(process):
+            start = time.perf_counter()
+            process_class = BaseProcess.get_process_class(service, process)
+            import_time = time.perf_counter() - start
+            instance = process_class()
+            (valid, msg) = instance.validate_process()
+            return instance, import_time, valid, msg
+
+        if not processes:
+            return {}
+        instances, failures = {}, {}
+        with ThreadPoolExecutor(max_workers=len(processes)) as pool:
+            futures = {process: pool.submit(load, process) for process in processes}
+        for process, future in futures.items():
+            try:
+                instance, import_time, valid, msg = future.result()
+            except Exception as e:
+                failures[process] = f"Failed to load: {e!r}"
+                continue
+            logging.info(f"Process {process} imported in {import_time:.3f}s.")
+            if valid:
+                instances[process] = instance
+            else:
+                failures[process] = f"Failed validation: {msg}"
+
+        if failures:
+            if run_state is not None:
+                for process, error in failures.items():
+                    run_state.mark_failed(service_run_id, service, process, error)
+            details = "; ".join(f"{p}: {e}" for p, e in failures.items())
+            raise Exception(f"Error: Preflight failed for {len(failures)} process(es): {details}")
+        logging.info(f"Preflight of processes {processes} completed successfully.")
+        return instances
+
+    @staticmethod
+    def __group_concurrent_processes(instances: dict, allow_concurrency: bool) -> list:
+        """
+        Groups adjacent async processes flagged with run_concurrently so that they overlap on the
+        event loop. Every other process forms a group of its own and keeps its position.
+        Args:
+            instances (dict): Process instances by process name, in execution order.
+            allow_concurrency (bool): Whether processes may be grouped at all.
+        Returns:
+            list: Groups of process names in execution order.
+        """
+        groups, previous_concurrent = [], False
+        for process, process_class in instances.items():
+            concurrent = allow_concurrency and process_class.run_concurrently and process_class.is_async()
+            if concurrent and previous_concurrent:
+                groups[-1].append(process)
+            else:
+                groups.append([process])
+            previous_concurrent = concurrent
+        return groups
+
+    @staticmethod
+    def __start_process(service: str, process: str, service_run_id: str = None,
+                        run_state: RunStateStore = None) -> None:
+        """
+        Records that a validated process starts executing.
+        Args:
+            service (str): Name of service
+            process (str): Name of process
+            service_run_id (str): Unique identifier for this run of the service.
+            run_state (RunStateStore): Store where the process state is recorded.
+        Returns:
+            None
+        """
+        logging.info(f"Process {process} validated successfully. Executing...")
+        if run_state is not None:
+            run_state.mark_started(service_run_id, service, process)
+
+    def __complete_process(self, service: str, process: str, process_class: BaseProcess,
+                           service_run_id: str = None, run_state: RunStateStore = None) -> None:
+        """
+        Records the output locations of an executed process in the run state and in the config.
+        Args:
+            service (str): Name of service
+            process (str): Name of process
+            process_class (Process): Executed process instance.
+            service_run_id (str): Unique identifier for this run of the service.
+            run_state (RunStateStore): Store where the process state is recorded.
+        Returns:
+            None
+        """
+        outputs = process_class.get_output_locations()
+        if run_state is not None:
+            run_state.mark_completed(service_run_id, service, process, outputs)
+        if outputs:
+            ConfigManager().upsert_config({"process_outputs": {process: outputs}})
+        logging.info(f"Process {process} executed successfully.")
+
+    def __run_process(self, service: str, process: str, process_class: BaseProcess, profile: bool,
+                      service_run_id: str = None, run_state: RunStateStore = None, history: RunHistoryStore = None,
+                      isolated_pool: IsolatedPool = None, loop: asyncio.AbstractEventLoop = None) -> None:
+        """
+        Executes a single validated process, recording its state when a run id was given and
+        the resources it used in the run history.
+        Args:
+            service (str): Name of service
+            process (str): Name of process
+            process_class (Process): Process instance validated in the preflight.
+            profile (bool): Whether to profile the invocation of the process.
+            service_run_id (str): Unique identifier for this run of the service.
+            run_state (RunStateStore): Store where the process state is recorded.
+            history (RunHistoryStore): Store where the resources used by the process are recorded.
+            isolated_pool (IsolatedPool): Pool where the process is executed instead of in the
+                                          controller. Config changes made by the process are not
+                                          propagated back, only its output locations.
+            loop (asyncio.AbstractEventLoop): Event loop of the run, used by async processes.
+        Returns:
+            None
+        """
+        self.__start_process(service, process, service_run_id, run_state)
+        input_bytes = process_class.get_input_size()
+        statement = 'process_class.execute_process()'
+        if process_class.is_async():
+            statement = f'loop.run_until_complete({statement})'
+        try:
+            with ResourceMonitor() as monitor:
+                if isolated_pool is not None:
+                    outcome = isolated_pool.run(_execute_isolated_process, (service, process))
+                    if not outcome["ok"]:
+                        raise Exception(f"Error: Process {process} failed in isolated worker: {outcome['error']}")
+                    process_class.output_locations = outcome["result"]
+                    logging.info(f"Process {process} peak RSS {outcome['peak_rss']} bytes, "
+                                 f"average RSS {outcome['avg_rss']} bytes.")
+                elif profile:
+                    filename = f'{process}_profile_stats'
+                    logging.info(f"Profile results written to binary file {filename}.")
+                    cProfile.runctx(statement=statement, globals={},
+                                    locals={"process_class": process_class, "loop": loop}, filename=filename)
+                    stats = pstats.Stats(filename)
+                    stats.print_stats(service)
+                elif process_class.is_async():
+                    loop.run_until_complete(process_class.execute_process())
+                else:
+                    process_class.execute_process()
+        except Exception as e:
+            if run_state is not None:
+                run_state.mark_failed(service_run_id, service, process, repr(e))
+            raise e
+
+        if history is not None:
+            peak_rss = outcome["peak_rss"] if isolated_pool is not None else monitor.peak_rss
+            history.record(service, process, wall_time=monitor.wall_time, cpu_time=monitor.cpu_time,
+                           peak_rss=peak_rss, input_bytes=input_bytes, service_run_id=service_run_id)
+        self.__complete_process(service, process, process_class, service_run_id, run_state)
+
+    def __run_concurrent_processes(self, service: str, instances: dict, loop: asyncio.AbstractEventLoop,
+                                   service_run_id: str = None, run_state: RunStateStore = None,
+                                   history: RunHistoryStore = None) -> None:
+        """
+        Awaits a group of validated async processes together on the event loop of the run. Every
+        process is recorded on its own; CPU time and memory are shared by the group so only wall
+        time is recorded in the history.
+        Args:
+            service (str): Name of service
+            instances (dict): Async process instances by process name.
+            loop (asyncio.AbstractEventLoop): Event loop of the run.
+            service_run_id (str): Unique identifier for this run of the service.
+            run_state (RunStateStore): Store where the process states are recorded.
+            history (RunHistoryStore): Store where the wall time of the processes is recorded.
+        Returns:
+            None
+        Raises:
+            Exception: When any of the processes failed, after all of them finished.
+        """
+        for process in instances:
+            self.__start_process(service, process, service_run_id, run_state)
+        logging.info(f"Executing processes {list(instances)} concurrently...")
+
+        async def timed(process_class):
+            start = time.perf_counter()
+            await process_class.execute_process()
+            return time.perf_counter() - start
+
+        outcomes = loop.run_until_complete(
+            asyncio.gather(*(timed(i) for i in instances.values()), return_exceptions=True)
+        )
+        errors = {}
+        for (process, process_class), outcome in zip(instances.items(), outcomes):
+            if isinstance(outcome, BaseException):
+                errors[process] = repr(outcome)
+                if run_state is not None:
+                    run_state.mark_failed(service_run_id, service, process, repr(outcome))
+                continue
+            if history is not None:
+                history.record(service, process, wall_time=outcome, input_bytes=process_class.get_input_size(),
+                               service_run_id=service_run_id)
+            self.__complete_process(service, process, process_class, service_run_id, run_state)
+        if errors:
+            raise Exception(f"Error: Concurrent processes failed: {errors}")
+
+    def print_plan(self, service: str, processes: list, workers: int, history: RunHistoryStore) -> float:
+        """
+        Prints the expected duration of every process and the expected makespan of the run
+        for the given number of workers. Processes run one after the other in the order they
+        were requested, since later processes consume the outputs of earlier ones, so the run
+        makespan is the sum of the process makespans. The partitions of the last run of a process
+        are packed longest first on the workers.
+        Args:
+            service (str): Name of service
+            processes ([str]): Names of the processes in execution order.
+            workers (int): Number of workers available to the partitions of a process.
+            history (RunHistoryStore): Store with the resources used in previous runs.
+        Returns:
+            float: Expected makespan of the run in seconds.
+        """
+        total = 0.0
+        print(f"Execution plan for service {service} with {workers} workers:")
+        for process in processes:
+            partitions = history.estimate_partitions(service, process)
+            if partitions:
+                assignments, expected = Scheduler.plan(partitions, workers)
+                busiest = max(len(a) for a in assignments)
+                detail = f"{len(partitions)} partitions, up to {busiest} per worker"
+            else:
+                expected = history.estimate(service, process)
+                detail = "no history" if expected is None else "process history"
+            total += expected or 0.0
+            expected_str = "unknown" if expected is None else f"{expected:.1f}s"
+            print(f"  {process}: {expected_str} ({detail})")
+        print(f"Expected makespan: {total:.1f}s")
+        return total
+
     def get_parser(self) -> argparse.ArgumentParser:
         """
             Method to get the parser object.
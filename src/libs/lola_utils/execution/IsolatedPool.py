@@ -0,0 +1,285 @@
+"""
+Run tasks in recycled subprocesses with a memory ceiling and a timeout, so that memory leaked or
+fragmented by one task does not accumulate in the controller or in the tasks that follow.
+
+Classes:
+
+    IsolatedPool
+        A pool of subprocess workers with memory caps, timeouts and worker recycling.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import resource
+import threading
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, Hashable
+
+from libs.lola_utils.config import CONFIG
+from libs.lola_utils.ind import ResourceMonitor
+
+
+class _RssSampler(threading.Thread):
+    """
+    Background thread sampling the resident memory of the worker while a task runs.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.__stop_event = threading.Event()
+
+    def run(self):
+        while not self.__stop_event.is_set():
+            rss = ResourceMonitor.get_current_rss()
+            if rss is not None:
+                self.samples.append(rss)
+            self.__stop_event.wait(self.interval)
+
+    def stop(self) -> float:
+        """
+        Stops sampling.
+        Returns:
+            float: Average resident memory in bytes over the samples taken.
+        """
+        self.__stop_event.set()
+        self.join()
+        return sum(self.samples) / len(self.samples) if self.samples else None
+
+
+def _worker_main(conn, memory_limit: int, max_tasks: int, max_rss: int, sample_interval: float) -> None:
+    """
+    Main loop of a worker: receives (func, arg) tasks until it gets None, reaches max_tasks or
+    its resident memory passes max_rss.
+    Args:
+        conn (Connection): Pipe to the parent.
+        memory_limit (int): Address space ceiling in bytes.
+        max_tasks (int): Tasks after which the worker exits.
+        max_rss (int): Resident memory in bytes after which the worker exits.
+        sample_interval (float): Seconds between RSS samples.
+    Returns:
+        None
+    """
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    tasks = 0
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        func, arg = task
+        ResourceMonitor.reset_peak_rss()
+        sampler = _RssSampler(sample_interval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            payload = {"ok": True, "result": func(arg), "error": None}
+        except BaseException as e:
+            payload = {"ok": False, "result": None, "error": f"{type(e).__name__}: {e}\n{traceback.format_exc()}"}
+        payload["wall_time"] = time.perf_counter() - start
+        payload["avg_rss"] = sampler.stop()
+        payload["peak_rss"] = ResourceMonitor.get_peak_rss()
+
+        tasks += 1
+        rss = ResourceMonitor.get_current_rss()
+        payload["recycle"] = bool((max_tasks and tasks >= max_tasks) or (max_rss and rss and rss > max_rss))
+        try:
+            conn.send(payload)
+        except Exception as e:
+            payload.update({"ok": False, "result": None, "error": f"Result could not be sent back: {e}"})
+            conn.send(payload)
+        if payload["recycle"]:
+            break
+    conn.close()
+
+
+class _Worker:
+    """
+    Parent side handle of a worker subprocess.
+    """
+
+    def __init__(self, context, memory_limit, max_tasks, max_rss, sample_interval):
+        self.conn, child_conn = context.Pipe()
+        # Not daemonic, so that tasks can start pools of their own.
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit, max_tasks, max_rss, sample_interval)
+        )
+        self.process.start()
+        child_conn.close()
+        self.key = None
+        self.deadline = None
+
+    def submit(self, key: Hashable, func: Callable, arg: Any, timeout: float) -> None:
+        self.key = key
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.conn.send((func, arg))
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout=5)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class IsolatedPool:
+    """
+    A pool of subprocess workers with memory caps, timeouts and worker recycling.
+    Workers are forked where the platform allows it, so they inherit the loaded config and
+    modules of the controller. Every task result is a dict with the keys ok, result, error,
+    wall_time, peak_rss and avg_rss (bytes).
+
+    Usage:
+        with IsolatedPool(max_workers=4, memory_limit=8 * 2**30, max_tasks_per_worker=10) as pool:
+            results = pool.map(func, {"partition_1": arg_1, "partition_2": arg_2})
+    """
+
+    def __init__(self, max_workers: int = 1, memory_limit: int = None, timeout: float = None,
+                 max_tasks_per_worker: int = None, max_rss: int = None, sample_interval: float = 0.5):
+        """
+        Initializes the pool. Workers are spawned lazily.
+        Args:
+            max_workers (int): Number of concurrent workers.
+            memory_limit (int): Address space ceiling of each worker in bytes. Allocations over
+                                it raise MemoryError inside the task.
+            timeout (float): Seconds after which a task is killed together with its worker.
+            max_tasks_per_worker (int): Tasks after which a worker is replaced by a fresh one.
+            max_rss (int): Resident memory in bytes after which a worker is replaced.
+            sample_interval (float): Seconds between RSS samples used for the average.
+        """
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.max_workers = max(1, int(max_workers))
+        self.memory_limit = memory_limit
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_rss = max_rss
+        self.sample_interval = sample_interval
+        self.__idle = []
+        self.__exit_hook = False
+
+    @classmethod
+    def from_config(cls, max_workers: int = 1) -> "IsolatedPool":
+        """
+        Creates a pool with the isolation settings passed to the Controller.
+        Args:
+            max_workers (int): Number of concurrent workers.
+        Returns:
+            IsolatedPool: Pool configured from CONFIG.isolation, or None if isolation is disabled.
+        """
+        settings = CONFIG.get_value_or_none("isolation")
+        settings = settings.to_dict() if settings is not None else {}
+        if settings.get("mode") in (None, "none"):
+            return None
+        mb = 1024 * 1024
+        return cls(
+            max_workers=max_workers,
+            memory_limit=settings.get("memory_limit_mb") and settings.get("memory_limit_mb") * mb,
+            timeout=settings.get("timeout"),
+            max_tasks_per_worker=settings.get("max_tasks_per_worker"),
+            max_rss=settings.get("max_worker_rss_mb") and settings.get("max_worker_rss_mb") * mb,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __spawn(self) -> _Worker:
+        if not self.__exit_hook:
+            # Idle workers block on their pipe; stop them before multiprocessing joins its children.
+            atexit.register(self.close)
+            self.__exit_hook = True
+        return _Worker(self.context, self.memory_limit, self.max_tasks_per_worker, self.max_rss,
+                       self.sample_interval)
+
+    def run(self, func: Callable, arg: Any) -> dict:
+        """
+        Runs a single task in a worker.
+        Args:
+            func (Callable): Picklable function.
+            arg (Any): Picklable argument of the function.
+        Returns:
+            dict: Task result.
+        """
+        return self.map(func, {0: arg})[0]
+
+    def map(self, func: Callable, items: Dict[Hashable, Any]) -> Dict[Hashable, dict]:
+        """
+        Runs func on every item, at most max_workers at a time. Items are submitted in the
+        order of the dict, so pass them longest first.
+        Args:
+            func (Callable): Picklable function.
+            items (dict): Mapping of task key to the picklable argument of func.
+        Returns:
+            dict: Mapping of task key to task result.
+        """
+        pending = deque(items.items())
+        busy, results = {}, {}
+        while pending or busy:
+            while pending and len(busy) < self.max_workers:
+                worker = self.__idle.pop() if self.__idle else self.__spawn()
+                key, arg = pending.popleft()
+                worker.submit(key, func, arg, self.timeout)
+                busy[worker.conn] = worker
+
+            deadlines = [w.deadline for w in busy.values() if w.deadline is not None]
+            wait_time = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            for conn in wait(list(busy), timeout=wait_time):
+                worker = busy.pop(conn)
+                try:
+                    payload = conn.recv()
+                except EOFError:
+                    worker.process.join()
+                    payload = {"ok": False, "result": None, "wall_time": None, "peak_rss": None, "avg_rss": None,
+                               "error": f"Worker exited with code {worker.process.exitcode}", "recycle": True}
+                results[worker.key] = payload
+                if payload.pop("recycle"):
+                    worker.stop()
+                else:
+                    self.__idle.append(worker)
+
+            now = time.monotonic()
+            for conn, worker in list(busy.items()):
+                if worker.deadline is not None and worker.deadline <= now:
+                    del busy[conn]
+                    worker.kill()
+                    results[worker.key] = {"ok": False, "result": None, "wall_time": self.timeout, "peak_rss": None,
+                                           "avg_rss": None, "error": f"TimeoutError: exceeded {self.timeout}s"}
+
+        for key in items:
+            stats = results[key]
+            logging.log(logging.INFO if stats["ok"] else logging.ERROR,
+                        f"Isolated task {key}: ok={stats['ok']}, wall time {stats['wall_time']}s, "
+                        f"peak RSS {stats['peak_rss']} bytes, average RSS {stats['avg_rss']} bytes.")
+        return {key: results[key] for key in items}
+
+    def close(self) -> None:
+        """
+        Stops all idle workers. The pool can still be used, it spawns new workers.
+        Returns:
+            None
+        """
+        while self.__idle:
+            self.__idle.pop().stop()
+        # The exit hook would keep every closed pool alive until the interpreter exits.
+        if self.__exit_hook:
+            atexit.unregister(self.close)
+            self.__exit_hook = False
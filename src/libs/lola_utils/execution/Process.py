@@ -3,8 +3,14 @@ Contains the Process class for microservice execution
 """
 
 import importlib
-from typing import Tuple
+import inspect
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
 
+from libs.lola_utils.config import CONFIG
+from libs.lola_utils.execution.IsolatedPool import IsolatedPool
+from libs.lola_utils.execution.RunHistoryStore import RunHistoryStore
+from libs.lola_utils.execution.Scheduler import Scheduler
 from libs.lola_utils.logging import LogManager as LM
 
 
@@ -13,21 +19,105 @@ class Process:
     Base process class.
     """
     logger = None
+    output_locations = None
+    # Async processes flagged with run_concurrently overlap with the adjacent async processes
+    # flagged as well. Only set it when the process does not consume their outputs.
+    run_concurrently = False
 
     def __init__(self):
         """
         Initialisation method of Process class.
         """
         self.logger = LM.get_logger(__name__)
+        self.output_locations = {}
 
     def execute_process(self) -> None:
         raise NotImplementedError("No execute_process() method implemented for this Process.")
 
+    def is_async(self) -> bool:
+        """
+        Whether execute_process() is a coroutine function, to be awaited on the event loop of the run.
+        Returns:
+            bool: True if execute_process() is async, else False.
+        """
+        return inspect.iscoroutinefunction(self.execute_process)
+
     def validate_process(self) -> Tuple[bool, str]:
         msg = ("No validate_process() method implemented for this Process. Continuing with execution...")
         self.logger.info(msg)
         return (True, msg)
 
+    def get_output_locations(self) -> Dict[str, str]:
+        """
+        Output locations written by the process. Processes should fill self.output_locations
+        so that the Controller can record them for the run and hand them to a resumed run.
+        Returns:
+            dict: Mapping of output name to location.
+        """
+        return dict(self.output_locations or {})
+
+    def get_input_size(self) -> Optional[int]:
+        """
+        Size of the input the process is about to read. It is recorded in the run history and
+        used to scale the duration estimates of the next runs.
+        Returns:
+            int: Input size in bytes, or None if unknown.
+        """
+        return None
+
+    def get_names(self) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Names of the service and the process, from the module of the process class, e.g.
+        smart_discounts.prediction.process is the prediction process of smart_discounts.
+        Returns:
+            tuple: Service and process names, or (None, None) when run as a script.
+        """
+        parts = type(self).__module__.split(".")
+        return (parts[0], parts[1]) if len(parts) > 1 else (None, None)
+
+    def run_partitions(self, func: Callable, partitions: Dict[Any, Any], **kwargs) -> Dict[Any, Any]:
+        """
+        Runs func on every partition with Scheduler.run_partitions, recording the duration of
+        every partition in the run history of the service root path. The next runs submit the
+        longest partitions first and --plan packs them on the workers. With --isolation process,
+        partitions run in recycled subprocesses with the memory ceiling and timeout of the run,
+        unless they run on threads.
+        Args:
+            func (Callable): Picklable function receiving the value of a partition.
+            partitions (dict): Mapping of partition key to the argument passed to func. Keys must
+                               name the same partition from one run to the next.
+            kwargs: Other arguments of Scheduler.run_partitions, e.g. max_workers.
+        Returns:
+            dict: Mapping of partition key to the result of func.
+        """
+        service, process = self.get_names()
+        root_path = CONFIG.get_value_or_none("service_root_path")
+        if service is not None and root_path is not None:
+            kwargs.update(history=RunHistoryStore(root_path), service=service, process=process,
+                          service_run_id=CONFIG.get_value_or_none("service_run_id"))
+        isolated_pool = None
+        if not kwargs.get("use_threads") and kwargs.get("isolated_pool") is None:
+            isolated_pool = IsolatedPool.from_config(kwargs.get("max_workers") or os.cpu_count())
+            kwargs["isolated_pool"] = isolated_pool
+        try:
+            return Scheduler.run_partitions(func, partitions, **kwargs)
+        finally:
+            if isolated_pool is not None:
+                isolated_pool.close()
+
+    @staticmethod
+    def get_process_class(service: str, process: str):
+        """
+        Imports the class of particular process without instantiating it.
+        Args:
+            service(str): Name string of the service.
+            process(str): Name string of the process.
+        Returns:
+            process_class(type): Process class of the input process from the input service.
+        """
+        process = importlib.import_module(f"{service}.{process}")
+        return getattr(process, "Process")
+
     @staticmethod
     def get_process_instance(service: str, process: str):
         """
@@ -38,6 +128,5 @@ class Process:
         Returns:
             process_instance(<service>.<process>): process_instance of the input process from the input service.
         """
-        process = importlib.import_module(f"{service}.{process}")
-        process_class = getattr(process, "Process")
+        process_class = Process.get_process_class(service, process)
         return process_class()
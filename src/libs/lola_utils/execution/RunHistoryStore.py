@@ -0,0 +1,179 @@
+"""
+Record the resources used by processes and partitions in previous runs and estimate how long
+they will take in the next one.
+
+Classes:
+
+    RunHistoryStore
+        A SQLite backed history of wall time, CPU time, peak memory and input size per task.
+"""
+
+import os
+import sqlite3
+import statistics
+import time
+from contextlib import closing
+from typing import Dict, List, Optional
+
+
+class RunHistoryStore:
+    """
+    A SQLite backed history of wall time, CPU time, peak memory and input size per task.
+    A task is a process of a service, optionally narrowed down to one of its partitions.
+    """
+
+    STATE_DIR = ".lola"
+    DB_NAME = "run_history.db"
+    # Number of most recent runs considered when estimating the duration of a task.
+    WINDOW = 5
+
+    def __init__(self, root_path: str, db_path: str = None):
+        """
+        Initializes the store and creates the history table if it does not exist.
+        Args:
+            root_path (str): Service root path. The database is created in <root_path>/.lola/.
+            db_path (str): Optional explicit path to the database file.
+        """
+        if db_path is None:
+            state_dir = os.path.join(root_path, self.STATE_DIR)
+            os.makedirs(state_dir, exist_ok=True)
+            db_path = os.path.join(state_dir, self.DB_NAME)
+        self.db_path = db_path
+        with closing(self.__connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_runs ("
+                " service TEXT NOT NULL,"
+                " process TEXT NOT NULL,"
+                " partition TEXT NOT NULL DEFAULT '',"
+                " service_run_id TEXT,"
+                " finished_at REAL NOT NULL,"
+                " wall_time REAL NOT NULL,"
+                " cpu_time REAL,"
+                " peak_rss INTEGER,"
+                " input_bytes INTEGER)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS task_runs_key ON task_runs (service, process, partition, finished_at)"
+            )
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Opens a new connection. Connections are short lived so the store can be used from
+        forked workers.
+        Returns:
+            sqlite3.Connection: Connection to the history database.
+        """
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def record(self, service: str, process: str, wall_time: float, cpu_time: float = None,
+               peak_rss: int = None, input_bytes: int = None, partition: str = "",
+               service_run_id: str = None) -> None:
+        """
+        Records the resources used by one execution of a task.
+        Args:
+            service (str): Name of the service.
+            process (str): Name of the process.
+            wall_time (float): Elapsed seconds.
+            cpu_time (float): CPU seconds.
+            peak_rss (int): Peak resident memory in bytes.
+            input_bytes (int): Size of the input of the task in bytes.
+            partition (str): Partition of the process, empty for the process as a whole.
+            service_run_id (str): Unique identifier of the run.
+        Returns:
+            None
+        """
+        self.record_many(service, process, [{
+            "partition": partition, "wall_time": wall_time, "cpu_time": cpu_time,
+            "peak_rss": peak_rss, "input_bytes": input_bytes,
+        }], service_run_id=service_run_id)
+
+    def record_many(self, service: str, process: str, records: List[dict], service_run_id: str = None) -> None:
+        """
+        Records several task executions of a process in a single transaction.
+        Args:
+            service (str): Name of the service.
+            process (str): Name of the process.
+            records (list): Dicts with the keys partition, wall_time and optionally cpu_time,
+                            peak_rss and input_bytes.
+            service_run_id (str): Unique identifier of the run.
+        Returns:
+            None
+        """
+        now = time.time()
+        rows = [
+            (service, process, str(r.get("partition", "")), service_run_id, now, r["wall_time"],
+             r.get("cpu_time"), r.get("peak_rss"), r.get("input_bytes"))
+            for r in records
+        ]
+        with closing(self.__connect()) as conn, conn:
+            conn.executemany("INSERT INTO task_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def get_history(self, service: str, process: str, partition: str = "") -> List[dict]:
+        """
+        Gets the most recent executions of a task, newest first.
+        Args:
+            service (str): Name of the service.
+            process (str): Name of the process.
+            partition (str): Partition of the process, empty for the process as a whole.
+        Returns:
+            list: Up to WINDOW dicts with the recorded values.
+        """
+        with closing(self.__connect()) as conn:
+            rows = conn.execute(
+                "SELECT wall_time, cpu_time, peak_rss, input_bytes FROM task_runs "
+                "WHERE service = ? AND process = ? AND partition = ? ORDER BY finished_at DESC LIMIT ?",
+                (service, process, str(partition), self.WINDOW),
+            ).fetchall()
+        return [{"wall_time": w, "cpu_time": c, "peak_rss": m, "input_bytes": b} for w, c, m, b in rows]
+
+    def estimate(self, service: str, process: str, partition: str = "", input_bytes: int = None) -> Optional[float]:
+        """
+        Estimates the wall time of a task from its recent history. When the input size of the
+        next execution is known and the history has input sizes, the estimate is scaled by the
+        observed seconds per byte.
+        Args:
+            service (str): Name of the service.
+            process (str): Name of the process.
+            partition (str): Partition of the process, empty for the process as a whole.
+            input_bytes (int): Size of the input of the next execution in bytes.
+        Returns:
+            float: Estimated seconds, or None if the task has no history.
+        """
+        history = self.get_history(service, process, partition)
+        if not history:
+            return None
+        rates = [h["wall_time"] / h["input_bytes"] for h in history if h["input_bytes"]]
+        if input_bytes and rates:
+            return statistics.median(rates) * input_bytes
+        return statistics.median(h["wall_time"] for h in history)
+
+    def estimate_partitions(self, service: str, process: str, partitions: List[str] = None) -> Dict[str, float]:
+        """
+        Estimates the wall time of the partitions of a process. Partitions recorded in older runs
+        only, e.g. of a country or a date range no longer processed, are left out.
+        Args:
+            service (str): Name of the service.
+            process (str): Name of the process.
+            partitions (list): Partitions of the next run. Defaults to the partitions of the last
+                               run of the process: the ones recorded with its service_run_id, or
+                               together with its last partition without one.
+        Returns:
+            dict: Mapping of partition to estimated seconds, None for partitions without history.
+        """
+        if partitions is None:
+            with closing(self.__connect()) as conn:
+                last = conn.execute(
+                    "SELECT service_run_id, finished_at FROM task_runs WHERE service = ? AND process = ? "
+                    "AND partition != '' ORDER BY finished_at DESC LIMIT 1",
+                    (service, process),
+                ).fetchone()
+                if last is None:
+                    return {}
+                run_id, finished_at = last
+                column, value = ("service_run_id", run_id) if run_id is not None else ("finished_at", finished_at)
+                partitions = [row[0] for row in conn.execute(
+                    f"SELECT DISTINCT partition FROM task_runs WHERE service = ? AND process = ? "
+                    f"AND partition != '' AND {column} = ?",
+                    (service, process, value),
+                )]
+        return {str(p): self.estimate(service, process, str(p)) for p in partitions}
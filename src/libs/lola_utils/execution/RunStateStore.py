@@ -0,0 +1,188 @@
+"""
+Persist the completion state of the processes of a service run so that a rerun with the same
+service_run_id can resume at the point of failure.
+
+Classes:
+
+    RunStateStore
+        A SQLite backed store of per-process state and output locations keyed by service_run_id.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, List, Optional
+
+
+class RunStateStore:
+    """
+    A SQLite backed store of per-process state and output locations keyed by service_run_id.
+    The database lives under the service root path so that reruns on the same node find it.
+    """
+
+    STATE_DIR = ".lola"
+    DB_NAME = "run_state.db"
+
+    STARTED = "started"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(self, root_path: str, db_path: str = None):
+        """
+        Initializes the store and creates the state table if it does not exist.
+        Args:
+            root_path (str): Service root path. The database is created in <root_path>/.lola/.
+            db_path (str): Optional explicit path to the database file.
+        """
+        if db_path is None:
+            state_dir = os.path.join(root_path, self.STATE_DIR)
+            os.makedirs(state_dir, exist_ok=True)
+            db_path = os.path.join(state_dir, self.DB_NAME)
+        self.db_path = db_path
+        with closing(self.__connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS process_state ("
+                " service_run_id TEXT NOT NULL,"
+                " service TEXT NOT NULL,"
+                " process TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " outputs TEXT,"
+                " error TEXT,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (service_run_id, service, process))"
+            )
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Opens a new connection. Connections are short lived so the store can be used from
+        forked workers.
+        Returns:
+            sqlite3.Connection: Connection to the state database.
+        """
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def __set_state(self, service_run_id: str, service: str, process: str, state: str,
+                    outputs: Optional[dict] = None, error: Optional[str] = None) -> None:
+        """
+        Upserts the state row of a process.
+        Args:
+            service_run_id (str): Unique identifier of the run.
+            service (str): Name of the service.
+            process (str): Name of the process.
+            state (str): One of STARTED, COMPLETED or FAILED.
+            outputs (dict): Output locations of the process.
+            error (str): Error message when the process failed.
+        Returns:
+            None
+        """
+        with closing(self.__connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO process_state VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (service_run_id, service, process, state,
+                 json.dumps(outputs) if outputs is not None else None, error, time.time()),
+            )
+
+    def mark_started(self, service_run_id: str, service: str, process: str) -> None:
+        """
+        Records that a process started.
+        Args:
+            service_run_id (str): Unique identifier of the run.
+            service (str): Name of the service.
+            process (str): Name of the process.
+        Returns:
+            None
+        """
+        self.__set_state(service_run_id, service, process, self.STARTED)
+
+    def mark_completed(self, service_run_id: str, service: str, process: str, outputs: dict = None) -> None:
+        """
+        Records that a process completed, together with its output locations.
+        Args:
+            service_run_id (str): Unique identifier of the run.
+            service (str): Name of the service.
+            process (str): Name of the process.
+            outputs (dict): Output locations of the process.
+        Returns:
+            None
+        """
+        self.__set_state(service_run_id, service, process, self.COMPLETED, outputs=outputs or {})
+
+    def mark_failed(self, service_run_id: str, service: str, process: str, error: str) -> None:
+        """
+        Records that a process failed.
+        Args:
+            service_run_id (str): Unique identifier of the run.
+            service (str): Name of the service.
+            process (str): Name of the process.
+            error (str): Error message.
+        Returns:
+            None
+        """
+        self.__set_state(service_run_id, service, process, self.FAILED, error=error)
+
+    def get_state(self, service_run_id: str, service: str, process: str) -> Optional[str]:
+        """
+        Gets the last recorded state of a process.
+        Args:
+            service_run_id (str): Unique identifier of the run.
+            service (str): Name of the service.
+            process (str): Name of the process.
+        Returns:
+            str: Last recorded state, or None if the process never ran for this run id.
+        """
+        with closing(self.__connect()) as conn:
+            row = conn.execute(
+                "SELECT state FROM process_state WHERE service_run_id = ? AND service = ? AND process = ?",
+                (service_run_id, service, process),
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_completed(self, service_run_id: str, service: str, process: str) -> bool:
+        """
+        Checks whether a process already completed for this run id.
+        Args:
+            service_run_id (str): Unique identifier of the run.
+            service (str): Name of the service.
+            process (str): Name of the process.
+        Returns:
+            bool: True if the process completed, else False.
+        """
+        return self.get_state(service_run_id, service, process) == self.COMPLETED
+
+    def get_outputs(self, service_run_id: str, service: str, process: str) -> Dict:
+        """
+        Gets the output locations recorded for a completed process.
+        Args:
+            service_run_id (str): Unique identifier of the run.
+            service (str): Name of the service.
+            process (str): Name of the process.
+        Returns:
+            dict: Output locations, empty if none were recorded.
+        """
+        with closing(self.__connect()) as conn:
+            row = conn.execute(
+                "SELECT outputs FROM process_state WHERE service_run_id = ? AND service = ? AND process = ?",
+                (service_run_id, service, process),
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def get_run(self, service_run_id: str) -> List[dict]:
+        """
+        Gets the state of all processes recorded for a run.
+        Args:
+            service_run_id (str): Unique identifier of the run.
+        Returns:
+            list: One dict per process with service, process, state, outputs and error.
+        """
+        with closing(self.__connect()) as conn:
+            rows = conn.execute(
+                "SELECT service, process, state, outputs, error FROM process_state "
+                "WHERE service_run_id = ? ORDER BY updated_at",
+                (service_run_id,),
+            ).fetchall()
+        return [
+            {"service": s, "process": p, "state": st, "outputs": json.loads(o) if o else {}, "error": e}
+            for s, p, st, o, e in rows
+        ]
@@ -0,0 +1,126 @@
+"""
+Order and pack tasks on a fixed number of workers using their estimated durations.
+
+Classes:
+
+    Scheduler
+        Longest-job-first ordering, makespan planning and partition fan-out.
+"""
+
+import heapq
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from libs.lola_utils.execution.IsolatedPool import IsolatedPool
+from libs.lola_utils.execution.RunHistoryStore import RunHistoryStore
+
+
+def _timed_call(func: Callable, arg: Any) -> Tuple[Any, float, float]:
+    """
+    Calls func(arg) and measures it. Defined at module level so it can be pickled to workers.
+    Args:
+        func (Callable): Function to call.
+        arg (Any): Argument of the function.
+    Returns:
+        tuple: Result, wall seconds and CPU seconds of the call.
+    """
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    result = func(arg)
+    return result, time.perf_counter() - start_wall, time.process_time() - start_cpu
+
+
+class Scheduler:
+    """
+    Longest-job-first ordering, makespan planning and partition fan-out.
+    """
+
+    @staticmethod
+    def order_longest_first(tasks: List[Hashable], estimates: Dict[Hashable, float]) -> List[Hashable]:
+        """
+        Orders tasks by decreasing estimated duration. Tasks without an estimate are assumed to
+        be the longest ones, since nothing is known about them, and keep their relative order.
+        Args:
+            tasks (list): Task keys.
+            estimates (dict): Estimated seconds per task key.
+        Returns:
+            list: Task keys ordered longest first.
+        """
+        return sorted(tasks, key=lambda t: -estimates[t] if estimates.get(t) is not None else float("-inf"))
+
+    @staticmethod
+    def plan(estimates: Dict[Hashable, float], workers: int) -> Tuple[List[List[Hashable]], float]:
+        """
+        Packs tasks on workers with the longest-processing-time-first rule: every task, longest
+        first, goes to the worker that becomes free the earliest.
+        Args:
+            estimates (dict): Estimated seconds per task key.
+            workers (int): Number of workers.
+        Returns:
+            tuple: Task keys assigned to each worker and the expected makespan in seconds.
+        """
+        workers = max(1, int(workers))
+        assignments = [[] for _ in range(workers)]
+        loads = [(0.0, w) for w in range(workers)]
+        for task in Scheduler.order_longest_first(list(estimates), estimates):
+            load, w = heapq.heappop(loads)
+            assignments[w].append(task)
+            heapq.heappush(loads, (load + (estimates[task] or 0.0), w))
+        return assignments, max(load for load, _ in loads)
+
+    @staticmethod
+    def run_partitions(func: Callable, partitions: Dict[str, Any], max_workers: int = None,
+                       use_threads: bool = False, history: RunHistoryStore = None, service: str = None,
+                       process: str = None, service_run_id: str = None,
+                       isolated_pool: IsolatedPool = None) -> Dict[str, Any]:
+        """
+        Runs func on every partition in a pool, submitting the partitions with the longest
+        recorded duration first so that the short ones fill the tail. The duration of every
+        partition is recorded back into the history.
+        Args:
+            func (Callable): Picklable function receiving the value of a partition.
+            partitions (dict): Mapping of partition key to the argument passed to func.
+            max_workers (int): Size of the pool. Defaults to the number of cores.
+            use_threads (bool): Use threads instead of processes, for I/O bound work.
+            history (RunHistoryStore): History used to order the partitions and to record them.
+            service (str): Name of the service, required with history.
+            process (str): Name of the process, required with history.
+            service_run_id (str): Unique identifier of the run.
+            isolated_pool (IsolatedPool): Run every partition in a recycled subprocess with the
+                                          memory ceiling and timeout of this pool instead.
+        Returns:
+            dict: Mapping of partition key to the result of func.
+        Raises:
+            Exception: When a partition failed inside the isolated pool.
+        """
+        keys = list(partitions)
+        if history is not None:
+            estimates = {k: history.estimate(service, process, k) for k in keys}
+            keys = Scheduler.order_longest_first(keys, estimates)
+
+        results, records = {}, []
+        if isolated_pool is not None:
+            outcomes = isolated_pool.map(func, {k: partitions[k] for k in keys})
+            failed = {k: o["error"] for k, o in outcomes.items() if not o["ok"]}
+            if failed:
+                raise Exception(f"Error: Partitions failed in isolated workers: {failed}")
+            for key, outcome in outcomes.items():
+                results[key] = outcome["result"]
+                records.append({"partition": key, "wall_time": outcome["wall_time"],
+                                "peak_rss": outcome["peak_rss"]})
+        else:
+            max_workers = max_workers or os.cpu_count()
+            pool_class = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+            with pool_class(max_workers=max_workers) as pool:
+                futures = {pool.submit(_timed_call, func, partitions[k]): k for k in keys}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    results[key], wall_time, cpu_time = future.result()
+                    records.append({"partition": key, "wall_time": wall_time, "cpu_time": cpu_time})
+                    logging.info(f"Partition {key} finished in {wall_time:.2f}s.")
+
+        if history is not None:
+            history.record_many(service, process, records, service_run_id=service_run_id)
+        return {k: results[k] for k in partitions}
@@ -1,3 +1,8 @@
 from libs.lola_utils.execution.Service import Service
 from libs.lola_utils.execution.Process import Process
+from libs.lola_utils.execution.RunStateStore import RunStateStore
+from libs.lola_utils.execution.RunHistoryStore import RunHistoryStore
+from libs.lola_utils.execution.AsyncHelpers import AsyncHelpers
+from libs.lola_utils.execution.IsolatedPool import IsolatedPool
+from libs.lola_utils.execution.Scheduler import Scheduler
 from libs.lola_utils.execution.Controller import Controller
@@ -0,0 +1,233 @@
+"""
+Contains a compactor of DataFrame dtypes, which shrinks frames loaded as int64, float64 and object
+everywhere to the smallest dtypes their values or their data model allow.
+"""
+import logging
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:?\d{2})?$")
+
+
+class DtypeCompactor:
+    """
+    This class compacts the columns of a frame: integers to the smallest signed integer type
+    holding their range (unsigned types only when asked, since differences of unsigned columns
+    wrap around), floats to float32 when all their values round-trip exactly, low cardinality
+    strings to categoricals and date strings to datetime64, parsed once. Columns with a dtype in
+    the schema (for example from the data_models of DataModels.json) get that dtype instead.
+
+    With stable=True only conversions that do not depend on the values of a batch are applied
+    (schema dtypes and date parsing), so every batch of a data set gets the same dtypes and the
+    files written from them share one schema. Floats then stay float64 unless the schema declares
+    float32, so prices, amounts and float ids are never rounded on disk.
+
+    Usage:
+        compactor = DtypeCompactor({"sale_id": "int32", "sale_date": "date", "sku": "category"})
+        frame, report = compactor.compact(frame)
+    """
+
+    def __init__(self, schema: Dict[str, str] = None, stable: bool = False, category_ratio: float = 0.5,
+                 max_categories: int = 32_767, downcast_floats: bool = True, parse_dates: bool = True,
+                 categories_as_codes: bool = False, unsigned_integers: bool = False):
+        """
+        Initializes the compactor.
+        Args:
+            schema (dict): Dtype of some columns. Any pandas dtype, "date", "datetime" or "category".
+            stable (bool): Only apply conversions independent of the values of the frame.
+            category_ratio (float): Maximum ratio of distinct values to rows of strings turned into categoricals.
+            max_categories (int): Maximum number of distinct values of strings turned into categoricals.
+            downcast_floats (bool): Convert float64 columns whose values round-trip exactly to float32.
+            parse_dates (bool): Parse strings holding ISO dates to datetime64.
+            categories_as_codes (bool): Replace categoricals by their integer codes, keeping the
+                                        categories in self.categories.
+            unsigned_integers (bool): Downcast integer columns without negative values to unsigned types.
+        """
+        self.schema = dict(schema or {})
+        self.stable = stable
+        self.category_ratio = category_ratio
+        self.max_categories = max_categories
+        self.downcast_floats = downcast_floats
+        self.parse_dates = parse_dates
+        self.categories_as_codes = categories_as_codes
+        self.unsigned_integers = unsigned_integers
+        self.categories = {}
+
+    @staticmethod
+    def memory_usage(frame: pd.DataFrame) -> pd.Series:
+        """
+        Gets the bytes used by every column, including the python strings of object columns.
+        Args:
+            frame (pd.DataFrame): Frame to measure.
+        Returns:
+            pd.Series: Bytes by column.
+        """
+        return frame.memory_usage(index=False, deep=True)
+
+    @staticmethod
+    def is_date_column(series: pd.Series) -> bool:
+        """
+        Checks if a string column holds ISO dates, looking at a sample of its values.
+        Args:
+            series (pd.Series): Column to check.
+        Returns:
+            bool: True if every sampled value is an ISO date or datetime string.
+        """
+        sample = series.dropna().head(100)
+        return bool(len(sample)) and sample.map(lambda v: isinstance(v, str) and bool(DATE_PATTERN.match(v))).all()
+
+    @staticmethod
+    def downcast_integer(series: pd.Series, unsigned: bool = False) -> pd.Series:
+        """
+        Converts an integer column to the smallest integer type holding its range.
+        Args:
+            series (pd.Series): Integer column.
+            unsigned (bool): Use unsigned types for columns without negative values.
+        Returns:
+            pd.Series: Downcast column.
+        """
+        if not len(series):
+            return series
+        low, high = series.min(), series.max()
+        if unsigned and low >= 0:
+            candidates = (np.uint8, np.uint16, np.uint32, np.uint64)
+        else:
+            candidates = (np.int8, np.int16, np.int32, np.int64)
+        for dtype in candidates:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return series.astype(dtype)
+        return series
+
+    @staticmethod
+    def downcast_float(series: pd.Series) -> pd.Series:
+        """
+        Converts a float64 column to float32 if every value round-trips exactly.
+        Args:
+            series (pd.Series): Float column.
+        Returns:
+            pd.Series: Downcast column, or the column itself if float32 would lose precision.
+        """
+        values = series.to_numpy()
+        with np.errstate(over="ignore"):
+            downcast = values.astype(np.float32)
+        if np.array_equal(downcast.astype(np.float64), values, equal_nan=True):
+            return pd.Series(downcast, index=series.index, name=series.name)
+        return series
+
+    def __to_schema_dtype(self, name: str, series: pd.Series, dtype: str) -> pd.Series:
+        """
+        Converts a column to the dtype of the schema.
+        Args:
+            name (str): Column name.
+            series (pd.Series): Column.
+            dtype (str): Dtype of the schema.
+        Returns:
+            pd.Series: Converted column.
+        """
+        if dtype in ("date", "datetime"):
+            return series if pd.api.types.is_datetime64_any_dtype(series) else pd.to_datetime(series)
+        if dtype == "category":
+            return series if self.stable else series.astype("category")
+        target = pd.api.types.pandas_dtype(dtype)
+        if pd.api.types.is_integer_dtype(target) and len(series) and series.notna().any():
+            info = np.iinfo(target.numpy_dtype if hasattr(target, "numpy_dtype") else target)
+            low, high = series.min(), series.max()
+            if low < info.min or high > info.max:
+                raise ValueError(f"Error: column {name} ranges from {low} to {high}, out of the range of {dtype}")
+        return series.astype(target)
+
+    def __compact_column(self, name: str, series: pd.Series) -> pd.Series:
+        """
+        Compacts one column.
+        Args:
+            name (str): Column name.
+            series (pd.Series): Column.
+        Returns:
+            pd.Series: Compacted column.
+        """
+        if name in self.schema:
+            return self.__to_schema_dtype(name, series, self.schema[name])
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        if pd.api.types.is_integer_dtype(series):
+            return series if self.stable else self.downcast_integer(series, self.unsigned_integers)
+        if pd.api.types.is_float_dtype(series):
+            if self.stable or not self.downcast_floats or series.dtype != np.float64:
+                return series
+            return self.downcast_float(series)
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+        if self.parse_dates and self.is_date_column(series):
+            try:
+                return pd.to_datetime(series)
+            except (ValueError, TypeError):
+                return series
+        if not self.stable and len(series):
+            distinct = series.nunique(dropna=True)
+            if distinct <= self.max_categories and distinct <= self.category_ratio * len(series):
+                return series.astype("category")
+        return series
+
+    def compact(self, frame: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Compacts every column of a frame.
+        Args:
+            frame (pd.DataFrame): Frame to compact. It is not modified.
+        Returns:
+            tuple: Compacted frame, and a report with the dtype and bytes of every column before and after.
+        """
+        before = self.memory_usage(frame)
+        columns = {}
+        for name in frame.columns:
+            series = self.__compact_column(name, frame[name])
+            if self.categories_as_codes and isinstance(series.dtype, pd.CategoricalDtype):
+                self.categories[name] = series.cat.categories
+                series = series.cat.codes
+            columns[name] = series
+        compacted = pd.DataFrame(columns, index=frame.index, copy=False)
+        after = self.memory_usage(compacted)
+        report = pd.DataFrame({
+            "dtype_before": frame.dtypes.astype(str),
+            "dtype_after": compacted.dtypes.astype(str),
+            "bytes_before": before,
+            "bytes_after": after,
+        })
+        return compacted, report
+
+    @staticmethod
+    def combine_reports(reports: List[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Adds up the reports of the batches of a data set.
+        Args:
+            reports ([pd.DataFrame]): Reports returned by compact().
+        Returns:
+            pd.DataFrame: Report of all the batches.
+        """
+        if not reports:
+            return pd.DataFrame(columns=["dtype_before", "dtype_after", "bytes_before", "bytes_after"])
+        combined = pd.concat(reports)
+        return combined.groupby(level=0, sort=False).agg(
+            {"dtype_before": "first", "dtype_after": "first", "bytes_before": "sum", "bytes_after": "sum"}
+        )
+
+    @staticmethod
+    def log_report(report: pd.DataFrame, name: str = "frame", logger: logging.Logger = None) -> None:
+        """
+        Logs the bytes saved by a compaction, in total and per column.
+        Args:
+            report (pd.DataFrame): Report returned by compact().
+            name (str): Name of the compacted frame.
+            logger (logging.Logger): Logger to use. Defaults to the root logger.
+        Returns:
+            None
+        """
+        logger = logger or logging.getLogger()
+        total_before, total_after = int(report["bytes_before"].sum()), int(report["bytes_after"].sum())
+        logger.info(f"Compacted {name}: {total_before / 2 ** 20:.1f} MB -> {total_after / 2 ** 20:.1f} MB.")
+        for column, row in report.iterrows():
+            logger.info(f"  {column}: {row['dtype_before']} -> {row['dtype_after']}, "
+                         f"{row['bytes_before']} -> {row['bytes_after']} bytes")
@@ -0,0 +1,100 @@
+"""
+Contains helpers to measure the wall time, CPU time and memory used by a block of code.
+"""
+import os
+import resource
+import sys
+import time
+from typing import Optional
+
+
+class ResourceMonitor:
+    """
+    This class measures wall time, CPU time and resident memory of the current process.
+    Use it as a context manager:
+
+        with ResourceMonitor() as monitor:
+            run()
+        monitor.wall_time, monitor.cpu_time, monitor.peak_rss
+    """
+
+    def __init__(self):
+        """
+        Initializes the measured values.
+        """
+        self.wall_time = None
+        self.cpu_time = None
+        self.peak_rss = None
+        self.__start_wall = None
+        self.__start_cpu = None
+
+    def __enter__(self):
+        ResourceMonitor.reset_peak_rss()
+        self.__start_wall = time.perf_counter()
+        self.__start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_time = time.perf_counter() - self.__start_wall
+        self.cpu_time = time.process_time() - self.__start_cpu
+        self.peak_rss = ResourceMonitor.get_peak_rss()
+        return False
+
+    @staticmethod
+    def get_current_rss() -> Optional[int]:
+        """
+        Gets the current resident set size of this process.
+        Returns:
+            int: Resident memory in bytes, or None when it cannot be read on this platform.
+        """
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def get_peak_rss() -> int:
+        """
+        Gets the peak resident set size of this process since start or since the last
+        reset_peak_rss() call.
+        Returns:
+            int: Peak resident memory in bytes.
+        """
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on linux.
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    @staticmethod
+    def reset_peak_rss() -> bool:
+        """
+        Resets the peak resident set size counter. Only supported on linux, elsewhere the peak
+        keeps covering the whole lifetime of the process.
+        Returns:
+            bool: True if the counter was reset, else False.
+        """
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def get_total_memory() -> Optional[int]:
+        """
+        Gets the physical memory of the node.
+        Returns:
+            int: Physical memory in bytes, or None when it cannot be read on this platform.
+        """
+        try:
+            return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,210 @@
+"""
+Contains a normalizer of names (products, customers, stores) that normalizes every distinct value
+once and remembers it across batches and runs.
+"""
+import json
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from libs.lola_utils.cache import TieredCache
+
+SPACES = re.compile(r"\s+")
+
+
+class TextNormalizer:
+    """
+    This class normalizes names for matching: transliteration to ASCII with unidecode, lowercase,
+    and stripped and collapsed whitespace. A column is factorized first so every distinct value is
+    normalized once and mapped back to the rows, and normalized values are kept in a bounded LRU
+    memo shared by all the batches. The memo can be saved and loaded, so the next run starts with
+    the names already seen. With a TieredCache, values missing from the memo are looked up there
+    first, so the workers and nodes of a run share the names normalized by any of them.
+
+    Usage:
+        normalizer = TextNormalizer(cache_path="/dbfs/ptc/co/ingestion/_normalized_names.json")
+        frame["product_key"] = normalizer.normalize(frame["product_name"])
+        normalizer.save()
+    """
+
+    def __init__(self, max_size: int = 100_000, cache_path: str = None, transliterate: bool = True,
+                 lowercase: bool = True, collapse_spaces: bool = True, cache: TieredCache = None):
+        """
+        Initializes the normalizer, loading the memo of cache_path if it exists.
+        Args:
+            max_size (int): Maximum number of values kept in the memo.
+            cache_path (str): Json file where the memo is saved between runs.
+            transliterate (bool): Transliterate to ASCII with unidecode ("Ñandú" -> "Nandu").
+            lowercase (bool): Convert to lowercase.
+            collapse_spaces (bool): Replace runs of whitespace by one space.
+            cache (TieredCache): Cache shared with other processes, looked up after the memo.
+        """
+        self.max_size = max_size
+        self.cache_path = cache_path
+        self.transliterate = transliterate
+        self.lowercase = lowercase
+        self.collapse_spaces = collapse_spaces
+        self.cache = cache
+        self.memo = OrderedDict()
+        self.stats = {"values": 0, "distinct": 0, "hits": 0, "cache_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._unidecode = None
+        if transliterate:
+            from unidecode import unidecode
+
+            self._unidecode = unidecode
+        if cache_path:
+            self.load(cache_path)
+
+    def normalize_value(self, value: str) -> str:
+        """
+        Normalizes one value, without the memo.
+        Args:
+            value (str): Value to normalize.
+        Returns:
+            str: Normalized value.
+        """
+        value = str(value)
+        if self._unidecode is not None:
+            value = self._unidecode(value)
+        if self.lowercase:
+            value = value.lower()
+        if self.collapse_spaces:
+            value = SPACES.sub(" ", value)
+        return value.strip()
+
+    def __lookup(self, uniques: np.ndarray) -> np.ndarray:
+        """
+        Normalizes distinct values with the memo, then the shared cache for the values the memo
+        misses, in one multi-get.
+        Args:
+            uniques (np.ndarray): Distinct values.
+        Returns:
+            np.ndarray: Normalized values, in the same order.
+        """
+        normalized = np.empty(len(uniques), dtype=object)
+        missing = {}
+        with self._lock:
+            for i, value in enumerate(uniques):
+                key = str(value)
+                result = self.memo.get(key)
+                if result is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self.memo.move_to_end(key)
+                    self.stats["hits"] += 1
+                    normalized[i] = result
+        if not missing:
+            return normalized
+        found = {}
+        if self.cache is not None:
+            prefix = self.__cache_prefix()
+            found = {k[len(prefix):]: v for k, v in self.cache.mget(prefix + k for k in missing).items()}
+        computed = {key: self.normalize_value(key) for key in missing if key not in found}
+        if computed and self.cache is not None:
+            self.cache.mset({prefix + k: v for k, v in computed.items()})
+        with self._lock:
+            for key, positions in missing.items():
+                result = found[key] if key in found else computed[key]
+                normalized[positions] = result
+                self.memo[key] = result
+            while len(self.memo) > self.max_size:
+                self.memo.popitem(last=False)
+            self.stats["cache_hits"] += len(found)
+            self.stats["misses"] += len(computed)
+        return normalized
+
+    def normalize(self, values: Any) -> pd.Series:
+        """
+        Normalizes a column, one call per distinct value. Nulls stay null.
+        Args:
+            values (pd.Series or array-like): Values to normalize.
+        Returns:
+            pd.Series: Normalized values, with the index and name of values if it is a series.
+        """
+        series = values if isinstance(values, pd.Series) else pd.Series(values)
+        codes, uniques = pd.factorize(series, sort=False)
+        uniques = np.asarray(uniques, dtype=object)
+        normalized = self.__lookup(uniques)
+        result = np.where(codes >= 0, normalized[np.maximum(codes, 0)] if len(normalized) else None, None)
+        with self._lock:
+            self.stats["values"] += len(series)
+            self.stats["distinct"] += len(uniques)
+        return pd.Series(result, index=series.index, name=series.name, dtype=object)
+
+    def hit_rate(self) -> float:
+        """
+        Gets the share of distinct values found in the memo or the cache.
+        Returns:
+            float: Hits over lookups, None before any lookup.
+        """
+        hits = self.stats["hits"] + self.stats["cache_hits"]
+        lookups = hits + self.stats["misses"]
+        return hits / lookups if lookups else None
+
+    def save(self, path: str = None) -> str:
+        """
+        Saves the memo, least recently used first. The file is replaced atomically.
+        Args:
+            path (str): Json file. Defaults to cache_path.
+        Returns:
+            str: Path of the file.
+        """
+        path = path or self.cache_path
+        if not path:
+            raise ValueError("Error: no path to save the normalized values to")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            data = {"settings": self.__settings(), "values": list(self.memo.items())}
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, path: str) -> int:
+        """
+        Loads a memo saved by save(). A memo saved with other settings is ignored.
+        Args:
+            path (str): Json file.
+        Returns:
+            int: Number of values loaded.
+        """
+        if not os.path.isfile(path):
+            return 0
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("settings") != self.__settings():
+            return 0
+        with self._lock:
+            for key, value in data["values"][-self.max_size:]:
+                self.memo[key] = value
+                self.memo.move_to_end(key)
+            while len(self.memo) > self.max_size:
+                self.memo.popitem(last=False)
+        return len(data["values"][-self.max_size:])
+
+    def __cache_prefix(self) -> str:
+        """
+        Gets the prefix of the cache keys, which depends on the settings so normalizers with other
+        settings do not share values.
+        Returns:
+            str: Prefix of the keys, e.g. "names:tlc:".
+        """
+        flags = "".join(f for f, on in zip("tlc", self.__settings().values()) if on)
+        return f"names:{flags}:"
+
+    def __settings(self) -> Dict[str, bool]:
+        """
+        Gets the settings the normalized values depend on.
+        Returns:
+            dict: Normalization settings.
+        """
+        return {"transliterate": self.transliterate, "lowercase": self.lowercase,
+                "collapse_spaces": self.collapse_spaces}
@@ -1,2 +1,5 @@
+from libs.lola_utils.ind.DtypeCompactor import DtypeCompactor
 from libs.lola_utils.ind.PathHelpers import PathHelpers
+from libs.lola_utils.ind.ResourceMonitor import ResourceMonitor
 from libs.lola_utils.ind.Singleton import Singleton
+from libs.lola_utils.ind.TextNormalizer import TextNormalizer
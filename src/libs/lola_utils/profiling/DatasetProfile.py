@@ -0,0 +1,299 @@
+"""
+Contains the profile of a data set, computed batch by batch with mergeable sketches while the
+data set is written, so data quality checks and bucket boundaries need no extra pass over it.
+"""
+import json
+import os
+import uuid
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from libs.lola_utils.profiling.FrequencySketch import FrequencySketch
+from libs.lola_utils.profiling.HyperLogLog import HyperLogLog
+from libs.lola_utils.profiling.QuantileSketch import QuantileSketch
+
+
+class DatasetProfile:
+    """
+    This class profiles every column of a data set: row and null counts, distinct counts
+    (HyperLogLog), min, max and mean of numbers and dates, quantiles of numbers (KLL) and most
+    frequent values of strings, categories and booleans (Misra-Gries). Profiles of batches,
+    partitions or workers are merged into the profile of the whole data set.
+
+    Usage:
+        profile = DatasetProfile()
+        for batch in batches:
+            profile.update(batch)
+        profile.save(dataset_path)
+        DatasetProfile.load(dataset_path).summary()["columns"]["price"]["quantiles"]
+    """
+
+    FILE_NAME = "_profile.json"
+    QUANTILES = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+    def __init__(self, hll_precision: int = 14, quantile_k: int = 200, frequent_capacity: int = 1000):
+        """
+        Initializes an empty profile.
+        Args:
+            hll_precision (int): Precision of the distinct count sketches.
+            quantile_k (int): Size of the quantile sketches.
+            frequent_capacity (int): Counters of the frequent value sketches.
+        """
+        self.hll_precision = hll_precision
+        self.quantile_k = quantile_k
+        self.frequent_capacity = frequent_capacity
+        self.rows = 0
+        self.columns = {}
+
+    @staticmethod
+    def get_kind(series: pd.Series) -> str:
+        """
+        Gets the kind of profile a column gets.
+        Args:
+            series (pd.Series): Column.
+        Returns:
+            str: "numeric", "datetime" or "categorical".
+        """
+        if pd.api.types.is_bool_dtype(series):
+            return "categorical"
+        if pd.api.types.is_numeric_dtype(series):
+            return "numeric"
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return "datetime"
+        return "categorical"
+
+    def __new_column(self, kind: str) -> Dict[str, Any]:
+        """
+        Creates the statistics of a column.
+        Args:
+            kind (str): Kind of the column.
+        Returns:
+            dict: Empty statistics and sketches.
+        """
+        return {
+            "kind": kind, "count": 0, "nulls": 0, "min": None, "max": None, "sum": 0.0,
+            "distinct": HyperLogLog(self.hll_precision),
+            "quantiles": QuantileSketch(self.quantile_k) if kind == "numeric" else None,
+            "frequent": FrequencySketch(self.frequent_capacity) if kind == "categorical" else None,
+        }
+
+    def update(self, frame: pd.DataFrame) -> None:
+        """
+        Adds a batch of rows to the profile.
+        Args:
+            frame (pd.DataFrame): Batch of rows.
+        Returns:
+            None
+        """
+        self.rows += len(frame)
+        for name in frame.columns:
+            series = frame[name]
+            present = series.dropna()
+            column = self.columns.get(name)
+            if column is None or (column["kind"] is None and len(present)):
+                stats = self.__new_column(self.get_kind(series) if len(present) else None)
+                if column is not None:
+                    stats.update(count=column["count"], nulls=column["nulls"])
+                column = self.columns[name] = stats
+            column["count"] += len(series)
+            column["nulls"] += len(series) - len(present)
+            if not len(present):
+                continue
+            kind = self.get_kind(series)
+            column["distinct"].update(present.to_numpy())
+            if kind != column["kind"]:
+                continue
+            if kind in ("numeric", "datetime"):
+                values = present.to_numpy()
+                low, high = values.min(), values.max()
+                column["min"] = low if column["min"] is None else min(column["min"], low)
+                column["max"] = high if column["max"] is None else max(column["max"], high)
+            if kind == "numeric":
+                values = values.astype(np.float64)
+                column["sum"] += float(values.sum())
+                column["quantiles"].update(values)
+            elif kind == "categorical":
+                column["frequent"].update(present.to_numpy())
+
+    def merge(self, other: "DatasetProfile") -> "DatasetProfile":
+        """
+        Merges the profile of other rows into this one.
+        Args:
+            other (DatasetProfile): Profile to merge.
+        Returns:
+            DatasetProfile: This profile.
+        """
+        self.rows += other.rows
+        for name, theirs in other.columns.items():
+            ours = self.columns.get(name)
+            if ours is None or (ours["kind"] is None and theirs["kind"] is not None):
+                merged = self.__new_column(theirs["kind"])
+                merged.update(count=(ours or {}).get("count", 0), nulls=(ours or {}).get("nulls", 0))
+                if ours is not None:
+                    merged["distinct"].merge(ours["distinct"])
+                ours = self.columns[name] = merged
+            ours["count"] += theirs["count"]
+            ours["nulls"] += theirs["nulls"]
+            ours["distinct"].merge(theirs["distinct"])
+            if theirs["kind"] != ours["kind"]:
+                continue
+            for key, pick in (("min", min), ("max", max)):
+                if theirs[key] is not None:
+                    ours[key] = theirs[key] if ours[key] is None else pick(ours[key], theirs[key])
+            ours["sum"] += theirs["sum"]
+            for key in ("quantiles", "frequent"):
+                if ours[key] is not None:
+                    ours[key].merge(theirs[key])
+        return self
+
+    def subtract(self, other: "DatasetProfile") -> "DatasetProfile":
+        """
+        Removes the rows of another profile, e.g. of rows deleted or replaced by newer versions,
+        from the row, value and null counts and the sums, so counts, null rates and means are
+        exact. Distinct counts, min, max, quantiles and frequent values still include them, since
+        sketches cannot forget values.
+        Args:
+            other (DatasetProfile): Profile of rows included in this one.
+        Returns:
+            DatasetProfile: This profile.
+        """
+        self.rows -= other.rows
+        for name, theirs in other.columns.items():
+            ours = self.columns.get(name)
+            if ours is None:
+                continue
+            ours["count"] -= theirs["count"]
+            ours["nulls"] -= theirs["nulls"]
+            if theirs["kind"] == ours["kind"] == "numeric":
+                ours["sum"] -= theirs["sum"]
+        return self
+
+    @classmethod
+    def merge_all(cls, profiles: Iterable["DatasetProfile"]) -> "DatasetProfile":
+        """
+        Merges profiles, e.g. the ones of every partition or worker.
+        Args:
+            profiles (Iterable[DatasetProfile]): Profiles to merge.
+        Returns:
+            DatasetProfile: Profile of all their rows.
+        """
+        merged = None
+        for profile in profiles:
+            merged = profile if merged is None else merged.merge(profile)
+        return merged if merged is not None else cls()
+
+    @staticmethod
+    def __to_json_value(value: Any) -> Any:
+        """
+        Converts numpy scalars and dates to json values.
+        Args:
+            value (Any): Value.
+        Returns:
+            Any: Json value.
+        """
+        if isinstance(value, (np.datetime64, pd.Timestamp)):
+            return pd.Timestamp(value).isoformat()
+        return value.item() if hasattr(value, "item") else value
+
+    def summary(self, ranks: List[float] = None, top_k: int = 20) -> Dict[str, Any]:
+        """
+        Summarizes the profile.
+        Args:
+            ranks ([float]): Quantile ranks to report. Defaults to QUANTILES.
+            top_k (int): Number of most frequent values to report.
+        Returns:
+            dict: Row count and statistics of every column.
+        """
+        ranks = ranks or self.QUANTILES
+        columns = {}
+        for name, column in self.columns.items():
+            present = column["count"] - column["nulls"]
+            stats = {
+                "kind": column["kind"], "count": column["count"], "nulls": column["nulls"],
+                "null_rate": column["nulls"] / column["count"] if column["count"] else None,
+                "distinct": min(column["distinct"].count(), present),
+                "min": self.__to_json_value(column["min"]), "max": self.__to_json_value(column["max"]),
+            }
+            if column["kind"] == "numeric":
+                stats["mean"] = column["sum"] / present if present else None
+                stats["quantiles"] = dict(zip([str(r) for r in ranks], column["quantiles"].quantiles(ranks)))
+            if column["kind"] == "categorical":
+                stats["top_k"] = column["frequent"].top_k(top_k)
+            columns[name] = stats
+        return {"rows": self.rows, "columns": columns}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Serializes the profile with its sketches, so it can be merged after it is loaded.
+        Returns:
+            dict: Summary and state of the profile.
+        """
+        state = {}
+        for name, column in self.columns.items():
+            state[name] = {
+                key: (value.to_dict() if hasattr(value, "to_dict") else self.__to_json_value(value))
+                for key, value in column.items()
+            }
+        return {
+            "summary": self.summary(),
+            "settings": {"hll_precision": self.hll_precision, "quantile_k": self.quantile_k,
+                         "frequent_capacity": self.frequent_capacity},
+            "rows": self.rows,
+            "columns": state,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DatasetProfile":
+        """
+        Deserializes a profile.
+        Args:
+            data (dict): Output of to_dict().
+        Returns:
+            DatasetProfile: The profile.
+        """
+        profile = cls(**data["settings"])
+        profile.rows = data["rows"]
+        sketches = {"distinct": HyperLogLog, "quantiles": QuantileSketch, "frequent": FrequencySketch}
+        for name, state in data["columns"].items():
+            column = dict(state)
+            for key, sketch in sketches.items():
+                column[key] = sketch.from_dict(state[key]) if state[key] is not None else None
+            if column["kind"] == "datetime":
+                column["min"], column["max"] = (pd.Timestamp(column[k]) if column[k] is not None else None
+                                                for k in ("min", "max"))
+            profile.columns[name] = column
+        return profile
+
+    def save(self, folder: str) -> str:
+        """
+        Saves the profile next to a data set. The file is replaced atomically and its name starts
+        with an underscore, so data set readers ignore it.
+        Args:
+            folder (str): Folder of the data set.
+        Returns:
+            str: Path of the profile.
+        """
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, self.FILE_NAME)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f, default=str)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, folder: str) -> "DatasetProfile":
+        """
+        Loads the profile saved next to a data set.
+        Args:
+            folder (str): Folder of the data set.
+        Returns:
+            DatasetProfile: The profile, or None if the data set has none.
+        """
+        path = os.path.join(folder, cls.FILE_NAME)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,114 @@
+"""
+Contains a Misra-Gries frequency sketch to find the most frequent values in one pass with bounded memory.
+"""
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class FrequencySketch:
+    """
+    This class keeps at most capacity counters. When a new batch overflows them, the count of
+    the first counter that does not fit is subtracted from all counters and the ones reaching
+    zero are dropped. Every count is underestimated by at most n / (capacity + 1), so every value
+    more frequent than that is kept. Sketches are merged the same way, adding their counters.
+
+    Usage:
+        sketch = FrequencySketch()
+        sketch.update(frame["brand"].to_numpy())
+        sketch.top_k(10)
+    """
+
+    def __init__(self, capacity: int = 1000):
+        """
+        Initializes an empty sketch.
+        Args:
+            capacity (int): Maximum number of counters.
+        """
+        self.capacity = capacity
+        self.n = 0
+        self.counters = pd.Series(dtype=np.int64)
+
+    def __add(self, counts: pd.Series, n: int) -> None:
+        """
+        Adds counts to the counters and shrinks them back to capacity.
+        Args:
+            counts (pd.Series): Counts by value.
+            n (int): Number of values counted.
+        Returns:
+            None
+        """
+        self.n += n
+        counters = self.counters.add(counts, fill_value=0).astype(np.int64)
+        if len(counters) > self.capacity:
+            counters = counters.sort_values(ascending=False)
+            counters = counters - counters.iloc[self.capacity]
+            counters = counters[counters > 0]
+        self.counters = counters
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Adds values to the sketch. Values are counted by their string representation.
+        Args:
+            values (np.ndarray): Values to add, without nulls.
+        Returns:
+            None
+        """
+        if len(values) == 0:
+            return
+        counts = pd.Series(values).astype(str).value_counts(sort=False)
+        self.__add(counts, len(values))
+
+    def merge(self, other: "FrequencySketch") -> "FrequencySketch":
+        """
+        Merges another sketch into this one.
+        Args:
+            other (FrequencySketch): Sketch to merge.
+        Returns:
+            FrequencySketch: This sketch.
+        """
+        self.__add(other.counters, other.n)
+        return self
+
+    def top_k(self, k: int) -> List[Tuple[str, int]]:
+        """
+        Gets the most frequent values.
+        Args:
+            k (int): Number of values.
+        Returns:
+            list: (value, lower bound of its count) pairs, most frequent first.
+        """
+        top = self.counters.sort_values(ascending=False, kind="stable").head(k)
+        return [(str(value), int(count)) for value, count in top.items()]
+
+    def max_error(self) -> int:
+        """
+        Gets the maximum underestimation of a count.
+        Returns:
+            int: Maximum error of the counts.
+        """
+        return self.n // (self.capacity + 1)
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the sketch.
+        Returns:
+            dict: Capacity, count and counters.
+        """
+        return {"capacity": self.capacity, "n": self.n,
+                "counters": {str(value): int(count) for value, count in self.counters.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FrequencySketch":
+        """
+        Deserializes a sketch.
+        Args:
+            data (dict): Output of to_dict().
+        Returns:
+            FrequencySketch: The sketch.
+        """
+        sketch = cls(data["capacity"])
+        sketch.n = data["n"]
+        sketch.counters = pd.Series(data["counters"], dtype=np.int64)
+        return sketch
@@ -0,0 +1,112 @@
+"""
+Contains a HyperLogLog sketch to estimate distinct counts in one pass with fixed memory.
+"""
+import base64
+
+import numpy as np
+import pandas as pd
+
+
+class HyperLogLog:
+    """
+    This class estimates the number of distinct values it has seen. Sketches of different
+    batches, partitions or workers are merged by taking the maximum of every register, so the
+    estimate of the merged sketch is the one of the union of their values.
+
+    Usage:
+        hll = HyperLogLog()
+        hll.update(frame["sku"].to_numpy())
+        hll.merge(other_hll)
+        hll.count()
+    """
+
+    def __init__(self, precision: int = 14):
+        """
+        Initializes an empty sketch.
+        Args:
+            precision (int): Number of bits addressing the registers. 2^precision bytes of memory
+                             and a relative standard error of about 1.04 / sqrt(2^precision).
+        """
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @staticmethod
+    def hash_values(values: np.ndarray) -> np.ndarray:
+        """
+        Hashes values to 64 bits, vectorized and stable across processes.
+        Args:
+            values (np.ndarray): Values to hash. Nulls must be removed first.
+        Returns:
+            np.ndarray: uint64 hashes.
+        """
+        values = np.asarray(values)
+        if values.dtype.kind in "OUS":
+            values = values.astype(object)
+        return pd.util.hash_array(values)
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Adds values to the sketch.
+        Args:
+            values (np.ndarray): Values to add, without nulls.
+        Returns:
+            None
+        """
+        if len(values) == 0:
+            return
+        hashes = self.hash_values(values)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes << np.uint64(self.precision)
+        # Rank of the first 1 bit of the remaining bits, 65 - precision when they are all 0.
+        rank = np.full(len(rest), 65 - self.precision, dtype=np.uint8)
+        nonzero = rest != 0
+        rank[nonzero] = (64 - np.floor(np.log2(rest[nonzero].astype(np.float64)))).astype(np.uint8)
+        np.maximum.at(self.registers, index, np.minimum(rank, 65 - self.precision))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """
+        Merges another sketch of the same precision into this one.
+        Args:
+            other (HyperLogLog): Sketch to merge.
+        Returns:
+            HyperLogLog: This sketch.
+        """
+        if other.precision != self.precision:
+            raise ValueError(f"Error: cannot merge HyperLogLog of precision {other.precision} into {self.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        """
+        Estimates the number of distinct values, with linear counting for small cardinalities.
+        Returns:
+            int: Estimated distinct count.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the sketch.
+        Returns:
+            dict: Precision and base64 encoded registers.
+        """
+        return {"precision": self.precision, "registers": base64.b64encode(self.registers.tobytes()).decode()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog":
+        """
+        Deserializes a sketch.
+        Args:
+            data (dict): Output of to_dict().
+        Returns:
+            HyperLogLog: The sketch.
+        """
+        sketch = cls(data["precision"])
+        sketch.registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return sketch
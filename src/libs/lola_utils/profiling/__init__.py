@@ -0,0 +1,4 @@
+from libs.lola_utils.profiling.HyperLogLog import HyperLogLog
+from libs.lola_utils.profiling.QuantileSketch import QuantileSketch
+from libs.lola_utils.profiling.FrequencySketch import FrequencySketch
+from libs.lola_utils.profiling.DatasetProfile import DatasetProfile
@@ -0,0 +1,288 @@
+"""
+Contains a cache of model artifacts: a local copy of every artifact keyed by id and checksum, and
+the models loaded from it kept once per process.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+MANIFEST = "_manifest.json"
+
+
+class ModelCache:
+    """
+    This class caches model artifacts (a model file or a folder with the model and its metadata)
+    behind a remote path such as MODEL_PATH_ID. An artifact is copied once to a local folder
+    <cache_dir>/<artifact id>/<checksum>/ and loaded once per process: loaded models are kept in
+    memory, shared by all the ModelCache instances of the process. Load a model before creating a
+    pool of forked workers and the workers share its memory instead of loading it again. Arrays
+    saved as .npy are memory mapped from the local copy, so all the processes of the node share
+    the same pages. The checksum is the sha256 of the content of the files; it is recomputed only
+    when their size or modification time change.
+
+    Usage:
+        cache = ModelCache("/local_disk0/models")
+        booster = cache.load("/dbfs/sd/co/model", lambda path: xgb.Booster(model_file=f"{path}/model.json"))
+        grid = cache.load_array("/dbfs/sd/co/curves", "grid.npy")
+        cache.stats()
+    """
+
+    _models = OrderedDict()
+    _stats = {}
+    _stats_pid = None
+    _lock = threading.RLock()
+
+    def __init__(self, cache_dir: str = None, max_models: int = 8, keep_copies: int = 2):
+        """
+        Initializes the cache.
+        Args:
+            cache_dir (str): Local folder of the copies. Defaults to <tmp>/lola_model_cache.
+            max_models (int): Maximum number of models kept in memory by the process.
+            keep_copies (int): Copies of every artifact kept on disk, the most recent ones.
+        """
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "lola_model_cache")
+        self.max_models = max_models
+        self.keep_copies = keep_copies
+
+    @staticmethod
+    def list_files(path: str) -> List[str]:
+        """
+        Lists the files of an artifact, relative to it. Hidden and temporary files are skipped.
+        Args:
+            path (str): Model file or folder.
+        Returns:
+            list: Relative paths, sorted.
+        """
+        if os.path.isfile(path):
+            return [os.path.basename(path)]
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            files.extend(os.path.relpath(os.path.join(root, n), path) for n in names
+                         if not n.startswith(".") and not n.endswith(".tmp"))
+        return sorted(files)
+
+    @staticmethod
+    def fingerprint(path: str) -> List[Tuple[str, int, int]]:
+        """
+        Gets the size and modification time of the files of an artifact, to know when it changes
+        without reading it.
+        Args:
+            path (str): Model file or folder.
+        Returns:
+            list: (relative path, size, modification time in ns) of every file.
+        """
+        root = os.path.dirname(path) if os.path.isfile(path) else path
+        result = []
+        for name in ModelCache.list_files(path):
+            stat = os.stat(os.path.join(root, name))
+            result.append((name, stat.st_size, stat.st_mtime_ns))
+        return result
+
+    @staticmethod
+    def checksum(path: str) -> str:
+        """
+        Computes the sha256 of the names and content of the files of an artifact.
+        Args:
+            path (str): Model file or folder.
+        Returns:
+            str: Hex digest.
+        """
+        root = os.path.dirname(path) if os.path.isfile(path) else path
+        digest = hashlib.sha256()
+        for name in ModelCache.list_files(path):
+            digest.update(name.encode())
+            with open(os.path.join(root, name), "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def artifact_id(source: str) -> str:
+        """
+        Gets a readable id of an artifact from its path, e.g. "sd_co_model" for /dbfs/sd/co/model.
+        Args:
+            source (str): Model file or folder.
+        Returns:
+            str: Id of the artifact.
+        """
+        parts = [p for p in os.path.normpath(os.path.abspath(source)).split(os.sep) if p][-3:]
+        return "_".join(parts).replace(".", "_") or "model"
+
+    @classmethod
+    def _count(cls, **increments) -> Dict[str, Any]:
+        """
+        Updates the statistics of this process. A forked worker inherits the models of its parent
+        but starts its own statistics, so its hits count the models it did not load.
+        Args:
+            increments: Increments of hits, misses, downloads, load_seconds or download_seconds.
+        Returns:
+            dict: The statistics.
+        """
+        with cls._lock:
+            if cls._stats_pid != os.getpid():
+                cls._stats = {"hits": 0, "misses": 0, "downloads": 0, "load_seconds": 0.0, "download_seconds": 0.0}
+                cls._stats_pid = os.getpid()
+            for key, value in increments.items():
+                cls._stats[key] += value
+            return cls._stats
+
+    def __artifact_dir(self, artifact_id: str) -> str:
+        return os.path.join(self.cache_dir, artifact_id)
+
+    def __latest(self, artifact_id: str) -> Dict[str, Any]:
+        """
+        Gets the manifest of the last copy of an artifact.
+        Args:
+            artifact_id (str): Id of the artifact.
+        Returns:
+            dict: Manifest, or None without a copy.
+        """
+        path = os.path.join(self.__artifact_dir(artifact_id), MANIFEST)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def __prune(self, artifact_id: str) -> None:
+        """
+        Removes the oldest copies of an artifact beyond keep_copies. Processes still reading a
+        removed copy through a memory map keep their pages until they close it.
+        Args:
+            artifact_id (str): Id of the artifact.
+        Returns:
+            None
+        """
+        folder = self.__artifact_dir(artifact_id)
+        copies = sorted((os.path.join(folder, d) for d in os.listdir(folder)
+                         if not d.startswith(".") and os.path.isdir(os.path.join(folder, d))),
+                        key=os.path.getmtime, reverse=True)
+        for path in copies[self.keep_copies:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def fetch(self, source: str, artifact_id: str = None) -> Tuple[str, str]:
+        """
+        Gets the local copy of an artifact, copying it when it is new or changed.
+        Args:
+            source (str): Model file or folder, e.g. on a mounted remote storage.
+            artifact_id (str): Id of the artifact. Defaults to one derived from the path.
+        Returns:
+            tuple: Local path (with the same file name as source for a file) and checksum.
+        """
+        artifact_id = artifact_id or self.artifact_id(source)
+        fingerprint = [list(f) for f in self.fingerprint(source)]
+        if not fingerprint:
+            raise ValueError(f"Error: model artifact {source} not found or empty")
+        name = os.path.basename(source) if os.path.isfile(source) else ""
+        latest = self.__latest(artifact_id)
+        if latest is not None and latest["source"] == os.path.abspath(source) \
+                and latest["fingerprint"] == fingerprint:
+            local = os.path.join(self.__artifact_dir(artifact_id), latest["checksum"])
+            if os.path.isdir(local):
+                return os.path.join(local, name) if name else local, latest["checksum"]
+
+        start = time.perf_counter()
+        checksum = self.checksum(source)
+        local = os.path.join(self.__artifact_dir(artifact_id), checksum)
+        if not os.path.isdir(local):
+            tmp_path = os.path.join(self.__artifact_dir(artifact_id), f".{checksum}.{uuid.uuid4().hex}.tmp")
+            if name:
+                os.makedirs(tmp_path)
+                shutil.copy2(source, os.path.join(tmp_path, name))
+            else:
+                shutil.copytree(source, tmp_path, ignore=shutil.ignore_patterns(".*", "*.tmp"))
+            try:
+                os.rename(tmp_path, local)
+                # copytree keeps the times of the source, the copies are pruned by copy time.
+                os.utime(local)
+            except OSError:
+                # Another process copied the same checksum first.
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            self._count(downloads=1, download_seconds=time.perf_counter() - start)
+            logging.info(f"Model artifact {artifact_id} {checksum[:12]} copied to {local} in "
+                         f"{time.perf_counter() - start:.2f}s.")
+            self.__prune(artifact_id)
+        manifest = {"source": os.path.abspath(source), "fingerprint": fingerprint, "checksum": checksum}
+        manifest_path = os.path.join(self.__artifact_dir(artifact_id), MANIFEST)
+        tmp_manifest = f"{manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_manifest, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest, manifest_path)
+        return os.path.join(local, name) if name else local, checksum
+
+    def load(self, source: str, loader: Callable[[str], Any], artifact_id: str = None, name: str = None) -> Any:
+        """
+        Loads a model once per process from the local copy of its artifact.
+        Args:
+            source (str): Model file or folder.
+            loader (Callable): Function loading the model from the local path.
+            artifact_id (str): Id of the artifact. Defaults to one derived from the path.
+            name (str): Name of the loader, when several loaders read the same artifact. Defaults
+                        to the qualified name of loader.
+        Returns:
+            Any: The loaded model. It is shared, treat it as read only.
+        """
+        artifact_id = artifact_id or self.artifact_id(source)
+        local, checksum = self.fetch(source, artifact_id)
+        key = (artifact_id, checksum, name or getattr(loader, "__qualname__", repr(loader)))
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self._count(hits=1)
+                return self._models[key]
+            start = time.perf_counter()
+            model = loader(local)
+            seconds = time.perf_counter() - start
+            self._count(misses=1, load_seconds=seconds)
+            self._models[key] = model
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+        logging.info(f"Model {artifact_id} {checksum[:12]} loaded in {seconds:.2f}s (pid {os.getpid()}).")
+        return model
+
+    def load_array(self, source: str, file_name: str, artifact_id: str = None) -> np.ndarray:
+        """
+        Memory maps a .npy array of an artifact, read only. Processes of the node share its pages.
+        Args:
+            source (str): Folder of the artifact.
+            file_name (str): Name of the .npy file in the folder.
+            artifact_id (str): Id of the artifact. Defaults to one derived from the path.
+        Returns:
+            np.ndarray: Memory mapped array.
+        """
+        return self.load(source, lambda path: np.load(os.path.join(path, file_name), mmap_mode="r"),
+                         artifact_id, name=f"npy:{file_name}")
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """
+        Gets the statistics of the cache in this process.
+        Returns:
+            dict: Hits, misses, downloads, seconds loading and downloading, hit rate and models kept.
+        """
+        with cls._lock:
+            stats = dict(cls._count())
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else None
+            stats["models"] = len(cls._models)
+        return stats
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Drops the models kept in memory by this process. Local copies are kept.
+        Returns:
+            None
+        """
+        with cls._lock:
+            cls._models.clear()
@@ -0,0 +1,446 @@
+"""
+Read and write data sets as hive partitioned parquet files, e.g. <path>/country=co/date=2023-01-01/.
+Writes are atomic: files are written under a hidden name and renamed in place, and overwritten
+partitions are swapped as whole folders, so concurrent readers and writers never see half written
+files. A reader listing a partition while it is swapped can find it empty for the time between two
+renames; a failed swap puts the old folder back. Reads support column projection and predicate
+pushdown: filters on partition columns prune folders and filters on other columns skip row groups
+using their statistics.
+
+Classes:
+
+    PartitionedDataset
+        A partitioned parquet data set on a local or mounted file system.
+"""
+
+import os
+import shutil
+import uuid
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# A filter is a list of (column, op, value) tuples joined with AND, or a list of such lists joined with OR.
+Filters = Union[List[Tuple[str, str, Any]], List[List[Tuple[str, str, Any]]]]
+
+
+class PartitionedDataset:
+    """
+    A partitioned parquet data set on a local or mounted file system.
+
+    Usage:
+        dataset = PartitionedDataset("/dbfs/ptc/sales", partition_columns=["country", "date"])
+        dataset.write(frame)
+        frame = dataset.read(columns=["sku", "units"], filters=[("country", "=", "co"), ("date", ">=", "2023-01-01")])
+    """
+
+    def __init__(self, path: str, partition_columns: List[str] = None, compression: str = "snappy",
+                 row_group_size: int = 128 * 1024):
+        """
+        Initializes the data set. Nothing is read or written until it is used.
+        Args:
+            path (str): Root folder of the data set.
+            partition_columns ([str]): Columns encoded in the folder names, outermost first.
+            compression (str): Parquet compression codec.
+            row_group_size (int): Rows per row group. Smaller groups skip more data on filtered
+                                  reads, larger ones compress better.
+        """
+        self.path = path
+        self.partition_columns = list(partition_columns or [])
+        self.compression = compression
+        self.row_group_size = row_group_size
+
+    @staticmethod
+    def format_value(value: Any) -> str:
+        """
+        Formats a partition value for a folder name.
+        Args:
+            value (Any): Partition value.
+        Returns:
+            str: Value as written in the folder name.
+        """
+        if isinstance(value, (pd.Timestamp, datetime)):
+            return value.date().isoformat() if value == pd.Timestamp(value).normalize() else value.isoformat()
+        if isinstance(value, date):
+            return value.isoformat()
+        return str(value)
+
+    def partition_path(self, values: Dict[str, Any]) -> str:
+        """
+        Gets the folder of a partition, or of a branch of partitions when only the leading
+        partition columns are given, e.g. <path>/country=co for {"country": "co"}.
+        Args:
+            values (dict): Values of the partition columns.
+        Returns:
+            str: Folder of the partition.
+        """
+        parts = []
+        for column in self.partition_columns:
+            if column not in values:
+                break
+            parts.append(f"{column}={self.format_value(values[column])}")
+        return os.path.join(self.path, *parts)
+
+    def __split(self, frame: pd.DataFrame, partition_values: Dict[str, Any]) -> Iterator[Tuple[dict, pd.DataFrame]]:
+        """
+        Splits a frame by partition. Partition columns are encoded in the folder names so they
+        are dropped from the files.
+        Args:
+            frame (pd.DataFrame): Rows to split.
+            partition_values (dict): Constant partition values for columns missing from the frame.
+        Returns:
+            Iterator: Partition values and rows of every partition.
+        """
+        partition_values = dict(partition_values or {})
+        by = [c for c in self.partition_columns if c not in partition_values]
+        if not by:
+            yield partition_values, frame.drop(columns=[c for c in self.partition_columns if c in frame])
+            return
+        for values, group in frame.groupby(by, sort=False):
+            values = values if isinstance(values, tuple) else (values,)
+            yield {**partition_values, **dict(zip(by, values))}, group.drop(columns=self.partition_columns,
+                                                                           errors="ignore")
+
+    def __write_file(self, folder: str, frame: pd.DataFrame) -> str:
+        """
+        Writes one parquet file under a hidden name and renames it in place.
+        Args:
+            folder (str): Destination folder.
+            frame (pd.DataFrame): Rows to write.
+        Returns:
+            str: Path of the written file.
+        """
+        os.makedirs(folder, exist_ok=True)
+        name = f"part-{uuid.uuid4().hex}.parquet"
+        tmp_path = os.path.join(folder, f".{name}.tmp")
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        pq.write_table(table, tmp_path, compression=self.compression, row_group_size=self.row_group_size,
+                       write_statistics=True)
+        os.replace(tmp_path, os.path.join(folder, name))
+        return os.path.join(folder, name)
+
+    def replace_file(self, path: str, frame: pd.DataFrame) -> None:
+        """
+        Replaces the rows of one file of the data set in a single rename, e.g. to delete some of
+        them, and removes the file when no rows are left. The other files are not touched.
+        Args:
+            path (str): File of the data set, as listed by files().
+            frame (pd.DataFrame): New rows of the file, without the partition columns.
+        Returns:
+            None
+        """
+        if not len(frame):
+            os.remove(path)
+            return
+        tmp_path = self.__hidden_sibling(path, "tmp")
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        pq.write_table(table, tmp_path, compression=self.compression, row_group_size=self.row_group_size,
+                       write_statistics=True)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def __swap(tmp_path: str, path: str) -> None:
+        """
+        Moves a fully written folder in place of another one. A folder cannot replace a non empty
+        one in a single rename, so the old folder is first renamed aside: readers listing the
+        folder between the two renames find no data for it. If the second rename fails, the old
+        folder is put back and the written one is left for the caller to retry or remove.
+        Args:
+            tmp_path (str): Fully written folder.
+            path (str): Folder to replace.
+        Returns:
+            None
+        """
+        old_path = f"{tmp_path}.old"
+        moved = os.path.isdir(path)
+        if moved:
+            os.rename(path, old_path)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            if moved:
+                os.rename(old_path, path)
+            raise
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @staticmethod
+    def __hidden_sibling(path: str, suffix: str) -> str:
+        """
+        Gets a hidden temporary path next to a folder, on the same file system so it can be renamed.
+        Args:
+            path (str): Folder.
+            suffix (str): Suffix of the temporary folder.
+        Returns:
+            str: Temporary folder path.
+        """
+        parent, name = os.path.split(os.path.normpath(path))
+        return os.path.join(parent, f".{name}.{uuid.uuid4().hex}.{suffix}")
+
+    def write(self, frame: pd.DataFrame, partition_values: Dict[str, Any] = None,
+              mode: str = "append") -> List[str]:
+        """
+        Writes rows to the data set.
+        Args:
+            frame (pd.DataFrame): Rows to write.
+            partition_values (dict): Constant partition values for partition columns missing from
+                                     the frame, e.g. {"country": "co"}.
+            mode (str): "append" adds new files next to the existing ones. "overwrite_partitions"
+                        replaces the partitions present in the frame and keeps the others.
+        Returns:
+            list: Paths of the written files.
+        """
+        if mode not in ("append", "overwrite_partitions"):
+            raise ValueError(f"Unsupported write mode {mode}")
+        files = []
+        for values, group in self.__split(frame, partition_values):
+            folder = self.partition_path(values)
+            if mode == "append":
+                files.append(self.__write_file(folder, group))
+            else:
+                tmp_path = self.__hidden_sibling(folder, "tmp")
+                try:
+                    file = self.__write_file(tmp_path, group)
+                    self.__swap(tmp_path, folder)
+                finally:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                files.append(os.path.join(folder, os.path.basename(file)))
+        return files
+
+    def write_stream(self, frames: Iterator[pd.DataFrame], partition_values: Dict[str, Any] = None) -> str:
+        """
+        Writes a stream of frames into one file of a partition, a row group at a time, so only one
+        frame is in memory. The file is renamed in place once complete.
+        Args:
+            frames (Iterator[pd.DataFrame]): Rows to write, all with the same columns.
+            partition_values (dict): Values of all the partition columns, e.g. {"country": "co"}.
+        Returns:
+            str: Path of the written file, or None if the frames were empty.
+        """
+        folder = self.partition_path(partition_values or {})
+        os.makedirs(folder, exist_ok=True)
+        name = f"part-{uuid.uuid4().hex}.parquet"
+        tmp_path = os.path.join(folder, f".{name}.tmp")
+        writer = None
+        try:
+            for frame in frames:
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression=self.compression,
+                                              write_statistics=True)
+                writer.write_table(table, row_group_size=self.row_group_size)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if writer is None:
+            return None
+        writer.close()
+        os.replace(tmp_path, os.path.join(folder, name))
+        return os.path.join(folder, name)
+
+    def staging(self, partition_values: Dict[str, Any] = None) -> "PartitionedDataset":
+        """
+        Gets a hidden data set next to a partition, to build its new content with several writes
+        (e.g. from parallel workers) and move it in place with commit_staging. Readers of the data
+        set ignore it.
+        Args:
+            partition_values (dict): Values of the leading partition columns of the partition.
+        Returns:
+            PartitionedDataset: Empty data set with the remaining partition columns.
+        """
+        partition_values = dict(partition_values or {})
+        target = self.partition_path(partition_values)
+        return PartitionedDataset(self.__hidden_sibling(target, "build"),
+                                  [c for c in self.partition_columns if c not in partition_values],
+                                  self.compression, self.row_group_size)
+
+    def commit_staging(self, staging: "PartitionedDataset", partition_values: Dict[str, Any] = None) -> None:
+        """
+        Replaces a partition with a data set built by staging().
+        Args:
+            staging (PartitionedDataset): Data set returned by staging() for the same partition.
+            partition_values (dict): Values of the leading partition columns of the partition.
+        Returns:
+            None
+        """
+        target = self.partition_path(dict(partition_values or {}))
+        os.makedirs(staging.path, exist_ok=True)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self.__swap(staging.path, target)
+
+    def overwrite(self, frames: Iterator[pd.DataFrame], partition_values: Dict[str, Any] = None) -> List[str]:
+        """
+        Replaces the data set with the given frames. The new data is built next to the old one and
+        swapped in once complete, so frames are streamed and never held together. When constant
+        values are given for the leading partition columns only that branch is replaced, e.g.
+        {"country": "co"} rebuilds <path>/country=co/ and keeps the other countries.
+        Args:
+            frames (Iterator[pd.DataFrame]): Rows of the new data set.
+            partition_values (dict): Constant partition values for partition columns missing from the frames.
+        Returns:
+            list: Paths of the written files.
+        """
+        partition_values = dict(partition_values or {})
+        prefix = []
+        for column in self.partition_columns:
+            if column not in partition_values:
+                break
+            prefix.append(column)
+        target = self.partition_path(partition_values)
+        build = PartitionedDataset(self.__hidden_sibling(target, "build"), self.partition_columns[len(prefix):],
+                                   self.compression, self.row_group_size)
+        os.makedirs(build.path)
+        try:
+            files = []
+            for frame in frames:
+                files.extend(build.write(frame, {c: v for c, v in partition_values.items() if c not in prefix}))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            self.__swap(build.path, target)
+        finally:
+            shutil.rmtree(build.path, ignore_errors=True)
+        return [f.replace(build.path, target, 1) for f in files]
+
+    def exists(self) -> bool:
+        """
+        Checks if the data set has been written.
+        Returns:
+            bool: True if the root folder exists.
+        """
+        return os.path.isdir(self.path)
+
+    def __dataset(self, expression: ds.Expression = None, unify: bool = True) -> ds.Dataset:
+        """
+        Opens the data set. Hidden and underscore files (in-flight writes, metadata) are ignored.
+        The schema is unified across the footers of the files of the partitions read, since a
+        batch whose values were all null has a null typed column that must not decide the type of
+        the whole column. Files of the partitions pruned by the filters are not opened.
+        Args:
+            expression (pyarrow.dataset.Expression): Filter of the read, to unify only the files it keeps.
+            unify (bool): Unify the schema with the footers, not needed to list files.
+        Returns:
+            pyarrow.dataset.Dataset: Dataset over all the committed files.
+        """
+        partitioning = ds.partitioning(
+            pa.schema([(c, pa.string()) for c in self.partition_columns]), flavor="hive"
+        ) if self.partition_columns else None
+        dataset = ds.dataset(self.path, format="parquet", partitioning=partitioning)
+        if not unify:
+            return dataset
+        fragments = dataset.get_fragments(filter=expression) if expression is not None else dataset.get_fragments()
+        schema = pa.unify_schemas([dataset.schema] + [f.physical_schema for f in fragments])
+        return dataset if schema.equals(dataset.schema) else dataset.replace_schema(schema)
+
+    @staticmethod
+    def to_expression(filters: Filters) -> ds.Expression:
+        """
+        Converts filters in disjunctive normal form to a pyarrow expression. Partition columns
+        are read as strings, so compare them with strings (ISO dates compare correctly).
+        Args:
+            filters: List of (column, op, value) joined with AND, or a list of such lists joined with OR.
+                     Supported ops: =, ==, !=, <, <=, >, >=, in, not in.
+        Returns:
+            pyarrow.dataset.Expression: Equivalent expression.
+        """
+        if not filters:
+            return None
+        if isinstance(filters[0], tuple):
+            filters = [filters]
+        ops = {
+            "=": lambda f, v: f == v, "==": lambda f, v: f == v, "!=": lambda f, v: f != v,
+            "<": lambda f, v: f < v, "<=": lambda f, v: f <= v, ">": lambda f, v: f > v, ">=": lambda f, v: f >= v,
+            "in": lambda f, v: f.isin(list(v)), "not in": lambda f, v: ~f.isin(list(v)),
+        }
+        disjunction = None
+        for conjunction in filters:
+            expression = None
+            for column, op, value in conjunction:
+                term = ops[op](ds.field(column), value)
+                expression = term if expression is None else expression & term
+            disjunction = expression if disjunction is None else disjunction | expression
+        return disjunction
+
+    def read(self, columns: List[str] = None, filters: Filters = None) -> pd.DataFrame:
+        """
+        Reads the data set into memory.
+        Args:
+            columns ([str]): Columns to read. All columns when None.
+            filters: Filters pushed down to the partitions and row groups.
+        Returns:
+            pd.DataFrame: Rows matching the filters.
+        """
+        expression = self.to_expression(filters)
+        return self.__dataset(expression).to_table(columns=columns, filter=expression).to_pandas()
+
+    def iter_batches(self, columns: List[str] = None, filters: Filters = None,
+                     batch_size: int = 128 * 1024) -> Iterator[pd.DataFrame]:
+        """
+        Streams the data set batch by batch, so data sets larger than memory can be processed.
+        Args:
+            columns ([str]): Columns to read. All columns when None.
+            filters: Filters pushed down to the partitions and row groups.
+            batch_size (int): Maximum rows per batch.
+        Returns:
+            Iterator[pd.DataFrame]: Batches of rows matching the filters.
+        """
+        expression = self.to_expression(filters)
+        scanner = self.__dataset(expression).scanner(columns=columns, filter=expression, batch_size=batch_size)
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+    def files(self, filters: Filters = None) -> List[str]:
+        """
+        Lists the files holding rows of the partitions matching the filters, e.g. to hand them to
+        parallel workers. Only partition columns are used to prune.
+        Args:
+            filters: Filters on partition columns.
+        Returns:
+            list: Paths of the files.
+        """
+        if not self.exists():
+            return []
+        dataset = self.__dataset(unify=False)
+        expression = self.to_expression(filters)
+        fragments = dataset.get_fragments(filter=expression) if expression is not None else dataset.get_fragments()
+        return sorted(f.path for f in fragments)
+
+    def partitions(self, filters: Filters = None) -> List[Dict[str, str]]:
+        """
+        Lists the partitions holding data, as read from the folder names.
+        Args:
+            filters: Filters on partition columns.
+        Returns:
+            list: Values of the partition columns of every partition, as strings.
+        """
+        partitions = []
+        for file in self.files(filters):
+            parts = os.path.relpath(os.path.dirname(file), self.path).split(os.sep)
+            values = dict(p.split("=", 1) for p in parts if "=" in p)
+            if values not in partitions:
+                partitions.append(values)
+        return partitions
+
+    def count_rows(self, filters: Filters = None) -> int:
+        """
+        Counts rows, using parquet metadata where the filters allow it.
+        Args:
+            filters: Filters pushed down to the partitions and row groups.
+        Returns:
+            int: Number of rows matching the filters.
+        """
+        expression = self.to_expression(filters)
+        return self.__dataset(expression).count_rows(filter=expression)
+
+    def size_in_bytes(self) -> int:
+        """
+        Sums the size of the committed files.
+        Returns:
+            int: Size of the data set on disk in bytes.
+        """
+        return sum(os.path.getsize(f) for f in self.files())
@@ -0,0 +1,2 @@
+from libs.lola_utils.storage.ModelCache import ModelCache
+from libs.lola_utils.storage.PartitionedDataset import PartitionedDataset
@@ -2,8 +2,15 @@
 Module to define the base class for all PTC processes. Here it is where
 the AML authentication is defined.
 """
+import os
+from typing import Dict, List
+
+import pandas as pd
 
 from libs.lola_utils.config import CONFIG
+from libs.lola_utils.ind import DtypeCompactor
+from libs.lola_utils.profiling import DatasetProfile
+from libs.lola_utils.storage import PartitionedDataset
 
 
 class Base:
@@ -19,3 +26,80 @@ class Base:
 
     def mgs_secundario(self) -> None:
         print("Hola Doctor Quiroz")
+
+    def get_dataset(self, name: str) -> PartitionedDataset:
+        """Gets the data set of an ingested source, partitioned by country and then by the
+        partition_columns of the source. Read it with column projection and filters so only
+        the columns and partitions needed are loaded, e.g.
+        self.get_dataset("sales").read(["sku", "units"], [("country", "=", "co")]).
+
+        Args:
+            name (str): Name of the source in data_ingestion.sources.
+        Returns:
+            PartitionedDataset: Data set of the source.
+        """
+        settings = CONFIG.data_ingestion.to_dict()
+        source = next((s for s in settings["sources"] if s["name"] == name), None)
+        if source is None:
+            raise ValueError(f"Error: source {name} is not in data_ingestion.sources")
+        return PartitionedDataset(
+            os.path.join(settings["output_path"], name),
+            ["country"] + source.get("partition_columns", []),
+            compression=settings.get("compression", "snappy"),
+            row_group_size=settings.get("row_group_size", 128 * 1024),
+        )
+
+    def get_profile(self, name: str, country: str = None) -> DatasetProfile:
+        """Gets the profile computed while a source was ingested: row and null counts, distinct
+        counts, quantiles and most frequent values of every column, with no pass over the data.
+
+        Args:
+            name (str): Name of the source in data_ingestion.sources.
+            country (str): Country of the data. Defaults to the COUNTRY environment variable.
+        Returns:
+            DatasetProfile: Profile of the source, or None if it has none.
+        """
+        country = country or os.getenv("COUNTRY") or CONFIG.get_value_or_none("country")
+        return DatasetProfile.load(self.get_dataset(name).partition_path({"country": country}))
+
+    def get_schema(self, name: str) -> Dict[str, str]:
+        """Gets the dtypes of the columns of a data set from data_models in DataModels.json,
+        e.g. {"data_models": {"sales": {"sale_id": "int32", "sale_date": "date", "sku": "category"}}}.
+
+        Args:
+            name (str): Name of the data set.
+        Returns:
+            dict: Dtype by column, empty when the data set has no data model.
+        """
+        schema = CONFIG.get_value_or_none(["data_models", name])
+        return schema.to_dict() if schema is not None else {}
+
+    def compact(self, frame: pd.DataFrame, name: str = None, **kwargs) -> pd.DataFrame:
+        """Compacts the dtypes of a frame with its data model and the ranges of its values, and
+        logs the bytes before and after per column.
+
+        Args:
+            frame (pd.DataFrame): Frame to compact.
+            name (str): Name of the data set, to use its data model.
+            **kwargs: Options of DtypeCompactor.
+        Returns:
+            pd.DataFrame: Compacted frame.
+        """
+        frame, report = DtypeCompactor(self.get_schema(name) if name else None, **kwargs).compact(frame)
+        DtypeCompactor.log_report(report, name or "frame", getattr(self, "logger", None))
+        return frame
+
+    def load_source(self, name: str, columns: List[str] = None, filters: list = None,
+                    compact: bool = True) -> pd.DataFrame:
+        """Reads the columns and partitions needed of an ingested source, compacted.
+
+        Args:
+            name (str): Name of the source in data_ingestion.sources.
+            columns ([str]): Columns to read. All columns when None.
+            filters (list): Filters pushed down to the partitions and row groups.
+            compact (bool): Compact the dtypes of the frame.
+        Returns:
+            pd.DataFrame: Rows of the source.
+        """
+        frame = self.get_dataset(name).read(columns, filters)
+        return self.compact(frame, name) if compact else frame
@@ -0,0 +1,181 @@
+"""
+PTC DATA INGESTION base of the partitioned extractors.
+
+An extractor splits a source query in partitions, extracts them concurrently over a pool of
+connections and streams every partition as columnar batches, either to a thread safe sink or
+through a bounded iterator.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import pandas as pd
+
+
+class ExtractionCancelled(Exception):
+    """Raised in the workers of iter_batches when the consumer stopped reading."""
+
+
+class ConnectionPool:
+    """Fixed size pool of connections shared by the partition workers."""
+
+    def __init__(self, connection_factory: Callable[[], Any], size: int) -> None:
+        """
+        Args:
+            connection_factory (Callable): Function returning a new connection.
+            size (int): Maximum number of open connections.
+        """
+        self.connection_factory = connection_factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        """Lends a connection, opening a new one while the pool is below its size. A connection
+        that fails to open gives its slot back, so the waiting workers try to open one too."""
+        conn = None
+        while conn is None:
+            try:
+                conn = self._idle.get_nowait()
+                continue
+            except queue.Empty:
+                pass
+            with self._lock:
+                create = self._created < self.size
+                self._created += create
+            if create:
+                try:
+                    conn = self.connection_factory()
+                except BaseException:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        """Closes all the idle connections that can be closed."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            # Salesforce clients answer any attribute with an sObject, so close must be a method.
+            close = getattr(conn, "close", None)
+            if callable(close):
+                close()
+        self._created = 0
+
+
+class BatchExtractor:
+    """Runs the partitions of a query concurrently and streams them in columnar batches.
+
+    Subclasses implement _extract_partition() for their kind of source.
+    """
+
+    def __init__(self, connection_factory: Callable[[], Any], pool_size: int = 4,
+                 batch_size: int = 50_000) -> None:
+        """
+        Args:
+            connection_factory (Callable): Function returning a new connection.
+            pool_size (int): Number of partitions extracted at the same time.
+            batch_size (int): Rows per batch.
+        """
+        self.pool = ConnectionPool(connection_factory, pool_size)
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+
+    def _extract_partition(self, query: str, partition: Dict[str, Any],
+                           emit: Callable[[str, pd.DataFrame], None], where: str = None, params: tuple = ()) -> int:
+        """Streams one partition through emit() batch by batch and returns its row count."""
+        raise NotImplementedError
+
+    def extract(self, query: str, partitions: List[Dict[str, Any]], sink: Callable[[str, pd.DataFrame], None],
+                where: str = None, params: tuple = (), stop: threading.Event = None) -> Dict[str, int]:
+        """Extracts all partitions concurrently, calling sink(partition_name, batch) from the
+        worker threads as batches arrive. The sink must be thread safe.
+
+        Args:
+            query (str): Query to extract.
+            partitions (list): Partitions of the query. Without partitions the query runs whole.
+            sink (Callable): Receives every batch with the name of its partition.
+            where (str): Filter applied to every partition, e.g. a watermark, with ? placeholders.
+            params (tuple): Parameters of the filter.
+            stop (threading.Event): Partitions not started when it is set are skipped.
+        Returns:
+            dict: Row count per partition.
+        """
+        partitions = partitions or [{"name": "all"}]
+
+        def run(partition: Dict[str, Any]) -> int:
+            if stop is not None and stop.is_set():
+                return 0
+            return self._extract_partition(query, partition, sink, where, params)
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            futures = {p["name"]: executor.submit(run, p) for p in partitions}
+            return {name: future.result() for name, future in futures.items()}
+
+    def iter_batches(self, query: str, partitions: List[Dict[str, Any]], where: str = None,
+                     params: tuple = ()) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """Extracts all partitions concurrently and yields (partition_name, batch) pairs.
+
+        A bounded queue between the workers and the consumer keeps at most two batches per
+        worker in memory, so a slow consumer slows the extraction down instead of piling data up.
+        When the consumer stops early or raises, the workers stop at their next batch, the
+        partitions not started are skipped and the connections go back to the pool.
+        """
+        batches = queue.Queue(maxsize=2 * self.pool_size)
+        done = object()
+        errors = []
+        stop = threading.Event()
+
+        def put(item: Any) -> None:
+            # Waits for room in the queue, until the consumer is gone.
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+            if item is not done:
+                raise ExtractionCancelled()
+
+        def run():
+            try:
+                self.extract(query, partitions, lambda name, batch: put((name, batch)), where, params, stop)
+            except ExtractionCancelled:
+                pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(done)
+
+        producer = threading.Thread(target=run, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+        if errors:
+            raise errors[0]
+
+    def close(self) -> None:
+        """Closes the pooled connections."""
+        self.pool.close()
@@ -0,0 +1,250 @@
+"""
+PTC DATA INGESTION in-memory stand-in for a simple_salesforce client.
+
+Serves records from a json file ({"Account": [{...}, ...], ...}) through the same calls the
+Salesforce extractor makes: query(), query_more() with nextRecordsUrl paging, bulk query jobs
+with lazy_operation and describe() of an sObject. Like the real APIs, REST results hold dates and
+datetimes as ISO strings and bulk results as epoch milliseconds. It understands the SOQL the
+extractor generates (SELECT ... FROM ... WHERE with AND joined comparisons, ORDER BY and LIMIT),
+so ingestion can run and be tested offline.
+"""
+import json
+import re
+import threading
+import uuid
+from typing import Any, Dict, Iterator, List
+
+import pandas as pd
+
+DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}T[\d:.]+(Z|[+-]\d{2}:?\d{2})$")
+CONDITION = re.compile(r"^\s*([\w.]+)\s*(>=|<=|!=|=|<|>)\s*(.+?)\s*$")
+QUERY = re.compile(
+    r"^\s*SELECT\s+(?P<fields>.+?)\s+FROM\s+(?P<object>\w+)(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>[\w.]+)(?:\s+(?P<direction>ASC|DESC))?)?(?:\s+LIMIT\s+(?P<limit>\d+))?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+class FakeBulkType:
+    """Bulk API of one sObject."""
+
+    def __init__(self, client: "FakeSalesforce", name: str) -> None:
+        self.client = client
+        self.name = name
+
+    def query(self, soql: str, lazy_operation: bool = False):
+        """Runs a bulk query job. With lazy_operation the result chunks are yielded one by one."""
+        with self.client.lock:
+            self.client.calls["bulk"] += 1
+        if self.client.fail_bulk:
+            raise Exception(f"Error: bulk query jobs are not available for {self.name}")
+        records = [self.client.to_bulk(r) for r in self.client.run(soql)]
+        chunks = (records[i:i + self.client.bulk_chunk_size] for i in range(0, len(records),
+                                                                             self.client.bulk_chunk_size))
+        return chunks if lazy_operation else records
+
+
+class FakeBulkHandler:
+    """Gives access to the bulk API of every sObject as an attribute, like client.bulk.Account."""
+
+    def __init__(self, client: "FakeSalesforce") -> None:
+        self.client = client
+
+    def __getattr__(self, name: str) -> FakeBulkType:
+        return FakeBulkType(self.client, name)
+
+
+class FakeSObject:
+    """REST API of one sObject, like client.Account."""
+
+    def __init__(self, client: "FakeSalesforce", name: str) -> None:
+        self.client = client
+        self.name = name
+
+    def describe(self) -> Dict[str, Any]:
+        """Describes the fields of the sObject, typed from the values of its records: date and
+        datetime for ISO strings, string otherwise."""
+        with self.client.lock:
+            self.client.calls["describe"] += 1
+        values = {}
+        for record in self.client.records.get(self.name, []):
+            for field, value in record.items():
+                if not isinstance(value, dict):
+                    values.setdefault(field, []).append(value)
+        fields = []
+        for field, present in values.items():
+            present = [v for v in present if v is not None]
+            kind = "string"
+            if present and all(isinstance(v, str) and DATETIME.match(v) for v in present):
+                kind = "datetime"
+            elif present and all(isinstance(v, str) and DATE.match(v) for v in present):
+                kind = "date"
+            fields.append({"name": field, "type": kind})
+        return {"name": self.name, "fields": fields}
+
+
+class FakeSalesforce:
+    """In-memory simple_salesforce client.
+
+    Usage:
+        client = FakeSalesforce({"Account": [{"Id": "001000000000001", "Name": "Acme"}]})
+        client.query("SELECT Id, Name FROM Account WHERE Name = 'Acme'")
+    """
+
+    _files = {}
+    _files_lock = threading.Lock()
+
+    def __init__(self, records: Dict[str, List[Dict[str, Any]]], page_size: int = 2000,
+                 bulk_chunk_size: int = 10_000, fail_bulk: bool = False) -> None:
+        """
+        Args:
+            records (dict): Records of every sObject.
+            page_size (int): Records per REST query page.
+            bulk_chunk_size (int): Records per bulk result chunk.
+            fail_bulk (bool): Make bulk jobs fail, to exercise the REST fallback.
+        """
+        self.records = records
+        self.page_size = page_size
+        self.bulk_chunk_size = bulk_chunk_size
+        self.fail_bulk = fail_bulk
+        self.bulk = FakeBulkHandler(self)
+        self.calls = {"query": 0, "query_more": 0, "bulk": 0, "describe": 0}
+        self.lock = threading.Lock()
+        self._cursors = {}
+
+    def __getattr__(self, name: str) -> FakeSObject:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return FakeSObject(self, name)
+
+    @classmethod
+    def from_file(cls, path: str, page_size: int = 2000, **kwargs) -> "FakeSalesforce":
+        """Creates a client over the records of a json file, read once per path."""
+        with cls._files_lock:
+            if path not in cls._files:
+                with open(path) as f:
+                    cls._files[path] = json.load(f)
+        return cls(cls._files[path], page_size, **kwargs)
+
+    @staticmethod
+    def _parse_literal(literal: str) -> Any:
+        """Reads a SOQL literal."""
+        if literal.startswith("'") and literal.endswith("'"):
+            return literal[1:-1].replace("\\'", "'").replace("\\\\", "\\")
+        if literal.lower() in ("true", "false"):
+            return literal.lower() == "true"
+        if literal.lower() == "null":
+            return None
+        if DATE.match(literal) or DATETIME.match(literal):
+            value = pd.Timestamp(literal)
+            return value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+        return float(literal) if "." in literal else int(literal)
+
+    @staticmethod
+    def _get(record: Dict[str, Any], field: str) -> Any:
+        """Gets a field of a record, following Parent.Field relationships."""
+        value = record
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+
+    def _matches(self, record: Dict[str, Any], conditions: List[tuple]) -> bool:
+        """Evaluates AND joined comparisons on a record."""
+        for field, op, expected in conditions:
+            value = self._get(record, field)
+            if isinstance(expected, pd.Timestamp) and value is not None:
+                value = pd.Timestamp(value)
+                value = value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+            if op in ("=", "!="):
+                if (value == expected) != (op == "="):
+                    return False
+            elif value is None or expected is None or not {
+                "<": value < expected, "<=": value <= expected, ">": value > expected, ">=": value >= expected
+            }[op]:
+                return False
+        return True
+
+    def run(self, soql: str) -> List[Dict[str, Any]]:
+        """Runs a SOQL query over the records and returns all the matching ones."""
+        match = QUERY.match(soql)
+        if match is None:
+            raise ValueError(f"Error: unsupported SOQL {soql}")
+        conditions = []
+        if match.group("where"):
+            where = re.sub(r"[()]", " ", match.group("where"))
+            if re.search(r"\sOR\s", where, re.IGNORECASE):
+                raise ValueError(f"Error: OR is not supported by the fake client: {soql}")
+            for condition in re.split(r"\s+AND\s+", where.strip(), flags=re.IGNORECASE):
+                field, op, literal = CONDITION.match(condition).groups()
+                conditions.append((field, op, self._parse_literal(literal)))
+        name = match.group("object")
+        records = [r for r in self.records.get(name, []) if self._matches(r, conditions)]
+        if match.group("order"):
+            order = match.group("order")
+            records.sort(key=lambda r: (self._get(r, order) is None, self._get(r, order)),
+                         reverse=(match.group("direction") or "ASC").upper() == "DESC")
+        if match.group("limit"):
+            records = records[:int(match.group("limit"))]
+        fields = [f.strip() for f in match.group("fields").split(",")]
+        return [self._project(r, name, fields) for r in records]
+
+    @classmethod
+    def to_bulk(cls, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Formats a record like the json results of bulk query jobs, with dates and datetimes as
+        epoch milliseconds."""
+        result = {}
+        for key, value in record.items():
+            if isinstance(value, dict):
+                value = cls.to_bulk(value)
+            elif isinstance(value, str) and (DATE.match(value) or DATETIME.match(value)):
+                value = pd.Timestamp(value)
+                value = value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+                value = int(value.value // 10 ** 6)
+            result[key] = value
+        return result
+
+    def _project(self, record: Dict[str, Any], name: str, fields: List[str]) -> Dict[str, Any]:
+        """Keeps the selected fields of a record, nesting Parent.Field relationships like the API."""
+        result = {"attributes": {"type": name}}
+        for field in fields:
+            target = result
+            parts = field.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {"attributes": {"type": part}})
+            target[parts[-1]] = self._get(record, field)
+        return result
+
+    def _page(self, cursor: str) -> Dict[str, Any]:
+        """Returns the next page of a query cursor."""
+        records = self._cursors.pop(cursor)
+        page, rest = records[:self.page_size], records[self.page_size:]
+        result = {"totalSize": len(records), "done": not rest, "records": page}
+        if rest:
+            next_cursor = uuid.uuid4().hex
+            self._cursors[next_cursor] = rest
+            result["nextRecordsUrl"] = f"/services/data/v52.0/query/{next_cursor}"
+        return result
+
+    def query(self, soql: str, include_deleted: bool = False, **kwargs) -> Dict[str, Any]:
+        """Runs a REST query and returns its first page."""
+        with self.lock:
+            self.calls["query"] += 1
+        cursor = uuid.uuid4().hex
+        self._cursors[cursor] = self.run(soql)
+        return self._page(cursor)
+
+    def query_more(self, next_records_identifier: str, identifier_is_url: bool = False, **kwargs) -> Dict[str, Any]:
+        """Returns the next page of a REST query."""
+        with self.lock:
+            self.calls["query_more"] += 1
+        return self._page(next_records_identifier.rsplit("/", 1)[-1])
+
+    def query_all_iter(self, soql: str, **kwargs) -> Iterator[Dict[str, Any]]:
+        """Yields all the records of a query, page by page."""
+        result = self.query(soql)
+        while True:
+            yield from result["records"]
+            if result["done"]:
+                break
+            result = self.query_more(result["nextRecordsUrl"], identifier_is_url=True)
@@ -0,0 +1,252 @@
+"""
+PTC DATA INGESTION incremental loading with persisted high-watermarks.
+
+Every incremental source has a watermark column (e.g. a last modified timestamp). The last
+watermark loaded successfully is saved per country and table, so the next run only extracts the
+newer rows and merges them into the partitioned data set of the source.
+"""
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from libs.lola_utils.ind import DtypeCompactor
+from libs.lola_utils.profiling import DatasetProfile
+from libs.lola_utils.storage import PartitionedDataset
+from ptc.data_ingestion.batch_extractor import BatchExtractor
+
+
+class WatermarkStore:
+    """Last successful watermark per country and table, kept in a json file next to the data."""
+
+    FILE_NAME = "_watermarks.json"
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Folder of the ingested data sets.
+        """
+        self.path = os.path.join(path, self.FILE_NAME)
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Any]:
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def get(self, country: str, table: str) -> Dict[str, Any]:
+        """Gets the saved watermark of a table as {"column": ..., "value": ...}, or None."""
+        return self._read().get(country, {}).get(table)
+
+    def set(self, country: str, table: str, column: str, value: Any) -> None:
+        """Saves the watermark of a table. The file is replaced atomically."""
+        if isinstance(value, pd.Timestamp):
+            value = value.isoformat()
+        elif hasattr(value, "item"):
+            value = value.item()
+        with self._lock:
+            watermarks = self._read()
+            watermarks.setdefault(country, {})[table] = {"column": column, "value": value}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(watermarks, f, indent=2, default=str)
+            os.replace(tmp_path, self.path)
+
+    def clear(self, country: str, table: str) -> None:
+        """Forgets the watermark of a table, so the next load is a full reload."""
+        with self._lock:
+            watermarks = self._read()
+            if watermarks.get(country, {}).pop(table, None) is not None:
+                tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(watermarks, f, indent=2, default=str)
+                os.replace(tmp_path, self.path)
+
+
+class IncrementalLoader:
+    """Extracts the rows of a source newer than its watermark and merges them into its data set.
+
+    The data set of a source is partitioned by country and then by the partition columns of the
+    source, <source_path>/country=<country>/<column>=<value>/part-*.parquet. New rows are appended
+    as new files, and the older versions of their keys are deleted from the files holding them,
+    in any partition of the country, so a row whose partition value changed moves. Files without
+    any of the keys loaded are not rewritten.
+    """
+
+    def __init__(self, extractor: BatchExtractor, store: WatermarkStore, country: str) -> None:
+        """
+        Args:
+            extractor (BatchExtractor): Extractor of the source.
+            store (WatermarkStore): Store of the watermarks.
+            country (str): Country the watermarks and loaded rows belong to.
+        """
+        self.extractor = extractor
+        self.store = store
+        self.country = country
+
+    def load(self, source: Dict[str, Any], dataset: PartitionedDataset, partitions: list = None,
+             full_reload: bool = False, compactor: DtypeCompactor = None,
+             transform: Callable[[pd.DataFrame], pd.DataFrame] = None) -> Dict[str, Any]:
+        """Loads a source incrementally, or fully when it has no watermark yet or full_reload is set.
+
+        The filter uses >= on the watermark, so rows committed late with the same watermark value
+        are picked up again; the merge on the key columns removes the duplicates. The loaded rows
+        are profiled on the way and the profile, merged with the one of earlier loads, is saved
+        next to the data of the country.
+
+        Args:
+            source (dict): Source config with name, query and incremental:
+                           {"watermark_column": ..., "key_columns": [...]}.
+            dataset (PartitionedDataset): Data set of the source, partitioned by country first.
+            partitions (list): Extraction partitions of the source query.
+            full_reload (bool): Ignore the watermark and rebuild the data set of the country.
+            compactor (DtypeCompactor): Compactor of the batches, applied after the watermark is read.
+            transform (Callable): Function applied to every batch before it is compacted.
+        Returns:
+            dict: Loaded row count, mode, new watermark and compaction report.
+        """
+        settings = source["incremental"]
+        column = settings["watermark_column"]
+        watermark = None if full_reload else self.store.get(self.country, source["name"])
+        country_path = dataset.partition_path({"country": self.country})
+        if watermark is not None and (watermark["column"] != column or not os.path.isdir(country_path)):
+            watermark = None
+
+        lock = threading.Lock()
+        state = {"max": None}
+        profiles = {}
+        reports = []
+
+        def track(partition: str, batch: pd.DataFrame) -> pd.DataFrame:
+            batch_max = batch[column].max()
+            with lock:
+                if state["max"] is None or batch_max > state["max"]:
+                    state["max"] = batch_max
+            if transform is not None:
+                batch = transform(batch)
+            if compactor is not None:
+                batch, report = compactor.compact(batch)
+                reports.append(report)
+            # Batches of a partition come from one worker, so each partition profile has one writer.
+            profiles.setdefault(partition, DatasetProfile()).update(batch)
+            return batch
+
+        if watermark is None:
+            # A full load streams straight into a new copy of the country and swaps it in.
+            counter = {"rows": 0}
+
+            def batches():
+                for partition, batch in self.extractor.iter_batches(source["query"], partitions or []):
+                    if len(batch):
+                        counter["rows"] += len(batch)
+                        yield track(partition, batch)
+
+            dataset.overwrite(batches(), {"country": self.country})
+            rows = counter["rows"]
+        else:
+            replaced = DatasetProfile()
+            rows = self._merge(source, dataset, partitions, column, watermark["value"], track, replaced)
+
+        profile = DatasetProfile.merge_all(profiles.values())
+        if watermark is not None:
+            profile = DatasetProfile.merge_all([DatasetProfile.load(country_path) or DatasetProfile(), profile])
+            # The rows replaced by newer versions or dropped as duplicates are no longer counted.
+            profile.subtract(replaced)
+        profile.save(country_path)
+        if state["max"] is not None:
+            self.store.set(self.country, source["name"], column, state["max"])
+        return {"rows": rows, "mode": "full" if watermark is None else "incremental",
+                "watermark": state["max"] if state["max"] is not None else (watermark or {}).get("value"),
+                "compaction": DtypeCompactor.combine_reports(reports)}
+
+    def _merge(self, source: Dict[str, Any], dataset: PartitionedDataset, partitions: list, column: str,
+               watermark: Any, track, replaced: DatasetProfile) -> int:
+        """Stages the rows at or after the watermark and upserts them into the data set of the country.
+
+        The newest version of every staged key (highest watermark, then last staged) is kept. The
+        older versions are deleted first, reading only the key columns of the files of the country
+        and rewriting the files holding some of them; the new rows are then appended, one file per
+        partition. A reader between the two steps misses the upserted rows; a run failing between
+        them keeps its watermark, so the next run loads them again.
+
+        Args:
+            source (dict): Source config.
+            dataset (PartitionedDataset): Data set of the source, partitioned by country first.
+            partitions (list): Extraction partitions of the source query.
+            column (str): Watermark column.
+            watermark (Any): Saved watermark.
+            track (Callable): Function applied to every extracted batch before it is staged.
+            replaced (DatasetProfile): Profile the deleted rows are added to.
+        Returns:
+            int: Number of rows extracted.
+        """
+        keys = source["incremental"]["key_columns"]
+        parent, name = os.path.split(os.path.normpath(dataset.path))
+        staging = PartitionedDataset(os.path.join(parent, f".{name}.{uuid.uuid4().hex}.staging"),
+                                     dataset.partition_columns[1:], dataset.compression, dataset.row_group_size)
+        try:
+            rows = self.extractor.extract(
+                source["query"], partitions or [],
+                lambda partition, batch: staging.write(track(partition, batch)) if len(batch) else None,
+                f"{column} >= ?", (watermark,),
+            )
+            if not staging.exists():
+                return sum(rows.values())
+            staged = staging.read(columns=list(dict.fromkeys(keys + [column] + staging.partition_columns)))
+            newest = self._newest(staged, keys, column)
+            self._delete_keys(dataset, keys, newest[keys], replaced)
+            for values in staging.partitions():
+                group = staging.read(filters=[(c, "=", v) for c, v in values.items()] or None)
+                here = newest
+                for c, v in values.items():
+                    here = here[here[c] == v]
+                # Older versions of a key, in this partition or staged in another one, are not written.
+                kept = self._newest(group, keys, column)
+                kept = kept[pd.MultiIndex.from_frame(kept[keys]).isin(pd.MultiIndex.from_frame(here[keys]))]
+                replaced.update(group.drop(index=kept.index))
+                dataset.write(kept.drop(columns=list(values)), {"country": self.country, **values})
+        finally:
+            shutil.rmtree(staging.path, ignore_errors=True)
+        return sum(rows.values())
+
+    @staticmethod
+    def _newest(frame: pd.DataFrame, keys: List[str], column: str) -> pd.DataFrame:
+        """Keeps the newest version of every key: the highest watermark, then the last row."""
+        return frame.sort_values(column, kind="stable", na_position="first") \
+            .drop_duplicates(keys, keep="last").sort_index()
+
+    def _delete_keys(self, dataset: PartitionedDataset, keys: List[str], deleted: pd.DataFrame,
+                     replaced: DatasetProfile) -> None:
+        """Deletes the rows of some keys from the data set of the country. Only the key columns of
+        the files are read, and only the files holding some of the keys are rewritten.
+
+        Args:
+            dataset (PartitionedDataset): Data set of the source, partitioned by country first.
+            keys ([str]): Key columns.
+            deleted (pd.DataFrame): Keys to delete.
+            replaced (DatasetProfile): Profile the deleted rows are added to.
+        """
+        if not os.path.isdir(dataset.partition_path({"country": self.country})):
+            return
+        deleted = pd.MultiIndex.from_frame(deleted.astype(str))
+        for file in dataset.files([("country", "=", self.country)]):
+            parts = os.path.relpath(os.path.dirname(file), dataset.path).split(os.sep)
+            values = dict(p.split("=", 1) for p in parts if "=" in p)
+            # Key columns that are partition columns are read from the folder names.
+            file_keys = [k for k in keys if k not in values]
+            found = pq.read_table(file, columns=file_keys).to_pandas() if file_keys \
+                else pd.DataFrame(index=range(pq.ParquetFile(file).metadata.num_rows))
+            found = found.assign(**{k: values[k] for k in keys if k in values})
+            matches = pd.MultiIndex.from_frame(found[keys].astype(str)).isin(deleted)
+            if not matches.any():
+                continue
+            frame = pq.read_table(file).to_pandas()
+            replaced.update(frame[matches].assign(**values))
+            dataset.replace_file(file, frame[~matches].reset_index(drop=True))
@@ -1,8 +1,23 @@
 """
 PTC DATA INGESTION process code.
 """
+import os
+from datetime import date
+from typing import Any, Callable, Dict, Tuple
+
+import pandas as pd
+
+from libs.lola_utils.cache import TieredCache
+from libs.lola_utils.config import CONFIG
 from libs.lola_utils.execution import Process as BaseProcess
+from libs.lola_utils.ind import DtypeCompactor, TextNormalizer
+from libs.lola_utils.profiling import DatasetProfile
+from libs.lola_utils.storage import PartitionedDataset
 from ptc.base import Base
+from ptc.data_ingestion.batch_extractor import BatchExtractor
+from ptc.data_ingestion.incremental import IncrementalLoader, WatermarkStore
+from ptc.data_ingestion.salesforce_extractor import SalesforceExtractor
+from ptc.data_ingestion.sql_extractor import SqlExtractor
 
 
 class Process(BaseProcess):
@@ -18,22 +33,214 @@ class Process(BaseProcess):
         """
         super().__init__()
         self.b = Base()
+        self.normalizer = None
 
     def validate_process(self):
+        settings = CONFIG.get_value_or_none("data_ingestion")
+        if settings is not None:
+            settings = settings.to_dict()
+            for key in ("output_path", "sources"):
+                if key not in settings:
+                    return False, f"data_ingestion.{key} is missing in the service config"
+            for source in settings["sources"]:
+                key = "salesforce" if source.get("type") == "salesforce" else "connection"
+                if key not in settings:
+                    return False, f"data_ingestion.{key} is missing for source {source['name']}"
         return True, "PTC DATA INGESTION process"
 
     def execute_process(self) -> None:
-        """_summary_
-        Raises:
-            exc: _description_
+        """Extracts every source of data_ingestion.sources in the service config,
+        partition by partition and concurrently, into the partitioned data set
+        <output_path>/<source name>/country=<country>/. Batches are compacted on the
+        way and the bytes saved per column are logged. Columns listed in the normalize
+        entry of a source get a <column>_normalized copy for name matching.
+        Sources of type salesforce are read from data_ingestion.salesforce, the
+        others from the database of data_ingestion.connection. Sources with an
+        incremental config only extract the rows newer than their last watermark,
+        unless data_ingestion.full_reload or the full_reload of the source is set.
+        Without a data_ingestion config nothing is extracted.
+
         Returns:
-            bool: _description_
+            None
         """
         print(">>> PTC Process: DATA INGESTION")
         self.b.mgs_secundario()
 
+        settings = CONFIG.get_value_or_none("data_ingestion")
+        if settings is None:
+            return None
+        settings = settings.to_dict()
+
+        country = os.getenv("COUNTRY") or CONFIG.get_value_or_none("country")
+        store = WatermarkStore(settings["output_path"])
+        extractors = {}
+        try:
+            for source in settings["sources"]:
+                source_type = source.get("type", "sql")
+                if source_type not in extractors:
+                    extractors[source_type] = self.get_extractor(settings, source_type)
+                extractor = extractors[source_type]
+                dataset = self.b.get_dataset(source["name"])
+                if source.get("incremental"):
+                    full_reload = settings.get("full_reload", False) or source.get("full_reload", False)
+                    loader = IncrementalLoader(extractor, store, country)
+                    result = loader.load(source, dataset, self.get_partitions(extractor, source), full_reload,
+                                         self.get_compactor(settings, source), self.get_transform(settings, source))
+                    self.logger.info(f"Source {source['name']} loaded ({result['mode']}): {result['rows']} rows, "
+                                     f"watermark {result['watermark']}.")
+                    report = result["compaction"]
+                else:
+                    rows, report = self.extract_source(extractor, source, dataset, country,
+                                                       self.get_compactor(settings, source),
+                                                       self.get_transform(settings, source))
+                    self.logger.info(f"Source {source['name']} extracted: {rows} rows.")
+                if len(report):
+                    DtypeCompactor.log_report(report, source["name"], self.logger)
+                self.output_locations[source["name"]] = dataset.path
+            if self.normalizer is not None:
+                self.normalizer.save()
+                self.logger.info(f"Normalized names: {self.normalizer.stats['values']} values, "
+                                 f"{self.normalizer.stats['misses']} normalized, "
+                                 f"{self.normalizer.stats['hits']} found in the memo, "
+                                 f"{self.normalizer.stats['cache_hits']} in the cache.")
+                if self.normalizer.cache is not None:
+                    self.logger.info(f"Ingestion cache: {self.normalizer.cache.stats()}")
+        finally:
+            for extractor in extractors.values():
+                extractor.close()
+
         return None
 
+    @staticmethod
+    def get_extractor(settings: Dict[str, Any], source_type: str) -> BatchExtractor:
+        """Builds the extractor of a type of source.
+
+        Args:
+            settings (dict): data_ingestion config.
+            source_type (str): "sql" or "salesforce".
+        Returns:
+            BatchExtractor: Extractor of the sources of that type.
+        """
+        pool_size = settings.get("pool_size", 4)
+        batch_size = settings.get("batch_size", 50_000)
+        if source_type == "sql":
+            return SqlExtractor(SqlExtractor.connection_factory(settings["connection"]), pool_size, batch_size)
+        if source_type == "salesforce":
+            salesforce = settings["salesforce"]
+            return SalesforceExtractor(SalesforceExtractor.client_factory(salesforce), pool_size, batch_size,
+                                       use_bulk=salesforce.get("use_bulk", True),
+                                       field_types=salesforce.get("field_types"))
+        raise ValueError(f"Unsupported source type {source_type}")
+
+    def get_compactor(self, settings: Dict[str, Any], source: Dict[str, Any]) -> DtypeCompactor:
+        """Builds the compactor of the batches of a source, unless data_ingestion.compact is false.
+        Only conversions that give every batch the same dtypes are applied: the dtypes of the
+        data model of the source and date parsing. Floats are kept float64 unless the data model
+        declares float32.
+
+        Args:
+            settings (dict): data_ingestion config.
+            source (dict): Source config.
+        Returns:
+            DtypeCompactor: Compactor of the source, or None.
+        """
+        if not settings.get("compact", True):
+            return None
+        return DtypeCompactor(self.b.get_schema(source["name"]), stable=True)
+
+    def get_transform(self, settings: Dict[str, Any], source: Dict[str, Any]) -> Callable:
+        """Builds the function adding a normalized copy of the name columns listed in the normalize
+        entry of a source, e.g. "normalize": ["product_name"] adds product_name_normalized. The
+        normalizer is shared by all the sources and its memo is kept in
+        <output_path>/_normalized_names.json between runs. With a data_ingestion.cache config the
+        names missing from the memo are looked up in a TieredCache shared with other workers.
+
+        Args:
+            settings (dict): data_ingestion config.
+            source (dict): Source config.
+        Returns:
+            Callable: Function transforming a batch, or None.
+        """
+        columns = source.get("normalize")
+        if not columns:
+            return None
+        if self.normalizer is None:
+            cache = TieredCache.from_settings(settings["cache"], "ptc") if settings.get("cache") else None
+            self.normalizer = TextNormalizer(settings.get("normalize_cache_size", 100_000),
+                                             os.path.join(settings["output_path"], "_normalized_names.json"),
+                                             cache=cache)
+
+        def transform(batch: pd.DataFrame) -> pd.DataFrame:
+            return batch.assign(**{f"{c}_normalized": self.normalizer.normalize(batch[c]) for c in columns})
+
+        return transform
+
+    @staticmethod
+    def get_partitions(extractor: BatchExtractor, source: Dict[str, Any]) -> list:
+        """Builds the partitions of a source from its partition config.
+
+        Args:
+            extractor (BatchExtractor): Extractor used to query the key bounds.
+            source (dict): Source config with an optional partition entry:
+                           {"type": "key", "column": ..., "count": ...} (sql),
+                           {"type": "id", "count": ...} (salesforce) or
+                           {"type": "date", "column": ..., "start": ..., "end": ..., "step_days": ...}.
+        Returns:
+            list: Partitions of the source.
+        """
+        partition = source.get("partition")
+        if not partition:
+            return []
+        if partition["type"] == "key":
+            return extractor.key_range_partitions(source["query"], partition["column"], partition["count"])
+        if partition["type"] == "id":
+            return extractor.id_partitions(source["query"], partition["count"])
+        if partition["type"] == "date":
+            end = date.fromisoformat(partition["end"]) if partition.get("end") else date.today()
+            kwargs = {"is_datetime": partition["is_datetime"]} if "is_datetime" in partition else {}
+            return extractor.date_partitions(
+                partition["column"], date.fromisoformat(partition["start"]), end, partition.get("step_days", 1),
+                **kwargs
+            )
+        raise ValueError(f"Unsupported partition type {partition['type']}")
+
+    def extract_source(self, extractor: BatchExtractor, source: Dict[str, Any], dataset: PartitionedDataset,
+                       country: str, compactor: DtypeCompactor = None,
+                       transform: Callable[[pd.DataFrame], pd.DataFrame] = None) -> Tuple[int, pd.DataFrame]:
+        """Extracts one source, streaming its batches into a new copy of the data set of the
+        country that replaces the old one once the extraction succeeds. Batches are profiled
+        per partition on the way and the merged profile is saved next to the data.
+
+        Args:
+            extractor (BatchExtractor): Extractor of the source.
+            source (dict): Source config with name, query and partition.
+            dataset (PartitionedDataset): Data set of the source.
+            country (str): Country of the extracted rows.
+            compactor (DtypeCompactor): Compactor of the batches.
+            transform (Callable): Function applied to every batch before it is compacted.
+        Returns:
+            tuple: Extracted row count and compaction report.
+        """
+        counter = {"rows": 0}
+        profiles = {}
+        reports = []
+
+        def batches():
+            for partition, batch in extractor.iter_batches(source["query"], self.get_partitions(extractor, source)):
+                if len(batch):
+                    counter["rows"] += len(batch)
+                    if transform is not None:
+                        batch = transform(batch)
+                    if compactor is not None:
+                        batch, report = compactor.compact(batch)
+                        reports.append(report)
+                    profiles.setdefault(partition, DatasetProfile()).update(batch)
+                    yield batch
+
+        dataset.overwrite(batches(), {"country": country})
+        DatasetProfile.merge_all(profiles.values()).save(dataset.partition_path({"country": country}))
+        return counter["rows"], DtypeCompactor.combine_reports(reports)
+
 
 if __name__ == "__main__":
     Process().execute_process()
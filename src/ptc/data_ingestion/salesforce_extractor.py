@@ -0,0 +1,352 @@
+"""
+PTC DATA INGESTION parallel Salesforce extraction.
+
+A SOQL query runs as a Bulk API job when possible, which Salesforce executes server side and
+returns in large chunks. Queries the Bulk API cannot run (relationship subqueries) or jobs that
+fail to start fall back to the REST API. Either way the query is split in partitions by date or
+ID ranges that are extracted concurrently, every partition streaming its records straight into
+columnar batches instead of paging the whole result serially.
+"""
+import logging
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ptc.data_ingestion.batch_extractor import BatchExtractor
+
+ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+# Datetimes as returned by the API (2023-01-31T10:00:00.000+0000) or saved as watermarks (isoformat).
+DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?$")
+
+
+class SalesforceExtractor(BatchExtractor):
+    """Runs a SOQL query split in partitions concurrently and streams it in columnar batches.
+
+    Usage:
+        extractor = SalesforceExtractor(SalesforceExtractor.client_factory(settings), pool_size=8)
+        partitions = extractor.date_partitions("CreatedDate", date(2022, 1, 1), date.today(), 7)
+        for partition, batch in extractor.iter_batches("SELECT Id, Name FROM Account", partitions):
+            ...
+    """
+
+    def __init__(self, client_factory: Callable[[], Any], pool_size: int = 4, batch_size: int = 50_000,
+                 use_bulk: bool = True, field_types: Dict[str, str] = None) -> None:
+        """
+        Args:
+            client_factory (Callable): Function returning a new simple_salesforce client.
+            pool_size (int): Number of partitions extracted at the same time.
+            batch_size (int): Records per batch.
+            use_bulk (bool): Run queries as Bulk API jobs when possible.
+            field_types (dict): "date" or "datetime" by field name, e.g. {"Owner.CreatedDate": "datetime"},
+                                for fields the describe of the sObject does not cover.
+        """
+        super().__init__(client_factory, pool_size, batch_size)
+        self.use_bulk = use_bulk
+        self.field_types = dict(field_types or {})
+        self._described = {}
+        self._describe_lock = threading.Lock()
+
+    @staticmethod
+    def client_factory(settings: Dict[str, Any]) -> Callable[[], Any]:
+        """Builds a client factory from the salesforce settings of the service config. The first
+        client logs in; the others reuse its session, so the workers do not log in one by one.
+
+        Args:
+            settings (dict): {"username": ..., "password": ..., "security_token": ..., "domain": ...},
+                             {"instance_url": ..., "session_id": ...} or
+                             {"driver": "fake", "records_path": ...} for a local stand-in.
+        Returns:
+            Callable: Function returning a new client.
+        """
+        if settings.get("driver") == "fake":
+            from ptc.data_ingestion.fake_salesforce import FakeSalesforce
+
+            return lambda: FakeSalesforce.from_file(settings["records_path"], settings.get("page_size", 2000))
+
+        from simple_salesforce import Salesforce
+
+        version = settings.get("version", "52.0")
+        session = {k: settings[k] for k in ("instance_url", "session_id") if k in settings}
+
+        def factory():
+            if not session:
+                client = Salesforce(username=settings["username"], password=settings["password"],
+                                    security_token=settings.get("security_token", ""),
+                                    domain=settings.get("domain", "login"), version=version)
+                session.update(instance_url=f"https://{client.sf_instance}", session_id=client.session_id)
+                return client
+            return Salesforce(instance_url=session["instance_url"], session_id=session["session_id"],
+                              version=version)
+
+        return factory
+
+    @staticmethod
+    def literal(value: Any) -> str:
+        """Formats a value as a SOQL literal. Dates and datetimes are not quoted in SOQL; strings
+        holding a datetime, like watermarks read back from json, are formatted as datetimes."""
+        if isinstance(value, str) and DATETIME.match(value):
+            value = pd.Timestamp(value)
+        if value is None:
+            return "null"
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (pd.Timestamp, datetime)):
+            value = pd.Timestamp(value)
+            value = value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+            return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, (int, float, np.number)):
+            return str(value)
+        escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+        return f"'{escaped}'"
+
+    @classmethod
+    def bind(cls, where: str, params: Iterable[Any]) -> str:
+        """Replaces the ? placeholders of a filter with SOQL literals, since SOQL has no parameters."""
+        params = iter(params)
+        return re.sub(r"\?", lambda _: cls.literal(next(params)), where) if where else where
+
+    @staticmethod
+    def _clauses(soql: str) -> Dict[str, int]:
+        """Finds the position of the top level FROM, WHERE, ORDER BY and LIMIT keywords."""
+        positions = {}
+        depth = 0
+        quoted = False
+        for i, char in enumerate(soql):
+            if char == "'" and (i == 0 or soql[i - 1] != "\\"):
+                quoted = not quoted
+            elif not quoted and char == "(":
+                depth += 1
+            elif not quoted and char == ")":
+                depth -= 1
+            elif not quoted and depth == 0 and (i == 0 or soql[i - 1].isspace()):
+                for keyword in ("FROM", "WHERE", "GROUP BY", "ORDER BY", "LIMIT", "OFFSET"):
+                    if keyword not in positions and soql[i:i + len(keyword)].upper() == keyword:
+                        positions[keyword] = i
+        return positions
+
+    @classmethod
+    def _tail_start(cls, soql: str) -> int:
+        """Finds where the clauses following the WHERE clause start."""
+        clauses = cls._clauses(soql)
+        return min([clauses[k] for k in ("GROUP BY", "ORDER BY", "LIMIT", "OFFSET") if k in clauses],
+                   default=len(soql))
+
+    @classmethod
+    def add_filter(cls, soql: str, where: str) -> str:
+        """Adds a filter to a SOQL query with AND, keeping its ORDER BY and LIMIT clauses.
+        SOQL has no subqueries in FROM, so the filter is inserted in the query itself."""
+        if not where:
+            return soql
+        end = cls._tail_start(soql)
+        clauses = cls._clauses(soql)
+        head, tail = soql[:end].rstrip(), soql[end:]
+        if "WHERE" in clauses:
+            start = clauses["WHERE"] + len("WHERE")
+            head = f"{head[:start]} ({head[start:].strip()}) AND ({where})"
+        else:
+            head = f"{head} WHERE {where}"
+        return f"{head} {tail}".rstrip()
+
+    @classmethod
+    def object_name(cls, soql: str) -> str:
+        """Gets the sObject a SOQL query reads from."""
+        clauses = cls._clauses(soql)
+        if "FROM" not in clauses:
+            raise ValueError(f"Error: no FROM clause in {soql}")
+        return soql[clauses["FROM"] + len("FROM"):].split()[0]
+
+    @staticmethod
+    def date_partitions(field: str, start: date, end: date, step_days: int = 1,
+                        is_datetime: bool = True) -> List[Dict[str, Any]]:
+        """Splits a date or datetime field in half-open ranges of step_days, from start to end inclusive.
+
+        Args:
+            field (str): Date or datetime field, e.g. CreatedDate.
+            start (date): First day.
+            end (date): Last day.
+            step_days (int): Days per partition.
+            is_datetime (bool): The field is a datetime, compared with UTC datetime literals.
+        Returns:
+            list: Partitions with name, where and params.
+        """
+        start = start.date() if isinstance(start, datetime) else start
+        end = end.date() if isinstance(end, datetime) else end
+        partitions = []
+        lo = start
+        while lo <= end:
+            hi = min(lo + timedelta(days=step_days), end + timedelta(days=1))
+            bounds = (datetime.combine(lo, datetime.min.time()), datetime.combine(hi, datetime.min.time())) \
+                if is_datetime else (lo, hi)
+            partitions.append({"name": f"{field}_{lo.isoformat()}", "where": f"{field} >= ? AND {field} < ?",
+                               "params": bounds})
+            lo = hi
+        return partitions
+
+    @staticmethod
+    def _id_to_int(record_id: str) -> int:
+        """Reads the 15 character case sensitive form of a record ID as a base 62 number."""
+        number = 0
+        for char in record_id[:15].ljust(15, "0"):
+            number = number * 62 + ID_ALPHABET.index(char)
+        return number
+
+    @staticmethod
+    def _int_to_id(number: int) -> str:
+        """Writes a base 62 number as a 15 character record ID."""
+        chars = []
+        for _ in range(15):
+            number, digit = divmod(number, 62)
+            chars.append(ID_ALPHABET[digit])
+        return "".join(reversed(chars))
+
+    def get_id_bounds(self, soql: str, where: str = None, params: tuple = ()) -> Tuple[str, str]:
+        """Gets the smallest and largest record ID of the query, optionally filtered."""
+        clauses = self._clauses(soql)
+        if "FROM" not in clauses:
+            raise ValueError(f"Error: no FROM clause in {soql}")
+        base = f"SELECT Id {soql[clauses['FROM']:self._tail_start(soql)].strip()}"
+        base = self.add_filter(base, self.bind(where, params))
+        bounds = []
+        with self.pool.acquire() as client:
+            for order in ("ASC", "DESC"):
+                records = client.query(f"{base} ORDER BY Id {order} LIMIT 1")["records"]
+                bounds.append(records[0]["Id"] if records else None)
+        return bounds[0], bounds[1]
+
+    def id_partitions(self, soql: str, partitions: int, where: str = None, params: tuple = ()) -> List[Dict[str, Any]]:
+        """Splits the record IDs of a query in equally wide half-open ranges. IDs are allocated
+        sequentially, so equally wide ranges hold similar numbers of records.
+
+        Args:
+            soql (str): Query to split.
+            partitions (int): Number of ranges.
+            where (str): Filter applied when querying the bounds.
+            params (tuple): Parameters of the filter.
+        Returns:
+            list: Partitions with name, where and params.
+        """
+        lower, upper = self.get_id_bounds(soql, where, params)
+        if lower is None:
+            return []
+        lo, hi = self._id_to_int(lower), self._id_to_int(upper) + 1
+        edges = sorted({lo + (hi - lo) * i // partitions for i in range(partitions + 1)})
+        ranges = []
+        for i, (start, stop) in enumerate(zip(edges[:-1], edges[1:])):
+            conditions, bounds = ["Id >= ?"], [self._int_to_id(start)]
+            if i < len(edges) - 2:
+                conditions.append("Id < ?")
+                bounds.append(self._int_to_id(stop))
+            ranges.append({"name": f"Id_{bounds[0]}", "where": " AND ".join(conditions), "params": tuple(bounds)})
+        return ranges
+
+    @staticmethod
+    def _flatten(record: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+        """Drops the attributes of a record and flattens its parent relationships as Parent.Field."""
+        flat = {}
+        for key, value in record.items():
+            if key == "attributes":
+                continue
+            if isinstance(value, dict) and "records" not in value:
+                flat.update(SalesforceExtractor._flatten(value, f"{prefix}{key}."))
+            else:
+                flat[f"{prefix}{key}"] = value
+        return flat
+
+    def get_field_types(self, client: Any, soql: str) -> Dict[str, str]:
+        """Gets the date and datetime fields of the sObject of a query from its describe, read once
+        per sObject, and the field_types of the extractor. Without a describe, e.g. when the user
+        cannot read it, only the field_types are known."""
+        name = self.object_name(soql)
+        with self._describe_lock:
+            if name not in self._described:
+                try:
+                    fields = getattr(client, name).describe()["fields"]
+                    self._described[name] = {f["name"]: f["type"] for f in fields if f["type"] in ("date", "datetime")}
+                except Exception as e:
+                    logging.warning(f"Describe of {name} failed, its date fields are found by format only: {e}")
+                    self._described[name] = {}
+            return {**self._described[name], **self.field_types}
+
+    @staticmethod
+    def to_datetime(values: pd.Series, kind: str) -> pd.Series:
+        """Parses a date or datetime field, which the REST API returns as ISO strings and the Bulk
+        API as epoch milliseconds, to UTC timestamps (datetime) or ISO date strings (date)."""
+        numeric = pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+        if kind == "date" and not numeric:
+            return values
+        parsed = pd.to_datetime(values, unit="ms", utc=True) if numeric else pd.to_datetime(values, utc=True)
+        return parsed.dt.strftime("%Y-%m-%d") if kind == "date" else parsed.astype("datetime64[ns, UTC]")
+
+    @staticmethod
+    def to_columnar(records: List[Dict[str, Any]], field_types: Dict[str, str] = None) -> pd.DataFrame:
+        """Transposes a list of records into one array per field. Date and datetime fields of
+        field_types are parsed with to_datetime(), so the Bulk and REST APIs give the same
+        columns; other fields holding ISO datetime strings are parsed to UTC timestamps."""
+        records = [SalesforceExtractor._flatten(r) for r in records]
+        columns = list(dict.fromkeys(k for r in records for k in r))
+        field_types = field_types or {}
+        data = {}
+        for column in columns:
+            values = pd.Series(np.array([r.get(column) for r in records], dtype=object)).infer_objects()
+            if column in field_types:
+                values = SalesforceExtractor.to_datetime(values, field_types[column])
+            elif pd.api.types.is_string_dtype(values):
+                present = values.dropna()
+                if len(present) and present.map(lambda v: isinstance(v, str) and bool(DATETIME.match(v))).all():
+                    values = pd.to_datetime(values, utc=True)
+            data[column] = values
+        return pd.DataFrame(data, copy=False)
+
+    def _can_bulk(self, soql: str) -> bool:
+        """Bulk query jobs cannot run relationship subqueries."""
+        return self.use_bulk and not re.search(r"\(\s*SELECT\s", soql, re.IGNORECASE)
+
+    def _bulk_chunks(self, client: Any, soql: str) -> Iterable[List[Dict[str, Any]]]:
+        """Runs a Bulk API query job and yields its result chunks as they are downloaded."""
+        return getattr(client.bulk, self.object_name(soql)).query(soql, lazy_operation=True)
+
+    @staticmethod
+    def _rest_pages(client: Any, soql: str) -> Iterable[List[Dict[str, Any]]]:
+        """Pages through a REST API query, following nextRecordsUrl."""
+        result = client.query(soql)
+        yield result["records"]
+        while not result["done"]:
+            result = client.query_more(result["nextRecordsUrl"], identifier_is_url=True)
+            yield result["records"]
+
+    def _extract_partition(self, query: str, partition: Dict[str, Any],
+                           emit: Callable[[str, pd.DataFrame], None], where: str = None, params: tuple = ()) -> int:
+        """Streams one partition through emit() in batches of batch_size records and returns its
+        record count. A bulk job that fails before returning records is retried over REST."""
+        soql = self.add_filter(
+            self.add_filter(query, self.bind(partition.get("where"), partition.get("params", ()))),
+            self.bind(where, params),
+        )
+        rows_read = 0
+        buffer = []
+        with self.pool.acquire() as client:
+            field_types = self.get_field_types(client, soql)
+            sources = [self._bulk_chunks, self._rest_pages] if self._can_bulk(soql) else [self._rest_pages]
+            for i, source in enumerate(sources):
+                try:
+                    for records in source(client, soql):
+                        buffer.extend(records)
+                        rows_read += len(records)
+                        if len(buffer) >= self.batch_size:
+                            emit(partition["name"], self.to_columnar(buffer, field_types))
+                            buffer = []
+                    break
+                except Exception as e:
+                    if rows_read or i == len(sources) - 1:
+                        raise e
+                    logging.warning(f"Bulk query of partition {partition['name']} failed, using REST: {e}")
+        if buffer:
+            emit(partition["name"], self.to_columnar(buffer, field_types))
+        logging.info(f"Partition {partition['name']} extracted: {rows_read} records.")
+        return rows_read
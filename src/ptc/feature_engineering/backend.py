@@ -0,0 +1,126 @@
+"""
+PTC FEATURE ENGINEERING DataFrame backends.
+
+The feature engine runs its frame operations (group numbering, group aggregations, date parsing,
+concatenation) through a backend: pandas, or Modin on Ray or Dask, which splits the frame in
+partitions processed on every core of the node. The vectorized numpy parts of the engine work on
+arrays taken from the frame, so they are the same for both backends.
+"""
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+MODIN_ENGINES = ("ray", "dask", "python")
+
+
+class FrameBackend:
+    """Compatibility layer over pandas and Modin for the operations of the feature engine.
+
+    Usage:
+        backend = FrameBackend.from_settings({"name": "modin", "engine": "ray", "min_rows": 5_000_000}, rows)
+        features = FeaturePlan(features).execute(frame, backend=backend)
+    """
+
+    def __init__(self, name: str = "pandas", engine: str = "ray", cpus: int = None) -> None:
+        """
+        Args:
+            name (str): "pandas" or "modin".
+            engine (str): Engine of Modin: "ray", "dask" (local processes) or "python" (serial, to debug).
+            cpus (int): Cores used by Modin. Defaults to all the cores of the node.
+        """
+        if name not in ("pandas", "modin"):
+            raise ValueError(f"Error: unsupported DataFrame backend {name}")
+        self.name = name
+        self.engine = engine
+        self.cpus = cpus
+        self.pd = self._import_modin(engine, cpus) if name == "modin" else pd
+
+    @classmethod
+    def from_settings(cls, settings: Any, rows: int = None) -> "FrameBackend":
+        """Builds the backend of a config: a name, or {"name", "engine", "cpus", "min_rows"}. With
+        min_rows, pandas is used for data sets with fewer rows, e.g. small countries.
+
+        Args:
+            settings (str or dict): Backend config. pandas when None.
+            rows (int): Rows of the data set, to apply min_rows.
+        Returns:
+            FrameBackend: The backend.
+        """
+        if settings is None:
+            return cls()
+        if isinstance(settings, str):
+            settings = {"name": settings}
+        if rows is not None and rows < settings.get("min_rows", 0):
+            return cls()
+        return cls(settings.get("name", "pandas"), settings.get("engine", "ray"), settings.get("cpus"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Gets the config of the backend, to build it again in another process."""
+        return {"name": self.name, "engine": self.engine, "cpus": self.cpus}
+
+    @staticmethod
+    def _import_modin(engine: str, cpus: int = None):
+        """Configures Modin and imports modin.pandas."""
+        if engine not in MODIN_ENGINES:
+            raise ValueError(f"Error: unsupported Modin engine {engine}")
+        import modin.config
+
+        modin.config.Engine.put(engine.capitalize())
+        modin.config.CpuCount.put(cpus or os.cpu_count())
+        import modin.pandas
+
+        return modin.pandas
+
+    @property
+    def is_modin(self) -> bool:
+        return self.name == "modin"
+
+    def from_pandas(self, frame: pd.DataFrame):
+        """Moves a pandas frame to the backend."""
+        return self.pd.DataFrame(frame) if self.is_modin else frame
+
+    def to_pandas(self, frame) -> pd.DataFrame:
+        """Gets a frame or series of the backend as pandas."""
+        return frame._to_pandas() if self.is_modin and hasattr(frame, "_to_pandas") else frame
+
+    def to_numpy(self, series, dtype=np.float64) -> np.ndarray:
+        """Gets a column as a numpy array, with NaN for missing values."""
+        series = self.to_pandas(series)
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            return series.to_numpy(dtype=dtype, na_value=np.nan)
+        return series.to_numpy(dtype=dtype)
+
+    def ngroup(self, frame, by: List[str]) -> np.ndarray:
+        """Numbers the groups of the rows, in order of first appearance."""
+        codes = frame.groupby(by, sort=False, dropna=False, observed=True).ngroup()
+        return self.to_pandas(codes).to_numpy().astype(np.int64)
+
+    def to_datetime(self, series) -> pd.DatetimeIndex:
+        """Parses a column to dates."""
+        return pd.DatetimeIndex(self.to_pandas(self.pd.to_datetime(series)))
+
+    def group_agg(self, columns: Dict[str, np.ndarray], codes: np.ndarray, groups: int,
+                  aggregations: Dict[str, tuple]) -> pd.DataFrame:
+        """Aggregates columns by group number.
+
+        Args:
+            columns (dict): Arrays by column name.
+            codes (np.ndarray): Group number of every row.
+            groups (int): Number of groups.
+            aggregations (dict): (column, aggregation) by output name.
+        Returns:
+            pd.DataFrame: One row per group number, in order.
+        """
+        frame = self.pd.DataFrame(dict(columns, group_number__=codes))
+        table = frame.groupby("group_number__", sort=True).agg(**aggregations)
+        return self.to_pandas(table).reindex(np.arange(groups))
+
+    def concat(self, frames: list, axis: int = 0):
+        """Concatenates frames of the backend."""
+        return self.pd.concat(frames, axis=axis)
+
+    def frame(self, data: Dict[str, np.ndarray], index=None):
+        """Builds a frame of the backend."""
+        return self.pd.DataFrame(data, index=index)
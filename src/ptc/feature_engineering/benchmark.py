@@ -0,0 +1,97 @@
+"""
+PTC FEATURE ENGINEERING benchmark of the DataFrame backends.
+
+Runs a representative feature plan on synthetic sales of increasing size with every backend and
+reports the seconds and rows per second of each, e.g.
+
+    python -m ptc.feature_engineering.benchmark --sizes 100000 1000000 10000000 --backends pandas modin:ray
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from ptc.feature_engineering.backend import FrameBackend
+from ptc.feature_engineering.engine import FeaturePlan
+
+FEATURES = [
+    {"name": "units_lag_1", "type": "lag", "column": "units", "by": ["store", "sku"], "order_by": "sale_date"},
+    {"name": "units_lag_7d", "type": "lag", "column": "units", "by": ["store", "sku"], "order_by": "sale_date",
+     "days": 7},
+    {"name": "units_sum_7d", "type": "rolling", "column": "units", "by": ["store", "sku"], "order_by": "sale_date",
+     "window": 7, "unit": "days", "agg": "sum"},
+    {"name": "units_mean_28d", "type": "rolling", "column": "units", "by": ["store", "sku"], "order_by": "sale_date",
+     "window": 28, "unit": "days", "agg": "mean"},
+    {"name": "units_std_91d", "type": "rolling", "column": "units", "by": ["store", "sku"], "order_by": "sale_date",
+     "window": 91, "unit": "days", "agg": "std"},
+    {"name": "sku_mean", "type": "group_agg", "column": "units", "by": ["sku"], "agg": "mean"},
+    {"name": "store_median", "type": "group_agg", "column": "units", "by": ["store"], "agg": "median"},
+    {"name": "units_vs_sku", "type": "ratio", "numerator": "units", "denominator": "sku_mean"},
+    {"type": "calendar", "column": "sale_date", "parts": ["dayofweek", "month", "is_weekend"]},
+]
+
+
+def synthetic_sales(rows: int, stores: int = 200, skus: int = 2000, days: int = 365, seed: int = 0) -> pd.DataFrame:
+    """Generates daily sales of random store and sku pairs.
+
+    Args:
+        rows (int): Number of rows.
+        stores (int): Number of stores.
+        skus (int): Number of skus.
+        days (int): Number of days.
+        seed (int): Random seed.
+    Returns:
+        pd.DataFrame: store, sku, sale_date and units.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "store": rng.integers(0, stores, rows).astype(np.int32),
+        "sku": rng.integers(0, skus, rows).astype(np.int32),
+        "sale_date": pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, days, rows), unit="D"),
+        "units": rng.poisson(3, rows).astype(np.float32),
+    })
+
+
+def run(sizes: List[int], backends: List[str], repeat: int = 1) -> pd.DataFrame:
+    """Times the feature plan with every backend and size, keeping the best of the repetitions.
+
+    Args:
+        sizes ([int]): Row counts of the synthetic data.
+        backends ([str]): "pandas" or "modin:<engine>".
+        repeat (int): Repetitions of every measure.
+    Returns:
+        pd.DataFrame: Backend, rows, seconds and rows per second. Backends that cannot be imported
+                      are reported with no time.
+    """
+    plan = FeaturePlan(FEATURES)
+    results = []
+    for size in sizes:
+        frame = synthetic_sales(size)
+        for spec in backends:
+            name, _, engine = spec.partition(":")
+            try:
+                backend = FrameBackend(name, engine or "ray")
+            except ImportError as exc:
+                results.append({"backend": spec, "rows": size, "seconds": None, "rows_per_second": None,
+                                "error": str(exc)})
+                continue
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                backend.to_pandas(plan.execute(frame, backend=backend))
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results.append({"backend": spec, "rows": size, "seconds": round(best, 3),
+                            "rows_per_second": int(size / best), "error": None})
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the feature engineering DataFrame backends.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--backends", nargs="+", default=["pandas", "modin:ray", "modin:dask"])
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    print(run(args.sizes, args.backends, args.repeat).to_string(index=False))
@@ -0,0 +1,415 @@
+"""
+PTC FEATURE ENGINEERING declarative feature engine.
+
+Features are declared in the service config and compiled into a plan of vectorized numpy and
+DataFrame operations, run on pandas or Modin (see backend.py). Intermediates shared by several
+features (group codes, sort orders, parsed dates, group aggregate tables) are computed once per
+frame and reused.
+
+Feature types:
+    lag        {"name", "type": "lag", "column", "by", "order_by", "periods": 1} or "days": 7
+               for the value of exactly that many days before.
+    rolling    {"name", "type": "rolling", "column", "by", "order_by", "window", "agg",
+               "unit": "rows" | "days", "min_periods": 1, "exclude_current": false}
+               with agg in sum, mean, count, std, min, max. A window of days holds every row of its
+               days; with exclude_current it holds the previous window days.
+    group_agg  {"name", "type": "group_agg", "column", "by", "agg"} with agg in sum, mean, count,
+               min, max, std, median, nunique.
+    ratio      {"name", "type": "ratio", "numerator", "denominator"}.
+    calendar   {"type": "calendar", "column", "parts": [...], "prefix"} with parts in year,
+               quarter, month, day, dayofweek, dayofyear, weekofyear, is_weekend,
+               is_month_start, is_month_end. Produces <prefix or column>_<part>, as Int16 with
+               missing values when some dates are missing.
+
+Rows without order value are in no window or lag of the other rows, and their own lags and
+rolling windows are missing.
+
+Inputs of lags, rolling windows, group aggregates and ratios can be other features.
+"""
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ptc.feature_engineering.backend import FrameBackend
+
+ROLLING_AGGS = ("sum", "mean", "count", "std", "min", "max")
+GROUP_AGGS = ("sum", "mean", "count", "min", "max", "std", "median", "nunique")
+CALENDAR_PARTS = ("year", "quarter", "month", "day", "dayofweek", "dayofyear", "weekofyear", "is_weekend",
+                  "is_month_start", "is_month_end")
+# Sort key of the rows without order value, the int64 NaT.
+MISSING_TIME = np.iinfo(np.int64).min
+
+
+class FeatureContext:
+    """Intermediates of one frame, computed on first use and shared by all the features."""
+
+    def __init__(self, frame, backend: FrameBackend = None) -> None:
+        """
+        Args:
+            frame (pd.DataFrame): Frame the features are computed on, of the backend.
+            backend (FrameBackend): DataFrame backend. pandas when None.
+        """
+        self.frame = frame
+        self.backend = backend or FrameBackend()
+        self.features = {}
+        self.cache = {}
+        self.hits = {}
+
+    def _memo(self, key: tuple, compute):
+        """Returns a cached intermediate, computing it the first time."""
+        if key not in self.cache:
+            self.cache[key] = compute()
+        else:
+            self.hits[key] = self.hits.get(key, 0) + 1
+        return self.cache[key]
+
+    def values(self, column: str) -> np.ndarray:
+        """Gets a source column or a computed feature as float64."""
+        if column in self.features:
+            return self.features[column]
+        return self._memo(("values", column), lambda: self.backend.to_numpy(self.frame[column]))
+
+    def datetimes(self, column: str) -> pd.DatetimeIndex:
+        """Gets a date column parsed once."""
+        return self._memo(("datetimes", column), lambda: self.backend.to_datetime(self.frame[column]))
+
+    def sort_key(self, column: str) -> np.ndarray:
+        """Gets the values of an ordering column as int64: days for dates, the values otherwise, and
+        MISSING_TIME for missing values."""
+        def compute():
+            series = self.frame[column]
+            if pd.api.types.is_numeric_dtype(series.dtype):
+                series = self.backend.to_pandas(series)
+                missing = series.isna().to_numpy()
+                if missing.any():
+                    return np.where(missing, MISSING_TIME, series.fillna(0).to_numpy(dtype=np.int64))
+                return series.to_numpy(dtype=np.int64)
+            return self.datetimes(column).to_numpy().astype("datetime64[D]").astype(np.int64)
+        return self._memo(("sort_key", column), compute)
+
+    def codes(self, by: Tuple[str, ...]) -> Tuple[np.ndarray, int]:
+        """Gets the group number of every row and the number of groups, numbered by first appearance."""
+        def compute():
+            if not by:
+                return np.zeros(len(self.frame), dtype=np.int64), 1
+            codes = self.backend.ngroup(self.frame, list(by))
+            return codes, int(codes.max()) + 1 if len(codes) else 0
+        return self._memo(("codes", by), compute)
+
+    def order(self, by: Tuple[str, ...], order_by: str) -> Dict[str, np.ndarray]:
+        """Gets the permutation sorting the rows by group and order column, with the sorted group
+        numbers, a composite (group, order) key for range searches and the start of every group.
+
+        Rows without order value are sorted last, each in a group of its own, so they are in no
+        window of the other rows; "missing" flags them in sorted order."""
+        def compute():
+            codes, groups = self.codes(by)
+            times = self.sort_key(order_by)
+            missing = times == MISSING_TIME
+            if missing.any():
+                codes = np.where(missing, groups + np.cumsum(missing) - 1, codes)
+                times = np.where(missing, times[~missing].min() if not missing.all() else 0, times)
+            permutation = np.lexsort((times, codes))
+            sorted_codes, sorted_times = codes[permutation], times[permutation]
+            low = sorted_times.min() if len(sorted_times) else 0
+            span = int(sorted_times.max() - low) + 1 if len(sorted_times) else 1
+            new_group = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]] if len(codes) else np.empty(0, bool)
+            positions = np.arange(len(codes))
+            group_start = np.maximum.accumulate(np.where(new_group, positions, 0)) if len(codes) else positions
+            return {"permutation": permutation, "codes": sorted_codes, "times": sorted_times,
+                    "key": sorted_codes * (2 * span + 1) + (sorted_times - low), "span": span,
+                    "group_start": group_start, "missing": missing[permutation]}
+        return self._memo(("order", by, order_by), compute)
+
+
+class FeaturePlan:
+    """Compiles feature declarations into an ordered plan and runs it on frames.
+
+    Usage:
+        plan = FeaturePlan(CONFIG.feature_engineering.features.to_dict())
+        print(plan.explain())
+        features = plan.execute(frame)
+    """
+
+    def __init__(self, features: List[Dict[str, Any]], dtype: str = "float32") -> None:
+        """
+        Args:
+            features (list): Feature declarations.
+            dtype (str): Dtype of the numeric features in the output.
+        """
+        self.dtype = dtype
+        self.features = self._expand(features)
+        self.names = {f["name"] for f in self.features}
+        self.steps = self._order(self.features)
+        self.group_aggs = {}
+        for feature in self.steps:
+            if feature["type"] == "group_agg":
+                self.group_aggs.setdefault(tuple(feature["by"]), []).append(feature)
+
+    @staticmethod
+    def _expand(features: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Validates the declarations and expands calendar declarations to one feature per part."""
+        expanded = []
+        for feature in features:
+            feature = dict(feature)
+            kind = feature.get("type")
+            if kind == "calendar" and "part" in feature:
+                expanded.append(feature)
+                continue
+            if kind == "calendar":
+                for part in feature["parts"]:
+                    if part not in CALENDAR_PARTS:
+                        raise ValueError(f"Error: unsupported calendar part {part}")
+                    prefix = feature.get("prefix", feature["column"])
+                    expanded.append({"name": f"{prefix}_{part}", "type": "calendar", "column": feature["column"],
+                                     "part": part})
+                continue
+            if kind not in ("lag", "rolling", "group_agg", "ratio"):
+                raise ValueError(f"Error: unsupported feature type {kind} of {feature.get('name')}")
+            if kind in ("lag", "rolling", "group_agg"):
+                feature["by"] = list(feature.get("by", []))
+            if kind == "rolling" and feature["agg"] not in ROLLING_AGGS:
+                raise ValueError(f"Error: unsupported rolling aggregation {feature['agg']} of {feature['name']}")
+            if kind == "group_agg" and feature["agg"] not in GROUP_AGGS:
+                raise ValueError(f"Error: unsupported group aggregation {feature['agg']} of {feature['name']}")
+            expanded.append(feature)
+        names = [f["name"] for f in expanded]
+        duplicated = {n for n in names if names.count(n) > 1}
+        if duplicated:
+            raise ValueError(f"Error: duplicated feature names {sorted(duplicated)}")
+        return expanded
+
+    @staticmethod
+    def inputs(feature: Dict[str, Any]) -> List[str]:
+        """Gets the columns or features a feature reads."""
+        if feature["type"] == "ratio":
+            return [feature["numerator"], feature["denominator"]]
+        if feature["type"] == "calendar":
+            return [feature["column"]]
+        columns = [feature["column"]] + feature["by"]
+        return columns + [feature["order_by"]] if "order_by" in feature else columns
+
+    def _order(self, features: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Orders the features so every feature runs after the features it reads."""
+        names = {f["name"] for f in features}
+        done, ordered, pending = set(), [], list(features)
+        while pending:
+            ready = [f for f in pending if all(i not in names or i in done for i in self.inputs(f))]
+            if not ready:
+                raise ValueError(f"Error: circular feature dependencies in {[f['name'] for f in pending]}")
+            for feature in ready:
+                ordered.append(feature)
+                done.add(feature["name"])
+                pending.remove(feature)
+        return ordered
+
+    @property
+    def required_columns(self) -> List[str]:
+        """Source columns the plan reads, to project them when loading the data."""
+        names = {f["name"] for f in self.features}
+        return list(dict.fromkeys(c for f in self.features for c in self.inputs(f) if c not in names))
+
+    def explain(self) -> str:
+        """Describes the plan: the shared intermediates and the features using each of them."""
+        lines = [f"Feature plan: {len(self.steps)} features."]
+        groupings = {}
+        for feature in self.steps:
+            if feature["type"] in ("lag", "rolling"):
+                groupings.setdefault(f"sort by {feature['by']} then {feature['order_by']}", []).append(feature["name"])
+            elif feature["type"] == "calendar":
+                groupings.setdefault(f"parse {feature['column']}", []).append(feature["name"])
+        for by, features in self.group_aggs.items():
+            groupings[f"one group-by on {list(by)}"] = [f["name"] for f in features]
+        for intermediate, features in groupings.items():
+            lines.append(f"  {intermediate}: {', '.join(features)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _lag(ctx: FeatureContext, feature: Dict[str, Any]) -> np.ndarray:
+        """Value of the same group some rows or exactly some days before."""
+        order = ctx.order(tuple(feature["by"]), feature["order_by"])
+        values = ctx.values(feature["column"])[order["permutation"]]
+        n = len(values)
+        shifted = np.full(n, np.nan)
+        if "days" in feature:
+            key = order["key"]
+            target = key - int(feature["days"])
+            index = np.minimum(np.searchsorted(key, target, side="left"), max(n - 1, 0))
+            found = (key[index] == target) & (order["codes"][index] == order["codes"]) if n else np.empty(0, bool)
+            shifted[found] = values[index[found]]
+        else:
+            periods = int(feature.get("periods", 1))
+            if 0 < periods < n:
+                same_group = order["codes"][periods:] == order["codes"][:-periods]
+                shifted[periods:] = np.where(same_group, values[:-periods], np.nan)
+        shifted[order["missing"]] = np.nan
+        result = np.empty(n)
+        result[order["permutation"]] = shifted
+        return result
+
+    @staticmethod
+    def _rolling(ctx: FeatureContext, feature: Dict[str, Any]) -> np.ndarray:
+        """Aggregation over a window of rows or days of the same group, with cumulative sums for
+        sum, mean, count and std, and pandas rolling windows for min and max."""
+        order = ctx.order(tuple(feature["by"]), feature["order_by"])
+        permutation = order["permutation"]
+        values = ctx.values(feature["column"])[permutation]
+        n = len(values)
+        window = int(feature["window"])
+        positions = np.arange(n)
+        if feature.get("unit", "rows") == "days":
+            # Windows of days include every row of their days, so rows of the same day get the same value.
+            key = order["key"]
+            if feature.get("exclude_current"):
+                start = np.searchsorted(key, key - window, side="left")
+                end = np.searchsorted(key, key, side="left") - 1
+            else:
+                start = np.searchsorted(key, key - window + 1, side="left")
+                end = np.searchsorted(key, key, side="right") - 1
+            # Windows longer than the span of the dates would reach into the previous group.
+            start = np.maximum(start, order["group_start"])
+        else:
+            end = positions - 1 if feature.get("exclude_current") else positions
+            start = np.maximum(end - window + 1, order["group_start"])
+        agg = feature["agg"]
+        present = ~np.isnan(values)
+        count = np.r_[0, np.cumsum(present)]
+        counts = np.where(end >= start, count[np.maximum(end + 1, 0)] - count[start], 0).astype(np.float64)
+        if agg in ("min", "max"):
+            sorted_frame = pd.DataFrame({"g": order["codes"], "v": values})
+            if feature.get("unit", "rows") == "days":
+                sorted_frame.index = pd.to_datetime(order["times"], unit="D")
+                rolled = sorted_frame.groupby("g", sort=False)["v"].rolling(f"{window}D", min_periods=1,
+                                                                            closed="left" if feature.get(
+                                                                                "exclude_current") else "right")
+            else:
+                rolled = sorted_frame["v"].groupby(sorted_frame["g"], sort=False).rolling(window, min_periods=1)
+                if feature.get("exclude_current"):
+                    rolled = getattr(rolled, agg)().groupby(level=0).shift(1)
+            computed = rolled if isinstance(rolled, pd.Series) else getattr(rolled, agg)()
+            # Groups are contiguous in sorted order, so the rolled values come back in that order.
+            result_sorted = computed.to_numpy(dtype=np.float64)
+            if feature.get("unit", "rows") == "days":
+                # A window closed on the left holds the earlier rows of the day after the first one, and a
+                # window closed on the right misses the later ones before the last, so every row takes the
+                # value of the row of its day whose window holds exactly the window days.
+                side = "left" if feature.get("exclude_current") else "right"
+                of_day = np.searchsorted(order["key"], order["key"], side=side) - (side == "right")
+                result_sorted = result_sorted[of_day]
+        else:
+            filled = np.where(present, values, 0.0)
+            total = np.r_[0.0, np.cumsum(filled)]
+            sums = np.where(end >= start, total[np.maximum(end + 1, 0)] - total[start], 0.0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if agg == "sum":
+                    result_sorted = sums
+                elif agg == "count":
+                    result_sorted = counts
+                elif agg == "mean":
+                    result_sorted = sums / counts
+                else:
+                    squares = np.r_[0.0, np.cumsum(filled * filled)]
+                    sum_squares = np.where(end >= start, squares[np.maximum(end + 1, 0)] - squares[start], 0.0)
+                    variance = (sum_squares - sums * sums / counts) / (counts - 1)
+                    result_sorted = np.sqrt(np.maximum(variance, 0.0))
+                    result_sorted[counts < 2] = np.nan
+        result_sorted = np.where(counts >= feature.get("min_periods", 1), result_sorted, np.nan) \
+            if agg != "count" else result_sorted
+        result_sorted[order["missing"]] = np.nan
+        result = np.empty(n)
+        result[permutation] = result_sorted
+        return result
+
+    @staticmethod
+    def _group_aggs(ctx: FeatureContext, by: Tuple[str, ...], features: List[Dict[str, Any]]) -> None:
+        """Computes all the aggregations over the same groups with one pass per column: bincount
+        for sum, mean and count, one pandas group-by for the others."""
+        codes, groups = ctx.codes(by)
+        others = {}
+        for feature in features:
+            values = ctx.values(feature["column"])
+            agg = feature["agg"]
+            if agg in ("sum", "mean", "count"):
+                present = ~np.isnan(values)
+                counts = np.bincount(codes, weights=present.astype(np.float64), minlength=groups)
+                if agg == "count":
+                    table = counts
+                else:
+                    sums = np.bincount(codes, weights=np.where(present, values, 0.0), minlength=groups)
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        table = sums if agg == "sum" else sums / counts
+                ctx.features[feature["name"]] = table[codes]
+            else:
+                others[feature["name"]] = (feature["column"], agg)
+        if others:
+            columns = {column: ctx.values(column) for column, _ in others.values()}
+            table = ctx.backend.group_agg(columns, codes, groups, others)
+            for name in others:
+                ctx.features[name] = table[name].to_numpy(dtype=np.float64)[codes]
+
+    @staticmethod
+    def _calendar(ctx: FeatureContext, feature: Dict[str, Any]) -> np.ndarray:
+        """Part of a date, as float64 with NaN for missing dates."""
+        dates = ctx.datetimes(feature["column"])
+        part = feature["part"]
+        if part == "weekofyear":
+            values = dates.isocalendar().week.to_numpy(dtype=np.float64, na_value=np.nan)
+        elif part == "is_weekend":
+            values = dates.dayofweek >= 5
+        else:
+            values = getattr(dates, part)
+        values = np.asarray(values, dtype=np.float64)
+        values[np.asarray(dates.isna())] = np.nan
+        return values
+
+    @staticmethod
+    def _small_integers(values: np.ndarray):
+        """Calendar part as int16, or as nullable Int16 when some dates are missing."""
+        missing = np.isnan(values)
+        if not missing.any():
+            return values.astype(np.int16)
+        return pd.arrays.IntegerArray(np.where(missing, 0, values).astype(np.int16), missing)
+
+    def execute(self, frame: pd.DataFrame, keep_columns: List[str] = None,
+                backend: FrameBackend = None) -> pd.DataFrame:
+        """Computes all the features of a frame.
+
+        Args:
+            frame (pd.DataFrame): Rows to compute the features on, e.g. one partition.
+            keep_columns ([str]): Columns of the frame kept in the output. All when None.
+            backend (FrameBackend): DataFrame backend the frame operations run on. pandas when None.
+        Returns:
+            pd.DataFrame: Kept columns followed by the features, in the order of the frame, as a
+                          frame of the backend.
+        """
+        backend = backend or FrameBackend()
+        if backend.is_modin and isinstance(frame, pd.DataFrame):
+            frame = backend.from_pandas(frame)
+        ctx = FeatureContext(frame.reset_index(drop=True), backend)
+        for feature in self.steps:
+            kind = feature["type"]
+            if kind == "group_agg":
+                # One pass computes every aggregation over the same groups whose inputs are already computed.
+                if feature["name"] not in ctx.features:
+                    by = tuple(feature["by"])
+                    ready = [f for f in self.group_aggs[by] if f["name"] not in ctx.features
+                             and all(i not in self.names or i in ctx.features for i in self.inputs(f))]
+                    self._group_aggs(ctx, by, ready)
+            elif kind == "lag":
+                ctx.features[feature["name"]] = self._lag(ctx, feature)
+            elif kind == "rolling":
+                ctx.features[feature["name"]] = self._rolling(ctx, feature)
+            elif kind == "ratio":
+                numerator, denominator = ctx.values(feature["numerator"]), ctx.values(feature["denominator"])
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    ctx.features[feature["name"]] = np.where(denominator != 0, numerator / denominator, np.nan)
+            elif kind == "calendar":
+                ctx.features[feature["name"]] = self._calendar(ctx, feature)
+        output = ctx.frame[keep_columns] if keep_columns is not None else ctx.frame
+        features = {
+            f["name"]: (self._small_integers(ctx.features[f["name"]]) if f["type"] == "calendar"
+                        else ctx.features[f["name"]].astype(self.dtype, copy=False))
+            for f in self.features
+        }
+        return backend.concat([output, backend.frame(features, index=output.index)], axis=1)
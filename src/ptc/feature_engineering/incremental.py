@@ -0,0 +1,215 @@
+"""
+PTC FEATURE ENGINEERING incremental rolling windows with persisted per-key state.
+
+Rolling windows of days only need the daily totals of the last days of every key. The state keeps,
+for every key and day of the longest window, the sum, count, sum of squares, min and max of the
+window columns. Every run reads only the days after the last day computed (plus a lookback for
+late rows), recomputes the windows of the keys present in those days from the state and their new
+rows, and writes the key-day features of those days. The daily cost scales with the new days and
+the number of keys, not with the length of the history.
+"""
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from libs.lola_utils.ind import DtypeCompactor
+from libs.lola_utils.storage import PartitionedDataset
+from ptc.feature_engineering.engine import FeaturePlan
+
+STATS = ("sum", "count", "sumsq", "min", "max")
+
+
+class RollingState:
+    """Computes rolling windows of days incrementally from the daily totals saved by the last run.
+
+    The state of a country is kept in <state_path>/country=<country>/, with the last day computed
+    and a signature of the features in _state.json. When the features change, the next run
+    recomputes the whole history.
+
+    Usage:
+        state = RollingState(features, "/dbfs/ptc/co/features_state", lookback_days=1)
+        rows = state.run(source_dataset, output_dataset, "co")
+    """
+
+    FILE_NAME = "_state.json"
+
+    @staticmethod
+    def supports(feature: Dict[str, Any]) -> bool:
+        """Checks if a feature is a rolling window of days, which can be computed incrementally."""
+        return feature["type"] == "rolling" and feature.get("unit", "rows") == "days"
+
+    def __init__(self, features: List[Dict[str, Any]], state_path: str, lookback_days: int = 1,
+                 dtype: str = "float32", schema: Dict[str, str] = None) -> None:
+        """
+        Args:
+            features (list): Rolling windows of days, all grouped by the same keys and ordered by
+                             the same date column.
+            state_path (str): Folder of the state.
+            lookback_days (int): Days before the last day computed that are read again, to take
+                                 late rows into account.
+            dtype (str): Dtype of the features in the output.
+            schema (dict): Data model of the source, to compact the rows read.
+        """
+        if not features or not all(self.supports(f) for f in features):
+            raise ValueError("Error: only rolling windows of days can be computed incrementally")
+        groupings = {(tuple(f["by"]), f["order_by"]) for f in features}
+        if len(groupings) > 1:
+            raise ValueError(f"Error: incremental windows must share their by and order_by, got {sorted(groupings)}")
+        (self.by, self.order_by), = groupings
+        self.by = list(self.by)
+        self.features = [dict(f) for f in features]
+        self.columns = list(dict.fromkeys(f["column"] for f in self.features))
+        self.max_window = max(int(f["window"]) for f in self.features)
+        self.lookback_days = int(lookback_days)
+        self.dtype = dtype
+        self.schema = dict(schema or {})
+        self.state = PartitionedDataset(state_path, ["country"])
+        self.signature = hashlib.sha1(json.dumps(
+            {"features": self.features, "lookback_days": self.lookback_days}, sort_keys=True, default=str
+        ).encode()).hexdigest()
+        self.plan = FeaturePlan([
+            {"name": f"{column}__{stat}__{window}__{exclude}", "type": "rolling", "column": f"{column}__{stat}",
+             "by": self.by, "order_by": self.order_by, "window": window, "unit": "days",
+             "agg": {"min": "min", "max": "max"}.get(stat, "sum"), "exclude_current": exclude}
+            for column, window, exclude in dict.fromkeys(
+                (f["column"], int(f["window"]), bool(f.get("exclude_current", False))) for f in self.features)
+            for stat in STATS
+        ], dtype="float64")
+
+    def _meta_path(self, country: str) -> str:
+        return os.path.join(self.state.partition_path({"country": country}), self.FILE_NAME)
+
+    def get_meta(self, country: str) -> Dict[str, Any]:
+        """Gets the last day computed and the signature of the features of a country, or None."""
+        path = self._meta_path(country)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _set_meta(self, country: str, last_day: pd.Timestamp) -> None:
+        """Saves the last day computed. The file is replaced atomically."""
+        path = self._meta_path(country)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"last_day": last_day.date().isoformat(), "signature": self.signature}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def daily_totals(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Aggregates rows into the totals of every key and day.
+
+        Args:
+            frame (pd.DataFrame): Rows with the keys, the date column and the window columns.
+        Returns:
+            pd.DataFrame: Keys, day and <column>__<stat> for every window column and stat.
+        """
+        frame = frame.assign(**{self.order_by: pd.to_datetime(frame[self.order_by]).dt.normalize()})
+        aggregations = {}
+        for column in self.columns:
+            values = frame[column].astype(np.float64)
+            present = values.notna()
+            frame = frame.assign(**{f"{column}__sum": values.where(present, 0.0),
+                                    f"{column}__count": present.astype(np.float64),
+                                    f"{column}__sumsq": (values * values).where(present, 0.0),
+                                    f"{column}__min": values, f"{column}__max": values})
+            aggregations.update({f"{column}__{stat}": {"min": "min", "max": "max"}.get(stat, "sum")
+                                 for stat in STATS})
+        totals = frame.groupby(self.by + [self.order_by], sort=False, dropna=False, observed=True).agg(aggregations)
+        return totals.reset_index()
+
+    def windows(self, totals: pd.DataFrame) -> pd.DataFrame:
+        """Computes the features of every key and day from the daily totals, with the same values
+        the full engine gives every row of that key and day.
+
+        Args:
+            totals (pd.DataFrame): Daily totals, including the days before the ones computed that
+                                   their windows reach.
+        Returns:
+            pd.DataFrame: Keys, day and features.
+        """
+        rolled = self.plan.execute(totals, self.by + [self.order_by])
+        features = {}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for feature in self.features:
+                prefix = f"{feature['column']}__{{}}__{int(feature['window'])}__{bool(feature.get('exclude_current'))}"
+                s, n, q = (rolled[prefix.format(stat)].to_numpy() for stat in ("sum", "count", "sumsq"))
+                n = np.nan_to_num(n)
+                agg, enough = feature["agg"], n >= feature.get("min_periods", 1)
+                if agg == "count":
+                    values = n
+                elif agg == "sum":
+                    values = np.where(enough, s, np.nan)
+                elif agg == "mean":
+                    values = np.where(enough, s / n, np.nan)
+                elif agg == "std":
+                    variance = np.maximum((q - s * s / n) / (n - 1), 0.0)
+                    values = np.where(enough & (n >= 2), np.sqrt(variance), np.nan)
+                else:
+                    values = np.where(enough, rolled[prefix.format(agg)].to_numpy(), np.nan)
+                features[feature["name"]] = values.astype(self.dtype)
+        return pd.concat([rolled[self.by + [self.order_by]], pd.DataFrame(features, index=rolled.index)], axis=1)
+
+    def run(self, source: PartitionedDataset, output: PartitionedDataset, country: str,
+            filters: list = None) -> Dict[str, Any]:
+        """Computes the windows of the days after the last run and saves the state.
+
+        Args:
+            source (PartitionedDataset): Data set with the rows.
+            output (PartitionedDataset): Data set of the key-day features, partitioned by country
+                                         and the date column.
+            country (str): Country of the rows.
+            filters (list): Additional filters on the source.
+        Returns:
+            dict: Mode (full or incremental), first day computed, last day and rows written.
+        """
+        meta = self.get_meta(country)
+        full = meta is None or meta["signature"] != self.signature
+        filters = [("country", "=", country)] + list(filters or [])
+        start = None
+        if not full:
+            start = pd.Timestamp(meta["last_day"]) - pd.Timedelta(days=self.lookback_days - 1)
+            # Partition columns are read as strings, ISO dates compare correctly as strings.
+            bound = start.date().isoformat() if self.order_by in source.partition_columns else start.to_pydatetime()
+            filters.append((self.order_by, ">=", bound))
+
+        rows = source.read(self.by + [self.order_by] + self.columns, filters)
+        rows, _ = DtypeCompactor(self.schema, stable=True).compact(rows)
+        if not len(rows):
+            return {"mode": "full" if full else "incremental", "start": start, "last_day": meta and meta["last_day"],
+                    "rows": 0}
+        new_totals = self.daily_totals(rows)
+        last_day = new_totals[self.order_by].max()
+        if not full:
+            last_day = max(last_day, pd.Timestamp(meta["last_day"]))
+
+        history = None
+        if not full and self.state.exists():
+            history = self.state.read(filters=[("country", "=", country)]).drop(columns=["country"])
+            history[self.order_by] = pd.to_datetime(history[self.order_by])
+            history = history[history[self.order_by] < start]
+            affected = new_totals[self.by].drop_duplicates()
+            history_affected = history.merge(affected, on=self.by, how="inner")
+            totals = pd.concat([history_affected, new_totals], ignore_index=True)
+        else:
+            totals = new_totals
+
+        features = self.windows(totals)
+        if start is not None:
+            features = features[features[self.order_by] >= start]
+        if full:
+            output.overwrite(iter([features]), {"country": country})
+        else:
+            output.write(features, {"country": country}, mode="overwrite_partitions")
+
+        keep_from = last_day - pd.Timedelta(days=self.lookback_days - 1 + self.max_window)
+        state = new_totals if history is None else pd.concat([history, new_totals], ignore_index=True)
+        state = state[state[self.order_by] >= keep_from]
+        self.state.overwrite(iter([state]), {"country": country})
+        self._set_meta(country, last_day)
+        return {"mode": "full" if full else "incremental", "start": start, "last_day": last_day.date().isoformat(),
+                "rows": len(features)}
@@ -1,15 +1,45 @@
 """
-_summary_
+PTC FEATURE ENGINEERING process code.
 """
 # Importing global packages
-from typing import Tuple
+import os
+from typing import Any, Dict, List, Tuple
 
 # Importing LOLA modules
 from libs.lola_utils.config import CONFIG
 from libs.lola_utils.execution import Process as BaseProcess
+from libs.lola_utils.ind import DtypeCompactor
+from libs.lola_utils.storage import PartitionedDataset
 
 # Importing local modules
 from ptc.base import Base
+from ptc.feature_engineering.backend import FrameBackend
+from ptc.feature_engineering.engine import FeaturePlan
+from ptc.feature_engineering.incremental import RollingState
+
+
+def compute_partition(task: Dict[str, Any]) -> int:
+    """Computes the features of one partition of the source and writes them. Module level so it
+    can run in a process pool.
+
+    Args:
+        task (dict): Source and output data sets (path and partition columns), filters, columns
+                     to read, data model, features, kept columns, DataFrame backend and country.
+    Returns:
+        int: Number of rows written.
+    """
+    source = PartitionedDataset(task["source_path"], task["source_partition_columns"])
+    frame = source.read(task["columns"], task["filters"])
+    if not len(frame):
+        return 0
+    frame, _ = DtypeCompactor(task["schema"], stable=True).compact(frame)
+    backend = FrameBackend(**task["backend"])
+    features = FeaturePlan(task["features"], task["dtype"]).execute(frame, task["keep_columns"], backend)
+    features = backend.to_pandas(features)
+    output = PartitionedDataset(task["output_path"], task["output_partition_columns"],
+                                row_group_size=task["row_group_size"])
+    output.write(features, {"country": task["country"]}, mode="overwrite_partitions")
+    return len(features)
 
 
 class Process(BaseProcess, Base):
@@ -29,14 +59,167 @@ class Process(BaseProcess, Base):
         super().__init__()
 
     def validate_process(self) -> Tuple[bool, str]:
+        settings = CONFIG.get_value_or_none("feature_engineering")
+        if settings is not None:
+            settings = settings.to_dict()
+            for key in ("source", "output_path", "features"):
+                if key not in settings:
+                    return False, f"feature_engineering.{key} is missing in the service config"
+            try:
+                plan = FeaturePlan(settings["features"])
+            except ValueError as exc:
+                return False, str(exc)
+            if "incremental" in settings:
+                for key in ("state_path", "output_path"):
+                    if key not in settings["incremental"]:
+                        return False, f"feature_engineering.incremental.{key} is missing in the service config"
+                incremental, _ = self.split_incremental(plan)
+                if not incremental:
+                    return False, "feature_engineering.incremental needs rolling windows of days"
+                names = {f["name"] for f in incremental}
+                for feature in plan.steps:
+                    if feature not in incremental and names.intersection(plan.inputs(feature)):
+                        return False, f"feature {feature['name']} uses an incremental window"
+                try:
+                    RollingState(incremental, settings["incremental"]["state_path"])
+                except ValueError as exc:
+                    return False, str(exc)
+            backend = settings.get("backend")
+            name = backend.get("name", "pandas") if isinstance(backend, dict) else backend
+            if name not in (None, "pandas", "modin"):
+                return False, f"feature_engineering.backend {name} is not pandas or modin"
+            partition_by = settings.get("partition_by")
+            if partition_by is not None:
+                if partition_by not in self.get_dataset(settings["source"]).partition_columns:
+                    return False, f"feature_engineering.partition_by {partition_by} is not a partition column " \
+                                  f"of {settings['source']}"
+                for feature in plan.steps:
+                    if feature["type"] in ("lag", "rolling", "group_agg") and partition_by not in feature["by"]:
+                        return False, f"feature {feature['name']} is not grouped by partition_by {partition_by}"
         return True, "PTC FEATURE ENGINEERING process"
 
     def execute_process(self) -> None:
-        """_summary_"""
+        """Computes the features declared in feature_engineering.features on the ingested source
+        feature_engineering.source and writes them to the data set
+        <output_path>/country=<country>/[<partition_by>=<value>/]. Only the columns the features
+        need are read. With partition_by (a partition column of the source that every group of
+        the features includes) each partition is computed separately and concurrently, so only
+        one partition per worker is in memory. With feature_engineering.incremental the rolling
+        windows of days are computed incrementally from the state of the last run into the
+        key-day data set <incremental.output_path>/country=<country>/<order_by>=<day>/. Without a
+        feature_engineering config nothing is computed.
+
+        Returns:
+            None
+        """
         print(">>> PTC Process: FEATURE ENGINEERING")
         print(f"Estado del proceso: {CONFIG.state}")
+
+        settings = CONFIG.get_value_or_none("feature_engineering")
+        if settings is not None:
+            self.compute_features(settings.to_dict())
         self.despedida()
 
+    @staticmethod
+    def split_incremental(plan: FeaturePlan) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Splits the features of a plan into the rolling windows of days over source columns,
+        which are computed incrementally, and the others.
+
+        Args:
+            plan (FeaturePlan): Compiled features.
+        Returns:
+            tuple: Incremental features and other features.
+        """
+        names = {f["name"] for f in plan.features}
+        incremental = [f for f in plan.features if RollingState.supports(f) and f["column"] not in names]
+        return incremental, [f for f in plan.features if f not in incremental]
+
+    def compute_features(self, settings: Dict[str, Any]) -> None:
+        """Runs the feature plan on every partition of the source, and the incremental windows.
+
+        Args:
+            settings (dict): feature_engineering config.
+        Returns:
+            None
+        """
+        country = os.getenv("COUNTRY") or CONFIG.get_value_or_none("country")
+        source = self.get_dataset(settings["source"])
+        plan = FeaturePlan(settings["features"], settings.get("dtype", "float32"))
+        if "incremental" in settings:
+            incremental, others = self.split_incremental(plan)
+            self.compute_incremental(settings, incremental, source, country)
+            if not others:
+                return
+            settings = dict(settings, features=others)
+            plan = FeaturePlan(others, settings.get("dtype", "float32"))
+        self.logger.info(plan.explain())
+
+        partition_by = settings.get("partition_by")
+        keep_columns = list(dict.fromkeys(
+            settings.get("keep_columns", [c for f in plan.features for c in f.get("by", [])])
+            + ([partition_by] if partition_by else [])
+        ))
+        columns = list(dict.fromkeys(plan.required_columns + keep_columns))
+        filters = [("country", "=", country)] + [tuple(f) for f in settings.get("filters", [])]
+        output_partition_columns = ["country"] + ([partition_by] if partition_by else [])
+        backend_settings = settings.get("backend")
+        rows = source.count_rows(filters) if isinstance(backend_settings, dict) and "min_rows" in backend_settings \
+            else None
+        backend = FrameBackend.from_settings(backend_settings, rows)
+        self.logger.info(f"Computing the features of {settings['source']} with {backend.name}.")
+
+        task = {
+            "source_path": source.path, "source_partition_columns": source.partition_columns,
+            "columns": columns, "schema": self.get_schema(settings["source"]), "features": settings["features"],
+            "dtype": settings.get("dtype", "float32"), "keep_columns": keep_columns,
+            "output_path": settings["output_path"], "output_partition_columns": output_partition_columns,
+            "row_group_size": settings.get("row_group_size", 128 * 1024), "country": country,
+            "backend": backend.to_dict(),
+        }
+        if partition_by:
+            values = sorted({p[partition_by] for p in source.partitions(filters) if partition_by in p})
+            tasks = {v: dict(task, filters=filters + [(partition_by, "=", v)]) for v in values}
+            if backend.is_modin and len(tasks) == 1:
+                # A single partition gets every core through the frame operations of Modin.
+                rows = {v: compute_partition(t) for v, t in tasks.items()}
+            else:
+                if backend.is_modin:
+                    # The numpy steps of the engine (sorts, cumulative sums) are single threaded under Modin
+                    # too, so partitions keep the pool of processes on pandas instead of running one by one.
+                    self.logger.info(f"{len(tasks)} partitions of {settings['source']} run on pandas in a pool "
+                                     f"instead of one after the other on Modin.")
+                    tasks = {v: dict(t, backend=FrameBackend().to_dict()) for v, t in tasks.items()}
+                rows = self.run_partitions(compute_partition, tasks, max_workers=settings.get("max_workers"),
+                                           use_threads=settings.get("use_threads", False))
+        else:
+            rows = {country: compute_partition(dict(task, filters=filters))}
+        self.logger.info(f"Features of {settings['source']} computed: {sum(rows.values())} rows in "
+                         f"{len(rows)} partitions.")
+        self.output_locations["features"] = settings["output_path"]
+
+    def compute_incremental(self, settings: Dict[str, Any], features: List[Dict[str, Any]],
+                            source: PartitionedDataset, country: str) -> None:
+        """Updates the rolling windows of days with the days after the last run.
+
+        Args:
+            settings (dict): feature_engineering config.
+            features (list): Rolling windows of days.
+            source (PartitionedDataset): Data set of the source.
+            country (str): Country of the data.
+        Returns:
+            None
+        """
+        incremental = settings["incremental"]
+        state = RollingState(features, incremental["state_path"], incremental.get("lookback_days", 1),
+                             settings.get("dtype", "float32"), self.get_schema(settings["source"]))
+        output = PartitionedDataset(incremental["output_path"], ["country", state.order_by],
+                                    row_group_size=settings.get("row_group_size", 128 * 1024))
+        result = state.run(source, output, country, [tuple(f) for f in settings.get("filters", [])])
+        start = result["start"].date().isoformat() if result["start"] is not None else "the first day"
+        self.logger.info(f"Incremental windows of {settings['source']} ({result['mode']}): {result['rows']} "
+                         f"key-days from {start} to {result['last_day']}.")
+        self.output_locations["incremental_features"] = incremental["output_path"]
+
     def despedida(self) -> None:
         print(f"Adios {CONFIG.username}")
 
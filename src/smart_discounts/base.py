@@ -1,6 +1,16 @@
 """
 The class will define common functionality across various subprocess of smdc.
 """
+import json
+import os
+import uuid
+from typing import Any, Dict, List
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from libs.lola_utils.config import CONFIG
+from libs.lola_utils.storage import PartitionedDataset
 
 
 class Base:
@@ -14,3 +24,113 @@ class Base:
         """
         super().__init__()
         pass
+
+    @staticmethod
+    def get_path(argument: str, setting: List[str]) -> str:
+        """
+        Gets a path passed to the controller (e.g. --FEATURES_PATH_ID), or else from the service config.
+        Args:
+            argument (str): Name of the controller argument.
+            setting ([str]): Path of the setting in the service config.
+        Returns:
+            str: The path, or None.
+        """
+        return CONFIG.get_value_or_none(argument) or CONFIG.get_value_or_none(setting)
+
+    @staticmethod
+    def get_country() -> str:
+        return os.getenv("COUNTRY") or CONFIG.get_value_or_none("country")
+
+    def read_features(self, path: str, columns: List[str] = None, partition_columns: List[str] = None,
+                      filters: list = None) -> pd.DataFrame:
+        """
+        Reads a feature data set, only the rows of the country when it is partitioned by country.
+        Args:
+            path (str): Folder of the data set.
+            columns ([str]): Columns to read. All when None.
+            partition_columns ([str]): Partition columns of the data set. Defaults to ["country"].
+            filters (list): Additional filters.
+        Returns:
+            pd.DataFrame: Feature rows.
+        """
+        return self.get_feature_dataset(path, partition_columns).read(
+            columns, self.get_feature_filters(partition_columns, filters))
+
+    @staticmethod
+    def get_feature_dataset(path: str, partition_columns: List[str] = None) -> PartitionedDataset:
+        """
+        Gets a feature data set, partitioned by country unless other partition columns are given.
+        Args:
+            path (str): Folder of the data set.
+            partition_columns ([str]): Partition columns of the data set. Defaults to ["country"].
+        Returns:
+            PartitionedDataset: The data set.
+        """
+        return PartitionedDataset(path, ["country"] if partition_columns is None else partition_columns)
+
+    def get_feature_filters(self, partition_columns: List[str] = None, filters: list = None) -> list:
+        """
+        Gets the filters of the rows of the country, when the data set is partitioned by country.
+        Args:
+            partition_columns ([str]): Partition columns of the data set. Defaults to ["country"].
+            filters (list): Additional filters.
+        Returns:
+            list: The filters, or None without any.
+        """
+        partition_columns = ["country"] if partition_columns is None else partition_columns
+        filters = [tuple(f) for f in filters or []]
+        if "country" in partition_columns and self.get_country():
+            filters.insert(0, ("country", "=", self.get_country()))
+        return filters or None
+
+    @staticmethod
+    def get_row_group_tasks(dataset: PartitionedDataset, filters: list = None,
+                            row_groups_per_task: int = 4) -> List[Dict[str, Any]]:
+        """
+        Splits the files of a data set into tasks of a few row groups, to stream them in parallel.
+        Args:
+            dataset (PartitionedDataset): The data set.
+            filters (list): Filters on the partition columns, e.g. the country.
+            row_groups_per_task (int): Row groups per task.
+        Returns:
+            list: Tasks with the file, row groups and partition values of the folder.
+        """
+        tasks = []
+        for file in dataset.files(filters):
+            parts = os.path.relpath(os.path.dirname(file), dataset.path).split(os.sep)
+            partition_values = dict(p.split("=", 1) for p in parts if "=" in p)
+            row_groups = list(range(pq.ParquetFile(file).num_row_groups))
+            for start in range(0, len(row_groups), row_groups_per_task):
+                tasks.append({"file": file, "row_groups": row_groups[start:start + row_groups_per_task],
+                              "partition_values": partition_values})
+        return tasks
+
+    @staticmethod
+    def write_json(path: str, data: Dict[str, Any]) -> None:
+        """
+        Writes a json file, replacing it atomically.
+        Args:
+            path (str): Path of the file.
+            data (dict): Content.
+        Returns:
+            None
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read_json(path: str) -> Dict[str, Any]:
+        """
+        Reads a json file.
+        Args:
+            path (str): Path of the file.
+        Returns:
+            dict: Content, or None if the file does not exist.
+        """
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
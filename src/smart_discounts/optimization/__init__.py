@@ -0,0 +1,6 @@
+"""
+Module to import smart discounts optimization modules.
+"""
+
+# Importing modules for easy initilization in other modules.
+from smart_discounts.optimization.process import Process
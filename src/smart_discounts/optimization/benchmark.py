@@ -0,0 +1,102 @@
+"""
+SMART DISCOUNTS OPTIMIZATION benchmark of the discount optimizer.
+
+Generates synthetic demand curves of stores x SKUs, chunk by chunk from a seed inside the workers
+so nothing large is sent to them, and optimizes them serially and in a process pool. The report
+gives the store-SKUs optimized per second of every run, e.g.
+
+    python -m smart_discounts.optimization.benchmark --stores 2000 --skus 2000 --workers 1 8
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from smart_discounts.optimization.engine import DiscountOptimizer
+
+
+def synthetic_curves(stores: List[int], skus: int, seed: int = 0) -> pd.DataFrame:
+    """Generates the demand curves, boundaries and costs of some stores.
+
+    Args:
+        stores ([int]): Ids of the stores.
+        skus (int): SKUs per store.
+        seed (int): Random seed, combined with the first store so every chunk differs.
+    Returns:
+        pd.DataFrame: One row per store and SKU.
+    """
+    rng = np.random.default_rng([seed, stores[0]])
+    n = len(stores) * skus
+    base_price = rng.uniform(1.0, 50.0, n)
+    frame = pd.DataFrame({
+        "store": np.repeat(stores, skus), "sku": np.tile(np.arange(skus), len(stores)),
+        "base_price": base_price, "base_units": rng.gamma(2.0, 20.0, n), "elasticity": rng.uniform(-4.0, -0.5, n),
+        "cost": base_price * rng.uniform(0.4, 0.8, n),
+        "max_discount": rng.choice([0.2, 0.3, 0.5], n),
+    })
+    frame.loc[rng.random(n) < 0.05, "cost"] = np.nan
+    return frame
+
+
+def optimize_chunk(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Generates and optimizes a chunk of stores. Module level so it can run in a process pool.
+
+    Args:
+        task (dict): stores, skus, seed and the optimizer config.
+    Returns:
+        dict: Rows optimized, and seconds generating and optimizing them.
+    """
+    start = time.perf_counter()
+    frame = synthetic_curves(task["stores"], task["skus"], task["seed"])
+    generated = time.perf_counter()
+    DiscountOptimizer(**task["optimizer"]).optimize_stores(frame)
+    return {"rows": len(frame), "generate_seconds": generated - start,
+            "optimize_seconds": time.perf_counter() - generated}
+
+
+def run(stores: int, skus: int, workers: List[int], stores_per_task: int = 50, seed: int = 0,
+        optimizer: Dict[str, Any] = None) -> pd.DataFrame:
+    """Optimizes the synthetic stores with every number of workers.
+
+    Args:
+        stores (int): Number of stores.
+        skus (int): SKUs per store.
+        workers ([int]): Numbers of workers, 1 runs serially in this process.
+        stores_per_task (int): Stores per chunk.
+        seed (int): Random seed.
+        optimizer (dict): Arguments of the DiscountOptimizer.
+    Returns:
+        pd.DataFrame: Workers, rows, seconds and store-SKUs per second.
+    """
+    optimizer = optimizer or {"budget": {"share_of_revenue": 0.05}}
+    ids = list(range(stores))
+    tasks = [{"stores": ids[i:i + stores_per_task], "skus": skus, "seed": seed, "optimizer": optimizer}
+             for i in range(0, stores, stores_per_task)]
+    results = []
+    for count in workers:
+        start = time.perf_counter()
+        if count == 1:
+            chunks = [optimize_chunk(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=count) as pool:
+                chunks = list(pool.map(optimize_chunk, tasks))
+        seconds = time.perf_counter() - start
+        rows = sum(c["rows"] for c in chunks)
+        results.append({"workers": count, "rows": rows, "seconds": round(seconds, 3),
+                        "optimize_seconds": round(sum(c["optimize_seconds"] for c in chunks), 3),
+                        "rows_per_second": round(rows / seconds)})
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store-SKUs optimized per second, serial and in parallel.")
+    parser.add_argument("--stores", type=int, default=2000)
+    parser.add_argument("--skus", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--stores_per_task", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(run(args.stores, args.skus, args.workers, args.stores_per_task, args.seed).to_string(index=False))
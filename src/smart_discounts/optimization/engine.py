@@ -0,0 +1,210 @@
+"""
+SMART DISCOUNTS OPTIMIZATION engine.
+
+Every SKU of a store is evaluated at every candidate discount level at once: the demand curves,
+prices, margins and discount spend are (SKUs x levels) arrays and the boundaries are boolean masks
+over them. Without a budget every SKU takes its best allowed level independently, an argmax per
+row. The budget of the store couples the SKUs, so only it goes to scipy.optimize: with a
+multiplier (the value of one unit of budget) on the spend, SKUs are again independent, and the
+multiplier is searched with brentq until the spend of the store fits its budget.
+"""
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import optimize
+
+DEFAULT_LEVELS = [round(0.05 * i, 2) for i in range(11)]
+OBJECTIVES = ("margin", "revenue", "units")
+CURVE_COLUMNS = ["base_price", "base_units", "elasticity"]
+RESULT_COLUMNS = ["discount", "price", "units", "revenue", "margin", "spend", "budget_multiplier", "status"]
+
+
+class DiscountOptimizer:
+    """Chooses the discount level of every SKU of every store.
+
+    Demand curves have constant elasticity: at discount d the price is base_price * (1 - d) and
+    the units are base_units * (1 - d) ** elasticity (elasticity < 0). The spend of a discount is
+    base_price * d * units.
+
+    Usage:
+        optimizer = DiscountOptimizer(levels=[0, 0.1, 0.2, 0.3], budget={"share_of_revenue": 0.05})
+        result = optimizer.optimize_stores(frame)
+    """
+
+    def __init__(self, levels: List[float] = None, objective: str = "margin", budget: Dict[str, Any] = None,
+                 default_bounds: Tuple[float, float] = (0.0, 1.0), xtol: float = 1e-6) -> None:
+        """
+        Args:
+            levels ([float]): Candidate discount levels, as fractions of the base price.
+            objective (str): "margin", "revenue" or "units", summed over the SKUs of a store.
+            budget (dict): Spend allowed per store: {"amount": 5000.0}, or {"share_of_revenue": 0.05}
+                           of the revenue of the store without discounts. A budget column of the
+                           frame takes precedence. None for no budget.
+            default_bounds (tuple): Minimum and maximum discount of SKUs without boundaries.
+            xtol (float): Relative tolerance of the budget multiplier.
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Error: unsupported objective {objective}")
+        self.levels = np.asarray(sorted(DEFAULT_LEVELS if levels is None else levels), dtype=np.float64)
+        self.objective = objective
+        self.budget = budget
+        self.default_bounds = default_bounds
+        self.xtol = xtol
+
+    def evaluate(self, base_price: np.ndarray, base_units: np.ndarray, elasticity: np.ndarray,
+                 cost: np.ndarray, units: np.ndarray = None) -> Dict[str, np.ndarray]:
+        """Evaluates the demand curves at every level.
+
+        Args:
+            base_price (np.ndarray): Price without discount of every SKU.
+            base_units (np.ndarray): Units sold without discount.
+            elasticity (np.ndarray): Price elasticity.
+            cost (np.ndarray): Unit cost (e.g. the ZTPM price), NaN when unknown.
+            units (np.ndarray): (SKUs x levels) units already evaluated, e.g. from a CurveGrid.
+                                base_units and elasticity are then ignored.
+        Returns:
+            dict: price, units, revenue, margin and spend, (SKUs x levels) arrays.
+        """
+        factor = 1.0 - self.levels[None, :]
+        price = base_price[:, None] * factor
+        if units is None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                units = base_units[:, None] * np.power(factor, elasticity[:, None])
+        revenue = price * units
+        return {"price": price, "units": units, "revenue": revenue, "margin": revenue - cost[:, None] * units,
+                "spend": base_price[:, None] * self.levels[None, :] * units}
+
+    def allowed(self, min_discount: np.ndarray, max_discount: np.ndarray, values: Dict[str, np.ndarray]) -> np.ndarray:
+        """Masks the levels outside the boundaries, and the discounts of SKUs whose curve or cost
+        is unknown.
+
+        Args:
+            min_discount (np.ndarray): Minimum discount of every SKU, NaN for the default.
+            max_discount (np.ndarray): Maximum discount of every SKU, NaN for the default.
+            values (dict): Output of evaluate.
+        Returns:
+            np.ndarray: (SKUs x levels) mask of the allowed levels.
+        """
+        low = np.where(np.isnan(min_discount), self.default_bounds[0], min_discount)
+        high = np.where(np.isnan(max_discount), self.default_bounds[1], max_discount)
+        eps = 1e-9
+        mask = (self.levels[None, :] >= low[:, None] - eps) & (self.levels[None, :] <= high[:, None] + eps)
+        known = np.isfinite(values[self.objective]) & np.isfinite(values["spend"])
+        return mask & (known | (self.levels[None, :] == 0))
+
+    def solve(self, objective: np.ndarray, spend: np.ndarray, allowed: np.ndarray,
+              budget: float = None) -> Tuple[np.ndarray, float, str]:
+        """Chooses a level per SKU maximizing the objective of the store within its budget.
+
+        Args:
+            objective (np.ndarray): (SKUs x levels) objective.
+            spend (np.ndarray): (SKUs x levels) discount spend.
+            allowed (np.ndarray): (SKUs x levels) mask of the allowed levels.
+            budget (float): Spend allowed for the store. None or NaN for no budget.
+        Returns:
+            tuple: Level of every SKU (-1 without an allowed level), budget multiplier, and status
+                   ("optimal", "budget_infeasible" when even the cheapest levels exceed the budget).
+        """
+        rows = np.arange(len(objective))
+        score = np.where(allowed, np.nan_to_num(objective, nan=0.0), -np.inf)
+        cost = np.where(allowed, np.nan_to_num(spend, nan=0.0), 0.0)
+        has_level = allowed.any(axis=1)
+
+        def choose(multiplier: float) -> np.ndarray:
+            return np.where(has_level, np.argmax(score - multiplier * cost, axis=1), -1)
+
+        def excess(multiplier: float) -> float:
+            choice = choose(multiplier)
+            return float(cost[rows, np.maximum(choice, 0)][has_level].sum() - budget)
+
+        if budget is None or np.isnan(budget) or excess(0.0) <= 0:
+            return choose(0.0), 0.0, "optimal"
+        cheapest = np.where(allowed, cost, np.inf).min(axis=1)
+        if cheapest[has_level].sum() > budget:
+            return np.where(has_level, np.argmin(np.where(allowed, cost, np.inf), axis=1), -1), np.inf, \
+                "budget_infeasible"
+        high = 1.0
+        while excess(high) > 0:
+            high *= 2.0
+        # The spend is a decreasing step function of the multiplier: brentq finds the step where
+        # it crosses the budget, and the multiplier is raised to the feasible side of the step.
+        root = optimize.brentq(excess, 0.0, high, xtol=self.xtol * high)
+        multiplier, step = root, self.xtol * high
+        while excess(multiplier) > 0:
+            multiplier += step
+            step *= 2.0
+        choice = choose(multiplier)
+        # The budget left is given to the SKUs that take a more expensive level just below the
+        # multiplier, best objective gained per unit of spend first.
+        upper = choose(max(root - self.xtol * high, 0.0))
+        candidates = np.flatnonzero(upper != choice)
+        if len(candidates):
+            gain = score[candidates, upper[candidates]] - score[candidates, choice[candidates]]
+            extra = cost[candidates, upper[candidates]] - cost[candidates, choice[candidates]]
+            left = -excess(multiplier)
+            for i in np.argsort(-gain / np.maximum(extra, 1e-12), kind="stable"):
+                if gain[i] > 0 and extra[i] <= left:
+                    choice[candidates[i]] = upper[candidates[i]]
+                    left -= extra[i]
+        return choice, multiplier, "optimal"
+
+    def store_budget(self, frame: pd.DataFrame, values: Dict[str, np.ndarray]) -> float:
+        """Gets the budget of a store: its budget column, or the budget config."""
+        if "budget" in frame.columns and frame["budget"].notna().any():
+            return float(frame["budget"].dropna().iloc[0])
+        if not self.budget:
+            return None
+        if "amount" in self.budget:
+            return float(self.budget["amount"])
+        revenue = values["revenue"][:, self.levels == 0]
+        return float(self.budget["share_of_revenue"] * np.nansum(revenue)) if revenue.size else None
+
+    def optimize_store(self, frame: pd.DataFrame, units: np.ndarray = None) -> pd.DataFrame:
+        """Optimizes the SKUs of one store.
+
+        Args:
+            frame (pd.DataFrame): One row per SKU with base_price, base_units, elasticity, and
+                                  optionally cost, min_discount, max_discount and budget.
+            units (np.ndarray): (SKUs x levels) units of the curves, instead of base_units and
+                                elasticity.
+        Returns:
+            pd.DataFrame: The discount, price, units, revenue, margin and spend chosen for every
+                          row, the budget multiplier of the store and the status.
+        """
+        def column(name: str) -> np.ndarray:
+            if name not in frame.columns:
+                return np.full(len(frame), np.nan)
+            return frame[name].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        values = self.evaluate(column("base_price"), column("base_units"), column("elasticity"), column("cost"),
+                               units)
+        allowed = self.allowed(column("min_discount"), column("max_discount"), values)
+        choice, multiplier, status = self.solve(values[self.objective], values["spend"], allowed,
+                                                self.store_budget(frame, values))
+        rows = np.arange(len(frame))
+        picked = np.maximum(choice, 0)
+        result = {"discount": np.where(choice >= 0, self.levels[picked], np.nan)}
+        for name in ("price", "units", "revenue", "margin", "spend"):
+            result[name] = np.where(choice >= 0, values[name][rows, picked], np.nan)
+        result["budget_multiplier"] = multiplier
+        result["status"] = np.where(choice >= 0, status, "no_allowed_level")
+        return pd.DataFrame(result, index=frame.index)
+
+    def optimize_stores(self, frame: pd.DataFrame, store_column: str = "store",
+                        units: np.ndarray = None) -> pd.DataFrame:
+        """Optimizes every store of a frame.
+
+        Args:
+            frame (pd.DataFrame): SKUs of the stores, see optimize_store.
+            store_column (str): Column of the store.
+            units (np.ndarray): (rows x levels) units of the curves of the rows of frame, see
+                                optimize_store.
+        Returns:
+            pd.DataFrame: frame with the result columns.
+        """
+        if not len(frame):
+            return frame.assign(**{c: pd.Series(dtype=object) for c in RESULT_COLUMNS})
+        results = [self.optimize_store(frame.iloc[rows], None if units is None else units[rows])
+                   for rows in frame.groupby(store_column, sort=False).indices.values()]
+        return pd.concat([frame, pd.concat(results).reindex(frame.index)], axis=1)
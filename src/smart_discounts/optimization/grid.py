@@ -0,0 +1,233 @@
+"""
+SMART DISCOUNTS OPTIMIZATION demand curve grid.
+
+The demand curve of every store and SKU is evaluated once on a uniform grid of discounts (prices
+base_price * (1 - d)) and saved as one contiguous float32 .npy array, curves x grid points, next to
+the keys of its rows. Workers memory map it through the model cache, so the processes of a node
+share its pages, and evaluating the curves of a store at any discounts is a gather of the two grid
+points around every discount and a linear interpolation between them.
+"""
+import os
+import shutil
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from libs.lola_utils.storage import ModelCache
+from smart_discounts.base import Base
+
+
+class CurveGrid:
+    """Demand curves of stores and SKUs precomputed on a grid of discounts.
+
+    Curves are either constant elasticity, one row per key with base_price, base_units and
+    elasticity, or points, one row per key and discount with the units sold at that discount and
+    the base_price. Points are interpolated linearly onto the grid and kept constant before the
+    first and after the last point of a curve.
+
+    Usage:
+        CurveGrid.build(curves, ["store", "sku"], "/dbfs/sd/curve_grid/country=co", points=51)
+        grid = CurveGrid.load("/dbfs/sd/curve_grid/country=co", cache_dir="/local_disk0/models")
+        rows = grid.store_rows(["0001", "0002"])
+        units = grid.units(rows[:, None], np.array([0.0, 0.1, 0.2])[None, :])
+    """
+
+    def __init__(self, metadata: Dict[str, Any], keys: pd.DataFrame, values: np.ndarray,
+                 base_price: np.ndarray) -> None:
+        """
+        Args:
+            metadata (dict): points, max_discount, keys and source of the grid.
+            keys (pd.DataFrame): Keys of the rows, sorted.
+            values (np.ndarray): (rows x points) units at every grid discount.
+            base_price (np.ndarray): Price without discount of every row.
+        """
+        self.metadata = metadata
+        self.keys = keys
+        self.values = values
+        self.base_price = base_price
+        self.points = metadata["points"]
+        self.max_discount = metadata["max_discount"]
+        self.step = self.max_discount / (self.points - 1)
+        self.stores = keys[metadata["keys"][0]].to_numpy()
+        self.__index = None
+
+    @property
+    def grid(self) -> np.ndarray:
+        return np.linspace(0.0, self.max_discount, self.points)
+
+    @staticmethod
+    def source_fingerprint(files: List[str]) -> List[list]:
+        """Gets the size and modification time of the files of the curves, to know when the grid
+        is stale without reading them."""
+        return [[f, os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in sorted(files)]
+
+    @staticmethod
+    def is_current(path: str, source: List[list], points: int, max_discount: float) -> bool:
+        """Tells if the grid at path was built from the same curve files with the same grid."""
+        metadata = Base.read_json(os.path.join(path, "metadata.json"))
+        return metadata is not None and metadata["source"] == source and metadata["points"] == points \
+            and metadata["max_discount"] == max_discount
+
+    @staticmethod
+    def interpolate_points(curves: pd.DataFrame, codes: np.ndarray, grid: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Interpolates point curves onto the grid, for all the curves of a block at once.
+
+        Args:
+            curves (pd.DataFrame): discount and units of the points, sorted by curve and discount.
+            codes (np.ndarray): Curve (row of the grid) of every point, sorted.
+            grid (np.ndarray): Grid discounts.
+            rows (np.ndarray): Curves of the block.
+        Returns:
+            np.ndarray: (rows x points) units.
+        """
+        x = curves["discount"].to_numpy(dtype=np.float64)
+        y = curves["units"].to_numpy(dtype=np.float64)
+        # Points of every curve are sorted by discount in [0, 1], so curve * 2 + discount sorts
+        # all the points and one searchsorted finds the neighbours of every grid discount.
+        position = codes * 2.0 + np.clip(x, 0.0, 1.0)
+        first = np.searchsorted(codes, rows, "left")[:, None]
+        last = np.searchsorted(codes, rows, "right")[:, None] - 1
+        after = np.searchsorted(position, rows[:, None] * 2.0 + grid[None, :], "right")
+        low, high = np.clip(after - 1, first, last), np.clip(after, first, last)
+        width = x[high] - x[low]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(width > 0, np.clip((grid[None, :] - x[low]) / width, 0.0, 1.0), 0.0)
+        return y[low] * (1.0 - weight) + y[high] * weight
+
+    @classmethod
+    def build(cls, curves: pd.DataFrame, keys: List[str], path: str, points: int = 51, max_discount: float = 0.5,
+              source: List[list] = None, block_size: int = 65536) -> None:
+        """Evaluates the curves on the grid and replaces the grid at path.
+
+        Args:
+            curves (pd.DataFrame): Constant elasticity or point curves, see the class.
+            keys ([str]): Key columns of a curve, the store first.
+            path (str): Folder of the grid.
+            points (int): Grid points, from 0 to max_discount.
+            max_discount (float): Last grid discount. Discounts beyond it have no units.
+            source (list): Fingerprint of the curve files, see source_fingerprint.
+            block_size (int): Curves evaluated at once.
+        Returns:
+            None
+        """
+        if points < 2:
+            raise ValueError("Error: a curve grid needs at least 2 points")
+        grid = np.linspace(0.0, max_discount, points)
+        elasticity = "elasticity" in curves.columns
+        curves = curves.sort_values(keys if elasticity else keys + ["discount"], kind="stable")
+        if elasticity:
+            curves = curves.drop_duplicates(keys)
+            codes = np.arange(len(curves))
+            rows = curves
+        else:
+            codes = curves.groupby(keys, sort=False).ngroup().to_numpy()
+            rows = curves.drop_duplicates(keys)
+
+        parent, name = os.path.split(os.path.normpath(path))
+        tmp_path = os.path.join(parent, f".{name}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp_path)
+        try:
+            values = np.lib.format.open_memmap(os.path.join(tmp_path, "units.npy"), mode="w+", dtype=np.float32,
+                                               shape=(len(rows), points))
+            for start in range(0, len(rows), block_size):
+                block = slice(start, start + block_size)
+                if elasticity:
+                    base_units = rows["base_units"].to_numpy(dtype=np.float64)[block, None]
+                    exponent = rows["elasticity"].to_numpy(dtype=np.float64)[block, None]
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        values[block] = base_units * np.power(1.0 - grid[None, :], exponent)
+                else:
+                    values[block] = cls.interpolate_points(curves, codes, grid,
+                                                           np.arange(start, min(start + block_size, len(rows))))
+            values.flush()
+            del values
+            np.save(os.path.join(tmp_path, "base_price.npy"), rows["base_price"].to_numpy(dtype=np.float64))
+            rows[keys].reset_index(drop=True).to_parquet(os.path.join(tmp_path, "keys.parquet"), index=False)
+            Base.write_json(os.path.join(tmp_path, "metadata.json"),
+                            {"keys": keys, "points": points, "max_discount": max_discount, "rows": len(rows),
+                             "format": "elasticity" if elasticity else "points", "source": source})
+            old_path = f"{tmp_path}.old"
+            if os.path.isdir(path):
+                os.rename(path, old_path)
+            os.rename(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def read(cls, path: str) -> "CurveGrid":
+        """Reads a grid, memory mapping its arrays."""
+        return cls(Base.read_json(os.path.join(path, "metadata.json")),
+                   pd.read_parquet(os.path.join(path, "keys.parquet")),
+                   np.load(os.path.join(path, "units.npy"), mmap_mode="r"),
+                   np.load(os.path.join(path, "base_price.npy"), mmap_mode="r"))
+
+    @classmethod
+    def load(cls, path: str, cache_dir: str = None) -> "CurveGrid":
+        """Loads a grid once per process from its local copy in the model cache. Workers forked
+        after it was loaded share it."""
+        return ModelCache(cache_dir).load(path, cls.read, name="curve_grid")
+
+    def rows(self, frame: pd.DataFrame) -> np.ndarray:
+        """Gets the grid rows of the keys of a frame, -1 for keys without a curve."""
+        if self.__index is None:
+            self.__index = pd.MultiIndex.from_frame(self.keys)
+        return self.__index.get_indexer(pd.MultiIndex.from_frame(frame[self.metadata["keys"]]))
+
+    def store_rows(self, stores: List[Any]) -> np.ndarray:
+        """Gets the grid rows of the curves of some stores. Keys are sorted by store first, so the
+        rows of a store are a contiguous slice."""
+        first = np.searchsorted(self.stores, stores, "left")
+        last = np.searchsorted(self.stores, stores, "right")
+        return np.concatenate([np.arange(a, b) for a, b in zip(first, last)] + [np.empty(0, dtype=np.int64)])
+
+    def units(self, rows: np.ndarray, discounts: np.ndarray) -> np.ndarray:
+        """Evaluates curves at discounts. Rows and discounts broadcast against each other, e.g.
+        rows[:, None] and levels[None, :] give the (rows x levels) units of every curve at every
+        level.
+
+        Args:
+            rows (np.ndarray): Grid rows, -1 for no curve.
+            discounts (np.ndarray): Discounts, as fractions of the base price.
+        Returns:
+            np.ndarray: Units, NaN without a curve or beyond max_discount.
+        """
+        rows, discounts = np.broadcast_arrays(np.asarray(rows), np.asarray(discounts, dtype=np.float64))
+        position = np.clip(discounts / self.step, 0.0, self.points - 1)
+        low = np.minimum(position.astype(np.int64), self.points - 2)
+        weight = position - low
+        safe = np.where(rows >= 0, rows, 0)
+        units = self.values[safe, low] * (1.0 - weight) + self.values[safe, low + 1] * weight
+        outside = (rows < 0) | (discounts < 0) | (discounts > self.max_discount + 1e-9)
+        return np.where(outside, np.nan, units)
+
+    def units_at(self, rows: np.ndarray, levels: np.ndarray) -> np.ndarray:
+        """Evaluates curves at the same discount levels, the case of the optimizer. The grid
+        columns and weights of the levels are computed once, the rows are a slice of the grid
+        when contiguous (the SKUs of a store), and levels on grid points need no interpolation.
+
+        Args:
+            rows (np.ndarray): Grid rows, -1 for no curve.
+            levels (np.ndarray): Discount levels.
+        Returns:
+            np.ndarray: (rows x levels) units, NaN without a curve or beyond max_discount.
+        """
+        rows, levels = np.asarray(rows), np.asarray(levels, dtype=np.float64)
+        position = np.clip(levels / self.step, 0.0, self.points - 1)
+        low = np.minimum(np.round(position).astype(np.int64), self.points - 1)
+        weight = position - low
+        if len(rows) and rows[0] >= 0 and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+            block = self.values[rows[0]:rows[-1] + 1]
+        else:
+            block = self.values[np.where(rows >= 0, rows, 0)]
+        if np.all(np.abs(weight) < 1e-9):
+            units = block[:, low].astype(np.float64)
+        else:
+            low = np.minimum(position.astype(np.int64), self.points - 2)
+            weight = position - low
+            units = block[:, low] * (1.0 - weight) + block[:, low + 1] * weight
+        units[:, (levels < 0) | (levels > self.max_discount + 1e-9)] = np.nan
+        units[rows < 0] = np.nan
+        return units
@@ -0,0 +1,224 @@
+"""
+SMART DISCOUNTS OPTIMIZATION process code.
+"""
+# Importing global packages
+import shutil
+import time
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Importing LOLA modules
+from libs.lola_utils.config import CONFIG
+from libs.lola_utils.execution import Process as BaseProcess
+from libs.lola_utils.storage import PartitionedDataset
+
+# Importing local modules
+from smart_discounts.base import Base
+from smart_discounts.optimization.engine import CURVE_COLUMNS, DiscountOptimizer
+from smart_discounts.optimization.grid import CurveGrid
+
+
+def read_inputs(task: Dict[str, Any]) -> pd.DataFrame:
+    """Reads the demand curves of some stores with their boundaries and unit costs. With a curve
+    grid, the keys and base prices come from the grid and grid_row is its row of every key.
+
+    Args:
+        task (dict): keys, stores, filters, the paths and partition columns of the curves,
+                     boundaries and prices data sets, cost_column, and curve_grid_path and
+                     cache_dir to read the curves from a grid.
+    Returns:
+        pd.DataFrame: One row per store and SKU.
+    """
+    keys, store = task["keys"], task["keys"][0]
+    filters = list(task["filters"] or []) + [(store, "in", task["stores"])]
+    if task.get("curve_grid_path"):
+        grid = CurveGrid.load(task["curve_grid_path"], task["cache_dir"])
+        rows = grid.store_rows(task["stores"])
+        frame = grid.keys.iloc[rows].reset_index(drop=True)
+        frame["base_price"] = grid.base_price[rows]
+        frame["grid_row"] = rows
+    else:
+        frame = PartitionedDataset(task["curves_path"], task["partition_columns"]).read(keys + CURVE_COLUMNS, filters)
+    inputs = (("boundaries", ["min_discount", "max_discount", "budget"]), ("prices", [task["cost_column"]]))
+    for name, columns in inputs:
+        if not task.get(f"{name}_path"):
+            continue
+        dataset = PartitionedDataset(task[f"{name}_path"], task["partition_columns"])
+        files = dataset.files(task["filters"])
+        if not files:
+            continue
+        available = pq.read_schema(files[0]).names
+        on = [k for k in keys if k in available]
+        data = dataset.read(on + [c for c in columns if c in available],
+                            filters if store in on else task["filters"])
+        frame = frame.merge(data.drop_duplicates(on), on=on, how="left")
+    return frame.rename(columns={task["cost_column"]: "cost"})
+
+
+def optimize_stores(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Optimizes the discounts of some stores and writes them. Module level so it can run in a
+    process pool.
+
+    Args:
+        task (dict): See read_inputs, plus the optimizer config and the output data set
+                     (output_path, output_partition_columns).
+    Returns:
+        dict: Stores, rows and seconds, and rows by status.
+    """
+    start = time.perf_counter()
+    frame = read_inputs(task)
+    optimizer = DiscountOptimizer(**task["optimizer"])
+    units = None
+    if "grid_row" in frame.columns:
+        grid = CurveGrid.load(task["curve_grid_path"], task["cache_dir"])
+        units = grid.units_at(frame.pop("grid_row").to_numpy(), optimizer.levels)
+    result = optimizer.optimize_stores(frame, task["keys"][0], units)
+    output = PartitionedDataset(task["output_path"], task["output_partition_columns"])
+    output.write_stream(iter([result]))
+    return {"stores": len(task["stores"]), "rows": len(result), "seconds": time.perf_counter() - start,
+            "status": result["status"].value_counts().to_dict() if len(result) else {}}
+
+
+class Process(BaseProcess, Base):
+    """
+    Chooses the discount of every SKU of every store from the demand curves, within the
+    boundaries and the budget of the store.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def validate_process(self) -> Tuple[bool, str]:
+        settings = CONFIG.get_value_or_none("optimization")
+        settings = settings.to_dict() if settings is not None else {}
+        if not self.get_path("DEMAND_CURVES_PATH_ID", ["optimization", "demand_curves_path"]):
+            return False, "DEMAND_CURVES_PATH_ID or optimization.demand_curves_path is required"
+        if not self.get_path("OPT_OUTPUT_PATH_ID", ["optimization", "output_path"]):
+            return False, "OPT_OUTPUT_PATH_ID or optimization.output_path is required"
+        try:
+            DiscountOptimizer(**self.get_optimizer_settings(settings))
+        except ValueError as exc:
+            return False, str(exc)
+        return True, "SMART DISCOUNTS OPTIMIZATION process"
+
+    def execute_process(self) -> None:
+        """Optimizes the discounts of the stores of the country: demand curves from
+        DEMAND_CURVES_PATH_ID, boundaries (min_discount, max_discount, budget) from
+        BOUNDARIES_PATH_ID and unit costs from ZTPM_PRICES_PATH_ID, or the same settings of the
+        optimization config. The result replaces <OPT_OUTPUT_PATH_ID>/country=<country>/.
+
+        Returns:
+            None
+        """
+        print(">>> SMART DISCOUNTS Process: OPTIMIZATION")
+
+        settings = CONFIG.get_value_or_none("optimization")
+        self.optimize(settings.to_dict() if settings is not None else {})
+
+    @staticmethod
+    def get_optimizer_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+        """Gets the arguments of the DiscountOptimizer from the optimization config."""
+        names = ("levels", "objective", "budget", "default_bounds", "xtol")
+        return {k: tuple(v) if k == "default_bounds" else v for k, v in settings.items() if k in names}
+
+    def get_store_groups(self, dataset: PartitionedDataset, store: str, filters: list,
+                         stores_per_task: int, grid: CurveGrid = None) -> List[list]:
+        """Lists the stores of the demand curves, reading only the store column, in groups.
+
+        Args:
+            dataset (PartitionedDataset): Demand curves.
+            store (str): Store column.
+            filters (list): Filters of the country.
+            stores_per_task (int): Stores per group.
+            grid (CurveGrid): Curve grid, whose keys list the stores without reading the curves.
+        Returns:
+            list: Groups of stores.
+        """
+        if grid is not None:
+            stores = pd.unique(grid.stores).tolist()
+        else:
+            stores = sorted(dataset.read([store], filters)[store].drop_duplicates().tolist())
+        return [stores[i:i + stores_per_task] for i in range(0, len(stores), stores_per_task)]
+
+    def get_curve_grid(self, curves: PartitionedDataset, keys: List[str], filters: list,
+                       settings: Dict[str, Any]) -> str:
+        """Builds the curve grid of the country, unless it was built from the same curve files.
+
+        Args:
+            curves (PartitionedDataset): Demand curves.
+            keys ([str]): Key columns of a curve.
+            filters (list): Filters of the country.
+            settings (dict): curve_grid config: path, points and max_discount.
+        Returns:
+            str: Folder of the grid of the country.
+        """
+        path = PartitionedDataset(settings["path"], ["country"]).partition_path({"country": self.get_country()})
+        points, max_discount = settings.get("points", 51), settings.get("max_discount", 0.5)
+        files = curves.files(filters)
+        source = CurveGrid.source_fingerprint(files)
+        if CurveGrid.is_current(path, source, points, max_discount):
+            self.logger.info(f"Curve grid {path} is up to date.")
+            return path
+        start = time.perf_counter()
+        schema = pq.read_schema(files[0]).names if files else []
+        columns = CURVE_COLUMNS if "elasticity" in schema else ["discount", "units", "base_price"]
+        CurveGrid.build(curves.read(keys + columns, filters), keys, path, points, max_discount, source)
+        self.logger.info(f"Curve grid of {points} points built in {path} in {time.perf_counter() - start:.2f}s.")
+        return path
+
+    def optimize(self, settings: Dict[str, Any]) -> None:
+        """Optimizes groups of stores in a process pool and writes the discounts.
+
+        Args:
+            settings (dict): optimization config.
+        Returns:
+            None
+        """
+        country = self.get_country()
+        keys = settings.get("keys", ["store", "sku"])
+        partition_columns = settings.get("partition_columns", ["country"])
+        curves_path = self.get_path("DEMAND_CURVES_PATH_ID", ["optimization", "demand_curves_path"])
+        curves = self.get_feature_dataset(curves_path, partition_columns)
+        filters = self.get_feature_filters(partition_columns, settings.get("filters"))
+        grid_path, grid = None, None
+        if settings.get("curve_grid"):
+            grid_path = self.get_curve_grid(curves, keys, filters, settings["curve_grid"])
+            # Loaded before the pool is created, so the forked workers share it.
+            grid = CurveGrid.load(grid_path, settings.get("cache_dir"))
+        groups = self.get_store_groups(curves, keys[0], filters, settings.get("stores_per_task", 100), grid)
+
+        output_path = self.get_path("OPT_OUTPUT_PATH_ID", ["optimization", "output_path"])
+        output = PartitionedDataset(output_path, ["country"])
+        staging = output.staging({"country": country})
+        task = {
+            "keys": keys, "filters": filters, "partition_columns": partition_columns, "curves_path": curves.path,
+            "boundaries_path": self.get_path("BOUNDARIES_PATH_ID", ["optimization", "boundaries_path"]),
+            "prices_path": self.get_path("ZTPM_PRICES_PATH_ID", ["optimization", "prices_path"]),
+            "cost_column": settings.get("cost_column", "cost"), "optimizer": self.get_optimizer_settings(settings),
+            "output_path": staging.path, "output_partition_columns": staging.partition_columns,
+            "curve_grid_path": grid_path, "cache_dir": settings.get("cache_dir"),
+        }
+        tasks = {i: dict(task, stores=stores) for i, stores in enumerate(groups)}
+        self.logger.info(f"Optimizing {sum(len(g) for g in groups)} stores in {len(tasks)} tasks.")
+
+        start = time.perf_counter()
+        try:
+            results = self.run_partitions(optimize_stores, tasks, max_workers=settings.get("max_workers"))
+            output.commit_staging(staging, {"country": country})
+        finally:
+            shutil.rmtree(staging.path, ignore_errors=True)
+        seconds = time.perf_counter() - start
+        rows = sum(r["rows"] for r in results.values())
+        status = {}
+        for result in results.values():
+            for key, count in result["status"].items():
+                status[key] = status.get(key, 0) + count
+        self.logger.info(f"Discounts of {rows} store-SKUs written to {output_path} in {seconds:.2f}s "
+                         f"({rows / max(seconds, 1e-9):,.0f} rows/s): {status}.")
+        self.output_locations["discounts"] = output_path
+
+
+if __name__ == "__main__":
+    Process().execute_process()
@@ -0,0 +1,6 @@
+"""
+Module to import smart discounts prediction modules.
+"""
+
+# Importing modules for easy initilization in other modules.
+from smart_discounts.prediction.process import Process
@@ -0,0 +1,210 @@
+"""
+SMART DISCOUNTS PREDICTION process code.
+
+Scores the feature data set with the trained demand model in --mode predict. The files of the
+data set are split into tasks of a few row groups, scored in a process pool where every worker
+loads the model once, and streamed batch by batch: each task reads a batch, predicts it and
+appends it to its own output file, so a worker holds one batch whatever the size of the country.
+"""
+# Importing global packages
+import functools
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pyarrow.parquet as pq
+import xgboost as xgb
+
+# Importing LOLA modules
+from libs.lola_utils.config import CONFIG
+from libs.lola_utils.execution import Process as BaseProcess
+from libs.lola_utils.logging import LogManager as LM
+from libs.lola_utils.storage import ModelCache, PartitionedDataset
+
+# Importing local modules
+from smart_discounts.base import Base
+
+
+def read_model(path: str, nthread: int = 1) -> Tuple[xgb.Booster, List[str]]:
+    """Reads the model, predicting with nthread threads, and its feature names from the local copy
+    of the model folder."""
+    booster = xgb.Booster(params={"nthread": nthread}, model_file=os.path.join(path, "model.json"))
+    metadata = Base.read_json(os.path.join(path, "metadata.json")) or {}
+    return booster, metadata.get("feature_names") or booster.feature_names
+
+
+def load_model(model_path: str, nthread: int = 1, cache_dir: str = None) -> Tuple[xgb.Booster, List[str]]:
+    """Loads the model through the model cache: copied once to the local disk, and loaded once
+    per process and number of threads, since the booster is shared by its callers. Workers forked
+    after the model was loaded share it.
+
+    Args:
+        model_path (str): Folder with model.json and metadata.json, as written by training.
+        nthread (int): Threads used to predict.
+        cache_dir (str): Local folder of the model cache.
+    Returns:
+        tuple: Booster and feature names.
+    """
+    return ModelCache(cache_dir).load(model_path, functools.partial(read_model, nthread=nthread),
+                                      name=f"booster:nthread={nthread}")
+
+
+def score_batches(task: Dict[str, Any], booster: xgb.Booster, feature_names: List[str], stats: Dict[str, Any]):
+    """Reads the row groups of a task batch by batch and yields them with their predictions.
+
+    Args:
+        task (dict): See score_task.
+        booster (xgb.Booster): Model.
+        feature_names ([str]): Feature columns of the model.
+        stats (dict): Rows, batches and seconds scored, updated as batches are yielded.
+    Returns:
+        Iterator[pd.DataFrame]: Kept columns and prediction of every batch.
+    """
+    logger = LM.get_logger(__name__)
+    parquet = pq.ParquetFile(task["file"])
+    available = set(parquet.schema_arrow.names)
+    keep_columns = [c for c in task["keep_columns"] if c in available]
+    columns = list(dict.fromkeys(feature_names + keep_columns))
+    missing = [c for c in feature_names if c not in available and c not in task["partition_values"]]
+    if missing:
+        raise ValueError(f"Error: features {missing} of the model are not in {task['file']}")
+    for number, batch in enumerate(parquet.iter_batches(task["batch_size"], task["row_groups"],
+                                                        [c for c in columns if c in available])):
+        start = time.perf_counter()
+        frame = batch.to_pandas()
+        for column, value in task["partition_values"].items():
+            if column in columns:
+                frame[column] = value
+        values = frame[feature_names].to_numpy(dtype=np.float32, na_value=np.nan)
+        output = frame[[c for c in task["keep_columns"] if c in frame.columns]].copy()
+        output[task["output_column"]] = booster.inplace_predict(values).astype(np.float32)
+        seconds = time.perf_counter() - start
+        stats["rows"] += len(frame)
+        stats["batches"] += 1
+        stats["seconds"] += seconds
+        logger.info(f"Batch {number} of {os.path.basename(task['file'])}, row groups {task['row_groups'][0]}-"
+                    f"{task['row_groups'][-1]}: {len(frame)} rows in {seconds:.3f}s "
+                    f"({len(frame) / max(seconds, 1e-9):,.0f} rows/s).")
+        yield output
+
+
+def score_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Scores some row groups of a feature file into one output file. Module level so it can
+    run in a process pool.
+
+    Args:
+        task (dict): model_path, nthread, file, row_groups, partition_values (read from the folder
+                     names), keep_columns, output_column, batch_size, and the output data set
+                     (output_path, output_partition_columns, output_partition_values).
+    Returns:
+        dict: Rows, batches and seconds scored, and the file written.
+    """
+    booster, feature_names = load_model(task["model_path"], task["nthread"], task["cache_dir"])
+    output = PartitionedDataset(task["output_path"], task["output_partition_columns"])
+    stats = {"rows": 0, "batches": 0, "seconds": 0.0}
+    stats["file"] = output.write_stream(score_batches(task, booster, feature_names, stats),
+                                        task["output_partition_values"])
+    stats["pid"] = os.getpid()
+    stats["cache"] = ModelCache.stats()
+    return stats
+
+
+class Process(BaseProcess, Base):
+    """
+    Scores the features with the demand model in predict mode, streamed in batches on a pool of
+    processes.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def validate_process(self) -> Tuple[bool, str]:
+        if CONFIG.get_value_or_none("mode") != "predict":
+            return True, "SMART DISCOUNTS PREDICTION process"
+        settings = CONFIG.get_value_or_none("prediction")
+        if settings is None or "output_path" not in settings.to_dict():
+            return False, "prediction.output_path is missing in the service config"
+        if not self.get_path("FEATURES_PATH_ID", ["prediction", "features_path"]):
+            return False, "FEATURES_PATH_ID or prediction.features_path is required"
+        if not self.get_model_path():
+            return False, "MODEL_PATH_ID or prediction.model_path is required"
+        return True, "SMART DISCOUNTS PREDICTION process"
+
+    def execute_process(self) -> None:
+        """Scores the features of FEATURES_PATH_ID (or prediction.features_path) with the model of
+        MODEL_PATH_ID (or prediction.model_path, or training.model_path) and replaces the
+        predictions of the country in <prediction.output_path>/country=<country>/. Only runs in
+        --mode predict.
+
+        Returns:
+            None
+        """
+        print(">>> SMART DISCOUNTS Process: PREDICTION")
+
+        if CONFIG.get_value_or_none("mode") != "predict":
+            self.logger.info("Prediction skipped: not in predict mode.")
+            return
+        self.predict(CONFIG.prediction.to_dict())
+
+    def get_model_path(self) -> str:
+        return self.get_path("MODEL_PATH_ID", ["prediction", "model_path"]) \
+            or CONFIG.get_value_or_none(["training", "model_path"])
+
+    def predict(self, settings: Dict[str, Any]) -> None:
+        """Scores the feature data set in a process pool and writes the predictions.
+
+        Args:
+            settings (dict): prediction config.
+        Returns:
+            None
+        """
+        country = self.get_country()
+        features_path = self.get_path("FEATURES_PATH_ID", ["prediction", "features_path"])
+        model_path = self.get_model_path()
+        dataset = self.get_feature_dataset(features_path, settings.get("partition_columns"))
+        filters = self.get_feature_filters(settings.get("partition_columns"), settings.get("filters"))
+        # Loaded before the pool is created, with the threads of the workers, so the forked workers share it.
+        nthread = settings.get("nthread", 1)
+        _, feature_names = load_model(model_path, nthread, settings.get("cache_dir"))
+        tasks = self.get_row_group_tasks(dataset, filters, settings.get("row_groups_per_task", 4))
+        keep_columns = settings.get("keep_columns")
+        if keep_columns is None:
+            schema = pq.ParquetFile(tasks[0]["file"]).schema_arrow.names if tasks else []
+            keep_columns = [c for c in schema if c not in feature_names]
+        keep_columns = [c for c in keep_columns if c != "country"]
+
+        output = PartitionedDataset(settings["output_path"], ["country"],
+                                    row_group_size=settings.get("batch_size", 64 * 1024))
+        staging = output.staging({"country": country})
+        task = {"model_path": model_path, "nthread": nthread, "cache_dir": settings.get("cache_dir"),
+                "keep_columns": keep_columns,
+                "output_column": settings.get("output_column", "prediction"),
+                "batch_size": settings.get("batch_size", 64 * 1024), "output_path": staging.path,
+                "output_partition_columns": staging.partition_columns, "output_partition_values": {}}
+        tasks = {i: dict(task, **t) for i, t in enumerate(tasks)}
+        self.logger.info(f"Scoring {len(tasks)} tasks of {features_path} with {model_path}.")
+
+        start = time.perf_counter()
+        try:
+            results = self.run_partitions(score_task, tasks, max_workers=settings.get("max_workers"))
+            output.commit_staging(staging, {"country": country})
+        finally:
+            shutil.rmtree(staging.path, ignore_errors=True)
+        seconds = time.perf_counter() - start
+        rows = sum(r["rows"] for r in results.values())
+        batches = sum(r["batches"] for r in results.values())
+        self.logger.info(f"Predictions written to {settings['output_path']}: {rows} rows in {batches} batches, "
+                         f"{seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s).")
+        workers = {r["pid"]: r["cache"] for r in results.values()}
+        driver = ModelCache.stats()
+        self.logger.info(f"Model cache: {driver['misses']} loads ({driver['load_seconds']:.2f}s) and "
+                         f"{driver['downloads']} copies ({driver['download_seconds']:.2f}s) in the driver, "
+                         f"{sum(c['misses'] for c in workers.values())} loads and "
+                         f"{sum(c['hits'] for c in workers.values())} hits in {len(workers)} workers.")
+        self.output_locations["predictions"] = settings["output_path"]
+
+
+if __name__ == "__main__":
+    Process().execute_process()
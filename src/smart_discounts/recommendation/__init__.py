@@ -0,0 +1,6 @@
+"""
+Module to import smart discounts recommendation modules.
+"""
+
+# Importing modules for easy initilization in other modules.
+from smart_discounts.recommendation.process import Process
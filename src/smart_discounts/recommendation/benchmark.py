@@ -0,0 +1,88 @@
+"""
+SMART DISCOUNTS RECOMMENDATION benchmark of the top-k selection.
+
+Scores synthetic entities against synthetic candidates of their group in blocks and reports the
+entities ranked per second end to end, and by the selection alone: the partial selection of top_k
+against a full sort of every row, e.g.
+
+    python -m smart_discounts.recommendation.benchmark --entities 1000000 --candidates 2000 --k 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from smart_discounts.recommendation.ranking import BYTES_PER_SCORE, CandidateSet, top_k
+
+
+def full_sort(scores: np.ndarray, k: int):
+    """Reference selection sorting every row."""
+    columns = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return columns, np.take_along_axis(scores, columns, axis=1)
+
+
+def run(entities: int, candidates: int, groups: int = 1, dimensions: int = 16, k: int = 10, memory_mb: int = 256,
+        seed: int = 0) -> pd.DataFrame:
+    """Ranks the synthetic entities, and times the selection with top_k and with a full sort.
+
+    Args:
+        entities (int): Number of entities.
+        candidates (int): Candidates per group.
+        groups (int): Number of groups (stores).
+        dimensions (int): Embedding columns.
+        k (int): Recommendations per entity.
+        memory_mb (int): Memory of the score matrix of a block.
+        seed (int): Random seed.
+    Returns:
+        pd.DataFrame: Step, seconds, entities, block rows and entities per second.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"e{i}" for i in range(dimensions)]
+    frame = pd.DataFrame(rng.normal(size=(groups * candidates, dimensions)).astype(np.float32), columns=names)
+    frame["store"] = np.repeat(np.arange(groups), candidates)
+    frame["sku"] = np.tile(np.arange(candidates), groups)
+    frame["margin"] = rng.gamma(2.0, 1.0, len(frame))
+    block_rows = max(1, memory_mb * 2 ** 20 // (BYTES_PER_SCORE * candidates))
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        CandidateSet.build(frame, "store", ["sku"], names, "margin", os.path.join(folder, "candidates"))
+        candidate_set = CandidateSet.read(os.path.join(folder, "candidates"))
+        # End to end: scores of the groups of every block and partial selection.
+        block_rng = np.random.default_rng(seed + 1)
+        start = time.perf_counter()
+        for first in range(0, entities, block_rows):
+            n = min(block_rows, entities - first)
+            candidate_set.recommend(block_rng.normal(size=(n, dimensions)).astype(np.float32),
+                                    block_rng.integers(0, groups, n), k)
+        results.append({"step": "recommend", "seconds": time.perf_counter() - start})
+        # Selection only, on the same score blocks of one group.
+        seconds = {"top_k": 0.0, "argsort": 0.0}
+        block_rng = np.random.default_rng(seed + 1)
+        for first in range(0, entities, block_rows):
+            n = min(block_rows, entities - first)
+            scores = block_rng.normal(size=(n, dimensions)).astype(np.float32) @ candidate_set.embeddings[:candidates].T
+            for name, selection in (("top_k", top_k), ("argsort", full_sort)):
+                start = time.perf_counter()
+                selection(scores, k)
+                seconds[name] += time.perf_counter() - start
+        results.extend({"step": name, "seconds": value} for name, value in seconds.items())
+    for result in results:
+        result.update(entities=entities, block_rows=block_rows, entities_per_second=round(entities / result["seconds"]))
+        result["seconds"] = round(result["seconds"], 3)
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entities ranked per second, and by top_k and full sorts.")
+    parser.add_argument("--entities", type=int, default=1_000_000)
+    parser.add_argument("--candidates", type=int, default=2000)
+    parser.add_argument("--groups", type=int, default=1)
+    parser.add_argument("--dimensions", type=int, default=16)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--memory_mb", type=int, default=256)
+    args = parser.parse_args()
+    print(run(args.entities, args.candidates, args.groups, args.dimensions, args.k, args.memory_mb).to_string(
+        index=False))
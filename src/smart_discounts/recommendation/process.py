@@ -0,0 +1,217 @@
+"""
+SMART DISCOUNTS RECOMMENDATION process code.
+
+Recommends the k best discounts of every customer (or store). The candidates, by default the
+discounts chosen by the optimization, are saved once as memory mapped arrays shared by the
+workers. The entity data set is split into tasks of a few row groups and every task streams its
+entities in blocks whose score matrix fits in recommendation.memory_mb, so the memory of a worker
+is bounded whatever the number of customers.
+"""
+# Importing global packages
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Importing LOLA modules
+from libs.lola_utils.config import CONFIG
+from libs.lola_utils.execution import Process as BaseProcess
+from libs.lola_utils.logging import LogManager as LM
+from libs.lola_utils.storage import PartitionedDataset
+
+# Importing local modules
+from smart_discounts.base import Base
+from smart_discounts.recommendation.ranking import BYTES_PER_SCORE, CandidateSet
+
+
+def recommend_blocks(task: Dict[str, Any], candidates: CandidateSet, stats: Dict[str, Any]) -> Iterator[pd.DataFrame]:
+    """Reads the entities of a task block by block and yields their recommendations.
+
+    Args:
+        task (dict): See recommend_task.
+        candidates (CandidateSet): Candidates.
+        stats (dict): Entities, recommendations, blocks and seconds, updated as blocks are yielded.
+    Returns:
+        Iterator[pd.DataFrame]: Entity, rank, candidate columns and score of every recommendation.
+    """
+    logger = LM.get_logger(__name__)
+    parquet = pq.ParquetFile(task["file"])
+    available = set(parquet.schema_arrow.names)
+    group_column = candidates.group_column
+    columns = [task["entity_column"]] + ([group_column] if group_column else []) + task["embedding_columns"]
+    missing = [c for c in columns if c not in available and c not in task["partition_values"]]
+    if missing:
+        raise ValueError(f"Error: columns {missing} are not in {task['file']}")
+    candidate_columns = candidates.metadata["candidate_columns"]
+    for number, batch in enumerate(parquet.iter_batches(task["block_rows"], task["row_groups"],
+                                                        [c for c in columns if c in available])):
+        start = time.perf_counter()
+        frame = batch.to_pandas()
+        for column, value in task["partition_values"].items():
+            if column in columns:
+                frame[column] = value
+        embeddings = frame[task["embedding_columns"]].to_numpy(dtype=np.float32, na_value=np.nan)
+        groups = frame[group_column].to_numpy() if group_column else None
+        result = candidates.recommend(embeddings, groups, task["k"], task["bias_weight"])
+        output = pd.DataFrame({task["entity_column"]: frame[task["entity_column"]].to_numpy()[result["entity"]],
+                               "rank": result["rank"]})
+        selected = candidates.candidates.iloc[result["candidate"]]
+        for column in candidate_columns:
+            output[column] = selected[column].to_numpy()
+        output["score"] = result["score"]
+        seconds = time.perf_counter() - start
+        stats["entities"] += len(frame)
+        stats["recommendations"] += len(output)
+        stats["blocks"] += 1
+        stats["seconds"] += seconds
+        logger.info(f"Block {number} of {os.path.basename(task['file'])}: {len(frame)} entities in {seconds:.3f}s "
+                    f"({len(frame) / max(seconds, 1e-9):,.0f} entities/s).")
+        yield output
+
+
+def recommend_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Recommends the candidates of some row groups of an entity file into one output file. Module
+    level so it can run in a process pool.
+
+    Args:
+        task (dict): candidates_path, cache_dir, file, row_groups, partition_values, entity_column,
+                     embedding_columns, k, bias_weight, block_rows, and the output data set
+                     (output_path, output_partition_columns).
+    Returns:
+        dict: Entities, recommendations, blocks and seconds, and the file written.
+    """
+    candidates = CandidateSet.load(task["candidates_path"], task["cache_dir"])
+    output = PartitionedDataset(task["output_path"], task["output_partition_columns"],
+                                task["compression"], task["block_rows"] * task["k"])
+    stats = {"entities": 0, "recommendations": 0, "blocks": 0, "seconds": 0.0}
+    stats["file"] = output.write_stream(recommend_blocks(task, candidates, stats))
+    return stats
+
+
+class Process(BaseProcess, Base):
+    """
+    Recommends the k best discounts of every customer or store, scored in memory bounded blocks on
+    a pool of processes.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def validate_process(self) -> Tuple[bool, str]:
+        if str(CONFIG.get_value_or_none("CREATE_RECOMMENDATIONS")).lower() == "false":
+            return True, "SMART DISCOUNTS RECOMMENDATION process"
+        settings = CONFIG.get_value_or_none("recommendation")
+        settings = settings.to_dict() if settings is not None else {}
+        for name in ("entities_path", "output_path"):
+            if name not in settings:
+                return False, f"recommendation.{name} is missing in the service config"
+        if not self.get_candidates_path(settings):
+            return False, "OPT_OUTPUT_PATH_ID or recommendation.candidates_path is required"
+        if settings.get("k", 10) < 1:
+            return False, "recommendation.k must be positive"
+        return True, "SMART DISCOUNTS RECOMMENDATION process"
+
+    def execute_process(self) -> None:
+        """Recommends the k best candidates of every entity of recommendation.entities_path. The
+        candidates are read from recommendation.candidates_path, or the discounts of
+        OPT_OUTPUT_PATH_ID, and the recommendations replace those of the country in
+        <recommendation.output_path>/country=<country>/. Skipped when CREATE_RECOMMENDATIONS is
+        false.
+
+        Returns:
+            None
+        """
+        print(">>> SMART DISCOUNTS Process: RECOMMENDATION")
+
+        if str(CONFIG.get_value_or_none("CREATE_RECOMMENDATIONS")).lower() == "false":
+            self.logger.info("Recommendations skipped: CREATE_RECOMMENDATIONS is false.")
+            return
+        self.recommend(CONFIG.recommendation.to_dict())
+
+    @staticmethod
+    def get_candidates_path(settings: Dict[str, Any]) -> str:
+        return settings.get("candidates_path") or CONFIG.get_value_or_none("OPT_OUTPUT_PATH_ID")
+
+    def build_candidates(self, settings: Dict[str, Any]) -> str:
+        """Reads the candidates of the country, joins the item embeddings and saves them as a
+        CandidateSet in <work_dir>/sd_candidates/country=<country>.
+
+        Args:
+            settings (dict): recommendation config.
+        Returns:
+            str: Folder of the candidates.
+        """
+        partition_columns = settings.get("partition_columns", ["country"])
+        candidates = self.read_features(self.get_candidates_path(settings), None, partition_columns,
+                                        settings.get("candidate_filters"))
+        embedding_columns = settings.get("embedding_columns", [])
+        if settings.get("item_embeddings_path"):
+            on = settings.get("item_columns", ["sku"])
+            items = self.read_features(settings["item_embeddings_path"], on + embedding_columns, partition_columns)
+            candidates = candidates.drop(columns=[c for c in embedding_columns if c in candidates.columns]) \
+                .merge(items.drop_duplicates(on), on=on, how="inner")
+        bias_column = settings.get("bias_column", "margin")
+        path = os.path.join(settings.get("work_dir") or tempfile.gettempdir(), "sd_candidates",
+                            f"country={self.get_country()}")
+        CandidateSet.build(candidates, settings.get("group_column", "store"),
+                           settings.get("candidate_columns", ["sku", "discount"]), embedding_columns,
+                           bias_column if bias_column in candidates.columns else None, path)
+        return path
+
+    def recommend(self, settings: Dict[str, Any]) -> None:
+        """Recommends the candidates to the entities in a process pool and writes them.
+
+        Args:
+            settings (dict): recommendation config.
+        Returns:
+            None
+        """
+        country = self.get_country()
+        start = time.perf_counter()
+        candidates_path = self.build_candidates(settings)
+        # Loaded before the pool is created, so the forked workers share it.
+        candidates = CandidateSet.load(candidates_path, settings.get("cache_dir"))
+        k = settings.get("k", 10)
+        memory_bytes = settings.get("memory_mb", 256) * 2 ** 20
+        block_rows = int(min(settings.get("block_size", 100_000),
+                             max(1, memory_bytes // (BYTES_PER_SCORE * max(1, candidates.max_group_size)))))
+        self.logger.info(f"{len(candidates.candidates)} candidates, up to {candidates.max_group_size} per group, "
+                         f"saved in {time.perf_counter() - start:.2f}s; blocks of {block_rows} entities.")
+
+        partition_columns = settings.get("partition_columns", ["country"])
+        dataset = self.get_feature_dataset(settings["entities_path"], partition_columns)
+        filters = self.get_feature_filters(partition_columns, settings.get("filters"))
+        output = PartitionedDataset(settings["output_path"], ["country"])
+        staging = output.staging({"country": country})
+        task = {"candidates_path": candidates_path, "cache_dir": settings.get("cache_dir"),
+                "entity_column": settings.get("entity_column", "customer"),
+                "embedding_columns": settings.get("embedding_columns", []), "k": k,
+                "bias_weight": settings.get("bias_weight", 1.0), "block_rows": block_rows,
+                "compression": settings.get("compression", "zstd"), "output_path": staging.path,
+                "output_partition_columns": staging.partition_columns}
+        tasks = self.get_row_group_tasks(dataset, filters, settings.get("row_groups_per_task", 4))
+        tasks = {i: dict(task, **t) for i, t in enumerate(tasks)}
+        self.logger.info(f"Recommending {k} candidates to the entities of {settings['entities_path']} in "
+                         f"{len(tasks)} tasks.")
+
+        start = time.perf_counter()
+        try:
+            results = self.run_partitions(recommend_task, tasks, max_workers=settings.get("max_workers"))
+            output.commit_staging(staging, {"country": country})
+        finally:
+            shutil.rmtree(staging.path, ignore_errors=True)
+        seconds = time.perf_counter() - start
+        entities = sum(r["entities"] for r in results.values())
+        recommendations = sum(r["recommendations"] for r in results.values())
+        self.logger.info(f"Recommendations written to {settings['output_path']}: {recommendations} for {entities} "
+                         f"entities in {seconds:.2f}s ({entities / max(seconds, 1e-9):,.0f} entities/s).")
+        self.output_locations["recommendations"] = settings["output_path"]
+
+
+if __name__ == "__main__":
+    Process().execute_process()
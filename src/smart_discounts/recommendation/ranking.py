@@ -0,0 +1,185 @@
+"""
+SMART DISCOUNTS RECOMMENDATION ranking.
+
+The candidates of a group (the discounted SKUs of a store) are scored for a block of entities
+(customers or stores) at once as one matrix product, entity embeddings x candidate embeddings,
+plus a weighted bias of every candidate (e.g. the margin of its discount). The k best candidates of
+every row are selected with np.argpartition, linear in the number of candidates, and only those k
+are sorted.
+"""
+import os
+import shutil
+import uuid
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from libs.lola_utils.storage import ModelCache
+from smart_discounts.base import Base
+
+# Bytes per score of a block: the float32 score and the int64 index of np.argpartition.
+BYTES_PER_SCORE = 12
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Selects the k best columns of every row of a score matrix, best first.
+
+    Args:
+        scores (np.ndarray): (rows x candidates) scores, -inf for excluded candidates.
+        k (int): Number of columns kept per row.
+    Returns:
+        tuple: (rows x k) columns and scores.
+    """
+    rows, columns = scores.shape
+    k = min(k, columns)
+    if k < columns:
+        selected = np.argpartition(scores, columns - k, axis=1)[:, columns - k:]
+    else:
+        selected = np.broadcast_to(np.arange(columns), (rows, columns))
+    values = np.take_along_axis(scores, selected, axis=1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    return np.take_along_axis(selected, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+class CandidateSet:
+    """Candidates of the recommendations, sorted by group so the candidates of a group are a
+    contiguous slice, with their float32 embeddings and bias saved as .npy to be memory mapped.
+
+    Usage:
+        CandidateSet.build(offers, "store", ["sku", "discount"], ["e0", "e1"], "margin", "/local_disk0/candidates")
+        candidates = CandidateSet.load("/local_disk0/candidates")
+        output = candidates.recommend(entities, k=10)
+    """
+
+    def __init__(self, metadata: Dict[str, Any], candidates: pd.DataFrame, embeddings: np.ndarray,
+                 bias: np.ndarray) -> None:
+        """
+        Args:
+            metadata (dict): group_column, candidate_columns and embedding_columns.
+            candidates (pd.DataFrame): Group and candidate columns, sorted by group.
+            embeddings (np.ndarray): (candidates x embedding columns) embeddings.
+            bias (np.ndarray): Bias of every candidate.
+        """
+        self.metadata = metadata
+        self.candidates = candidates
+        self.embeddings = embeddings
+        self.bias = bias
+        self.group_column = metadata["group_column"]
+        self.groups = candidates[self.group_column].to_numpy() if self.group_column else None
+
+    @property
+    def max_group_size(self) -> int:
+        if self.groups is None:
+            return len(self.candidates)
+        return int(pd.Series(self.groups).value_counts().max()) if len(self.groups) else 0
+
+    @staticmethod
+    def build(frame: pd.DataFrame, group_column: str, candidate_columns: List[str], embedding_columns: List[str],
+              bias_column: str, path: str) -> None:
+        """Saves candidates to a folder, replacing it.
+
+        Args:
+            frame (pd.DataFrame): One row per candidate.
+            group_column (str): Column shared with the entities that restricts their candidates,
+                                e.g. the store. None to score every candidate for every entity.
+            candidate_columns ([str]): Columns identifying a candidate, written with the
+                                       recommendations, e.g. sku and discount.
+            embedding_columns ([str]): Embedding of every candidate. Can be empty, to rank by
+                                       the bias only.
+            bias_column (str): Score added to every candidate, None for none.
+            path (str): Folder of the candidates.
+        Returns:
+            None
+        """
+        frame = frame.dropna(subset=candidate_columns + embedding_columns)
+        if group_column:
+            frame = frame.sort_values(group_column, kind="stable")
+        parent, name = os.path.split(os.path.normpath(path))
+        os.makedirs(parent or ".", exist_ok=True)
+        tmp_path = os.path.join(parent, f".{name}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp_path)
+        try:
+            np.save(os.path.join(tmp_path, "embeddings.npy"),
+                    np.ascontiguousarray(frame[embedding_columns].to_numpy(dtype=np.float32).reshape(len(frame), -1)))
+            bias = frame[bias_column].to_numpy(dtype=np.float32, na_value=np.nan) if bias_column \
+                else np.zeros(len(frame), dtype=np.float32)
+            np.save(os.path.join(tmp_path, "bias.npy"), np.nan_to_num(bias, nan=0.0))
+            columns = ([group_column] if group_column else []) + candidate_columns
+            frame[columns].reset_index(drop=True).to_parquet(os.path.join(tmp_path, "candidates.parquet"),
+                                                             index=False)
+            Base.write_json(os.path.join(tmp_path, "metadata.json"),
+                            {"group_column": group_column, "candidate_columns": candidate_columns,
+                             "embedding_columns": embedding_columns, "bias_column": bias_column,
+                             "rows": len(frame)})
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp_path, path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def read(cls, path: str) -> "CandidateSet":
+        """Reads candidates, memory mapping their arrays."""
+        return cls(Base.read_json(os.path.join(path, "metadata.json")),
+                   pd.read_parquet(os.path.join(path, "candidates.parquet")),
+                   np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r"),
+                   np.load(os.path.join(path, "bias.npy"), mmap_mode="r"))
+
+    @classmethod
+    def load(cls, path: str, cache_dir: str = None) -> "CandidateSet":
+        """Loads candidates once per process through the model cache. Workers forked after they
+        were loaded share them."""
+        return ModelCache(cache_dir).load(path, cls.read, name="candidate_set")
+
+    def recommend(self, embeddings: np.ndarray, groups: np.ndarray = None, k: int = 10,
+                  bias_weight: float = 1.0) -> Dict[str, np.ndarray]:
+        """Selects the k best candidates of a block of entities.
+
+        Args:
+            embeddings (np.ndarray): (entities x embedding columns) embeddings of the entities.
+            groups (np.ndarray): Group of every entity, required with a group column.
+            k (int): Recommendations per entity.
+            bias_weight (float): Weight of the bias in the score.
+        Returns:
+            dict: entity (position in the block), candidate (row of the candidates), rank
+                  (1 for the best) and score of every recommendation, sorted by entity and rank.
+        """
+        n = len(embeddings)
+        if self.groups is None:
+            slices = [(np.arange(n), 0, len(self.candidates))]
+        else:
+            order = np.argsort(groups, kind="stable")
+            values, starts = np.unique(groups[order], return_index=True)
+            first = np.searchsorted(self.groups, values, "left")
+            last = np.searchsorted(self.groups, values, "right")
+            ends = np.append(starts[1:], n)
+            slices = [(order[s:e], a, b) for s, e, a, b in zip(starts, ends, first, last) if b > a]
+
+        entity, candidate, score = [], [], []
+        for rows, first, last in slices:
+            bias = bias_weight * np.asarray(self.bias[first:last])
+            if self.embeddings.shape[1]:
+                scores = embeddings[rows] @ np.asarray(self.embeddings[first:last]).T
+                scores += bias
+                np.nan_to_num(scores, copy=False, nan=-np.inf)
+                columns, values = top_k(scores, k)
+            else:
+                # Without embeddings every entity of the group gets the same ranking.
+                columns, values = top_k(bias[None, :], k)
+                columns, values = np.repeat(columns, len(rows), 0), np.repeat(values, len(rows), 0)
+            entity.append(np.repeat(rows, columns.shape[1]))
+            candidate.append(columns.ravel() + first)
+            score.append(values.ravel())
+        if not entity:
+            return {"entity": np.empty(0, np.int64), "candidate": np.empty(0, np.int64),
+                    "rank": np.empty(0, np.int16), "score": np.empty(0, np.float32)}
+        entity, candidate, score = np.concatenate(entity), np.concatenate(candidate), np.concatenate(score)
+        keep = np.isfinite(score)
+        order = np.argsort(entity[keep], kind="stable")
+        entity, candidate, score = entity[keep][order], candidate[keep][order], score[keep][order]
+        # Recommendations of an entity are consecutive and best first, so the rank is the position
+        # after the first recommendation of the entity.
+        starts = np.flatnonzero(np.r_[True, entity[1:] != entity[:-1]]) if len(entity) else np.empty(0, np.int64)
+        rank = np.arange(len(entity)) - np.repeat(starts, np.diff(np.r_[starts, len(entity)])) + 1
+        return {"entity": entity, "candidate": candidate, "rank": rank.astype(np.int16),
+                "score": score.astype(np.float32)}
@@ -0,0 +1,6 @@
+"""
+Module to import smart discounts serving modules.
+"""
+
+# Importing modules for easy initilization in other modules.
+from smart_discounts.serving.server import create_app, create_model_app
@@ -0,0 +1,189 @@
+"""
+SMART DISCOUNTS SERVING micro-batching.
+
+Concurrent scoring requests are queued and grouped into micro-batches: a batch is sent to the
+model when it reaches max_batch_size rows or when its first request has waited max_wait_ms, so the
+model is called once for many small requests at the cost of a bounded wait. The model runs in an
+executor thread, outside the event loop, while the next batch is collected.
+"""
+import asyncio
+import bisect
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+LATENCY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class Histogram:
+    """Counts observations in fixed buckets, like a Prometheus histogram.
+
+    Usage:
+        histogram = Histogram([1, 5, 10])
+        histogram.observe(3.2)
+        histogram.to_dict()["quantiles"]["p99"]
+    """
+
+    def __init__(self, buckets: List[float]) -> None:
+        """
+        Args:
+            buckets ([float]): Upper bounds of the buckets, sorted. A last bucket counts the rest.
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile as the upper bound of the bucket where it falls, None without
+        observations and inf in the last bucket."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative = np.cumsum(self.counts).tolist()
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else None,
+                "buckets": {**{str(b): c for b, c in zip(self.buckets, cumulative)}, "+Inf": self.count},
+                "quantiles": {f"p{int(q * 100)}": self.quantile(q) for q in (0.5, 0.9, 0.99)}}
+
+    def to_prometheus(self, name: str) -> List[str]:
+        """Formats the histogram in the Prometheus text format."""
+        cumulative = np.cumsum(self.counts).tolist()
+        lines = [f"# TYPE {name} histogram"]
+        lines += [f'{name}_bucket{{le="{b}"}} {c}' for b, c in zip(self.buckets, cumulative)]
+        lines += [f'{name}_bucket{{le="+Inf"}} {self.count}', f"{name}_sum {self.sum}", f"{name}_count {self.count}"]
+        return lines
+
+
+class MicroBatcher:
+    """Groups concurrent predictions into micro-batches before calling the model.
+
+    Usage:
+        batcher = MicroBatcher(lambda values: booster.inplace_predict(values), max_batch_size=256, max_wait_ms=5)
+        await batcher.start()
+        predictions = await batcher.predict(values)
+        await batcher.stop()
+    """
+
+    def __init__(self, predict: Callable[[np.ndarray], np.ndarray], max_batch_size: int = 256,
+                 max_wait_ms: float = 5.0, executor: Executor = None) -> None:
+        """
+        Args:
+            predict (Callable): Model function, from a (rows x features) float32 array to one
+                                prediction per row.
+            max_batch_size (int): Rows of a batch. A larger request is a batch of its own.
+            max_wait_ms (float): Longest wait of the first request of a batch for others.
+            executor (Executor): Executor running the model. Defaults to one thread.
+        """
+        self.predict_function = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.histograms = {"batch_rows": Histogram([2 ** i for i in range(max(1, max_batch_size).bit_length() + 1)]),
+                           "batch_requests": Histogram([2 ** i for i in range(11)]),
+                           "queue_ms": Histogram(LATENCY_BUCKETS_MS), "model_ms": Histogram(LATENCY_BUCKETS_MS)}
+        self.queue = None
+        self.task = None
+        self.pending = None
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        waiting = [self.pending] if self.pending is not None else []
+        while self.queue is not None and not self.queue.empty():
+            waiting.append(self.queue.get_nowait())
+        self.pending = None
+        for _, future, _ in waiting:
+            if not future.done():
+                future.set_exception(RuntimeError("Error: the model server is stopping"))
+
+    async def predict(self, values: np.ndarray) -> np.ndarray:
+        """Queues rows and waits for their predictions.
+
+        Args:
+            values (np.ndarray): (rows x features) float32 array.
+        Returns:
+            np.ndarray: Prediction of every row.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((values, future, time.perf_counter()))
+        return await future
+
+    async def collect(self) -> list:
+        """Waits for a request, then for more until the batch is full or the first one has waited
+        max_wait_ms since it was queued."""
+        if self.pending is not None:
+            batch, self.pending = [self.pending], None
+        else:
+            batch = [await self.queue.get()]
+        rows = len(batch[0][0])
+        deadline = batch[0][2] + self.max_wait
+        while rows < self.max_batch_size:
+            if self.queue.empty():
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            if rows + len(item[0]) > self.max_batch_size:
+                # Starts the next batch, so only a single request larger than max_batch_size
+                # makes a larger batch.
+                self.pending = item
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    async def run(self) -> None:
+        """Collects batches and predicts them, one at a time, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect()
+            start = time.perf_counter()
+            for _, _, queued in batch:
+                self.histograms["queue_ms"].observe((start - queued) * 1000)
+            values = np.concatenate([values for values, _, _ in batch]) if len(batch) > 1 else batch[0][0]
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.predict_function, values)
+            except asyncio.CancelledError:
+                for _, future, _ in batch:
+                    future.cancel()
+                raise
+            except Exception as exc:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.histograms["model_ms"].observe((time.perf_counter() - start) * 1000)
+            self.histograms["batch_rows"].observe(len(values))
+            self.histograms["batch_requests"].observe(len(batch))
+            offset = 0
+            for request, future, _ in batch:
+                if not future.done():
+                    future.set_result(predictions[offset:offset + len(request)])
+                offset += len(request)
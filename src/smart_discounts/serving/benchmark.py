@@ -0,0 +1,114 @@
+"""
+SMART DISCOUNTS SERVING benchmark of micro-batching, fully on localhost.
+
+Starts the server in this process on a free local port, with the model of --MODEL_PATH_ID or a
+small synthetic model, and sends it concurrent requests for every max_batch_size. The report gives
+the requests per second, the client latencies and the mean rows per model call, e.g.
+
+    python -m smart_discounts.serving.benchmark --requests 5000 --concurrency 64 --batch_sizes 1 64 256
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+
+import aiohttp
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from smart_discounts.serving.server import create_app, create_model_app
+
+
+def synthetic_app(max_batch_size: int, max_wait_ms: float, features: int = 10) -> web.Application:
+    """Creates the application with an xgboost model trained on random data."""
+    import xgboost as xgb
+
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(10_000, features)).astype(np.float32)
+    names = [f"f{i}" for i in range(features)]
+    booster = xgb.train({"tree_method": "hist", "max_depth": 6, "nthread": 1},
+                        xgb.DMatrix(values, label=values @ rng.normal(size=features), feature_names=names),
+                        num_boost_round=100)
+    return create_app(booster.inplace_predict, names, max_batch_size, max_wait_ms, "synthetic")
+
+
+async def load(url: str, feature_names: List[str], requests: int, concurrency: int, rows: int) -> List[float]:
+    """Sends requests from concurrent clients and gets their latencies in ms."""
+    rng = np.random.default_rng(1)
+    body = {"instances": rng.normal(size=(rows, len(feature_names))).round(3).tolist()}
+    latencies, remaining = [], [requests]
+
+    async def client(session: aiohttp.ClientSession) -> None:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            async with session.post(f"{url}/score", json=body) as response:
+                await response.json()
+                response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    return latencies
+
+
+async def run_one(app: web.Application, requests: int, concurrency: int, rows: int) -> Dict[str, Any]:
+    """Serves the application on a free local port and loads it."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = "http://127.0.0.1:{}".format(runner.addresses[0][1])
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{url}/health") as response:
+                health = await response.json()
+        start = time.perf_counter()
+        latencies = await load(url, health["features"], requests, concurrency, rows)
+        seconds = time.perf_counter() - start
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{url}/metrics") as response:
+                metrics = await response.json()
+    finally:
+        await runner.cleanup()
+    return {"max_batch_size": health["max_batch_size"], "requests_per_second": round(requests / seconds),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+            "model_calls": metrics["batch_rows"]["count"], "mean_batch_rows": round(metrics["batch_rows"]["mean"], 1)}
+
+
+def run(batch_sizes: List[int], requests: int = 5000, concurrency: int = 64, rows: int = 1, max_wait_ms: float = 5.0,
+        model_path: str = None) -> pd.DataFrame:
+    """Loads the server with every max_batch_size.
+
+    Args:
+        batch_sizes ([int]): max_batch_size of every run, 1 for no batching.
+        requests (int): Requests of a run.
+        concurrency (int): Concurrent clients.
+        rows (int): Rows of a request.
+        max_wait_ms (float): max_wait_ms of the server.
+        model_path (str): Model folder written by training. A synthetic model when None.
+    Returns:
+        pd.DataFrame: Requests per second, latencies and batches of every run.
+    """
+    results = []
+    for max_batch_size in batch_sizes:
+        app = create_model_app(model_path, max_batch_size, max_wait_ms) if model_path \
+            else synthetic_app(max_batch_size, max_wait_ms)
+        results.append(asyncio.run(run_one(app, requests, concurrency, rows)))
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Requests per second and latency of the server with micro-batches.")
+    parser.add_argument("--MODEL_PATH_ID", default=None)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 64, 256])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--rows", type=int, default=1)
+    parser.add_argument("--max_wait_ms", type=float, default=5.0)
+    args = parser.parse_args()
+    print(run(args.batch_sizes, args.requests, args.concurrency, args.rows, args.max_wait_ms,
+              args.MODEL_PATH_ID).to_string(index=False))
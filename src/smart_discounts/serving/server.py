@@ -0,0 +1,194 @@
+"""
+SMART DISCOUNTS SERVING server.
+
+Scores discounts on demand with the demand model, for consumers that cannot wait for the batch
+prediction. The model is loaded once through the model cache and concurrent requests are grouped
+into micro-batches. Predictions can be cached by row, so repeated rows skip the model. Runs on
+localhost by default:
+
+    python -m smart_discounts.serving.server --MODEL_PATH_ID /dbfs/sd/co/model --port 8080
+
+    POST /score    {"rows": [{"price": 10.5, "discount": 0.1}, ...]} or {"instances": [[10.5, 0.1], ...]}
+                   in the order of the features, answers {"predictions": [...]}
+    GET  /health   model, features and batching settings
+    GET  /metrics  latency and batch size histograms, and cache statistics, as json or ?format=prometheus
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from aiohttp import web
+
+from libs.lola_utils.cache import TieredCache
+from libs.lola_utils.logging import LogManager as LM
+from smart_discounts.serving.batching import LATENCY_BUCKETS_MS, Histogram, MicroBatcher
+
+
+def parse_rows(body: Dict[str, Any], feature_names: List[str]) -> np.ndarray:
+    """Reads the rows of a request as a float32 array in the order of the features. Missing
+    features are NaN, which the model treats as missing values.
+
+    Args:
+        body (dict): {"rows": [{feature: value}]} or {"instances": [[value, ...]]}.
+        feature_names ([str]): Features of the model.
+    Returns:
+        np.ndarray: (rows x features) array.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Error: the body must be a json object with rows or instances")
+    if "instances" in body:
+        try:
+            values = np.asarray(body["instances"], dtype=np.float32)
+        except (TypeError, ValueError):
+            values = None
+        if values is None or values.ndim != 2 or values.shape[1] != len(feature_names):
+            raise ValueError(f"Error: instances must be lists of the {len(feature_names)} features {feature_names}")
+        return values
+    rows = body.get("rows")
+    if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+        raise ValueError("Error: the body needs rows, a list of objects, or instances, a list of lists")
+    try:
+        values = np.array([[np.nan if r.get(f) is None else r[f] for f in feature_names] for r in rows],
+                          dtype=np.float32)
+    except (TypeError, ValueError):
+        values = None
+    if values is None or values.ndim != 2 or values.shape[1] != len(feature_names):
+        raise ValueError(f"Error: rows must be objects of numbers for the features {feature_names}")
+    return values
+
+
+def row_keys(values: np.ndarray) -> List[str]:
+    """Gets the cache key of every row: a hash of its float32 bytes.
+
+    Args:
+        values (np.ndarray): (rows x features) float32 array.
+    Returns:
+        [str]: Key of every row.
+    """
+    values = np.ascontiguousarray(values, dtype=np.float32)
+    return [hashlib.blake2b(row.tobytes(), digest_size=16).hexdigest() for row in values]
+
+
+def create_app(predict: Callable[[np.ndarray], np.ndarray], feature_names: List[str], max_batch_size: int = 256,
+               max_wait_ms: float = 5.0, model_id: str = None, cache: TieredCache = None) -> web.Application:
+    """Creates the application. The model is any function from rows to predictions, so the server
+    can be tested with a fake one. With a cache, the prediction of every row is looked up first,
+    in one multi-get per request run in a thread, and only the rows missed go to the model. The
+    namespace of the cache must identify the model.
+
+    Args:
+        predict (Callable): Model function, from a (rows x features) float32 array to predictions.
+        feature_names ([str]): Features of the model.
+        max_batch_size (int): Rows of a micro-batch.
+        max_wait_ms (float): Longest wait of a request for others to batch with.
+        model_id (str): Id of the model, reported by /health.
+        cache (TieredCache): Cache of the predictions by row.
+    Returns:
+        web.Application: The application.
+    """
+    batcher = MicroBatcher(predict, max_batch_size, max_wait_ms)
+    latency = Histogram(LATENCY_BUCKETS_MS)
+    counters = {"requests": 0, "rows": 0, "errors": 0}
+
+    async def score(request: web.Request) -> web.Response:
+        start = time.perf_counter()
+        try:
+            values = parse_rows(await request.json(), feature_names)
+        except json.JSONDecodeError as exc:
+            counters["errors"] += 1
+            return web.json_response({"error": f"Error: the body is not valid json: {exc}"}, status=400)
+        except ValueError as exc:
+            counters["errors"] += 1
+            return web.json_response({"error": str(exc)}, status=400)
+        if cache is None or not len(values):
+            predictions = await batcher.predict(values) if len(values) else np.empty(0, dtype=np.float32)
+        else:
+            predictions = await cached_predict(values)
+        latency.observe((time.perf_counter() - start) * 1000)
+        counters["requests"] += 1
+        counters["rows"] += len(values)
+        return web.json_response({"predictions": np.asarray(predictions, dtype=np.float64).tolist()})
+
+    async def cached_predict(values: np.ndarray) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        keys = row_keys(values)
+        found = await loop.run_in_executor(None, cache.mget, keys)
+        predictions = np.array([found.get(k, np.nan) for k in keys], dtype=np.float32)
+        missed = [i for i, k in enumerate(keys) if k not in found]
+        if missed:
+            computed = np.asarray(await batcher.predict(values[missed]), dtype=np.float32)
+            predictions[missed] = computed
+            await loop.run_in_executor(None, cache.mset, {keys[i]: float(p) for i, p in zip(missed, computed)})
+        return predictions
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "model": model_id, "features": feature_names,
+                                  "max_batch_size": max_batch_size, "max_wait_ms": max_wait_ms})
+
+    async def metrics(request: web.Request) -> web.Response:
+        histograms = {"request_ms": latency, **batcher.histograms}
+        if request.query.get("format") == "prometheus":
+            lines = []
+            for name, histogram in histograms.items():
+                lines += histogram.to_prometheus(f"smart_discounts_serving_{name}")
+            lines += [f"smart_discounts_serving_{name}_total {value}" for name, value in counters.items()]
+            if cache is not None:
+                for tier, stats in cache.stats()["tiers"].items():
+                    lines += [f'smart_discounts_serving_cache_{name}_total{{tier="{tier}"}} {stats[name]}'
+                              for name in ("hits", "misses", "expired", "sets", "evictions", "errors")]
+            return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+        body = {**counters, **{name: h.to_dict() for name, h in histograms.items()}}
+        if cache is not None:
+            body["cache"] = cache.stats()
+        return web.json_response(body)
+
+    async def start_batcher(app: web.Application) -> None:
+        await batcher.start()
+
+    async def stop_batcher(app: web.Application) -> None:
+        await batcher.stop()
+
+    app = web.Application()
+    app["batcher"] = batcher
+    app.add_routes([web.post("/score", score), web.get("/health", health), web.get("/metrics", metrics)])
+    app.on_startup.append(start_batcher)
+    app.on_cleanup.append(stop_batcher)
+    return app
+
+
+def create_model_app(model_path: str, max_batch_size: int = 256, max_wait_ms: float = 5.0, nthread: int = 1,
+                     cache_dir: str = None, cache_settings: Dict[str, Any] = None) -> web.Application:
+    """Creates the application serving the model written by training. With cache_settings (see
+    TieredCache.from_settings) predictions are cached in the namespace of the model checksum, so
+    a retrained model does not read the predictions of the previous one."""
+    # Imported here so the server can be tested with a fake model without xgboost.
+    from smart_discounts.prediction.process import load_model
+
+    booster, feature_names = load_model(model_path, nthread, cache_dir)
+    cache = None
+    if cache_settings:
+        checksum = hashlib.blake2b(bytes(booster.save_raw()), digest_size=8).hexdigest()
+        namespace = f"{cache_settings.get('namespace', 'sd_scores')}:{checksum}"
+        cache = TieredCache.from_settings({**cache_settings, "namespace": namespace})
+    return create_app(booster.inplace_predict, feature_names, max_batch_size, max_wait_ms, model_path, cache)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scores discounts on demand with micro-batches.")
+    parser.add_argument("--MODEL_PATH_ID", required=True, help="Folder with model.json and metadata.json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max_batch_size", type=int, default=256)
+    parser.add_argument("--max_wait_ms", type=float, default=5.0)
+    parser.add_argument("--nthread", type=int, default=1)
+    parser.add_argument("--cache_dir", default=None)
+    parser.add_argument("--cache", type=json.loads, default=None,
+                        help='Prediction cache, e.g. {"memory": {"max_bytes": 67108864}, "ttl": 3600}')
+    args = parser.parse_args()
+    LM.get_logger(__name__).info(f"Serving {args.MODEL_PATH_ID} on http://{args.host}:{args.port}.")
+    web.run_app(create_model_app(args.MODEL_PATH_ID, args.max_batch_size, args.max_wait_ms, args.nthread,
+                                 args.cache_dir, args.cache), host=args.host, port=args.port)
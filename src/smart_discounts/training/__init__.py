@@ -0,0 +1,6 @@
+"""
+Module to import smart discounts training modules.
+"""
+
+# Importing modules for easy initilization in other modules.
+from smart_discounts.training.process import Process
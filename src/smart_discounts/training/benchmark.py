@@ -0,0 +1,120 @@
+"""
+SMART DISCOUNTS TRAINING benchmark of in-memory and out-of-core training.
+
+Writes synthetic features of increasing size to a partitioned data set and trains the model on
+it in memory, from a QuantileDMatrix built batch by batch and from external memory pages. Every
+run is a new process, so its peak memory is its own. The report puts the peak memory next to the
+in-memory estimate used to switch modes automatically, e.g.
+
+    python -m smart_discounts.training.benchmark --sizes 1000000 10000000 --features 40
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from libs.lola_utils.ind import ResourceMonitor
+from libs.lola_utils.storage import PartitionedDataset
+from smart_discounts.training.external import ExternalFolds, estimate_in_memory_bytes
+
+MODES = ("memory", "quantile", "external")
+
+
+def write_synthetic_features(path: str, rows: int, features: int, seed: int = 0,
+                             batch_size: int = 1_000_000) -> List[str]:
+    """Writes random features and a target depending on them, batch by batch.
+
+    Args:
+        path (str): Folder of the data set, partitioned by country.
+        rows (int): Number of rows.
+        features (int): Number of feature columns.
+        seed (int): Random seed.
+        batch_size (int): Rows generated at once.
+    Returns:
+        [str]: Names of the feature columns.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"f{i}" for i in range(features)]
+    weights = rng.normal(size=features)
+    dataset = PartitionedDataset(path, ["country"])
+    for start in range(0, rows, batch_size):
+        n = min(batch_size, rows - start)
+        values = rng.normal(size=(n, features)).astype(np.float32)
+        frame = pd.DataFrame(values, columns=names)
+        frame["units"] = (values @ weights + rng.normal(size=n)).astype(np.float32)
+        dataset.write(frame, {"country": "co"})
+    return names
+
+
+def train_once(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the matrix of one mode and trains the model. Module level so it runs in a new process.
+
+    Args:
+        task (dict): path, mode, feature_names, rounds and batch_size.
+    Returns:
+        dict: Seconds and peak resident memory of the process.
+    """
+    filters = [("country", "=", "co")]
+    params = {"objective": "reg:squarederror", "tree_method": "hist", "max_bin": 256, "verbosity": 0}
+    start = time.perf_counter()
+    if task["mode"] == "memory":
+        frame = PartitionedDataset(task["path"], ["country"]).read(task["feature_names"] + ["units"], filters)
+        dtrain = xgb.DMatrix(frame[task["feature_names"]].to_numpy(dtype=np.float32),
+                             label=frame["units"].to_numpy(dtype=np.float32))
+        del frame
+    else:
+        folds = ExternalFolds(task["path"], ["country"], filters, task["feature_names"], "units", {"type": "kfold"},
+                              matrix=task["mode"], batch_size=task["batch_size"],
+                              cache_dir=os.path.join(task["path"], "..", "pages"))
+        dtrain = folds.full_matrix()
+    xgb.train(params, dtrain, num_boost_round=task["rounds"])
+    return {"seconds": time.perf_counter() - start, "peak_rss": ResourceMonitor.get_peak_rss()}
+
+
+def run(sizes: List[int], features: int = 40, modes: List[str] = MODES, rounds: int = 20,
+        batch_size: int = 256 * 1024) -> pd.DataFrame:
+    """Trains the model with every mode and size.
+
+    Args:
+        sizes ([int]): Row counts of the synthetic features.
+        features (int): Number of feature columns.
+        modes ([str]): "memory", "quantile" or "external".
+        rounds (int): Boosting rounds.
+        batch_size (int): Rows per batch of the out-of-core modes.
+    Returns:
+        pd.DataFrame: Mode, rows, seconds, peak memory and in-memory estimate in MiB.
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "features")
+            names = write_synthetic_features(path, size, features)
+            estimate = estimate_in_memory_bytes(size, features + 1, features, 0)
+            for mode in modes:
+                task = {"path": path, "mode": mode, "feature_names": names, "rounds": rounds,
+                        "batch_size": batch_size}
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(train_once, task).result()
+                results.append({"mode": mode, "rows": size, "seconds": round(result["seconds"], 3),
+                                "peak_mib": round(result["peak_rss"] / 2 ** 20, 1),
+                                "estimate_mib": round(estimate / 2 ** 20, 1)})
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak memory of in-memory and out-of-core training.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--features", type=int, default=40)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--batch_size", type=int, default=256 * 1024)
+    args = parser.parse_args()
+    print(run(args.sizes, args.features, args.modes, args.rounds, args.batch_size).to_string(index=False))
@@ -0,0 +1,256 @@
+"""
+Out-of-core training of the smart discounts demand model.
+
+The feature data set is streamed from parquet batch by batch into XGBoost through a DataIter, so
+the rows are never held in memory as a frame. XGBoost either quantizes the batches into a
+QuantileDMatrix (about one byte per value instead of the float32 matrix and the frame) or keeps
+them in external memory pages on disk. The rows of every fold are selected batch by batch, with
+the same blocks of dates or the same random assignment on every pass over the data set.
+"""
+import os
+import tempfile
+import threading
+import uuid
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from libs.lola_utils.storage import PartitionedDataset
+from smart_discounts.training.search import time_blocks
+
+MATRIX_TYPES = ("quantile", "external")
+
+# XGBoost matrices of the folds, built once per process and shared by all its trials.
+_MATRICES = {}
+_MATRICES_LOCK = threading.Lock()
+
+
+def estimate_in_memory_bytes(rows: int, columns: int, features: int, n_splits: int, workers: int = 1) -> int:
+    """Estimates the peak memory of in-memory training: the frame read, the float32 feature
+    matrix, the matrices of every fold, built by each of the workers running at the same time,
+    and the matrix of the final model (a value and a column index per value). Compare it with the
+    peak measured in the training logs to tune the budget.
+
+    Args:
+        rows (int): Rows of the data set.
+        columns (int): Columns read.
+        features (int): Feature columns.
+        n_splits (int): Number of folds.
+        workers (int): Concurrent worker processes, each with its own matrices of the folds.
+    Returns:
+        int: Estimated bytes.
+    """
+    return int(rows * (8 * columns + 4 * features + 8 * features * (n_splits * workers + 1)))
+
+
+class RowSelector:
+    """Selects the rows of one side of a fold in every batch.
+
+    Time folds compare the time column with the validation block of the fold. Random folds draw
+    the fold of every row from a generator seeded again at every pass, so every pass over the
+    batches, in the same order, gives the same rows.
+    """
+
+    def __init__(self, target: str, kind: str = "all", fold: Dict[str, Any] = None) -> None:
+        """
+        Args:
+            target (str): Target column. Rows without target are skipped.
+            kind (str): "all", "train" or "valid".
+            fold (dict): {"time_column", "start", "end"} or {"n_splits", "seed", "index"}. None with "all".
+        """
+        self.target = target
+        self.kind = kind
+        self.fold = fold or {}
+        self.rng = None
+
+    def reset(self) -> None:
+        if "seed" in self.fold:
+            self.rng = np.random.default_rng(self.fold["seed"])
+
+    def __call__(self, batch: pd.DataFrame) -> np.ndarray:
+        mask = batch[self.target].notna().to_numpy()
+        if self.kind == "all":
+            return mask
+        if "time_column" in self.fold:
+            times = pd.to_datetime(batch[self.fold["time_column"]]).to_numpy()
+            start, end = np.datetime64(self.fold["start"]), np.datetime64(self.fold["end"])
+            valid = (times >= start) & (times <= end)
+            train = times < start
+        else:
+            folds = self.rng.integers(0, self.fold["n_splits"], len(batch))
+            valid = folds == self.fold["index"]
+            train = ~valid
+        return mask & (valid if self.kind == "valid" else train)
+
+
+class FeatureBatches(xgb.DataIter):
+    """Feeds XGBoost the rows of a partitioned data set batch by batch.
+
+    Usage:
+        batches = FeatureBatches(dataset, filters, feature_names, "units", RowSelector("units"))
+        dtrain = xgb.QuantileDMatrix(batches, max_bin=256)
+    """
+
+    def __init__(self, dataset: PartitionedDataset, filters: list, feature_names: List[str], target: str,
+                 selector: RowSelector, batch_size: int = 256 * 1024, cache_prefix: str = None) -> None:
+        """
+        Args:
+            dataset (PartitionedDataset): Feature data set.
+            filters (list): Filters of the rows, e.g. the country.
+            feature_names ([str]): Feature columns.
+            target (str): Target column.
+            selector (RowSelector): Rows of every batch to use.
+            batch_size (int): Rows per batch read.
+            cache_prefix (str): Prefix of the pages on disk of an external memory DMatrix. None for
+                                a QuantileDMatrix.
+        """
+        self.dataset = dataset
+        self.filters = filters
+        self.feature_names = list(feature_names)
+        self.target = target
+        self.selector = selector
+        self.batch_size = batch_size
+        extra = [selector.fold["time_column"]] if "time_column" in selector.fold else []
+        self.columns = list(dict.fromkeys(self.feature_names + [target] + extra))
+        self.rows = 0
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self) -> None:
+        self._batches = None
+
+    def next(self, input_data) -> int:
+        if self._batches is None:
+            self._batches = self.dataset.iter_batches(self.columns, self.filters, self.batch_size)
+            self.selector.reset()
+            self.rows = 0
+        for batch in self._batches:
+            batch = batch[self.selector(batch)]
+            if not len(batch):
+                continue
+            self.rows += len(batch)
+            input_data(data=batch[self.feature_names].to_numpy(dtype=np.float32, na_value=np.nan),
+                       label=batch[self.target].to_numpy(dtype=np.float32), feature_names=self.feature_names)
+            return 1
+        return 0
+
+
+class ExternalFolds:
+    """Cross-validation folds streamed from the feature data set, with the matrices interface of
+    FoldCache.
+
+    Usage:
+        folds = ExternalFolds(path, ["country"], [("country", "=", "co")], names, "units", {"type": "time", ...})
+        for dtrain, dvalid in folds.matrices():
+            ...
+        dtrain = folds.full_matrix()
+    """
+
+    def __init__(self, path: str, partition_columns: List[str], filters: list, feature_names: List[str],
+                 target: str, folds: Dict[str, Any], blocks: List[Tuple[str, str]] = None, matrix: str = "quantile",
+                 batch_size: int = 256 * 1024, max_bin: int = 256, cache_dir: str = None, nthread: int = None) -> None:
+        """
+        Args:
+            path (str): Folder of the feature data set.
+            partition_columns ([str]): Partition columns of the data set.
+            filters (list): Filters of the rows, e.g. the country.
+            feature_names ([str]): Feature columns.
+            target (str): Target column.
+            folds (dict): training.folds config, as for build_folds.
+            blocks (list): Validation blocks of dates of time folds. Scanned from the data set when None.
+            matrix (str): "quantile" for QuantileDMatrix, "external" for an external memory DMatrix.
+            batch_size (int): Rows per batch read.
+            max_bin (int): Bins of the quantized features, as the max_bin parameter of the booster.
+            cache_dir (str): Folder of the external memory pages. Defaults to a temporary folder.
+            nthread (int): Threads to build the matrices.
+        """
+        if matrix not in MATRIX_TYPES:
+            raise ValueError(f"Error: unsupported matrix type {matrix}")
+        if folds.get("type", "kfold") not in ("time", "kfold"):
+            raise ValueError(f"Error: unsupported fold type {folds['type']}")
+        self.path = path
+        self.partition_columns = list(partition_columns)
+        self.dataset = PartitionedDataset(path, self.partition_columns)
+        self.filters = [tuple(f) for f in filters or []] or None
+        self.feature_names = list(feature_names)
+        self.target = target
+        self.folds = dict(folds)
+        self.matrix = matrix
+        self.batch_size = batch_size
+        self.max_bin = max_bin
+        self.cache_dir = cache_dir or tempfile.gettempdir()
+        self.nthread = nthread
+        if self.folds.get("type", "kfold") == "time" and blocks is None:
+            blocks = [(str(start), str(end)) for start, end in time_blocks(self.scan_times(), self.n_splits)]
+        self.blocks = blocks
+
+    @property
+    def n_splits(self) -> int:
+        return self.folds.get("n_splits", 5)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Gets the config of the folds, to open them again in a worker with load_folds."""
+        return {"type": "external", "path": self.path, "partition_columns": self.partition_columns,
+                "filters": self.filters, "feature_names": self.feature_names, "target": self.target,
+                "folds": self.folds, "blocks": self.blocks, "matrix": self.matrix, "batch_size": self.batch_size,
+                "max_bin": self.max_bin, "cache_dir": self.cache_dir, "nthread": self.nthread}
+
+    @classmethod
+    def from_dict(cls, settings: Dict[str, Any]) -> "ExternalFolds":
+        return cls(**{k: v for k, v in settings.items() if k != "type"})
+
+    def scan_times(self) -> np.ndarray:
+        """Gets the sorted distinct dates of the time column, reading only that column."""
+        column = self.folds["time_column"]
+        times = set()
+        for batch in self.dataset.iter_batches([column], self.filters, self.batch_size):
+            times.update(pd.to_datetime(batch[column]).unique())
+        return np.array(sorted(times), dtype="datetime64[ns]")
+
+    def selectors(self) -> List[Tuple[RowSelector, RowSelector]]:
+        """Gets the train and validation row selectors of every fold."""
+        if self.blocks is not None:
+            specs = [{"time_column": self.folds["time_column"], "start": start, "end": end}
+                     for start, end in self.blocks]
+        else:
+            specs = [{"n_splits": self.n_splits, "seed": self.folds.get("seed", 0), "index": i}
+                     for i in range(self.n_splits)]
+        return [(RowSelector(self.target, "train", spec), RowSelector(self.target, "valid", spec)) for spec in specs]
+
+    def build(self, selector: RowSelector, ref: xgb.DMatrix = None) -> xgb.DMatrix:
+        """Builds the matrix of the rows of a selector.
+
+        Args:
+            selector (RowSelector): Rows to use.
+            ref (xgb.DMatrix): Training matrix whose quantiles a validation QuantileDMatrix uses.
+        Returns:
+            xgb.DMatrix: The matrix.
+        """
+        if self.matrix == "quantile":
+            batches = FeatureBatches(self.dataset, self.filters, self.feature_names, self.target, selector,
+                                     self.batch_size)
+            return xgb.QuantileDMatrix(batches, max_bin=self.max_bin, ref=ref, nthread=self.nthread)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_prefix = os.path.join(self.cache_dir, f"xgb_pages_{os.getpid()}_{uuid.uuid4().hex}")
+        batches = FeatureBatches(self.dataset, self.filters, self.feature_names, self.target, selector,
+                                 self.batch_size, cache_prefix)
+        return xgb.DMatrix(batches, nthread=self.nthread)
+
+    def matrices(self) -> List[Tuple[xgb.DMatrix, xgb.DMatrix]]:
+        """Gets the train and validation matrices of every fold, built on the first call of the
+        process."""
+        key = repr(sorted(self.to_dict().items()))
+        with _MATRICES_LOCK:
+            if key not in _MATRICES:
+                matrices = []
+                for train, valid in self.selectors():
+                    dtrain = self.build(train)
+                    matrices.append((dtrain, self.build(valid, ref=dtrain)))
+                _MATRICES[key] = matrices
+        return _MATRICES[key]
+
+    def full_matrix(self) -> xgb.DMatrix:
+        """Builds the matrix of all the rows with a target, to train the final model."""
+        return self.build(RowSelector(self.target))
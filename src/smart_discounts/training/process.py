@@ -0,0 +1,259 @@
+"""
+SMART DISCOUNTS TRAINING process code.
+"""
+# Importing global packages
+import os
+import shutil
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import optuna
+import pandas as pd
+import xgboost as xgb
+
+# Importing LOLA modules
+from libs.lola_utils.config import CONFIG
+from libs.lola_utils.execution import Process as BaseProcess
+from libs.lola_utils.ind import ResourceMonitor
+from libs.lola_utils.storage import PartitionedDataset
+
+# Importing local modules
+from smart_discounts.base import Base
+from smart_discounts.training.external import ExternalFolds, estimate_in_memory_bytes
+from smart_discounts.training.search import FoldCache, HyperparameterSearch, build_folds, run_worker, split_trials
+
+PARALLEL_BACKENDS = ("threads", "processes", "ray")
+
+
+class Process(BaseProcess, Base):
+    """
+    Trains the demand model of smart discounts: a hyperparameter search of the XGBoost model with
+    Optuna, run in parallel on the cores of the node or on a Ray cluster, and the final model
+    trained with the best parameters.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def validate_process(self) -> Tuple[bool, str]:
+        settings = CONFIG.get_value_or_none("training")
+        if settings is None:
+            return False, "training is missing in the service config"
+        settings = settings.to_dict()
+        if "target" not in settings:
+            return False, "training.target is missing in the service config"
+        if not self.get_path("FEATURES_PATH_ID", ["training", "features_path"]):
+            return False, "FEATURES_PATH_ID or training.features_path is required"
+        backend = settings.get("parallel", {}).get("backend", "processes")
+        if backend not in PARALLEL_BACKENDS:
+            return False, f"training.parallel.backend {backend} is not one of {', '.join(PARALLEL_BACKENDS)}"
+        return True, "SMART DISCOUNTS TRAINING process"
+
+    def execute_process(self) -> None:
+        """Searches the parameters of the demand model and trains it, in train mode and unless
+        TRAIN_MODEL is false. The features are read from FEATURES_PATH_ID (or
+        training.features_path) and the model is written to MODEL_PATH_ID (or
+        training.model_path) with best_params.json and metadata.json. The trials are kept in the
+        study <training.study_dir>/optuna.db, so a run resumes the study of the previous ones and
+        starts from the best parameters found so far.
+
+        Returns:
+            None
+        """
+        print(">>> SMART DISCOUNTS Process: TRAINING")
+
+        if CONFIG.get_value_or_none("mode") not in (None, "train"):
+            self.logger.info(f"Training skipped in {CONFIG.mode} mode.")
+            return
+        if str(CONFIG.get_value_or_none("TRAIN_MODEL")).lower() == "false":
+            self.logger.info("Training skipped: TRAIN_MODEL is false.")
+            return
+        self.train(CONFIG.training.to_dict())
+
+    def get_feature_names(self, frame: pd.DataFrame, settings: Dict[str, Any]) -> List[str]:
+        """Gets the feature columns: training.features, or else every numeric column but the
+        target, the partition columns and training.exclude.
+
+        Args:
+            frame (pd.DataFrame): Feature rows.
+            settings (dict): training config.
+        Returns:
+            [str]: Feature columns.
+        """
+        excluded = set(settings.get("exclude", [])) | {settings["target"]} \
+            | set(settings.get("partition_columns", ["country"]))
+        if "features" in settings:
+            return [c for c in settings["features"] if c not in excluded]
+        return [c for c in frame.columns if c not in excluded
+                and (pd.api.types.is_numeric_dtype(frame[c]) or pd.api.types.is_bool_dtype(frame[c]))]
+
+    def run_search(self, search: HyperparameterSearch, study: optuna.Study, settings: Dict[str, Any],
+                   workers: int) -> List[Dict[str, int]]:
+        """Runs the trials of the study on the parallel backend.
+
+        Args:
+            search (HyperparameterSearch): Search.
+            study (optuna.Study): Study.
+            settings (dict): training config.
+            workers (int): Concurrent trials.
+        Returns:
+            [dict]: trials and peak_rss of every worker process or Ray task, empty with threads.
+        """
+        parallel = settings.get("parallel", {})
+        backend = parallel.get("backend", "processes")
+        n_trials, timeout = settings.get("n_trials", 50), settings.get("timeout")
+        if backend == "threads" or workers == 1:
+            search.optimize(study, n_trials, timeout, n_jobs=workers)
+            return []
+        # Workers of other processes would race for the queued warm start trial, so it runs here first.
+        queued = len(study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.WAITING,)))
+        if queued:
+            search.optimize(study, queued, timeout)
+            n_trials -= queued
+            if n_trials <= 0:
+                return []
+        task = {"settings": settings, "storage": search.storage, "study_name": search.study_name,
+                "folds": search.folds.to_dict(), "nthread": search.nthread, "timeout": timeout}
+        tasks = {i: dict(task, n_trials=n) for i, n in enumerate(split_trials(n_trials, workers))}
+        if backend == "processes":
+            return list(self.run_partitions(run_worker, tasks, max_workers=workers).values())
+        import ray
+
+        ray.init(address=parallel.get("address"), ignore_reinit_error=True)
+        remote = ray.remote(num_cpus=search.nthread)(run_worker)
+        return ray.get([remote.remote(t) for t in tasks.values()])
+
+    def get_memory_mode(self, dataset: PartitionedDataset, filters: list, sample: pd.DataFrame,
+                        feature_names: List[str], settings: Dict[str, Any], workers: int = 1) -> Dict[str, Any]:
+        """Chooses in-memory or out-of-core training. With training.memory.mode "auto" (the
+        default), the data set is streamed batch by batch when the estimated peak memory of
+        in-memory training exceeds the budget: training.memory.budget_bytes, or max_fraction
+        (0.5 by default) of the memory of the node. Worker processes build their own matrices of
+        the folds, so the estimate counts them once per concurrent worker.
+
+        Args:
+            dataset (PartitionedDataset): Feature data set.
+            filters (list): Filters of the rows of the country.
+            sample (pd.DataFrame): First rows of the data set, with the columns read.
+            feature_names ([str]): Feature columns.
+            settings (dict): training config.
+            workers (int): Concurrent trials.
+        Returns:
+            dict: mode ("memory" or "external"), rows, in_memory_estimate and budget in bytes.
+        """
+        memory = settings.get("memory", {})
+        rows = dataset.count_rows(filters)
+        threads = settings.get("parallel", {}).get("backend", "processes") == "threads"
+        estimate = estimate_in_memory_bytes(rows, len(sample.columns), len(feature_names),
+                                            settings.get("folds", {}).get("n_splits", 5), 1 if threads else workers)
+        total = ResourceMonitor.get_total_memory()
+        budget = memory.get("budget_bytes") or (int(total * memory.get("max_fraction", 0.5)) if total else None)
+        mode = memory.get("mode", "auto")
+        if mode == "auto":
+            mode = "external" if budget is not None and estimate > budget else "memory"
+        return {"mode": mode, "rows": rows, "in_memory_estimate": estimate, "budget": budget}
+
+    def train(self, settings: Dict[str, Any]) -> None:
+        """Runs the hyperparameter search and trains the final model on all the rows, in memory or
+        streaming the feature data set batch by batch.
+
+        Args:
+            settings (dict): training config.
+        Returns:
+            None
+        """
+        country = self.get_country()
+        features_path = self.get_path("FEATURES_PATH_ID", ["training", "features_path"])
+        model_path = self.get_path("MODEL_PATH_ID", ["training", "model_path"]) \
+            or os.path.join(features_path, "..", "model")
+        study_dir = settings.get("study_dir", os.path.join(model_path, "study"))
+        study_name = settings.get("study_name", f"smart_discounts_{country}")
+        parallel = settings.get("parallel", {})
+        cores = parallel.get("cores") or os.cpu_count()
+        workers = max(1, min(parallel.get("workers") or cores, settings.get("n_trials", 50)))
+        nthread = parallel.get("nthread") or max(1, cores // workers)
+
+        with ResourceMonitor() as monitor:
+            dataset = self.get_feature_dataset(features_path, settings.get("partition_columns"))
+            filters = self.get_feature_filters(settings.get("partition_columns"), settings.get("filters"))
+            sample = next(dataset.iter_batches(settings.get("columns"), filters, 1024), None)
+            if sample is None:
+                raise ValueError(f"Error: no features in {features_path} for country {country}")
+            feature_names = self.get_feature_names(sample, settings)
+            memory = self.get_memory_mode(dataset, filters, sample, feature_names, settings, workers)
+            if memory["mode"] == "external":
+                folds = ExternalFolds(
+                    dataset.path, dataset.partition_columns, filters, feature_names, settings["target"],
+                    settings.get("folds", {}), matrix=settings.get("memory", {}).get("matrix", "quantile"),
+                    batch_size=settings.get("memory", {}).get("batch_size", 256 * 1024),
+                    max_bin=settings.get("params", {}).get("max_bin", 256),
+                    cache_dir=settings.get("memory", {}).get("cache_dir", os.path.join(study_dir, "pages")),
+                    nthread=nthread,
+                )
+                rows = memory["rows"]
+            else:
+                frame = dataset.read(settings.get("columns"), filters)
+                frame = frame[frame[settings["target"]].notna()].reset_index(drop=True)
+                features = frame[feature_names].to_numpy(dtype=np.float32, na_value=np.nan)
+                target = frame[settings["target"]].to_numpy(dtype=np.float32)
+                folds = FoldCache(os.path.join(study_dir, "folds", study_name))
+                folds.save(features, target, build_folds(frame, settings.get("folds", {})), feature_names)
+                rows = len(frame)
+                del frame
+            self.logger.info(f"Training on {rows} rows and {len(feature_names)} features ({memory['mode']} mode): "
+                             f"in-memory estimate {memory['in_memory_estimate'] / 2 ** 30:.2f} GiB, budget "
+                             f"{(memory['budget'] or 0) / 2 ** 30:.2f} GiB.")
+
+            storage = settings.get("storage") or f"sqlite:///{os.path.abspath(os.path.join(study_dir, 'optuna.db'))}"
+            os.makedirs(study_dir, exist_ok=True)
+            optuna.logging.set_verbosity(optuna.logging.WARNING)
+            search = HyperparameterSearch(settings, storage, study_name, folds, nthread)
+            warm_start = (self.read_json(os.path.join(model_path, "best_params.json")) or {}).get("params")
+            study = search.create_study(warm_start)
+            done = len(study.trials)
+            self.logger.info(f"Searching parameters of study {study_name}: {settings.get('n_trials', 50)} trials on "
+                             f"{workers} workers ({parallel.get('backend', 'processes')}) of {nthread} threads, "
+                             f"{done} trials done before.")
+            worker_stats = self.run_search(search, study, settings, workers)
+
+            study = search.load_study()
+            states = pd.Series([t.state.name for t in study.trials[done:]], dtype=object).value_counts().to_dict()
+            best = study.best_trial
+            self.logger.info(f"Trials run: {states}. Best {search.metric}: {best.value:.6f} in trial {best.number}.")
+
+            rounds = int(np.mean(best.user_attrs.get("best_iterations", [search.rounds])))
+            if memory["mode"] == "external":
+                dtrain = folds.full_matrix()
+            else:
+                dtrain = xgb.DMatrix(features, label=target, feature_names=feature_names)
+            booster = xgb.train(search.booster_params(dict(best.params), nthread=cores), dtrain,
+                                num_boost_round=rounds)
+        memory["peak_rss"] = monitor.peak_rss
+        # The monitor only sees the driver; the workers report their own peaks.
+        memory["workers_peak_rss"] = [w["peak_rss"] for w in worker_stats if w.get("peak_rss") is not None]
+        if memory["mode"] == "external" and folds.matrix == "external":
+            shutil.rmtree(folds.cache_dir, ignore_errors=True)
+        self.logger.info(f"Peak memory of training ({memory['mode']} mode): {monitor.peak_rss / 2 ** 30:.2f} GiB in "
+                         f"the driver, {sum(memory['workers_peak_rss']) / 2 ** 30:.2f} GiB in "
+                         f"{len(memory['workers_peak_rss'])} workers (in-memory estimate "
+                         f"{memory['in_memory_estimate'] / 2 ** 30:.2f} GiB).")
+
+        os.makedirs(model_path, exist_ok=True)
+        tmp_path = os.path.join(model_path, f"model.{os.getpid()}.tmp.json")
+        booster.save_model(tmp_path)
+        os.replace(tmp_path, os.path.join(model_path, "model.json"))
+        self.write_json(os.path.join(model_path, "best_params.json"),
+                        {"params": best.params, "value": best.value, "metric": search.metric,
+                         "num_boost_round": rounds})
+        self.write_json(os.path.join(model_path, "metadata.json"),
+                        {"country": country, "features_path": features_path, "feature_names": feature_names,
+                         "target": settings["target"], "rows": rows, "study_name": study_name,
+                         "storage": storage, "trials": len(study.trials), "best_trial": best.number,
+                         "memory": memory})
+        self.logger.info(f"Model trained with {rounds} rounds and saved to {model_path}.")
+        self.output_locations["model"] = model_path
+        self.output_locations["study"] = study_dir
+
+
+if __name__ == "__main__":
+    Process().execute_process()
@@ -0,0 +1,321 @@
+"""
+Hyperparameter search of the smart discounts demand model with Optuna and XGBoost.
+
+The cross-validation folds are built once and written as numpy arrays that every worker memory
+maps, and every worker builds the XGBoost matrices of the folds once and reuses them in all its
+trials. Trials of all the workers share one study kept in SQLite, so a search interrupted or run
+again resumes with the trials already done.
+"""
+import json
+import os
+import threading
+import uuid
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import optuna
+import pandas as pd
+import xgboost as xgb
+
+from libs.lola_utils.ind import ResourceMonitor
+
+MAXIMIZED_METRICS = ("auc", "aucpr", "map", "ndcg")
+
+DEFAULT_SEARCH_SPACE = {
+    "eta": {"type": "float", "low": 0.01, "high": 0.3, "log": True},
+    "max_depth": {"type": "int", "low": 3, "high": 10},
+    "min_child_weight": {"type": "float", "low": 1.0, "high": 20.0, "log": True},
+    "subsample": {"type": "float", "low": 0.5, "high": 1.0},
+    "colsample_bytree": {"type": "float", "low": 0.5, "high": 1.0},
+    "lambda": {"type": "float", "low": 1e-3, "high": 10.0, "log": True},
+    "alpha": {"type": "float", "low": 1e-3, "high": 10.0, "log": True},
+}
+
+# XGBoost matrices of the folds, built once per process and shared by all its trials.
+_MATRICES = {}
+_MATRICES_LOCK = threading.Lock()
+
+
+def time_blocks(times: np.ndarray, n_splits: int) -> List[Tuple[np.datetime64, np.datetime64]]:
+    """Splits sorted distinct dates into n_splits + 1 blocks and gets the first and last date of
+    every block but the first, each validated after training on the dates before it.
+
+    Args:
+        times (np.ndarray): Sorted distinct dates.
+        n_splits (int): Number of folds.
+    Returns:
+        list: (first date, last date) of the validation block of every fold.
+    """
+    return [(block[0], block[-1]) for block in np.array_split(times, n_splits + 1)[1:] if len(block)]
+
+
+def build_folds(frame: pd.DataFrame, settings: Dict[str, Any]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Builds the train and validation rows of every fold.
+
+    Args:
+        frame (pd.DataFrame): Training rows.
+        settings (dict): {"type": "time", "time_column": ..., "n_splits": 5}, expanding windows
+                         validated on the next block of dates, or {"type": "kfold", "n_splits": 5, "seed": 0}.
+    Returns:
+        list: (train positions, validation positions) of every fold.
+    """
+    n_splits = settings.get("n_splits", 5)
+    if settings.get("type", "kfold") == "time":
+        times = pd.to_datetime(frame[settings["time_column"]]).to_numpy()
+        return [(np.flatnonzero(times < start), np.flatnonzero((times >= start) & (times <= end)))
+                for start, end in time_blocks(np.unique(times), n_splits)]
+    if settings.get("type", "kfold") != "kfold":
+        raise ValueError(f"Error: unsupported fold type {settings['type']}")
+    positions = np.random.default_rng(settings.get("seed", 0)).permutation(len(frame))
+    chunks = np.array_split(positions, n_splits)
+    return [(np.sort(np.concatenate(chunks[:i] + chunks[i + 1:])), np.sort(chunk)) for i, chunk in enumerate(chunks)]
+
+
+class FoldCache:
+    """Features, target and folds written once to a folder and memory mapped by every worker.
+
+    Usage:
+        cache = FoldCache("/dbfs/sd/co/studies/folds")
+        cache.save(features, target, folds, names)
+        for dtrain, dvalid in cache.matrices():
+            ...
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Folder of the cache.
+        """
+        self.path = path
+
+    def save(self, features: np.ndarray, target: np.ndarray, folds: List[Tuple[np.ndarray, np.ndarray]],
+             feature_names: List[str]) -> None:
+        """Writes the arrays of the folds.
+
+        Args:
+            features (np.ndarray): Feature matrix, float32.
+            target (np.ndarray): Target.
+            folds (list): (train positions, validation positions) of every fold.
+            feature_names ([str]): Names of the feature columns.
+        Returns:
+            None
+        """
+        os.makedirs(self.path, exist_ok=True)
+        np.save(os.path.join(self.path, "features.npy"), np.ascontiguousarray(features, dtype=np.float32))
+        np.save(os.path.join(self.path, "target.npy"), np.asarray(target, dtype=np.float32))
+        np.savez(os.path.join(self.path, "folds.npz"),
+                 **{f"{kind}_{i}": rows for i, fold in enumerate(folds)
+                    for kind, rows in zip(("train", "valid"), fold)})
+        with open(os.path.join(self.path, "features.json"), "w") as f:
+            json.dump({"feature_names": list(feature_names), "folds": len(folds), "id": uuid.uuid4().hex}, f)
+        _MATRICES.pop(self.path, None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Gets the config of the folds, to open them again in a worker with load_folds."""
+        return {"type": "memory", "path": self.path}
+
+    def metadata(self) -> Dict[str, Any]:
+        with open(os.path.join(self.path, "features.json")) as f:
+            return json.load(f)
+
+    def matrices(self) -> List[Tuple[xgb.DMatrix, xgb.DMatrix]]:
+        """Gets the train and validation matrices of every fold, built on the first call of the
+        process from the memory mapped arrays."""
+        metadata = self.metadata()
+        with _MATRICES_LOCK:
+            cached = _MATRICES.get(self.path)
+            if cached is None or cached[0] != metadata["id"]:
+                cached = _MATRICES[self.path] = (metadata["id"], self.__build(metadata))
+        return cached[1]
+
+    def __build(self, metadata: Dict[str, Any]) -> List[Tuple[xgb.DMatrix, xgb.DMatrix]]:
+        """Builds the matrices of the folds from the memory mapped arrays."""
+        features = np.load(os.path.join(self.path, "features.npy"), mmap_mode="r")
+        target = np.load(os.path.join(self.path, "target.npy"), mmap_mode="r")
+        folds = np.load(os.path.join(self.path, "folds.npz"))
+        matrices = []
+        for i in range(metadata["folds"]):
+            pair = []
+            for kind in ("train", "valid"):
+                rows = folds[f"{kind}_{i}"]
+                pair.append(xgb.DMatrix(features[rows], label=target[rows], feature_names=metadata["feature_names"]))
+            matrices.append(tuple(pair))
+        return matrices
+
+
+class PruningCallback(xgb.callback.TrainingCallback):
+    """Reports the validation metric of a fold to the trial every few rounds and stops trials
+    the pruner finds worse than the others at the same fold and round."""
+
+    def __init__(self, trial: optuna.Trial, metric: str, fold: int, rounds: int, every: int) -> None:
+        self.trial = trial
+        self.key = metric
+        self.fold = fold
+        self.offset = fold * rounds
+        self.every = every
+
+    def after_iteration(self, model, epoch: int, evals_log: dict) -> bool:
+        if (epoch + 1) % self.every:
+            return False
+        self.trial.report(float(evals_log["valid"][self.key][-1]), self.offset + epoch)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f"Trial pruned at round {epoch} of fold {self.fold}")
+        return False
+
+
+class HyperparameterSearch:
+    """Optuna study over the parameters of the XGBoost model, cross-validated on shared folds.
+
+    Usage:
+        search = HyperparameterSearch(settings, "sqlite:////dbfs/sd/co/studies/optuna.db", "sd_co", cache)
+        study = search.create_study(warm_start={"eta": 0.05, "max_depth": 6})
+        search.optimize(study, n_trials=50, n_jobs=4)
+    """
+
+    def __init__(self, settings: Dict[str, Any], storage: str, study_name: str, folds: Any,
+                 nthread: int = 1) -> None:
+        """
+        Args:
+            settings (dict): training config: objective, metric, num_boost_round,
+                             early_stopping_rounds, search_space, params, pruner.
+            storage (str): Database URL of the study.
+            study_name (str): Name of the study.
+            folds (FoldCache or ExternalFolds): Cross-validation folds.
+            nthread (int): Threads of every trial.
+        """
+        self.settings = settings
+        self.storage = storage
+        self.study_name = study_name
+        self.folds = folds
+        self.nthread = nthread
+        self.metric = settings.get("metric", "rmse")
+        self.direction = "maximize" if self.metric.split("@")[0] in MAXIMIZED_METRICS else "minimize"
+        self.search_space = settings.get("search_space", DEFAULT_SEARCH_SPACE)
+        self.rounds = settings.get("num_boost_round", 1000)
+
+    def get_storage(self) -> optuna.storages.RDBStorage:
+        """Gets the storage of the study, waiting on the SQLite lock instead of failing when
+        several workers write at once."""
+        engine_kwargs = {"connect_args": {"timeout": 120}} if self.storage.startswith("sqlite") else {}
+        return optuna.storages.RDBStorage(self.storage, engine_kwargs=engine_kwargs)
+
+    def create_study(self, warm_start: Dict[str, Any] = None) -> optuna.Study:
+        """Creates the study, or loads it to resume it, and enqueues the warm start parameters
+        unless the study already tried them.
+
+        Args:
+            warm_start (dict): Best parameters of the previous run.
+        Returns:
+            optuna.Study: The study.
+        """
+        pruner = self.settings.get("pruner", {})
+        study = optuna.create_study(
+            storage=self.get_storage(), study_name=self.study_name, direction=self.direction, load_if_exists=True,
+            sampler=optuna.samplers.TPESampler(seed=self.settings.get("seed")),
+            pruner=optuna.pruners.MedianPruner(n_startup_trials=pruner.get("n_startup_trials", 5),
+                                               n_warmup_steps=pruner.get("n_warmup_steps", 50)),
+        )
+        if warm_start:
+            params = {k: v for k, v in warm_start.items() if k in self.search_space}
+            if params and all(t.params != params for t in study.trials):
+                study.enqueue_trial(params)
+        return study
+
+    def load_study(self) -> optuna.Study:
+        """Loads the study created by create_study, e.g. in a worker."""
+        pruner = self.settings.get("pruner", {})
+        return optuna.load_study(
+            study_name=self.study_name, storage=self.get_storage(),
+            pruner=optuna.pruners.MedianPruner(n_startup_trials=pruner.get("n_startup_trials", 5),
+                                               n_warmup_steps=pruner.get("n_warmup_steps", 50)),
+        )
+
+    def suggest(self, trial: optuna.Trial) -> Dict[str, Any]:
+        """Draws the parameters of a trial from the search space."""
+        params = {}
+        for name, space in self.search_space.items():
+            if space["type"] == "int":
+                params[name] = trial.suggest_int(name, space["low"], space["high"], log=space.get("log", False))
+            elif space["type"] == "float":
+                params[name] = trial.suggest_float(name, space["low"], space["high"], log=space.get("log", False))
+            elif space["type"] == "categorical":
+                params[name] = trial.suggest_categorical(name, space["choices"])
+            else:
+                raise ValueError(f"Error: unsupported search space type {space['type']} of {name}")
+        return params
+
+    def booster_params(self, params: Dict[str, Any], nthread: int = None) -> Dict[str, Any]:
+        """Completes the parameters of a trial with the fixed ones."""
+        return {"objective": self.settings.get("objective", "reg:squarederror"), "eval_metric": self.metric,
+                "tree_method": self.settings.get("tree_method", "hist"), "nthread": nthread or self.nthread,
+                "verbosity": 0, **self.settings.get("params", {}), **params}
+
+    def objective(self, trial: optuna.Trial) -> float:
+        """Cross-validates the parameters of a trial on the shared folds.
+
+        Args:
+            trial (optuna.Trial): Trial.
+        Returns:
+            float: Mean validation metric of the folds.
+        """
+        params = self.booster_params(self.suggest(trial))
+        scores, iterations = [], []
+        for fold, (dtrain, dvalid) in enumerate(self.folds.matrices()):
+            booster = xgb.train(
+                params, dtrain, num_boost_round=self.rounds, evals=[(dvalid, "valid")],
+                early_stopping_rounds=self.settings.get("early_stopping_rounds", 50), verbose_eval=False,
+                callbacks=[PruningCallback(trial, self.metric, fold, self.rounds,
+                                           self.settings.get("prune_every", 25))],
+            )
+            scores.append(booster.best_score)
+            iterations.append(booster.best_iteration + 1)
+        trial.set_user_attr("best_iterations", iterations)
+        return float(np.mean(scores))
+
+    def optimize(self, study: optuna.Study, n_trials: int = None, timeout: float = None, n_jobs: int = 1) -> None:
+        """Runs trials of the study in this process, on n_jobs threads.
+
+        Args:
+            study (optuna.Study): Study.
+            n_trials (int): Number of trials.
+            timeout (float): Seconds after which no new trial starts.
+            n_jobs (int): Concurrent trials.
+        Returns:
+            None
+        """
+        study.optimize(self.objective, n_trials=n_trials, timeout=timeout, n_jobs=n_jobs, gc_after_trial=True)
+
+
+def load_folds(settings: Dict[str, Any]):
+    """Opens the folds of a to_dict() config: a FoldCache, or ExternalFolds read batch by batch."""
+    if settings["type"] == "memory":
+        return FoldCache(settings["path"])
+    from smart_discounts.training.external import ExternalFolds
+
+    return ExternalFolds.from_dict(settings)
+
+
+def run_worker(task: Dict[str, Any]) -> Dict[str, int]:
+    """Runs trials of a study in a worker process or Ray task. Module level so it can be pickled.
+
+    Args:
+        task (dict): settings, storage, study_name, folds (to_dict() of the folds), nthread,
+                     n_trials and timeout.
+    Returns:
+        dict: trials run and peak_rss, the peak resident memory of the worker in bytes.
+    """
+    with ResourceMonitor() as monitor:
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        search = HyperparameterSearch(task["settings"], task["storage"], task["study_name"],
+                                      load_folds(task["folds"]), task["nthread"])
+        study = search.load_study()
+        before = len(study.trials)
+        search.optimize(study, task["n_trials"], task.get("timeout"))
+        trials = len(study.trials) - before
+    return {"trials": trials, "peak_rss": monitor.peak_rss}
+
+
+def split_trials(n_trials: int, workers: int) -> List[int]:
+    """Splits trials between workers, e.g. 10 trials on 4 workers as [3, 3, 2, 2]."""
+    share, extra = divmod(n_trials, workers)
+    return [share + (i < extra) for i in range(workers) if share + (i < extra) > 0]
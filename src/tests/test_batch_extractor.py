@@ -0,0 +1,84 @@
+"""Tests of the partitioning and streaming of ptc.data_ingestion.sql_extractor.SqlExtractor on sqlite."""
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from ptc.data_ingestion.sql_extractor import SqlExtractor
+
+ROWS = 1000
+QUERY = "SELECT id, sale_date, sold_at FROM sales"
+
+
+@pytest.fixture
+def extractor(tmp_path):
+    database = str(tmp_path / "sales.db")
+    with sqlite3.connect(database) as conn:
+        conn.execute("CREATE TABLE sales (id INTEGER, sale_date TEXT, sold_at TEXT)")
+        start = datetime(2024, 1, 1, 10, 30)
+        conn.executemany("INSERT INTO sales VALUES (?, ?, ?)",
+                         [(i, (start + timedelta(days=i % 10)).date().isoformat(),
+                           str(start + timedelta(days=i % 10))) for i in range(ROWS)])
+    extractor = SqlExtractor(SqlExtractor.connection_factory({"driver": "sqlite", "database": database}),
+                             pool_size=2, batch_size=64)
+    yield extractor
+    extractor.close()
+
+
+def read_ids(extractor: SqlExtractor, partitions: list) -> list:
+    return sorted(i for _, batch in extractor.iter_batches(QUERY, partitions) for i in batch["id"])
+
+
+def test_key_range_partitions_cover_every_row_once(extractor):
+    partitions = extractor.key_range_partitions(QUERY, "id", 7)
+    assert len(partitions) == 7
+    batches = list(extractor.iter_batches(QUERY, partitions))
+    assert all(len(batch) <= 64 for _, batch in batches)
+    assert sorted(i for _, batch in batches for i in batch["id"]) == list(range(ROWS))
+
+
+@pytest.mark.parametrize("column, is_datetime", [("sale_date", False), ("sold_at", True)])
+def test_date_partitions_cover_every_row_once(extractor, column, is_datetime):
+    partitions = SqlExtractor.date_partitions(column, date(2024, 1, 1), date(2024, 1, 10), 3, is_datetime)
+    assert [p["name"] for p in partitions][-1] == f"{column}_2024-01-10"
+    assert read_ids(extractor, partitions) == list(range(ROWS))
+
+
+def test_filter_applies_to_every_partition(extractor):
+    partitions = extractor.key_range_partitions(QUERY, "id", 4)
+    ids = sorted(i for _, batch in extractor.iter_batches(QUERY, partitions, "id % ? = 0", (100,))
+                 for i in batch["id"])
+    assert ids == list(range(0, ROWS, 100))
+
+
+@pytest.mark.parametrize("stop", ["break", "raise"])
+def test_consumer_stopping_early_stops_the_workers(extractor, stop):
+    threads = threading.active_count()
+    partitions = extractor.key_range_partitions(QUERY, "id", 8)
+    batches = extractor.iter_batches(QUERY, partitions)
+    next(batches)
+    if stop == "break":
+        batches.close()
+    else:
+        with pytest.raises(RuntimeError):
+            batches.throw(RuntimeError("consumer failed"))
+    assert threading.active_count() == threads
+    # The connections went back to the pool, so a new extraction does not wait for them.
+    assert read_ids(extractor, partitions) == list(range(ROWS))
+
+
+def test_worker_errors_reach_the_consumer(extractor):
+    with pytest.raises(sqlite3.OperationalError):
+        list(extractor.iter_batches("SELECT id FROM missing_table", []))
+
+
+def test_connection_errors_fail_every_partition_instead_of_hanging():
+    def connect():
+        raise sqlite3.OperationalError("unable to open database file")
+
+    extractor = SqlExtractor(connect, pool_size=2, batch_size=64)
+    partitions = SqlExtractor.date_partitions("sale_date", date(2024, 1, 1), date(2024, 1, 3))
+    with pytest.raises(sqlite3.OperationalError):
+        list(extractor.iter_batches(QUERY, partitions))
+    assert extractor.pool._created == 0
@@ -0,0 +1,104 @@
+"""Tests of the tiers of libs.lola_utils.cache.TieredCache."""
+import time
+
+import pytest
+
+from libs.lola_utils.cache import DiskTier, FakeRedis, MemoryTier, RedisTier, TieredCache
+
+
+class BrokenRedis(FakeRedis):
+    """FakeRedis whose server is unreachable."""
+
+    def mget(self, keys, *args):
+        raise ConnectionError("Error: connection refused")
+
+    def pipeline(self, transaction: bool = True):
+        pipeline = super().pipeline(transaction)
+        pipeline.execute = self.mget
+        return pipeline
+
+    def delete(self, *names):
+        raise ConnectionError("Error: connection refused")
+
+    def scan_iter(self, match: str = None, count: int = None):
+        raise ConnectionError("Error: connection refused")
+
+
+def make_cache(tmp_path, redis: FakeRedis, memory_bytes: int = 2 ** 20, ttl: float = None) -> TieredCache:
+    return TieredCache([MemoryTier(memory_bytes), DiskTier(str(tmp_path / "disk")), RedisTier(client=redis)],
+                       "test", ttl)
+
+
+def test_values_expire_in_every_tier(tmp_path):
+    cache = make_cache(tmp_path, FakeRedis(), ttl=0.2)
+    cache.mset({"a": 1, "b": [1, 2]})
+    cache.set("c", "kept", ttl=60)
+    assert cache.mget(["a", "b", "c"]) == {"a": 1, "b": [1, 2], "c": "kept"}
+    time.sleep(0.3)
+    assert cache.mget(["a", "b", "c"]) == {"c": "kept"}
+    assert all(cache.stats()["tiers"][name]["misses"] == 2 for name in ("memory", "disk", "redis"))
+    assert cache.stats()["tiers"]["memory"]["expired"] == 2
+
+
+def test_hits_of_slower_tiers_fill_the_faster_ones_with_their_ttl(tmp_path):
+    redis = FakeRedis()
+    make_cache(tmp_path / "writer", redis, ttl=60).mset({"a": 1, "b": 2})
+    cache = make_cache(tmp_path / "reader", redis)
+    assert cache.mget(["a", "b", "missing"]) == {"a": 1, "b": 2}
+    assert redis.calls["mget"] == 1
+    assert cache.mget(["a", "b"]) == {"a": 1, "b": 2}
+    assert redis.calls["mget"] == 1
+    memory, disk = cache.tiers[0], cache.tiers[1]
+    assert memory.stats()["hits"] == 2 and disk.stats()["sets"] == 2
+    (_, expires_at), = disk.mget(["test:a"]).values()
+    assert 0 < expires_at - time.time() <= 60
+
+
+def test_memory_tier_keeps_to_its_budget(tmp_path):
+    cache = make_cache(tmp_path, FakeRedis(), memory_bytes=2000)
+    cache.mset({str(i): "x" * 400 for i in range(10)})
+    memory = cache.tiers[0]
+    assert memory.bytes <= 2000 and memory.stats()["evictions"] > 0
+    # The evicted values are still found in the slower tiers.
+    assert len(cache.mget([str(i) for i in range(10)])) == 10
+
+
+def test_disk_tier_keeps_to_its_budget(tmp_path):
+    tier = DiskTier(str(tmp_path), max_bytes=4000)
+    for i in range(20):
+        tier.mset({f"key{i}": (b"x" * 400, None)})
+    assert tier.bytes <= 4000 and tier.stats()["evictions"] > 0
+    assert "key19" in tier.mget([f"key{i}" for i in range(20)])
+
+
+def test_failing_tiers_are_misses_and_counted(tmp_path):
+    cache = make_cache(tmp_path, BrokenRedis())
+    cache.mset({"a": 1})
+    assert cache.mget(["a", "b"]) == {"a": 1}
+    assert cache.mget_or_compute(["b"], lambda keys: {k: k.upper() for k in keys}) == {"b": "B"}
+    redis = cache.stats()["tiers"]["redis"]
+    assert redis["errors"] == 4 and redis["sets"] == 0
+
+
+def test_corrupt_disk_files_are_misses(tmp_path):
+    cache = TieredCache([DiskTier(str(tmp_path))], "test")
+    cache.mset({"a": 1, "b": 2})
+    with open(cache.tiers[0].file("test:a"), "wb") as f:
+        f.write(b"\x00")
+    assert cache.mget(["a", "b"]) == {"b": 2}
+    assert cache.stats()["tiers"]["disk"]["errors"] == 1
+
+
+def test_only_the_first_tier_can_be_in_memory(tmp_path):
+    with pytest.raises(ValueError):
+        TieredCache([DiskTier(str(tmp_path)), MemoryTier()])
+
+
+def test_failing_tiers_do_not_stop_deletes(tmp_path):
+    cache = make_cache(tmp_path, BrokenRedis())
+    cache.mset({"a": 1, "b": 2, "c": 3})
+    cache.delete(["a"])
+    assert cache.mget(["a", "b"]) == {"b": 2}
+    cache.clear()
+    assert cache.mget(["b", "c"]) == {}
+    assert cache.stats()["tiers"]["redis"]["errors"] == 5
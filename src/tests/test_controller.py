@@ -0,0 +1,131 @@
+"""Tests of the runs of libs.lola_utils.execution.Controller on a service written to a temporary root path."""
+import os
+import subprocess
+import sys
+import textwrap
+
+from libs.lola_utils.execution.RunStateStore import RunStateStore
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROCESS = """
+import os
+
+from libs.lola_utils.config import CONFIG
+from libs.lola_utils.execution import Process as BaseProcess
+
+
+class Process(BaseProcess):
+    def execute_process(self):
+        handed = CONFIG.get_value_or_none("process_outputs.first.data")
+        with open(os.environ["RUN_LOG"], "a") as f:
+            f.write(f"{name} {handed}\\n")
+        if os.path.exists(os.path.join(os.environ["FAIL_DIR"], "{name}")):
+            raise RuntimeError("Error: {name} failed")
+        self.output_locations = {"data": "/data/{name}"}
+"""
+
+ASYNC_PROCESS = """
+import asyncio
+import os
+
+from libs.lola_utils.execution import Process as BaseProcess
+
+
+class Process(BaseProcess):
+    run_concurrently = "{name}" != "alone"
+
+    async def execute_process(self):
+        with open(os.environ["RUN_LOG"], "a") as f:
+            f.write("{name} start\\n")
+        await asyncio.sleep(0.5)
+        with open(os.environ["RUN_LOG"], "a") as f:
+            f.write("{name} end\\n")
+        if os.path.exists(os.path.join(os.environ["FAIL_DIR"], "{name}")):
+            raise RuntimeError("Error: {name} failed")
+"""
+
+INVALID_PROCESS = PROCESS + """
+    def validate_process(self):
+        return False, "missing setting"
+"""
+
+
+def write_service(root, processes: dict) -> None:
+    """Writes the service demo with one process per name, whose body is a template of the name."""
+    os.makedirs(root / "demo")
+    (root / "demo" / "__init__.py").write_text("")
+    (root / "demo" / "service.py").write_text("from libs.lola_utils.execution import Service as BaseService\n\n\n"
+                                              "class Service(BaseService):\n    pass\n")
+    for name, body in processes.items():
+        os.makedirs(root / "demo" / name)
+        (root / "demo" / name / "__init__.py").write_text(f"from demo.{name}.process import Process\n")
+        (root / "demo" / name / "process.py").write_text(textwrap.dedent(body).replace("{name}", name))
+
+
+def run(root, processes: str, *args, fail: tuple = ()) -> subprocess.CompletedProcess:
+    """Runs the controller on the demo service and fails the given processes."""
+    fail_dir = root / "fail"
+    os.makedirs(fail_dir, exist_ok=True)
+    for name in os.listdir(fail_dir):
+        os.remove(fail_dir / name)
+    for name in fail:
+        (fail_dir / name).write_text("")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(root), SRC, os.environ.get("PYTHONPATH", "")]),
+               RUN_LOG=str(root / "run.log"), FAIL_DIR=str(fail_dir))
+    script = "from libs.lola_utils.execution import Controller; Controller().execute_processes()"
+    return subprocess.run([sys.executable, "-c", script, "--service", "demo", "--processes", processes,
+                           "--service_root_path", str(root), *args],
+                          cwd=str(root), env=env, capture_output=True, text=True, timeout=120)
+
+
+def log(root) -> list:
+    path = root / "run.log"
+    lines = path.read_text().splitlines() if path.exists() else []
+    path.unlink(missing_ok=True)
+    return lines
+
+
+def test_reruns_resume_at_the_failed_process_with_the_outputs_of_the_completed_ones(tmp_path):
+    write_service(tmp_path, {"first": PROCESS, "second": PROCESS})
+    assert run(tmp_path, "first,second", "--service_run_id", "r1", fail=("second",)).returncode != 0
+    assert log(tmp_path) == ["first None", "second /data/first"]
+    # The completed first process is skipped and its outputs are handed to the second one.
+    result = run(tmp_path, "first,second", "--service_run_id", "r1")
+    assert result.returncode == 0, result.stderr
+    assert log(tmp_path) == ["second /data/first"]
+    assert run(tmp_path, "first,second", "--service_run_id", "r1").returncode == 0
+    assert log(tmp_path) == []
+    assert run(tmp_path, "first,second", "--service_run_id", "r1", "--force_processes", "first").returncode == 0
+    assert log(tmp_path) == ["first None"]
+    # Other run ids and runs without an id execute every process.
+    assert run(tmp_path, "first,second", "--service_run_id", "r2").returncode == 0
+    assert log(tmp_path) == ["first None", "second /data/first"]
+    assert run(tmp_path, "first,second").returncode == 0
+    assert log(tmp_path) == ["first None", "second /data/first"]
+
+
+def test_flagged_async_processes_overlap_and_fail_on_their_own(tmp_path):
+    write_service(tmp_path, {"one": ASYNC_PROCESS, "two": ASYNC_PROCESS, "alone": ASYNC_PROCESS})
+    assert run(tmp_path, "alone,one,two", "--service_run_id", "r1", fail=("one",)).returncode != 0
+    lines = log(tmp_path)
+    assert lines[:2] == ["alone start", "alone end"]
+    assert sorted(lines[2:4]) == ["one start", "two start"] and sorted(lines[4:]) == ["one end", "two end"]
+    # The failure of one process of the group does not fail the other.
+    assert run(tmp_path, "alone,one,two", "--service_run_id", "r1").returncode == 0
+    assert log(tmp_path) == ["one start", "one end"]
+    # Isolated processes run one at a time.
+    assert run(tmp_path, "one,two", "--isolation", "process").returncode == 0
+    assert log(tmp_path) == ["one start", "one end", "two start", "two end"]
+
+
+def test_preflight_reports_every_failure_before_any_process_executes(tmp_path):
+    write_service(tmp_path, {"first": PROCESS, "invalid": INVALID_PROCESS, "broken": "import missing_module\n"})
+    result = run(tmp_path, "first,invalid,broken", "--service_run_id", "r1")
+    assert result.returncode != 0
+    assert "Preflight failed for 2 process(es)" in result.stderr
+    assert "invalid: Failed validation: missing setting" in result.stderr
+    assert "broken: Failed to load: ModuleNotFoundError" in result.stderr
+    assert log(tmp_path) == []
+    store = RunStateStore(str(tmp_path))
+    assert [store.get_state("r1", "demo", p) for p in ("first", "invalid", "broken")] == [None, "failed", "failed"]
@@ -0,0 +1,74 @@
+"""Tests of the interpolation of the demand curve grid of smart_discounts.optimization.grid."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from smart_discounts.optimization.grid import CurveGrid
+
+KEYS = ["store", "sku"]
+
+
+def elasticity_curves() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"store": np.repeat(["0002", "0001", "0003"], 4), "sku": np.tile(["a", "b", "c", "d"], 3),
+                         "base_price": rng.uniform(5, 20, 12), "base_units": rng.uniform(10, 100, 12),
+                         "elasticity": rng.uniform(-4, -1, 12)})
+
+
+def point_curves() -> pd.DataFrame:
+    return pd.DataFrame({"store": ["0001"] * 5 + ["0002"] * 2, "sku": ["a", "a", "a", "b", "b", "a", "a"],
+                         "discount": [0.3, 0.0, 0.1, 0.05, 0.25, 0.0, 0.4],
+                         "units": [40.0, 10.0, 20.0, 8.0, 4.0, 5.0, 7.0],
+                         "base_price": [10.0, 10.0, 10.0, 4.0, 4.0, 6.0, 6.0]})
+
+
+def test_elasticity_curves_are_exact_on_the_grid_and_close_between(tmp_path):
+    curves = elasticity_curves()
+    CurveGrid.build(curves, KEYS, str(tmp_path / "grid"), points=51, max_discount=0.5)
+    grid = CurveGrid.read(str(tmp_path / "grid"))
+    rows = grid.rows(curves)
+    assert sorted(rows.tolist()) == list(range(12)) and grid.base_price[rows].tolist() == curves["base_price"].tolist()
+    discounts = np.array([0.0, 0.1, 0.13, 0.255, 0.5])
+    elasticity = curves["elasticity"].to_numpy()[:, None]
+    exact = curves["base_units"].to_numpy()[:, None] * (1 - discounts[None, :]) ** elasticity
+    units = grid.units(rows[:, None], discounts[None, :])
+    np.testing.assert_allclose(units[:, [0, 1, 4]], exact[:, [0, 1, 4]], rtol=1e-6)
+    np.testing.assert_allclose(units, exact, rtol=1e-3)
+    assert np.isnan(grid.units(np.array([rows[0], -1]), np.array([0.6, 0.1]))).all()
+
+
+def test_point_curves_are_interpolated_linearly_and_constant_outside(tmp_path):
+    curves = point_curves()
+    CurveGrid.build(curves, KEYS, str(tmp_path / "grid"), points=11, max_discount=0.5)
+    grid = CurveGrid.read(str(tmp_path / "grid"))
+    assert grid.keys.to_dict("list") == {"store": ["0001", "0001", "0002"], "sku": ["a", "b", "a"]}
+    discounts = grid.grid
+    np.testing.assert_allclose(grid.values[0], np.interp(discounts, [0.0, 0.1, 0.3], [10.0, 20.0, 40.0]))
+    np.testing.assert_allclose(grid.values[1], np.interp(discounts, [0.05, 0.25], [8.0, 4.0]))
+    np.testing.assert_allclose(grid.values[2], np.interp(discounts, [0.0, 0.4], [5.0, 7.0]))
+    assert grid.units(np.array(0), np.array(0.12)) == pytest.approx(22.0)
+
+
+def test_units_at_levels_match_the_units_of_every_row(tmp_path):
+    CurveGrid.build(elasticity_curves(), KEYS, str(tmp_path / "grid"), points=21, max_discount=0.5)
+    grid = CurveGrid.read(str(tmp_path / "grid"))
+    on_grid, between = np.array([0.0, 0.1, 0.25]), np.array([0.0, 0.12, 0.33, 0.7])
+    for rows in (grid.store_rows(["0002"]), grid.store_rows(["0001", "0003"]), np.array([5, -1, 2])):
+        for levels in (on_grid, between):
+            np.testing.assert_allclose(grid.units_at(rows, levels), grid.units(rows[:, None], levels[None, :]),
+                                       rtol=1e-6, equal_nan=True)
+    assert grid.store_rows(["0001", "0003"]).tolist() == [0, 1, 2, 3, 8, 9, 10, 11]
+    assert len(grid.store_rows(["0009"])) == 0
+
+
+def test_grids_are_rebuilt_when_their_source_changes(tmp_path):
+    source = tmp_path / "curves.parquet"
+    elasticity_curves().to_parquet(source)
+    fingerprint = CurveGrid.source_fingerprint([str(source)])
+    CurveGrid.build(elasticity_curves(), KEYS, str(tmp_path / "grid"), points=11, source=fingerprint)
+    assert CurveGrid.is_current(str(tmp_path / "grid"), fingerprint, 11, 0.5)
+    assert not CurveGrid.is_current(str(tmp_path / "grid"), fingerprint, 21, 0.5)
+    CurveGrid.build(point_curves(), KEYS, str(tmp_path / "grid"), points=11)
+    assert not CurveGrid.is_current(str(tmp_path / "grid"), fingerprint, 11, 0.5)
+    assert CurveGrid.read(str(tmp_path / "grid")).metadata["format"] == "points"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["curves.parquet", "grid"]
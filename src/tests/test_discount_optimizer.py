@@ -0,0 +1,83 @@
+"""Tests of the budgeted discount choice of smart_discounts.optimization.engine against brute force."""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from smart_discounts.optimization.engine import DiscountOptimizer
+
+LEVELS = [0.0, 0.1, 0.2, 0.3]
+
+
+def make_store(skus: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"store": "0001", "base_price": rng.uniform(5, 20, skus),
+                         "base_units": rng.uniform(10, 100, skus), "elasticity": rng.uniform(-4, -1, skus),
+                         "cost": rng.uniform(1, 5, skus)})
+
+
+def evaluate(optimizer: DiscountOptimizer, frame: pd.DataFrame) -> dict:
+    return optimizer.evaluate(*(frame[c].to_numpy() for c in ["base_price", "base_units", "elasticity", "cost"]))
+
+
+def totals(values: dict, choice) -> tuple:
+    rows = np.arange(len(choice))
+    return values["margin"][rows, choice].sum(), values["spend"][rows, choice].sum()
+
+
+def test_without_budget_every_sku_takes_its_best_level():
+    optimizer = DiscountOptimizer(levels=LEVELS)
+    frame = make_store(50, seed=0)
+    values = evaluate(optimizer, frame)
+    result = optimizer.optimize_store(frame)
+    np.testing.assert_array_equal(result["discount"].to_numpy(), np.array(LEVELS)[values["margin"].argmax(axis=1)])
+    assert (result["budget_multiplier"] == 0).all() and (result["status"] == "optimal").all()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_budgeted_choice_is_feasible_and_close_to_brute_force(seed):
+    optimizer = DiscountOptimizer(levels=LEVELS)
+    frame = make_store(5, seed)
+    values = evaluate(optimizer, frame)
+    budget = np.random.default_rng(seed).uniform(0.2, 0.8) * values["spend"].max(axis=1).sum()
+    choice, _, status = optimizer.solve(values["margin"], values["spend"], np.ones((5, 4), bool), budget)
+    margin, spend = totals(values, choice)
+    assert status == "optimal" and spend <= budget
+    best = max(totals(values, c)[0] for c in itertools.product(range(4), repeat=5)
+               if totals(values, c)[1] <= budget)
+    # The choice of the relaxation is below the best one by at most the objective range of one SKU.
+    assert best - margin <= (values["margin"].max(axis=1) - values["margin"].min(axis=1)).max()
+
+
+def test_large_stores_are_close_to_the_bound_of_the_relaxation():
+    optimizer = DiscountOptimizer(levels=LEVELS)
+    frame = make_store(300, seed=1)
+    values = evaluate(optimizer, frame)
+    budget = 0.5 * values["spend"].max(axis=1).sum()
+    choice, multiplier, _ = optimizer.solve(values["margin"], values["spend"], np.ones((300, 4), bool), budget)
+    margin, spend = totals(values, choice)
+    bound = (values["margin"] - multiplier * values["spend"]).max(axis=1).sum() + multiplier * budget
+    assert spend <= budget and margin >= 0.995 * bound
+
+
+def test_boundaries_and_infeasible_budgets():
+    optimizer = DiscountOptimizer(levels=LEVELS, budget={"amount": 1.0})
+    frame = make_store(3, seed=2).assign(min_discount=[0.1, np.nan, 0.2], max_discount=[0.2, 0.0, np.nan])
+    result = optimizer.optimize_store(frame)
+    # Even the cheapest allowed levels spend more than the budget.
+    assert (result["status"] == "budget_infeasible").all()
+    assert result["discount"].tolist() == [0.1, 0.0, 0.2]
+    unknown = make_store(2, seed=3).assign(elasticity=[np.nan, -2.0], min_discount=[0.1, np.nan])
+    result = DiscountOptimizer(levels=LEVELS).optimize_store(unknown)
+    assert result["status"].tolist()[0] == "no_allowed_level" and np.isnan(result["discount"].iloc[0])
+
+
+def test_stores_get_a_share_of_their_revenue_as_budget():
+    optimizer = DiscountOptimizer(levels=LEVELS, budget={"share_of_revenue": 0.02})
+    frame = pd.concat([make_store(20, seed=4), make_store(30, seed=5).assign(store="0002")], ignore_index=True)
+    result = optimizer.optimize_stores(frame)
+    for store, rows in result.groupby("store"):
+        assert rows["spend"].sum() <= 0.02 * (rows["base_price"] * rows["base_units"]).sum() + 1e-9
+        assert rows["budget_multiplier"].nunique() == 1
+    assert list(result.index) == list(frame.index)
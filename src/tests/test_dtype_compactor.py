@@ -0,0 +1,34 @@
+"""Tests of the float handling of libs.lola_utils.ind.DtypeCompactor."""
+import numpy as np
+import pandas as pd
+
+from libs.lola_utils.ind import DtypeCompactor
+
+
+def make_frame() -> pd.DataFrame:
+    return pd.DataFrame({"units": [1.0, 2.5, np.nan], "price": [0.1, 2.0, 3.0], "id": [2.0 ** 24 + 1, 1.0, 2.0]})
+
+
+def test_floats_downcast_only_when_exact():
+    compacted, _ = DtypeCompactor().compact(make_frame())
+    assert compacted["units"].dtype == np.float32
+    assert compacted["price"].dtype == np.float64
+    assert compacted["id"].dtype == np.float64
+
+
+def test_stable_keeps_float64_unless_schema_says_float32():
+    frame = make_frame()
+    compacted, _ = DtypeCompactor({"units": "float32"}, stable=True).compact(frame)
+    assert compacted["units"].dtype == np.float32
+    assert compacted["price"].dtype == np.float64
+    np.testing.assert_array_equal(compacted["id"].to_numpy(), frame["id"].to_numpy())
+
+
+def test_integers_downcast_to_signed_types_unless_asked():
+    frame = pd.DataFrame({"units": [0, 3, 200], "stock": [-1, 5, 40_000], "id": [0, 1, 2 ** 40]})
+    compacted, _ = DtypeCompactor().compact(frame)
+    assert compacted.dtypes.tolist() == [np.int16, np.int32, np.int64]
+    # Differences of signed columns keep their sign.
+    assert (compacted["units"] - compacted["units"].max()).min() == -200
+    compacted, _ = DtypeCompactor(unsigned_integers=True).compact(frame)
+    assert compacted.dtypes.tolist() == [np.uint8, np.int32, np.uint64]
@@ -0,0 +1,65 @@
+"""Tests of the out-of-core folds of smart_discounts.training.external against the in-memory folds."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from libs.lola_utils.storage import PartitionedDataset
+from smart_discounts.training.external import ExternalFolds, estimate_in_memory_bytes
+from smart_discounts.training.search import build_folds, load_folds
+
+FEATURES = ["price", "discount"]
+
+
+def write_features(path) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "country": "co",
+        "date": pd.date_range("2023-01-01", periods=20).repeat(6),
+        "price": rng.random(120),
+        "discount": rng.random(120),
+        "units": np.arange(120, dtype=np.float64),
+    })
+    frame.loc[[5, 50, 90], "units"] = np.nan
+    PartitionedDataset(str(path), ["country"]).write(frame)
+    return frame.drop(columns=["country"])
+
+
+def labels(matrix) -> list:
+    return sorted(matrix.get_label().tolist())
+
+
+@pytest.mark.parametrize("matrix", ["quantile", "external"])
+def test_time_folds_stream_the_rows_of_the_in_memory_folds(tmp_path, matrix):
+    frame = write_features(tmp_path / "features")
+    settings = {"type": "time", "time_column": "date", "n_splits": 3}
+    folds = ExternalFolds(str(tmp_path / "features"), ["country"], [("country", "=", "co")], FEATURES, "units",
+                          settings, matrix=matrix, batch_size=7, cache_dir=str(tmp_path / "pages"))
+    expected = build_folds(frame, settings)
+    matrices = folds.matrices()
+    assert len(matrices) == len(expected) == 3
+    units = frame["units"].to_numpy()
+    for (dtrain, dvalid), (train, valid) in zip(matrices, expected):
+        assert labels(dtrain) == sorted(u for u in units[train] if not np.isnan(u))
+        assert labels(dvalid) == sorted(u for u in units[valid] if not np.isnan(u))
+    assert dtrain.feature_names == FEATURES
+    assert folds.full_matrix().num_row() == 117
+
+
+def test_random_folds_give_the_same_rows_on_every_pass(tmp_path):
+    write_features(tmp_path / "features")
+    folds = ExternalFolds(str(tmp_path / "features"), ["country"], [("country", "=", "co")], FEATURES, "units",
+                          {"n_splits": 4, "seed": 3}, batch_size=10)
+    matrices = folds.matrices()
+    assert load_folds(folds.to_dict()).matrices() is matrices
+    validated = sorted(u for _, dvalid in matrices for u in dvalid.get_label().tolist())
+    assert validated == sorted(set(range(120)) - {5, 50, 90})
+    # A second pass over the batches, e.g. in another worker, selects the same rows.
+    for (dtrain, dvalid), (train, valid) in zip(matrices, folds.selectors()):
+        assert labels(dtrain) == labels(folds.build(train)) and labels(dvalid) == labels(folds.build(valid))
+        assert dtrain.num_row() + dvalid.num_row() == 117
+
+
+def test_in_memory_estimate_counts_the_matrices_of_every_worker():
+    single = estimate_in_memory_bytes(1000, 10, 8, n_splits=5)
+    assert single == 1000 * (8 * 10 + 4 * 8 + 8 * 8 * 6)
+    assert estimate_in_memory_bytes(1000, 10, 8, n_splits=5, workers=4) - single == 1000 * 8 * 8 * 5 * 3
@@ -0,0 +1,88 @@
+"""Tests of the rolling windows of ptc.feature_engineering.engine against brute-force windows."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from ptc.feature_engineering.engine import FeaturePlan
+
+
+def make_frame(rows: int = 300, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "store": rng.integers(0, 3, rows),
+        # Few days, so most days have several rows of the same store.
+        "date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 30, rows), unit="D"),
+        "units": rng.integers(0, 5, rows).astype(np.float64),
+    })
+    frame.loc[rng.random(rows) < 0.05, "units"] = np.nan
+    return frame
+
+
+def brute_force(frame: pd.DataFrame, window: int, agg: str, exclude_current: bool) -> np.ndarray:
+    expected = np.full(len(frame), np.nan)
+    for i, row in frame.iterrows():
+        same = frame["store"] == row["store"]
+        if exclude_current:
+            days = (frame["date"] >= row["date"] - pd.Timedelta(days=window)) & (frame["date"] < row["date"])
+        else:
+            days = (frame["date"] > row["date"] - pd.Timedelta(days=window)) & (frame["date"] <= row["date"])
+        values = frame.loc[same & days, "units"].dropna()
+        if agg == "count":
+            expected[i] = len(values)
+        elif len(values):
+            expected[i] = getattr(values, agg)()
+    return expected
+
+
+@pytest.mark.parametrize("agg", ["min", "max", "sum", "mean", "count"])
+@pytest.mark.parametrize("exclude_current", [False, True])
+def test_rolling_days_matches_brute_force(agg, exclude_current):
+    frame = make_frame()
+    plan = FeaturePlan([{"name": "rolled", "type": "rolling", "column": "units", "by": ["store"],
+                         "order_by": "date", "window": 7, "agg": agg, "unit": "days",
+                         "exclude_current": exclude_current}], dtype="float64")
+    result = plan.execute(frame, keep_columns=[])["rolled"].to_numpy()
+    np.testing.assert_allclose(result, brute_force(frame, 7, agg, exclude_current), equal_nan=True)
+
+
+@pytest.mark.parametrize("agg", ["max", "sum"])
+def test_rows_without_date_are_left_out_of_the_windows(agg):
+    frame = make_frame()
+    frame.loc[[3, 50, 120], "date"] = pd.NaT
+    plan = FeaturePlan([
+        {"name": "rolled", "type": "rolling", "column": "units", "by": ["store"], "order_by": "date",
+         "window": 7, "agg": agg, "unit": "days"},
+        {"name": "last_week", "type": "lag", "column": "units", "by": ["store"], "order_by": "date", "days": 7},
+    ], dtype="float64")
+    result = plan.execute(frame, keep_columns=[])
+    dated = frame["date"].notna().to_numpy()
+    assert result.loc[~dated].isna().all().all()
+    np.testing.assert_allclose(result["rolled"].to_numpy()[dated], brute_force(frame, 7, agg, False)[dated],
+                               equal_nan=True)
+
+
+def test_group_aggregates_wait_for_the_features_they_read():
+    frame = make_frame(60)
+    plan = FeaturePlan([
+        {"name": "store_units", "type": "group_agg", "column": "units", "by": ["store"], "agg": "sum"},
+        {"name": "store_previous", "type": "group_agg", "column": "previous", "by": ["store"], "agg": "mean"},
+        {"name": "previous", "type": "lag", "column": "units", "by": ["store"], "order_by": "date"},
+    ], dtype="float64")
+    result = plan.execute(frame, keep_columns=[])
+    previous = frame.sort_values("date", kind="stable").groupby("store")["units"].shift(1).sort_index()
+    np.testing.assert_allclose(result["previous"], previous, equal_nan=True)
+    expected = previous.groupby(frame["store"]).transform("mean")
+    np.testing.assert_allclose(result["store_previous"], expected)
+    np.testing.assert_allclose(result["store_units"], frame.groupby("store")["units"].transform("sum"))
+
+
+def test_calendar_parts_of_missing_dates_are_missing():
+    frame = pd.DataFrame({"date": pd.to_datetime(["2023-01-07", None, "2023-03-31"])})
+    plan = FeaturePlan([{"type": "calendar", "column": "date", "parts": ["month", "weekofyear", "is_weekend"]}])
+    result = plan.execute(frame, keep_columns=[])
+    assert str(result["date_month"].dtype) == "Int16"
+    assert result["date_month"].tolist() == [1, pd.NA, 3]
+    assert result["date_weekofyear"].tolist() == [1, pd.NA, 13]
+    assert result["date_is_weekend"].tolist() == [1, pd.NA, 0]
+    dated = plan.execute(frame.dropna(), keep_columns=[])
+    assert dated["date_month"].dtype == np.int16
@@ -0,0 +1,52 @@
+"""Tests of the DataFrame backends of ptc.feature_engineering.backend."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from ptc.feature_engineering.backend import FrameBackend
+from ptc.feature_engineering.engine import FeaturePlan
+
+FEATURES = [
+    {"name": "units_mean_7", "type": "rolling", "column": "units", "by": ["store"], "order_by": "date",
+     "window": 7, "agg": "mean", "unit": "days"},
+    {"name": "units_last", "type": "lag", "column": "units", "by": ["store"], "order_by": "date", "periods": 1},
+    {"name": "store_units", "type": "group_agg", "column": "units", "by": ["store"], "agg": "sum"},
+]
+
+
+def make_frame(rows: int = 200) -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    return pd.DataFrame({
+        "store": rng.integers(0, 4, rows),
+        "date": (pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 20, rows), unit="D")).astype(str),
+        "units": rng.integers(0, 5, rows).astype(np.float64),
+    })
+
+
+def test_settings_choose_pandas_for_small_data_sets():
+    assert FrameBackend.from_settings(None).name == "pandas"
+    with pytest.raises(ValueError):
+        FrameBackend.from_settings("polars")
+    with pytest.raises(ValueError):
+        FrameBackend.from_settings({"name": "modin", "engine": "spark"}, rows=10)
+    small = FrameBackend.from_settings({"name": "modin", "engine": "dask", "min_rows": 1000}, rows=999)
+    assert small.to_dict() == {"name": "pandas", "engine": "ray", "cpus": None} and not small.is_modin
+
+
+def test_backend_operations_on_pandas():
+    backend = FrameBackend()
+    frame = pd.DataFrame({"store": [2, 1, 2, None], "units": [1.0, None, 3.0, 4.0]})
+    assert backend.ngroup(frame, ["store"]).tolist() == [0, 1, 0, 2]
+    np.testing.assert_array_equal(backend.to_numpy(frame["units"].astype("Float64")), [1.0, np.nan, 3.0, 4.0])
+    table = backend.group_agg({"units": frame["units"].to_numpy()}, np.array([0, 0, 2, 2]), 3,
+                              {"total": ("units", "sum")})
+    assert table["total"].tolist()[::2] == [1.0, 7.0] and np.isnan(table["total"].iloc[1])
+
+
+def test_modin_computes_the_features_of_pandas():
+    pytest.importorskip("modin")
+    frame = make_frame()
+    expected = FeaturePlan(FEATURES).execute(frame)
+    backend = FrameBackend("modin", engine="python")
+    result = backend.to_pandas(FeaturePlan(FEATURES).execute(backend.from_pandas(frame), backend=backend))
+    pd.testing.assert_frame_equal(result, expected)
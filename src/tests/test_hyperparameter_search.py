@@ -0,0 +1,71 @@
+"""Tests of the folds and shared study of smart_discounts.training.search."""
+import numpy as np
+import optuna
+import pandas as pd
+
+from smart_discounts.training.search import (FoldCache, HyperparameterSearch, build_folds, run_worker,
+                                             split_trials)
+
+SETTINGS = {"num_boost_round": 5, "early_stopping_rounds": 2, "seed": 0,
+            "search_space": {"eta": {"type": "float", "low": 0.1, "high": 0.5},
+                             "max_depth": {"type": "int", "low": 2, "high": 4}}}
+
+
+def make_cache(path, folds: int = 3) -> FoldCache:
+    rng = np.random.default_rng(0)
+    features = rng.random((120, 3))
+    target = features @ np.array([1.0, 2.0, -1.0]) + rng.normal(0, 0.1, 120)
+    cache = FoldCache(str(path))
+    cache.save(features, target, build_folds(pd.DataFrame(features), {"n_splits": folds}), ["a", "b", "c"])
+    return cache
+
+
+def test_trials_are_split_evenly_between_workers():
+    assert split_trials(10, 4) == [3, 3, 2, 2]
+    assert split_trials(2, 4) == [1, 1]
+    assert sum(split_trials(50, 7)) == 50
+
+
+def test_time_folds_validate_on_the_dates_after_their_training_rows():
+    frame = pd.DataFrame({"date": pd.date_range("2023-01-01", periods=12).repeat(2)})
+    folds = build_folds(frame, {"type": "time", "time_column": "date", "n_splits": 3})
+    assert len(folds) == 3
+    dates = frame["date"].to_numpy()
+    for train, valid in folds:
+        assert dates[train].max() < dates[valid].min()
+        assert len(train) == len(np.flatnonzero(dates < dates[valid].min()))
+    assert np.concatenate([valid for _, valid in folds]).tolist() == list(range(6, 24))
+
+
+def test_kfold_folds_validate_every_row_once():
+    folds = build_folds(pd.DataFrame({"x": range(10)}), {"n_splits": 3, "seed": 1})
+    assert sorted(np.concatenate([valid for _, valid in folds]).tolist()) == list(range(10))
+    assert all(len(np.intersect1d(train, valid)) == 0 and len(train) + len(valid) == 10 for train, valid in folds)
+
+
+def test_matrices_are_built_once_per_process_until_the_folds_change(tmp_path):
+    cache = make_cache(tmp_path / "folds")
+    matrices = cache.matrices()
+    assert len(matrices) == 3 and FoldCache(str(tmp_path / "folds")).matrices() is matrices
+    assert matrices[0][0].feature_names == ["a", "b", "c"]
+    assert sum(valid.num_row() for _, valid in matrices) == 120
+    make_cache(tmp_path / "folds", folds=2)
+    assert len(cache.matrices()) == 2
+
+
+def test_workers_share_the_study_and_the_warm_start_is_tried_once(tmp_path):
+    storage = f"sqlite:///{tmp_path / 'optuna.db'}"
+    cache = make_cache(tmp_path / "folds")
+    search = HyperparameterSearch(SETTINGS, storage, "sd_co", cache)
+    warm_start = {"eta": 0.3, "max_depth": 3, "gamma": 1.0}
+    # The queued warm start runs in the driver, the workers share the other trials.
+    search.optimize(search.create_study(warm_start=warm_start), n_trials=1)
+    task = {"settings": SETTINGS, "storage": storage, "study_name": "sd_co", "folds": cache.to_dict(),
+            "nthread": 1, "n_trials": 2}
+    assert [run_worker(task)["trials"] for _ in split_trials(4, 2)] == [2, 2]
+    # Resuming the study does not enqueue the warm start again.
+    study = search.create_study(warm_start=warm_start)
+    trials = [t for t in study.trials if t.state == optuna.trial.TrialState.COMPLETE]
+    assert len(trials) == 5 and trials[0].params == {"eta": 0.3, "max_depth": 3}
+    assert all(len(t.user_attrs["best_iterations"]) == 3 for t in trials)
+    assert len(study.get_trials(states=(optuna.trial.TrialState.WAITING,))) == 0
@@ -0,0 +1,67 @@
+"""Tests of the incremental rolling windows of ptc.feature_engineering.incremental against the full engine."""
+import numpy as np
+import pandas as pd
+
+from libs.lola_utils.storage import PartitionedDataset
+from ptc.feature_engineering.engine import FeaturePlan
+from ptc.feature_engineering.incremental import RollingState
+
+FEATURES = [
+    {"name": f"units_{agg}_{window}{'_before' if exclude else ''}", "type": "rolling", "column": "units",
+     "by": ["store"], "order_by": "date", "window": window, "agg": agg, "unit": "days", "exclude_current": exclude}
+    for agg, window, exclude in [("sum", 7, False), ("mean", 7, True), ("count", 3, False), ("max", 14, False),
+                                 ("min", 3, True)]
+]
+
+
+def make_rows(days: range, rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "country": "co",
+        "store": rng.integers(0, 3, rows),
+        "date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.choice(list(days), rows), unit="D"),
+        "units": rng.integers(0, 5, rows).astype(np.float64),
+    })
+    frame.loc[rng.random(rows) < 0.05, "units"] = np.nan
+    return frame
+
+
+def read_features(output: PartitionedDataset) -> pd.DataFrame:
+    features = output.read().drop(columns=["country"])
+    features["date"] = pd.to_datetime(features["date"])
+    return features.sort_values(["store", "date"]).reset_index(drop=True)
+
+
+def test_incremental_runs_match_the_full_engine(tmp_path):
+    source = PartitionedDataset(str(tmp_path / "sales"), ["country"])
+    output = PartitionedDataset(str(tmp_path / "features"), ["country", "date"])
+    state = RollingState(FEATURES, str(tmp_path / "state"), lookback_days=2, dtype="float64")
+    source.write(make_rows(range(0, 25), 300, seed=1))
+    assert state.run(source, output, "co")["mode"] == "full"
+    # New days, and late rows of the last day computed.
+    source.write(make_rows(range(24, 40), 200, seed=2))
+    result = state.run(source, output, "co")
+    assert result["mode"] == "incremental" and result["start"] == pd.Timestamp("2023-01-24")
+    assert result["last_day"] == "2023-02-09"
+
+    frame = source.read().drop(columns=["country"])
+    expected = FeaturePlan(FEATURES, dtype="float64").execute(frame, keep_columns=["store", "date"])
+    expected = expected.drop_duplicates(["store", "date"]).sort_values(["store", "date"]).reset_index(drop=True)
+    features = read_features(output)
+    assert len(features) == len(expected)
+    for feature in FEATURES:
+        np.testing.assert_allclose(features[feature["name"]].to_numpy(), expected[feature["name"]].to_numpy(),
+                                   equal_nan=True, err_msg=feature["name"])
+    # The state keeps only the days the longest window reaches.
+    days = pd.to_datetime(state.state.read()["date"])
+    assert days.min() >= pd.Timestamp("2023-02-09") - pd.Timedelta(days=15)
+
+
+def test_changed_features_recompute_the_whole_history(tmp_path):
+    source = PartitionedDataset(str(tmp_path / "sales"), ["country"])
+    output = PartitionedDataset(str(tmp_path / "features"), ["country", "date"])
+    source.write(make_rows(range(0, 10), 50, seed=3))
+    RollingState(FEATURES, str(tmp_path / "state")).run(source, output, "co")
+    changed = RollingState(FEATURES[:1], str(tmp_path / "state"))
+    assert changed.run(source, output, "co")["mode"] == "full"
+    assert sorted(read_features(output).columns) == ["date", "store", "units_sum_7"]
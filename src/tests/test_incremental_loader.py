@@ -0,0 +1,85 @@
+"""Tests of the watermark merges of ptc.data_ingestion.incremental.IncrementalLoader on sqlite."""
+import os
+import sqlite3
+
+import pytest
+
+from libs.lola_utils.profiling import DatasetProfile
+from libs.lola_utils.storage import PartitionedDataset
+from ptc.data_ingestion.incremental import IncrementalLoader, WatermarkStore
+from ptc.data_ingestion.sql_extractor import SqlExtractor
+
+SOURCE = {"name": "sales", "query": "SELECT id, store, units, modified_at FROM sales",
+          "incremental": {"watermark_column": "modified_at", "key_columns": ["id"]}}
+
+
+class Loader:
+    """Runs the loads of one country from a sqlite table of sales."""
+
+    def __init__(self, tmp_path, partition_columns: list):
+        self.database = str(tmp_path / "sales.db")
+        with sqlite3.connect(self.database) as conn:
+            conn.execute("CREATE TABLE sales (id INTEGER, store TEXT, units REAL, modified_at INTEGER)")
+        self.dataset = PartitionedDataset(str(tmp_path / "data" / "sales"), ["country"] + partition_columns)
+        self.store = WatermarkStore(str(tmp_path / "data"))
+
+    def upsert(self, *rows) -> None:
+        with sqlite3.connect(self.database) as conn:
+            conn.executemany("DELETE FROM sales WHERE id = ?", [(row[0],) for row in rows])
+            conn.executemany("INSERT INTO sales VALUES (?, ?, ?, ?)", rows)
+
+    def load(self) -> dict:
+        extractor = SqlExtractor(SqlExtractor.connection_factory({"driver": "sqlite", "database": self.database}))
+        try:
+            return IncrementalLoader(extractor, self.store, "co").load(SOURCE, self.dataset)
+        finally:
+            extractor.close()
+
+    def rows(self) -> list:
+        frame = self.dataset.read(columns=["id", "store", "units"])
+        return sorted(frame.itertuples(index=False, name=None))
+
+    def file_times(self) -> dict:
+        return {f: os.path.getmtime(f) for f in self.dataset.files()}
+
+
+@pytest.mark.parametrize("partition_columns", [[], ["store"]])
+def test_loads_upsert_the_newest_version_of_every_key(tmp_path, partition_columns):
+    loader = Loader(tmp_path, partition_columns)
+    loader.upsert((1, "a", 1.0, 10), (2, "a", 2.0, 10), (3, "b", 3.0, 20))
+    assert loader.load()["mode"] == "full"
+    # Row 3 is loaded again since its watermark equals the saved one; row 2 moves to store b.
+    loader.upsert((2, "b", 5.0, 30), (4, "b", 4.0, 30))
+    result = loader.load()
+    assert result["mode"] == "incremental" and result["rows"] == 3 and result["watermark"] == 30
+    assert loader.rows() == [(1, "a", 1.0), (2, "b", 5.0), (3, "b", 3.0), (4, "b", 4.0)]
+    assert loader.store.get("co", "sales") == {"column": "modified_at", "value": 30}
+    assert loader.load()["rows"] == 2
+    assert loader.rows() == [(1, "a", 1.0), (2, "b", 5.0), (3, "b", 3.0), (4, "b", 4.0)]
+
+
+def test_files_without_loaded_keys_are_not_rewritten(tmp_path):
+    loader = Loader(tmp_path, [])
+    loader.upsert((1, "a", 1.0, 10), (2, "a", 2.0, 10))
+    loader.load()
+    loader.upsert((3, "a", 3.0, 20))
+    loader.load()
+    before = loader.file_times()
+    loader.upsert((4, "a", 4.0, 30))
+    loader.load()
+    after = loader.file_times()
+    # Only the file holding row 3, loaded again with the saved watermark, is rewritten.
+    assert len(after) == len(before) + 1
+    assert sum(after.get(f) == t for f, t in before.items()) == len(before) - 1
+
+
+def test_profile_counts_the_current_rows_only(tmp_path):
+    loader = Loader(tmp_path, ["store"])
+    loader.upsert((1, "a", 1.0, 10), (2, "a", None, 10))
+    loader.load()
+    loader.upsert((2, "b", 4.0, 20))
+    loader.load()
+    loader.load()
+    summary = DatasetProfile.load(loader.dataset.partition_path({"country": "co"})).summary()
+    assert summary["rows"] == 2
+    assert summary["columns"]["units"]["nulls"] == 0 and summary["columns"]["units"]["mean"] == 2.5
@@ -0,0 +1,57 @@
+"""Tests of the timeouts, recycling and exit hook of libs.lola_utils.execution.IsolatedPool."""
+import atexit
+import os
+import time
+
+from libs.lola_utils.execution.IsolatedPool import IsolatedPool
+
+
+def pid(_) -> int:
+    return os.getpid()
+
+
+def sleep(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def allocate(megabytes: int) -> int:
+    return len(bytearray(megabytes * 1024 * 1024))
+
+
+def test_slow_tasks_time_out_without_failing_the_others():
+    with IsolatedPool(max_workers=2, timeout=1) as pool:
+        results = pool.map(sleep, {"slow": 30, "fast": 0.01})
+    assert not results["slow"]["ok"] and results["slow"]["error"].startswith("TimeoutError")
+    assert results["fast"]["ok"] and results["fast"]["result"] == 0.01
+
+
+def test_workers_are_recycled_after_max_tasks():
+    with IsolatedPool(max_workers=1, max_tasks_per_worker=2) as pool:
+        pids = [r["result"] for r in pool.map(pid, {i: i for i in range(5)}).values()]
+    assert pids[0] == pids[1] != pids[2] == pids[3] != pids[4]
+    assert os.getpid() not in pids
+
+
+def address_space() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def test_allocations_over_the_memory_limit_fail_the_task_only():
+    # Forked workers start with the address space of the test process.
+    with IsolatedPool(memory_limit=address_space() + 512 * 1024 * 1024) as pool:
+        results = pool.map(allocate, {"large": 2048, "small": 1})
+    assert not results["large"]["ok"] and results["large"]["error"].startswith("MemoryError")
+    assert results["small"]["ok"] and results["small"]["result"] == 1024 * 1024
+
+
+def test_closed_pools_are_not_kept_by_the_exit_hook(monkeypatch):
+    hooks = set()
+    monkeypatch.setattr(atexit, "register", lambda func: hooks.add(func))
+    monkeypatch.setattr(atexit, "unregister", lambda func: hooks.discard(func))
+    for _ in range(3):
+        with IsolatedPool() as pool:
+            assert pool.run(pid, None)["ok"]
+            assert len(hooks) == 1
+    assert not hooks
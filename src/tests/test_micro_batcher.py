@@ -0,0 +1,96 @@
+"""Tests of smart_discounts.serving: the micro-batcher and the scoring server."""
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from libs.lola_utils.cache import TieredCache  # noqa: E402
+from smart_discounts.serving.batching import MicroBatcher  # noqa: E402
+from smart_discounts.serving.server import create_app  # noqa: E402
+
+FEATURES = ["price", "discount"]
+
+
+class Model:
+    """Fake model predicting the sum of the features of every row and recording its batches."""
+
+    def __init__(self) -> None:
+        self.batches = []
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        self.batches.append(len(values))
+        return np.nansum(values, axis=1)
+
+
+def test_concurrent_requests_share_batches():
+    model = Model()
+
+    async def run():
+        batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=50)
+        await batcher.start()
+        try:
+            requests = [np.full((1 + i % 3, 2), i, dtype=np.float32) for i in range(12)]
+            return requests, await asyncio.gather(*(batcher.predict(r) for r in requests))
+        finally:
+            await batcher.stop()
+
+    requests, predictions = asyncio.run(run())
+    for request, prediction in zip(requests, predictions):
+        np.testing.assert_array_equal(prediction, request.sum(axis=1))
+    assert sum(model.batches) == sum(len(r) for r in requests)
+    assert len(model.batches) < len(requests) and max(model.batches) <= 8
+
+
+def test_model_errors_fail_every_request_of_the_batch():
+    def broken(values):
+        raise RuntimeError("model failed")
+
+    async def run():
+        batcher = MicroBatcher(broken, max_batch_size=8, max_wait_ms=20)
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.predict(np.ones((1, 2), np.float32)) for _ in range(3)),
+                                        return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+
+
+def score(model: Model, bodies: list, cache: TieredCache = None) -> list:
+    async def run():
+        async with TestClient(TestServer(create_app(model, FEATURES, max_wait_ms=1, cache=cache))) as client:
+            responses = []
+            for body in bodies:
+                response = await client.post("/score", json=body)
+                responses.append((response.status, await response.json()))
+            return responses
+
+    return asyncio.run(run())
+
+
+def test_server_scores_rows_and_instances():
+    responses = score(Model(), [{"rows": [{"price": 1.5, "discount": 0.5}, {"price": 2.0}]},
+                                {"instances": [[1.0, 1.0]]}])
+    assert responses == [(200, {"predictions": [2.0, 2.0]}), (200, {"predictions": [2.0]})]
+
+
+@pytest.mark.parametrize("body", [[1, 2], "text", None, {"rows": [1]}, {"instances": [[1.0]]}, {"other": []},
+                                  {"rows": [{"price": [1, 2]}]}, {"rows": [{"price": {"a": 1}}]},
+                                  {"rows": [{"price": "cheap"}]}, {"instances": [[{"a": 1}, 1.0]]}])
+def test_server_rejects_malformed_bodies(body):
+    (status, response), = score(Model(), [body])
+    assert status == 400 and response["error"].startswith("Error:")
+
+
+def test_server_caches_predictions_by_row():
+    model = Model()
+    cache = TieredCache.from_settings({"memory": {"max_bytes": 2 ** 20}, "redis": {"fake": True}}, "test")
+    rows = {"rows": [{"price": 1.0, "discount": 0.1}, {"price": 2.0, "discount": 0.2}]}
+    responses = score(model, [rows, rows, {"rows": rows["rows"] + [{"price": 3.0, "discount": 0.3}]}], cache)
+    assert [status for status, _ in responses] == [200, 200, 200]
+    assert responses[1][1] == responses[0][1]
+    assert model.batches == [2, 1]
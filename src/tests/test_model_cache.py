@@ -0,0 +1,74 @@
+"""Tests of libs.lola_utils.storage.ModelCache and of the model loading of the prediction."""
+import json
+import os
+
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from libs.lola_utils.storage import ModelCache
+from smart_discounts.prediction.process import load_model
+
+
+@pytest.fixture(autouse=True)
+def clear_models():
+    ModelCache.clear()
+    yield
+    ModelCache.clear()
+
+
+def write_model(path, rounds: int = 2) -> None:
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(0)
+    data = xgb.DMatrix(rng.random((50, 2)), label=rng.random(50), feature_names=["price", "discount"])
+    xgb.train({"max_depth": 2}, data, num_boost_round=rounds).save_model(os.path.join(path, "model.json"))
+    with open(os.path.join(path, "metadata.json"), "w") as f:
+        json.dump({"feature_names": ["price", "discount"]}, f)
+
+
+def read_booster(path) -> xgb.Booster:
+    return xgb.Booster(model_file=os.path.join(path, "model.json"))
+
+
+def counts() -> tuple:
+    stats = ModelCache.stats()
+    return stats["hits"], stats["misses"], stats["downloads"]
+
+
+def test_models_are_loaded_once_and_copied_once(tmp_path):
+    source = tmp_path / "model"
+    write_model(source)
+    cache = ModelCache(str(tmp_path / "cache"))
+    hits, misses, downloads = counts()
+    first = cache.load(str(source), lambda path: object())
+    assert ModelCache(str(tmp_path / "cache")).load(str(source), lambda path: object()) is first
+    assert counts() == (hits + 1, misses + 1, downloads + 1)
+    # A model lost from memory is loaded again from the local copy.
+    ModelCache.clear()
+    assert cache.load(str(source), lambda path: object()) is not first
+    assert counts() == (hits + 1, misses + 2, downloads + 1)
+
+
+def test_changed_artifacts_are_copied_and_loaded_again(tmp_path):
+    source = tmp_path / "model"
+    write_model(source, rounds=2)
+    cache = ModelCache(str(tmp_path / "cache"), keep_copies=1)
+    local, checksum = cache.fetch(str(source))
+    first = cache.load(str(source), read_booster, name="booster")
+    write_model(source, rounds=3)
+    changed_local, changed_checksum = cache.fetch(str(source))
+    assert changed_checksum != checksum and changed_local != local
+    # Only the last copy is kept.
+    assert not os.path.exists(local)
+    assert cache.load(str(source), read_booster, name="booster") is not first
+    # Touching the files without changing them keeps the copy.
+    os.utime(source / "model.json")
+    assert cache.fetch(str(source)) == (changed_local, changed_checksum)
+
+
+def test_prediction_workers_reuse_the_model_loaded_by_the_driver(tmp_path):
+    write_model(tmp_path / "model")
+    driver, feature_names = load_model(str(tmp_path / "model"), 2, str(tmp_path / "cache"))
+    worker, _ = load_model(str(tmp_path / "model"), 2, str(tmp_path / "cache"))
+    assert worker is driver and feature_names == ["price", "discount"]
+    assert json.loads(driver.save_config())["learner"]["generic_param"]["nthread"] == "2"
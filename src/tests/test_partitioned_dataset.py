@@ -0,0 +1,49 @@
+"""Tests of the partition swaps of libs.lola_utils.storage.PartitionedDataset."""
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from libs.lola_utils.storage import PartitionedDataset
+
+
+def test_failed_swap_keeps_the_old_partition(tmp_path, monkeypatch):
+    dataset = PartitionedDataset(str(tmp_path / "sales"), ["country"])
+    dataset.write(pd.DataFrame({"country": ["co"], "units": [1]}))
+    rename = os.rename
+
+    def failing_rename(src, dst):
+        if os.path.basename(src).startswith(".country=co.") and not src.endswith(".old"):
+            raise OSError("Error: rename failed")
+        rename(src, dst)
+
+    monkeypatch.setattr(os, "rename", failing_rename)
+    with pytest.raises(OSError):
+        dataset.write(pd.DataFrame({"country": ["co"], "units": [2]}), mode="overwrite_partitions")
+    monkeypatch.setattr(os, "rename", rename)
+    assert dataset.read()["units"].tolist() == [1]
+    assert os.listdir(tmp_path / "sales") == ["country=co"]
+
+
+def test_overwrite_replaces_the_partition(tmp_path):
+    dataset = PartitionedDataset(str(tmp_path / "sales"), ["country"])
+    dataset.write(pd.DataFrame({"country": ["co", "mx"], "units": [1, 5]}))
+    dataset.write(pd.DataFrame({"country": ["co"], "units": [2]}), mode="overwrite_partitions")
+    assert sorted(dataset.read()["units"].tolist()) == [2, 5]
+
+
+def test_reads_unify_the_schema_of_the_partitions_they_read_only(tmp_path):
+    dataset = PartitionedDataset(str(tmp_path / "sales"), ["country", "date"])
+    dataset.write(pd.DataFrame({"country": ["co"], "date": ["2023-01-01"], "price": [None]}))
+    dataset.write(pd.DataFrame({"country": ["co"], "date": ["2023-01-02"], "price": [1.5]}))
+    dataset.write(pd.DataFrame({"country": ["mx"], "date": ["2023-01-02"], "price": [2.5]}))
+    # A file whose footer cannot be read fails only the reads of its partition.
+    with open(tmp_path / "sales" / "country=mx" / "date=2023-01-02" / "part-broken.parquet", "wb") as f:
+        f.write(b"not parquet")
+    frame = dataset.read(filters=[("country", "=", "co")])
+    assert frame["price"].dtype == "float64" and frame["price"].isna().tolist() == [True, False]
+    assert dataset.count_rows([("country", "=", "co"), ("price", ">", 1.0)]) == 1
+    assert len(dataset.files()) == 4
+    with pytest.raises(pa.ArrowInvalid):
+        dataset.read(filters=[("country", "=", "mx")])
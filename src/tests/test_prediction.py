@@ -0,0 +1,82 @@
+"""Tests of the streaming scoring of smart_discounts.prediction."""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+
+from libs.lola_utils.storage import ModelCache, PartitionedDataset
+from smart_discounts.prediction.process import Process, score_task
+
+FEATURES = ["price", "discount"]
+
+
+@pytest.fixture(autouse=True)
+def clear_models():
+    ModelCache.clear()
+    yield
+    ModelCache.clear()
+
+
+def write_model(path) -> xgb.Booster:
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(0)
+    data = xgb.DMatrix(rng.random((100, 2)), label=rng.random(100), feature_names=FEATURES)
+    booster = xgb.train({"max_depth": 3}, data, num_boost_round=5)
+    booster.save_model(os.path.join(path, "model.json"))
+    with open(os.path.join(path, "metadata.json"), "w") as f:
+        json.dump({"feature_names": FEATURES}, f)
+    return booster
+
+
+def write_features(path, country: str, rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({"country": country, "sku": np.arange(rows), "price": rng.random(rows),
+                          "discount": rng.random(rows)})
+    frame.loc[3, "discount"] = np.nan
+    PartitionedDataset(str(path), ["country"], row_group_size=10).write(frame)
+    return frame.drop(columns=["country"])
+
+
+def expected(booster: xgb.Booster, frame: pd.DataFrame) -> np.ndarray:
+    matrix = xgb.DMatrix(frame[FEATURES].to_numpy(dtype=np.float32), feature_names=FEATURES)
+    return booster.predict(matrix).astype(np.float32)
+
+
+def test_tasks_score_their_row_groups_batch_by_batch(tmp_path):
+    booster = write_model(tmp_path / "model")
+    frame = write_features(tmp_path / "features", "co", 45, seed=1)
+    file, = PartitionedDataset(str(tmp_path / "features"), ["country"]).files()
+    stats = score_task({"model_path": str(tmp_path / "model"), "nthread": 1, "cache_dir": str(tmp_path / "cache"),
+                        "file": file, "row_groups": [1, 2], "partition_values": {"country": "co"},
+                        "keep_columns": ["sku"], "output_column": "prediction", "batch_size": 4,
+                        "output_path": str(tmp_path / "out"), "output_partition_columns": [],
+                        "output_partition_values": {}})
+    assert stats["rows"] == 20 and stats["batches"] == 5
+    scored = pd.read_parquet(stats["file"])
+    assert scored["sku"].tolist() == list(range(10, 30))
+    np.testing.assert_allclose(scored["prediction"].to_numpy(), expected(booster, frame.iloc[10:30]), rtol=1e-6)
+
+
+def test_prediction_replaces_the_scores_of_the_country(tmp_path, monkeypatch):
+    booster = write_model(tmp_path / "model")
+    frame = write_features(tmp_path / "features", "co", 35, seed=1)
+    frame = pd.concat([frame, write_features(tmp_path / "features", "co", 12, seed=2)], ignore_index=True)
+    write_features(tmp_path / "features", "mx", 5, seed=3)
+    output = PartitionedDataset(str(tmp_path / "predictions"), ["country"])
+    output.write(pd.DataFrame({"country": ["co", "mx"], "sku": [-1, -1], "prediction": np.float32([0.0, 0.0])}))
+    paths = {"FEATURES_PATH_ID": str(tmp_path / "features"), "MODEL_PATH_ID": str(tmp_path / "model")}
+    monkeypatch.setattr(Process, "get_path", staticmethod(lambda argument, setting: paths[argument]))
+    monkeypatch.setenv("COUNTRY", "co")
+    process = Process()
+    process.predict({"output_path": str(tmp_path / "predictions"), "keep_columns": ["sku", "price"],
+                     "row_groups_per_task": 2, "batch_size": 8, "max_workers": 2})
+    scored = output.read(filters=[("country", "=", "co")])
+    assert len(scored) == len(frame) == 47
+    merged = frame.merge(scored, on=["sku", "price"], validate="one_to_one")
+    np.testing.assert_allclose(merged["prediction"].to_numpy(), expected(booster, merged), rtol=1e-6)
+    assert output.read(filters=[("country", "=", "mx")])["sku"].tolist() == [-1]
+    assert process.output_locations == {"predictions": str(tmp_path / "predictions")}
+    assert not [name for name in os.listdir(tmp_path / "predictions") if name.startswith(".")]
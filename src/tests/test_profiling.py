@@ -0,0 +1,63 @@
+"""Tests of the mergeable sketches and profiles of libs.lola_utils.profiling."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from libs.lola_utils.profiling import DatasetProfile, FrequencySketch, HyperLogLog, QuantileSketch
+
+
+@pytest.mark.parametrize("distinct", [10, 1000, 200000])
+def test_distinct_counts_are_within_the_standard_error(distinct):
+    sketch = HyperLogLog(precision=12)
+    values = np.arange(distinct)
+    sketch.update(np.concatenate([values, values[::3]]))
+    # Three times the relative standard error of 1.04 / sqrt(2^12).
+    assert abs(sketch.count() - distinct) <= 3 * 1.04 / 64 * distinct + 1
+
+
+def test_merged_sketches_estimate_the_union():
+    left, right = HyperLogLog(), HyperLogLog()
+    left.update(np.array([f"sku-{i}" for i in range(0, 60000)], dtype=object))
+    right.update(np.array([f"sku-{i}" for i in range(40000, 100000)], dtype=object))
+    union = HyperLogLog.from_dict(left.to_dict()).merge(right)
+    assert abs(union.count() - 100000) <= 0.03 * 100000
+    with pytest.raises(ValueError):
+        left.merge(HyperLogLog(precision=10))
+
+
+def test_quantiles_of_merged_sketches_are_within_the_rank_error():
+    values = np.random.default_rng(0).permutation(100000).astype(np.float64)
+    sketches = [QuantileSketch(seed=i) for i in range(4)]
+    for sketch, chunk in zip(sketches, np.array_split(values, 4)):
+        sketch.update(chunk)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(QuantileSketch.from_dict(sketch.to_dict()))
+    ranks = [0.01, 0.25, 0.5, 0.75, 0.99]
+    for rank, estimate in zip(ranks, merged.quantiles(ranks)):
+        assert abs(estimate / len(values) - rank) <= 0.02
+
+
+def test_frequent_values_are_found_within_the_max_error():
+    sketch = FrequencySketch(capacity=20)
+    values = np.array(["a"] * 500 + ["b"] * 300 + [f"rare-{i}" for i in range(1000)], dtype=object)
+    sketch.update(np.random.default_rng(0).permutation(values))
+    top = dict(sketch.top_k(2))
+    assert list(top) == ["a", "b"]
+    assert 500 - sketch.max_error() <= top["a"] <= 500 and 300 - sketch.max_error() <= top["b"] <= 300
+
+
+def test_profiles_of_batches_merge_into_the_profile_of_the_data_set():
+    frame = pd.DataFrame({"price": [1.0, 2.0, None, 4.0, 5.0, 6.0], "brand": ["x", "y", "x", None, "x", "z"]})
+    whole = DatasetProfile()
+    whole.update(frame)
+    batches = [DatasetProfile() for _ in range(3)]
+    for batch, rows in zip(batches, [slice(0, 2), slice(2, 5), slice(5, 6)]):
+        batch.update(frame.iloc[rows])
+    merged = DatasetProfile.merge_all(DatasetProfile.from_dict(b.to_dict()) for b in batches).summary()
+    expected = whole.summary()
+    assert merged["rows"] == expected["rows"] == 6
+    for name in ["price", "brand"]:
+        for stat in ["count", "nulls", "distinct", "min", "max"]:
+            assert merged["columns"][name][stat] == expected["columns"][name][stat]
+    assert merged["columns"]["price"]["mean"] == 3.6 and merged["columns"]["brand"]["top_k"][0] == ("x", 3)
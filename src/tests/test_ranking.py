@@ -0,0 +1,62 @@
+"""Tests of the top-k selection of smart_discounts.recommendation.ranking against full sorts."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from smart_discounts.recommendation.ranking import CandidateSet, top_k
+
+
+@pytest.mark.parametrize("k", [1, 3, 8, 12])
+def test_top_k_matches_a_full_sort(k):
+    scores = np.random.default_rng(k).random((20, 8)).astype(np.float32)
+    scores[0, :5] = -np.inf
+    columns, values = top_k(scores, k)
+    expected = np.argsort(-scores, axis=1, kind="stable")[:, :min(k, 8)]
+    np.testing.assert_array_equal(values, np.take_along_axis(scores, expected, axis=1))
+    np.testing.assert_array_equal(np.take_along_axis(scores, columns, axis=1), values)
+    assert columns.shape == (20, min(k, 8))
+
+
+def make_candidates(tmp_path, group_column: str = "store", embedding_columns: list = None) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({"store": rng.choice(["b", "a", "c"], 30), "sku": np.arange(30),
+                          "e0": rng.normal(size=30), "e1": rng.normal(size=30), "margin": rng.random(30)})
+    frame.loc[4, "e0"] = np.nan
+    embedding_columns = ["e0", "e1"] if embedding_columns is None else embedding_columns
+    CandidateSet.build(frame, group_column, ["sku"], embedding_columns, "margin", str(tmp_path / "candidates"))
+    # Candidates without embedding are left out.
+    return frame.dropna(subset=embedding_columns).reset_index(drop=True)
+
+
+def brute_force(frame: pd.DataFrame, embedding: np.ndarray, store: str, k: int, bias_weight: float) -> list:
+    rows = frame[frame["store"] == store] if store is not None else frame
+    scores = rows[["e0", "e1"]].to_numpy(dtype=np.float32) @ embedding.astype(np.float32) \
+        + bias_weight * rows["margin"].to_numpy(dtype=np.float32)
+    return rows["sku"].to_numpy()[np.argsort(-scores, kind="stable")[:k]].tolist()
+
+
+@pytest.mark.parametrize("group_column", ["store", None])
+def test_recommendations_are_the_best_candidates_of_the_group(tmp_path, group_column):
+    frame = make_candidates(tmp_path, group_column)
+    candidates = CandidateSet.read(str(tmp_path / "candidates"))
+    embeddings = np.random.default_rng(1).normal(size=(6, 2)).astype(np.float32)
+    groups = np.array(["a", "c", "a", "z", "b", "c"], dtype=object)
+    output = candidates.recommend(embeddings, groups if group_column else None, k=3, bias_weight=0.5)
+    skus = candidates.candidates["sku"].to_numpy()[output["candidate"]]
+    for entity in range(6):
+        mine = output["entity"] == entity
+        store = groups[entity] if group_column else None
+        assert skus[mine].tolist() == brute_force(frame, embeddings[entity], store, 3, 0.5)
+        assert output["rank"][mine].tolist() == list(range(1, mine.sum() + 1))
+        assert np.all(np.diff(output["score"][mine]) <= 0)
+    # Entities of a store without candidates get no recommendations.
+    assert (3 in output["entity"]) == (group_column is None)
+
+
+def test_without_embeddings_the_bias_ranks_the_candidates(tmp_path):
+    frame = make_candidates(tmp_path, embedding_columns=[])
+    candidates = CandidateSet.read(str(tmp_path / "candidates"))
+    output = candidates.recommend(np.empty((2, 0), np.float32), np.array(["a", "a"], dtype=object), k=2)
+    best = frame[frame["store"] == "a"].sort_values("margin", ascending=False)["sku"].head(2).tolist()
+    assert candidates.candidates["sku"].to_numpy()[output["candidate"]].tolist() == best * 2
+    assert output["entity"].tolist() == [0, 0, 1, 1] and output["rank"].tolist() == [1, 2, 1, 2]
@@ -0,0 +1,72 @@
+"""Tests of libs.lola_utils.config.RemoteConfigSource with a FakeAppConfiguration store."""
+import pytest
+
+from libs.lola_utils.config.FakeAppConfiguration import FakeAppConfiguration
+from libs.lola_utils.config.RemoteConfigSource import RemoteConfigSource
+
+SENTINEL = "sd:sentinel"
+
+
+def make_client() -> FakeAppConfiguration:
+    client = FakeAppConfiguration({"sd:optimization:budget": "0.1", "sd:optimization:solver": "highs",
+                                   SENTINEL: "1", "other:key": "ignored"})
+    client.set("sd:optimization:budget", "0.2", label="co")
+    return client
+
+
+def make_source(client: FakeAppConfiguration, cache_dir=None, **kwargs) -> RemoteConfigSource:
+    return RemoteConfigSource(client, "sd:*", [None, "co"], str(cache_dir) if cache_dir else None,
+                              sentinel_key=SENTINEL, store_id="test", **kwargs)
+
+
+def test_settings_become_a_nested_config_with_label_overrides():
+    client = make_client()
+    assert make_source(client).load() == {"optimization": {"budget": 0.2, "solver": "highs"}}
+    assert client.calls["list"] == 1 and client.calls["get"] == 0
+
+
+def test_unchanged_sentinel_skips_the_list():
+    client = make_client()
+    source = make_source(client)
+    source.load()
+    assert source.refresh() is False
+    assert client.calls == {"list": 1, "pages": 0, "get": 1, "not_modified": 1}
+
+    client.set("sd:optimization:solver", "cbc")
+    assert source.refresh() is False
+    client.set(SENTINEL, "2")
+    assert source.refresh() is True
+    assert client.calls["list"] == 2
+    assert source.to_config()["optimization"]["solver"] == "cbc"
+
+
+def test_unreachable_store_falls_back_to_the_cached_copy(tmp_path):
+    make_source(make_client(), tmp_path).load()
+    client = make_client()
+    client.fail_with = ConnectionError("Error: store unreachable")
+    source = make_source(client, tmp_path, max_age=0, timeout=1)
+    assert source.load() == {"optimization": {"budget": 0.2, "solver": "highs"}}
+    assert source.stats["cache_loads"] == 1
+
+
+def test_slow_store_falls_back_to_the_cached_copy(tmp_path):
+    make_source(make_client(), tmp_path).load()
+    client = make_client()
+    client.set("sd:optimization:solver", "cbc")
+    client.set(SENTINEL, "2")
+    client.latency = 0.5
+    source = make_source(client, tmp_path, max_age=0, timeout=0.05)
+    assert source.load()["optimization"]["solver"] == "highs"
+    # The fetch goes on in the background and refreshes the cached copy for the next run.
+    source._fetching.join()
+    # The store of the next run is unreachable, so its own background fetch cannot replace the copy first.
+    client = make_client()
+    client.fail_with = ConnectionError("Error: store unreachable")
+    assert make_source(client, tmp_path, max_age=3600).load()["optimization"]["solver"] == "cbc"
+
+
+def test_unreachable_store_without_cached_copy_raises(tmp_path):
+    client = make_client()
+    client.fail_with = ConnectionError("Error: store unreachable")
+    with pytest.raises(ConnectionError):
+        make_source(client, tmp_path).load()
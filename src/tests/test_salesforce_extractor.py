@@ -0,0 +1,83 @@
+"""Tests of the bulk and REST paths of ptc.data_ingestion.salesforce_extractor.SalesforceExtractor."""
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from ptc.data_ingestion.fake_salesforce import FakeSalesforce
+from ptc.data_ingestion.salesforce_extractor import SalesforceExtractor
+
+QUERY = "SELECT Id, Name, CreatedDate FROM Account"
+
+
+def make_client(**kwargs) -> FakeSalesforce:
+    start = datetime(2024, 1, 1, 12)
+    records = [{"Id": SalesforceExtractor._int_to_id(1000 + i), "Name": f"Account {i}",
+                "CreatedDate": (start + timedelta(hours=7 * i)).strftime("%Y-%m-%dT%H:%M:%S.000+0000")}
+               for i in range(300)]
+    return FakeSalesforce({"Account": records}, page_size=20, bulk_chunk_size=15, **kwargs)
+
+
+def extract(client: FakeSalesforce, query: str = QUERY, partitions: list = None) -> pd.DataFrame:
+    extractor = SalesforceExtractor(lambda: client, pool_size=3, batch_size=100)
+    if partitions is None:
+        partitions = extractor.date_partitions("CreatedDate", date(2024, 1, 1), date(2024, 4, 1), 10)
+    return pd.concat([batch for _, batch in extractor.iter_batches(query, partitions)], ignore_index=True)
+
+
+def test_bulk_path_reads_every_record():
+    client = make_client()
+    frame = extract(client)
+    assert sorted(frame["Name"]) == sorted(f"Account {i}" for i in range(300))
+    assert client.calls["bulk"] > 0 and client.calls["query"] == 0
+    assert isinstance(frame["CreatedDate"].dtype, pd.DatetimeTZDtype) and str(frame["CreatedDate"].dt.tz) == "UTC"
+
+
+def test_failed_bulk_jobs_fall_back_to_rest():
+    client = make_client(fail_bulk=True)
+    frame = extract(client)
+    assert len(frame) == 300 and frame["Id"].is_unique
+    assert client.calls["bulk"] > 0 and client.calls["query"] == client.calls["bulk"]
+    assert client.calls["query_more"] > 0
+
+
+def test_subqueries_skip_the_bulk_api():
+    client = make_client()
+    frame = extract(client, "SELECT Id, (SELECT Id FROM Contacts) FROM Account", [{"name": "all"}])
+    assert client.calls["bulk"] == 0 and len(frame) == 300
+
+
+def test_id_partitions_cover_every_record_once():
+    client = make_client()
+    extractor = SalesforceExtractor(lambda: client, pool_size=3, batch_size=100)
+    partitions = extractor.id_partitions(QUERY, 4)
+    assert len(partitions) == 4
+    frame = extract(client, partitions=partitions)
+    assert len(frame) == 300 and frame["Id"].is_unique
+
+
+def make_typed_client(**kwargs) -> FakeSalesforce:
+    records = [{"Id": SalesforceExtractor._int_to_id(1000 + i), "Name": f"Opportunity {i}",
+                "CloseDate": f"2024-02-{1 + i % 28:02d}",
+                "LastModifiedDate": f"2024-03-{1 + i % 28:02d}T08:15:30.250+0000" if i % 5 else None}
+               for i in range(60)]
+    return FakeSalesforce({"Opportunity": records}, page_size=20, bulk_chunk_size=15, **kwargs)
+
+
+def test_bulk_and_rest_give_the_same_dates_and_datetimes():
+    query = "SELECT Id, CloseDate, LastModifiedDate FROM Opportunity"
+    assert isinstance(FakeSalesforce.to_bulk({"CloseDate": "2024-02-01"})["CloseDate"], int)
+    bulk = extract(make_typed_client(), query, [{"name": "all"}]).sort_values("Id", ignore_index=True)
+    rest = extract(make_typed_client(fail_bulk=True), query, [{"name": "all"}]).sort_values("Id", ignore_index=True)
+    pd.testing.assert_frame_equal(bulk, rest)
+    assert bulk["CloseDate"].iloc[0] == "2024-02-01"
+    assert bulk["LastModifiedDate"].iloc[1] == pd.Timestamp("2024-03-02T08:15:30.250Z")
+    assert bulk["LastModifiedDate"].isna().sum() == 12
+
+
+def test_field_types_cover_fields_without_describe():
+    client = make_typed_client()
+    client.Opportunity = None  # The user cannot describe Opportunity.
+    extractor = SalesforceExtractor(lambda: client, field_types={"LastModifiedDate": "datetime"})
+    frame, = [b for _, b in extractor.iter_batches("SELECT Id, CloseDate, LastModifiedDate FROM Opportunity", [])]
+    assert frame["LastModifiedDate"].iloc[1] == pd.Timestamp("2024-03-02T08:15:30.250Z")
+    assert frame["CloseDate"].dtype.kind in "iu"
@@ -0,0 +1,53 @@
+"""Tests of the longest-job-first scheduling of libs.lola_utils.execution.Scheduler and its history."""
+import itertools
+
+from libs.lola_utils.execution.RunHistoryStore import RunHistoryStore
+from libs.lola_utils.execution.Scheduler import Scheduler
+
+CALLS = []
+
+
+def square(value: int) -> int:
+    CALLS.append(value)
+    return value * value
+
+
+def test_tasks_without_history_go_first_then_longest_first():
+    estimates = {"a": 1.0, "b": 5.0, "c": None, "d": 3.0, "e": None}
+    assert Scheduler.order_longest_first(list(estimates), estimates) == ["c", "e", "b", "d", "a"]
+
+
+def test_plan_packs_longest_first_close_to_the_best_makespan():
+    estimates = {"a": 7.0, "b": 5.0, "c": 4.0, "d": 4.0, "e": 3.0, "f": 3.0, "g": 2.0}
+    assignments, makespan = Scheduler.plan(estimates, 3)
+    assert sorted(t for worker in assignments for t in worker) == sorted(estimates)
+    assert makespan == max(sum(estimates[t] for t in worker) for worker in assignments)
+    best = min(max(sum(estimates[t] for t, w in zip(estimates, workers) if w == i) for i in range(3))
+               for workers in itertools.product(range(3), repeat=len(estimates)))
+    # The longest-processing-time rule is within 4/3 of the best makespan.
+    assert best <= makespan <= best * 4 / 3
+    assert assignments[0][0] == "a"
+
+
+def test_partitions_run_longest_first_and_are_recorded(tmp_path):
+    history = RunHistoryStore(str(tmp_path))
+    history.record_many("svc", "proc", [{"partition": "small", "wall_time": 1.0},
+                                        {"partition": "large", "wall_time": 9.0}], service_run_id="run-1")
+    partitions = {"small": 2, "large": 3, "new": 4}
+    CALLS.clear()
+    results = Scheduler.run_partitions(square, partitions, max_workers=1, use_threads=True, history=history,
+                                       service="svc", process="proc", service_run_id="run-2")
+    assert results == {"small": 4, "large": 9, "new": 16}
+    assert CALLS == [4, 3, 2]
+    assert all(len(history.get_history("svc", "proc", p)) == (2 if p != "new" else 1) for p in partitions)
+
+
+def test_plan_estimates_only_the_partitions_of_the_last_run(tmp_path):
+    history = RunHistoryStore(str(tmp_path))
+    history.record_many("svc", "proc", [{"partition": "co", "wall_time": 4.0},
+                                        {"partition": "mx", "wall_time": 8.0}], service_run_id="run-1")
+    history.record_many("svc", "proc", [{"partition": "co", "wall_time": 2.0}], service_run_id="run-2")
+    history.record_many("svc", "proc", [{"partition": "pe", "wall_time": 6.0}], service_run_id="run-2")
+    assert history.estimate_partitions("svc", "proc") == {"co": 3.0, "pe": 6.0}
+    assert history.estimate_partitions("svc", "proc", ["mx", "ar"]) == {"mx": 8.0, "ar": None}
+    assert history.estimate_partitions("svc", "other") == {}
@@ -0,0 +1,43 @@
+"""Tests of the memo and shared cache of libs.lola_utils.ind.TextNormalizer."""
+import pandas as pd
+
+from libs.lola_utils.cache import MemoryTier, TieredCache
+from libs.lola_utils.ind import TextNormalizer
+
+
+def test_distinct_values_are_normalized_once_and_nulls_kept(monkeypatch):
+    normalizer = TextNormalizer()
+    calls = []
+    normalize_value = normalizer.normalize_value
+    monkeypatch.setattr(normalizer, "normalize_value", lambda value: calls.append(value) or normalize_value(value))
+    names = pd.Series(["  Ñandú  Azul", None, "ÑANDÚ azul", "  Ñandú  Azul"], index=[5, 6, 7, 8], name="product")
+    result = normalizer.normalize(names)
+    assert result.tolist() == ["nandu azul", None, "nandu azul", "nandu azul"]
+    assert list(result.index) == [5, 6, 7, 8] and result.name == "product"
+    assert sorted(calls) == ["  Ñandú  Azul", "ÑANDÚ azul"]
+    normalizer.normalize(pd.Series(["ÑANDÚ azul", "Café"]))
+    assert len(calls) == 3 and normalizer.stats["hits"] == 1 and normalizer.hit_rate() == 0.25
+
+
+def test_memo_keeps_the_most_recent_values_and_is_saved_between_runs(tmp_path):
+    path = str(tmp_path / "names.json")
+    normalizer = TextNormalizer(max_size=2, cache_path=path)
+    normalizer.normalize(pd.Series(["A", "B"]))
+    normalizer.normalize(pd.Series(["A", "C"]))
+    assert list(normalizer.memo) == ["A", "C"]
+    normalizer.save()
+    loaded = TextNormalizer(max_size=2, cache_path=path)
+    assert list(loaded.memo) == ["A", "C"]
+    # A memo saved with other settings is not used.
+    assert TextNormalizer(cache_path=path, lowercase=False).memo == {}
+
+
+def test_values_normalized_by_other_workers_are_found_in_the_shared_cache():
+    cache = TieredCache([MemoryTier(2 ** 20)], "names")
+    TextNormalizer(cache=cache).normalize(pd.Series(["Perú", "Bogotá"]))
+    other = TextNormalizer(cache=cache)
+    assert other.normalize(pd.Series(["Bogotá", "Cali"])).tolist() == ["bogota", "cali"]
+    assert other.stats["cache_hits"] == 1 and other.stats["misses"] == 1
+    # Normalizers with other settings do not share values.
+    upper = TextNormalizer(cache=cache, lowercase=False)
+    assert upper.normalize(pd.Series(["Bogotá"])).tolist() == ["Bogota"] and upper.stats["cache_hits"] == 0